@@ -3,10 +3,9 @@ import socket
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
 import threading
-import struct
-import ast
 from chat_ui_objects import root, login_frame, username_entry_var, username_entry, password_entry, chat_frame, chat_label, new_conversation_entry_var, new_conversation_entry, conversation_list
 import sys
+from protocol import VERSION_SIZE, SUCCESS, STRUCTURED_REPLIES, decode_counts, decode_messages, decode_page, decode_users, parse_message_id, recv_frame, send_frame
 
 # Get SERVER_HOST and SERVER_PORT from CLI if file ran from terminal. 
 # Otherwise use the default values (so that functions run for tests)
@@ -27,7 +26,9 @@ else:
     SERVER_HOST = "localhost"
     SERVER_PORT = 5001
 
-CLIENT_VERSION = "1.0.0"
+CLIENT_VERSION = "3.1.0"
+REQUEST_TIMEOUT = 10 # seconds to wait for the response to a single request
+RECEIVE_PAGE_SIZE = 200 # messages fetched per receive request
 
 current_user = None
 # conversations: key=contact, value=list of message dicts {id, from, message, status}
@@ -35,6 +36,11 @@ conversations = {}
 chat_windows = {}   # open chat windows
 undelivered = {} # saves undelivered message
 subscription_socket = None
+connection = None # long-lived, version-checked connection shared by all requests
+connection_lock = threading.Lock()
+received_seq = 0 # sequence number of the newest mailbox change loaded from the server
+message_positions = {} # {contact: (conversations[contact], {message id: index in that list})}
+unread_counts = {} # {contact: unread messages} from login, shown until the messages themselves are loaded
 
 def hash_password(password):
     """
@@ -65,11 +71,18 @@ def add_message(contact, msg):
     """
     if contact not in conversations:
         conversations[contact] = []
-    for i, existing in enumerate(conversations[contact]):
-        if existing["id"] == msg["id"]:
-            conversations[contact][i] = msg  # update the message (e.g. mark as deleted)
-            return True
-    conversations[contact].append(msg)
+    msgs = conversations[contact]
+    indexed, positions = message_positions.get(contact, (None, None))
+    if indexed is not msgs or len(positions) != len(msgs):
+        # The conversation was replaced or changed without going through add_message
+        positions = {m["id"]: i for i, m in enumerate(msgs)}
+        message_positions[contact] = (msgs, positions)
+    i = positions.get(msg["id"])
+    if i is not None:
+        msgs[i] = msg  # update the message (e.g. mark as deleted)
+    else:
+        positions[msg["id"]] = len(msgs)
+        msgs.append(msg)
     return True
 
 def check_version_number():
@@ -95,7 +108,7 @@ def check_version_number():
     # Check version number
     try:
         # Send version number first
-        conn.send(CLIENT_VERSION.encode().ljust(32))
+        conn.send(CLIENT_VERSION.encode().ljust(VERSION_SIZE))
         # Receive the server's response on verison number match
         response = conn.recv(1023).decode()
         if response.startswith("error:"):
@@ -109,33 +122,238 @@ def check_version_number():
         return None
 
 
+class ServerConnection:
+    """
+        A long-lived, version-checked connection to the server.
+
+        Every request is tagged with a new request ID, so several requests can be in
+        flight on the socket at once. A reader thread hands each response to whichever
+        caller is waiting on the matching ID.
+    """
+    def __init__(self, sock):
+        """
+            Wrap a socket that has already passed the version check.
+
+            Params:
+
+                sock: connected client socket
+
+            Returns:
+
+                None
+        """
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        self.pending = {} # request_id -> {"event": threading.Event(), "response": str, bytes or None}
+        self.next_request_id = 1
+        self.closed = False
+        self.reader = threading.Thread(target=self.read_responses, daemon=True)
+        self.reader.start()
+
+    def submit(self, request_type, data):
+        """
+            Send a request without waiting for its response.
+
+            Params:
+
+                request_type: integer that corresponds to a specific request to the server
+
+                data: request payload
+
+            Returns:
+
+                slot: pending-response handle to pass to wait()
+        """
+        with self.pending_lock:
+            if self.closed:
+                raise ConnectionError("Connection to server is closed")
+            request_id = self.next_request_id
+            self.next_request_id += 1
+            slot = {"event": threading.Event(), "response": None, "request_id": request_id}
+            self.pending[request_id] = slot
+        try:
+            with self.send_lock:
+                send_frame(self.sock, request_type, data, request_id)
+        except Exception:
+            self.close()
+            raise
+        return slot
+
+    def wait(self, slot, timeout=REQUEST_TIMEOUT):
+        """
+            Block until the response for a submitted request arrives.
+
+            Params:
+
+                slot: handle returned by submit()
+
+                timeout: seconds to wait before giving up
+
+            Returns:
+
+                response: decoded response from the server, or the bytes of a structured success reply
+        """
+        if not slot["event"].wait(timeout):
+            # Forget the request so a late response is dropped and the slot is not kept forever
+            with self.pending_lock:
+                self.pending.pop(slot["request_id"], None)
+            raise TimeoutError("Timed out waiting for the server's response")
+        if slot["response"] is None:
+            raise ConnectionError("Connection closed before the server responded")
+        return slot["response"]
+
+    def request(self, request_type, data):
+        """
+            Send one request and wait for its response.
+
+            Params:
+
+                request_type: integer that corresponds to a specific request to the server
+
+                data: request payload
+
+            Returns:
+
+                response: decoded response from the server, or the bytes of a structured success reply
+        """
+        return self.wait(self.submit(request_type, data))
+
+    def read_responses(self):
+        """
+            Reader thread: match each incoming frame to its pending request by request ID.
+
+            Params:
+
+                None
+
+            Returns:
+
+                None
+        """
+        try:
+            while True:
+                frame = recv_frame(self.sock)
+                if frame is None:
+                    break
+                msg_type, request_id, payload = frame
+                with self.pending_lock:
+                    slot = self.pending.pop(request_id, None)
+                if slot is not None:
+                    # Structured success replies are binary records, left for the caller to decode
+                    structured = msg_type in STRUCTURED_REPLIES and payload.startswith(SUCCESS)
+                    slot["response"] = payload if structured else payload.decode()
+                    slot["event"].set()
+        except Exception as e:
+            if not self.closed:
+                print(f"Connection error: {e}")
+        finally:
+            self.close()
+
+    def close(self):
+        """
+            Close the socket and wake every caller still waiting for a response.
+
+            Params:
+
+                None
+
+            Returns:
+
+                None
+        """
+        with self.pending_lock:
+            if self.closed:
+                return
+            self.closed = True
+            slots = list(self.pending.values())
+            self.pending.clear()
+        for slot in slots:
+            slot["event"].set()
+        try:
+            self.sock.close()
+        except Exception as e:
+            print(f"[ERROR] Failed to close connection: {e}")
+
+def get_connection():
+    """
+        Return the shared connection to the server, connecting and checking the version only if there is no open one.
+
+        Params:
+
+            None
+
+        Returns:
+
+            connection or None: open ServerConnection, or None if the server could not be reached or the version mismatched
+    """
+    global connection
+    with connection_lock:
+        if connection is None or connection.closed:
+            conn = check_version_number()
+            connection = ServerConnection(conn) if conn is not None else None
+        return connection
+
 def send_request(request_type, data):
     """
-        Send a request to the server using a custom binary protocol.
+        Send a request to the server over the shared connection using a custom binary protocol.
 
         Params:
 
             request_type: integer that corresponds to a specific request to the server
 
+            data: request payload
+
         Returns:
 
-            response.decode() or None: response from the server or None if there is error in connection to server
+            response or None: response from the server or None if there is error in connection to server
     """
     try:
-        client = check_version_number()
-        if client is not None:
-            # Since version matched, continue to pack data using struct
-            message = struct.pack("!I", request_type) + data.encode()
-            client.send(message)
-            
-            # Receive response
-            response = client.recv(4096)
-            client.close()
-            return response.decode()
+        conn = get_connection()
+        if conn is not None:
+            return conn.request(request_type, data)
     except Exception as e:
         messagebox.showerror("Error", f"Connection failed: {e}")
         return None
 
+def send_requests(requests):
+    """
+        Pipeline several requests on the shared connection: send them all, then collect the responses.
+
+        Params:
+
+            requests: list of (request_type, data) tuples
+
+        Returns:
+
+            responses or None: responses in the same order as requests, or None if there is error in connection to server
+    """
+    try:
+        conn = get_connection()
+        if conn is not None:
+            slots = [conn.submit(request_type, data) for request_type, data in requests]
+            return [conn.wait(slot) for slot in slots]
+    except Exception as e:
+        messagebox.showerror("Error", f"Connection failed: {e}")
+        return None
+
+def list_users():
+    """
+        Fetch the usernames of the accounts that were not deleted.
+
+        Params:
+
+            None
+
+        Returns:
+
+            usernames: list of usernames, empty if the server could not be reached
+    """
+    response = send_request(3, "empty")
+    if not isinstance(response, bytes):
+        return []
+    return decode_users(response, len(SUCCESS))
+
 def update_username_suggestions(event, entry, entry_var):
     """
         Update the dropdown options for username based on user input.
@@ -154,12 +372,7 @@ def update_username_suggestions(event, entry, entry_var):
     """
     typed = entry_var.get().lower()
     
-    try:
-        username_options = ast.literal_eval(send_request(3, "empty"))  # Ensure valid list
-        if not isinstance(username_options, list):  # Extra safety check
-            username_options = []
-    except (SyntaxError, ValueError):
-        username_options = []  # Handle bad responses safely
+    username_options = list_users()
 
     if typed == "":
         entry["values"] = username_options  # Reset to all options
@@ -179,18 +392,21 @@ def login():
 
             None
     """
-    global current_user
+    global current_user, received_seq, unread_counts
     username = username_entry.get().strip()
     password = password_entry.get().strip()
     if not username or not password:
         messagebox.showwarning("Input Error", "Username and password cannot be empty.")
         return
     response = send_request(2, f"{username}|{hash_password(password)}")
-    if response and response.startswith("success"):
+    if isinstance(response, bytes): # success replies are binary, errors text
         current_user = username
+        received_seq = 0
+        unread_counts = decode_counts(response, len(SUCCESS))
         login_frame.pack_forget()
         chat_frame.pack()
         chat_label.config(text=f"Chat - Logged in as {username}")
+        update_conversation_list()
         load_conversations()
         check_new_messages()
         threading.Thread(target=subscribe_thread, daemon=True).start()
@@ -240,18 +456,15 @@ def subscribe_thread():
     try:
         subscription_socket = check_version_number()
         if subscription_socket is not None:
-            request_type = 5
-            data = current_user
-            message = struct.pack("!I", request_type) + data.encode()
-            subscription_socket.send(message)
+            send_frame(subscription_socket, 5, current_user)
             while current_user:
-                response = subscription_socket.recv(4096)
-                if not response:
+                frame = recv_frame(subscription_socket)
+                if frame is None:
                     break
-                response = response.decode()
+                response = frame[2]
 
-                if response and response.startswith("success"):
-                    message_data = ast.literal_eval(response.split(':', 1)[1])
+                if response.startswith(SUCCESS):
+                    message_data = decode_messages(response, len(SUCCESS))[0][0]
                     sender = message_data["from"]
                     if add_message(sender, message_data):
                         update_conversation_list()
@@ -261,7 +474,7 @@ def subscribe_thread():
                                     continue
                             update_chat_window(sender)
                 else:
-                    messagebox.showerror("Error", response)
+                    messagebox.showerror("Error", response.decode())
     except Exception as e:
         print("Subscription error:", e)
     finally:
@@ -270,7 +483,7 @@ def subscribe_thread():
 
 def load_conversations():
     """
-        Load all of the messages stored for current user
+        Load the messages stored for current user that arrived since the last load, one page at a time
         
         Params:
 
@@ -280,20 +493,58 @@ def load_conversations():
 
             None
     """
-    response = send_request(8, current_user)
-    if response and response.startswith("success"):
-        messages = ast.literal_eval(response.split(":", 1)[1]) #list of dict of messages
-        if len(messages) != 0:
-          for msg in messages:
+    global received_seq
+    loaded = False
+    while True:
+        response = send_request(8, f"{current_user}|{received_seq}|{RECEIVE_PAGE_SIZE}")
+        if not isinstance(response, bytes): # success replies are binary, errors text
+            messagebox.showerror("Error", response if response else "No response from server.")
+            break
+        messages, received_seq, has_more = decode_page(response, len(SUCCESS))
+        for msg in messages:
             sender = msg["from"]
             add_message(sender, msg)
-          update_conversation_list()
-    else:
-        messagebox.showerror("Error", response if response else "No response from server.")
+            loaded = True
+        if not has_more:
+            if unread_counts: # every message is loaded, count them instead
+                unread_counts.clear()
+                loaded = True
+            break
+    if loaded:
+        update_conversation_list()
+
+def sync_conversations():
+    """
+        Apply the changes to the current user's mailbox since the last load or sync: new messages,
+        and messages that were read or deleted in the meantime
+
+        Params:
+
+            None
+
+        Returns:
+
+            None
+    """
+    global received_seq
+    changed = False
+    while True:
+        response = send_request(11, f"{current_user}|{received_seq}|{RECEIVE_PAGE_SIZE}")
+        if not isinstance(response, bytes):
+            break # retried on the next check
+        changes, received_seq, has_more = decode_page(response, len(SUCCESS))
+        for msg in changes:
+            add_message(msg["from"], msg)
+            changed = True
+        if not has_more:
+            break
+    if changed:
+        update_conversation_list()
 
 def update_conversation_list():
     """
-        Update conversation list by skipping deleted messages and showing number of unreads
+        Update conversation list by skipping deleted messages and showing number of unreads.
+        Contacts whose messages are not loaded yet show the unread count from login.
 
         Params:
 
@@ -313,6 +564,9 @@ def update_conversation_list():
         unread_indicator = f" 🔴({unread} unread)" if unread > 0 else ""
         display = f"{contact}{unread_indicator}"
         conversation_list.insert(tk.END, display)
+    for contact, unread in unread_counts.items():
+        if contact not in conversations:
+            conversation_list.insert(tk.END, f"{contact} 🔴({unread} unread)")
 
 def open_chat():
     """
@@ -379,7 +633,7 @@ def chat_window(contact):
             sender, recipient = current_user, contact
             response = send_request(4, f"{sender}|{recipient}|{message}")
             if response and response.startswith("success"):
-                msg_id = response.split(':', 1)[1] # msg_id
+                msg_id = parse_message_id(response.split(':', 1)[1]) # same type as the IDs of received messages
                 msg_obj = {"id": msg_id, "from": current_user, "message": message, "status": "unread"}
                 add_message(contact, msg_obj)
                 update_conversation_list()
@@ -526,7 +780,7 @@ def check_new_messages():
             None
     """
     if current_user:
-        load_conversations()
+        sync_conversations()
         root.after(5000, check_new_messages)
 
 def start_new_conversation():
@@ -550,7 +804,7 @@ def start_new_conversation():
         return
 
     # Check if the recipient exists.
-    users_list = ast.literal_eval(send_request(3, "empty"))
+    users_list = list_users()
     if recipient not in users_list:
         messagebox.showwarning("Input Error", f"User '{recipient}' does not exist.")
         return
@@ -641,7 +895,7 @@ def run_gui():
     tk.Label(login_frame, text="Username:").pack()
 
     try:
-        username_options = ast.literal_eval(send_request(3, "empty"))
+        username_options = list_users()
     except Exception as e:
         print(f"Error: {e}")
         return 
@@ -0,0 +1,439 @@
+import struct
+
+# Every request and response after the version handshake is sent as one frame:
+# a 12-byte header (message type, request ID, payload length) followed by the payload bytes.
+# Responses echo the request ID of the request they answer so pipelined requests can be matched.
+HEADER_FORMAT = "!III"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# Upper bound on a single payload so a corrupted header cannot make us allocate gigabytes.
+MAX_PAYLOAD_SIZE = 16 * 1024 * 1024
+# The version handshake is a fixed-size, space-padded string sent before any frame.
+VERSION_SIZE = 32
+
+# Replies to Login, List Users, Receive Messages and Sync, and subscription pushes, are "success:" followed by
+# binary records in a fixed field order (errors stay text):
+#   varint    unsigned integer, 7 bits per byte, low bits first, high bit set on every byte but the last
+#   string    varint length, then that many bytes of UTF-8
+#   users     varint count, then a string per username
+#   counts    varint count, then a string and a varint per entry (unread messages per contact)
+#   message   flags byte (bits 0-1: status code; ID_TEXT, HAS_SEQ, HAS_UPDATED bits), the ID (varint,
+#             or string if ID_TEXT), sender string, body string, then seq and updated varints if flagged
+#   messages  varint count, then the messages
+#   page      varint next_seq, has_more byte, then messages
+SUCCESS = b"success:"
+STRUCTURED_REPLIES = {2, 3, 5, 8, 11} # message types whose success replies are binary records
+STATUSES = ("unread", "read", "deleted") # status code -> status
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+ID_TEXT, HAS_SEQ, HAS_UPDATED = 4, 8, 16
+
+class FrameError(Exception):
+    """
+        Raised when a frame header is malformed or announces an oversized payload.
+    """
+    pass
+
+def recv_exact(conn, size):
+    """
+        Receive exactly size bytes from the socket, looping over partial reads.
+
+        Params:
+
+            conn: socket to read from
+
+            size: number of bytes to read
+
+        Returns:
+
+            data or None: the bytes read, or None if the peer closed the connection first
+    """
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = conn.recv(min(remaining, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+def pack_frame(msg_type, payload, request_id=0):
+    """
+        Build a frame for the given message type and payload.
+
+        Params:
+
+            msg_type: integer that corresponds to a specific request
+
+            payload: str or bytes payload
+
+            request_id: identifier echoed back in the matching response
+
+        Returns:
+
+            frame: header followed by the encoded payload
+    """
+    if isinstance(payload, str):
+        payload = payload.encode()
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise FrameError(f"Payload of {len(payload)} bytes exceeds the {MAX_PAYLOAD_SIZE} byte limit")
+    return struct.pack(HEADER_FORMAT, msg_type, request_id, len(payload)) + payload
+
+def unpack_header(header):
+    """
+        Decode a frame header.
+
+        Params:
+
+            header: HEADER_SIZE bytes read from the socket
+
+        Returns:
+
+            (msg_type, request_id, length): message type, request ID and payload length announced by the header
+    """
+    try:
+        msg_type, request_id, length = struct.unpack(HEADER_FORMAT, header)
+    except struct.error as e:
+        raise FrameError(f"Invalid frame header: {e}")
+    if length > MAX_PAYLOAD_SIZE:
+        raise FrameError(f"Frame payload of {length} bytes exceeds the {MAX_PAYLOAD_SIZE} byte limit")
+    return msg_type, request_id, length
+
+def parse_message_id(text):
+    """
+        Convert a message ID read from a payload back to the value the server stores.
+
+        Params:
+
+            text: message ID as sent: decimal digits for an ID numbered by the server, or a UUID string
+                from a server run with --id_format uuid
+
+        Returns:
+
+            message_id: int or str
+    """
+    return int(text) if text.isdigit() else text
+
+def send_frame(conn, msg_type, payload, request_id=0):
+    """
+        Send one complete frame over the socket.
+
+        Params:
+
+            conn: socket to write to
+
+            msg_type: integer that corresponds to a specific request
+
+            payload: str or bytes payload
+
+            request_id: identifier echoed back in the matching response
+
+        Returns:
+
+            None
+    """
+    conn.sendall(pack_frame(msg_type, payload, request_id))
+
+def recv_frame(conn):
+    """
+        Receive one complete frame from the socket.
+
+        Params:
+
+            conn: socket to read from
+
+        Returns:
+
+            (msg_type, request_id, payload) or None: the message type, request ID and raw payload bytes, or None if the peer closed the connection
+    """
+    header = recv_exact(conn, HEADER_SIZE)
+    if header is None:
+        return None
+    msg_type, request_id, length = unpack_header(header)
+    payload = recv_exact(conn, length) if length else b""
+    if payload is None:
+        return None
+    return msg_type, request_id, payload
+
+def encode_varint(n, out):
+    """
+        Append an unsigned integer as a varint.
+
+        Params:
+
+            n: integer >= 0
+
+            out: bytearray to append to
+
+        Returns:
+
+            None
+    """
+    while n > 0x7f:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+def decode_varint(data, pos):
+    """
+        Read a varint.
+
+        Params:
+
+            data: bytes holding the varint
+
+            pos: offset of its first byte
+
+        Returns:
+
+            (n, pos): the integer and the offset after it
+    """
+    byte = data[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    n, shift = 0, 0
+    while byte >= 0x80:
+        n |= (byte & 0x7f) << shift
+        shift += 7
+        pos += 1
+        byte = data[pos]
+    return n | byte << shift, pos + 1
+
+def encode_string(text, out):
+    """
+        Append a string as its varint length and UTF-8 bytes.
+
+        Params:
+
+            text: str to append
+
+            out: bytearray to append to
+
+        Returns:
+
+            None
+    """
+    data = text.encode()
+    encode_varint(len(data), out)
+    out += data
+
+def decode_string(data, pos):
+    """
+        Read a length-prefixed UTF-8 string.
+
+        Params:
+
+            data: bytes holding the string
+
+            pos: offset of its length
+
+        Returns:
+
+            (text, pos): the string and the offset after it
+    """
+    length, pos = decode_varint(data, pos)
+    end = pos + length
+    if end > len(data):
+        raise IndexError("string runs past the end of the data")
+    return data[pos:end].decode(), end
+
+def encode_users(usernames):
+    """
+        Encode a list of usernames.
+
+        Params:
+
+            usernames: list of str
+
+        Returns:
+
+            data: bytes
+    """
+    out = bytearray()
+    encode_varint(len(usernames), out)
+    for name in usernames:
+        encode_string(name, out)
+    return bytes(out)
+
+def decode_users(data, pos=0):
+    """
+        Decode a list of usernames written by encode_users.
+
+        Params:
+
+            data: bytes
+
+            pos: offset of the list in data
+
+        Returns:
+
+            usernames: list of str. Raises FrameError if data is malformed.
+    """
+    try:
+        count, pos = decode_varint(data, pos)
+        usernames = []
+        for _ in range(count):
+            name, pos = decode_string(data, pos)
+            usernames.append(name)
+    except (IndexError, UnicodeDecodeError) as e:
+        raise FrameError(f"Malformed user list: {e}")
+    return usernames
+
+def encode_counts(counts):
+    """
+        Encode a mapping of names to counts.
+
+        Params:
+
+            counts: dict of str -> int >= 0
+
+        Returns:
+
+            data: bytes
+    """
+    out = bytearray()
+    encode_varint(len(counts), out)
+    for name, count in counts.items():
+        encode_string(name, out)
+        encode_varint(count, out)
+    return bytes(out)
+
+def decode_counts(data, pos=0):
+    """
+        Decode a mapping of names to counts written by encode_counts.
+
+        Params:
+
+            data: bytes
+
+            pos: offset of the mapping in data
+
+        Returns:
+
+            counts: dict of str -> int. Raises FrameError if data is malformed.
+    """
+    try:
+        size, pos = decode_varint(data, pos)
+        counts = {}
+        for _ in range(size):
+            name, pos = decode_string(data, pos)
+            counts[name], pos = decode_varint(data, pos)
+    except (IndexError, UnicodeDecodeError) as e:
+        raise FrameError(f"Malformed counts: {e}")
+    return counts
+
+def encode_messages(messages, out=None):
+    """
+        Encode a list of message dicts {id, from, message, status, seq?, updated?}.
+
+        Params:
+
+            messages: list of message dicts; an ID is an int or a str
+
+            out: bytearray to append to, or None for a new one
+
+        Returns:
+
+            out: the bytearray holding the encoded messages
+    """
+    if out is None:
+        out = bytearray()
+    encode_varint(len(messages), out)
+    for msg in messages:
+        message_id = msg["id"]
+        flags = STATUS_CODES[msg["status"]]
+        if not isinstance(message_id, int):
+            flags |= ID_TEXT
+        if "seq" in msg:
+            flags |= HAS_SEQ
+        if "updated" in msg:
+            flags |= HAS_UPDATED
+        out.append(flags)
+        if flags & ID_TEXT:
+            encode_string(message_id, out)
+        else:
+            encode_varint(message_id, out)
+        encode_string(msg["from"], out)
+        encode_string(msg["message"], out)
+        if flags & HAS_SEQ:
+            encode_varint(msg["seq"], out)
+        if flags & HAS_UPDATED:
+            encode_varint(msg["updated"], out)
+    return out
+
+def decode_messages(data, pos=0):
+    """
+        Decode a list of messages written by encode_messages.
+
+        Params:
+
+            data: bytes
+
+            pos: offset of the list in data
+
+        Returns:
+
+            (messages, pos): the message dicts and the offset after them. Raises FrameError if data is malformed.
+    """
+    try:
+        count, pos = decode_varint(data, pos)
+        messages = []
+        for _ in range(count):
+            flags = data[pos]
+            if flags & ID_TEXT:
+                message_id, pos = decode_string(data, pos + 1)
+            else:
+                message_id, pos = decode_varint(data, pos + 1)
+            sender, pos = decode_string(data, pos)
+            body, pos = decode_string(data, pos)
+            msg = {"id": message_id, "from": sender, "message": body, "status": STATUSES[flags & 3]}
+            if flags & HAS_SEQ:
+                msg["seq"], pos = decode_varint(data, pos)
+            if flags & HAS_UPDATED:
+                msg["updated"], pos = decode_varint(data, pos)
+            messages.append(msg)
+    except (IndexError, UnicodeDecodeError) as e:
+        raise FrameError(f"Malformed message list: {e}")
+    return messages, pos
+
+def encode_page(messages, next_seq, has_more):
+    """
+        Encode one page of a paged receive or sync.
+
+        Params:
+
+            messages: list of message dicts
+
+            next_seq: cursor for the next request
+
+            has_more: whether more messages remain after this page
+
+        Returns:
+
+            data: bytes
+    """
+    out = bytearray()
+    encode_varint(next_seq, out)
+    out.append(has_more)
+    return bytes(encode_messages(messages, out))
+
+def decode_page(data, pos=0):
+    """
+        Decode a page written by encode_page.
+
+        Params:
+
+            data: bytes
+
+            pos: offset of the page in data
+
+        Returns:
+
+            (messages, next_seq, has_more). Raises FrameError if data is malformed.
+    """
+    try:
+        next_seq, pos = decode_varint(data, pos)
+        has_more = bool(data[pos])
+    except IndexError as e:
+        raise FrameError(f"Malformed page: {e}")
+    messages, _ = decode_messages(data, pos + 1)
+    return messages, next_seq, has_more
@@ -1,9 +1,14 @@
 import socket
-import struct
 import threading
+import asyncio
+import argparse
+import itertools
 import uuid
 import atexit
 import sys
+import bisect
+from collections import deque
+from protocol import FrameError, HEADER_SIZE, VERSION_SIZE, SUCCESS, encode_counts, encode_messages, encode_page, encode_users, pack_frame, recv_exact, recv_frame, send_frame, unpack_header
 
 # Get HOST and SERVER_PORT from CLI if file ran from terminal. 
 # Otherwise use the default values (so that functions run for tests)
@@ -24,15 +29,26 @@ else:
     HOST = "0.0.0.0"
     SERVER_PORT = 5001
 
-VERSION = "1.0.0"
+VERSION = "3.1.0"
+MAX_PAGE_SIZE = 1000 # most messages returned by one paged receive request
+# "int": message IDs are numbered by the server, a few decimal digits on the wire;
+# "uuid": 36-character UUID strings, for clients that expect them (--id_format uuid)
+ID_FORMAT = "int"
+message_ids = itertools.count(1)
 
 # User data storage
 users = {}
 # Subscriber tracking for real-time delivery
 active_users = set()
 active_users_lock = threading.Lock()
-subscribers = {}
+subscribers = {} # {username: {"conn": ..., "cond": threading.Condition(), "queue": [], "wakeup": callable (async mode only)}}
 subscribers_lock = threading.Lock()
+active_connections = 0 # open connections in async mode
+# Per-user message index so mark-read, delete and the unread count do not scan the whole history.
+# {username: {"messages": indexed list, "size": int, "by_id": {str(id): msg}, "unread": {sender: deque([msg, ...])},
+#             "unread_by_contact": {sender: int}, "positions": {sender: [list index, ...]}}}
+message_index = {}
+message_index_lock = threading.RLock()
 
 def handle_exit():
     """
@@ -48,6 +64,7 @@ def handle_exit():
     """
     print("[INFO] Shutting down server gracefully...")
     users.clear()
+    message_index.clear()
     for conn in subscribers.values():
         try:
             conn.close()  # Ensure all connections are closed properly
@@ -59,6 +76,240 @@ def handle_exit():
 # Clear users automatically when the program terminates.
 atexit.register(handle_exit)
 
+def push_to_subscriber(username, msg):
+    """
+        Queue a message for a subscribed user and wake whoever delivers it
+
+        Params:
+
+            username: recipient of the push
+
+            msg: message dict {id, from, message, status} to push
+        Returns:
+
+            None
+    """
+    with subscribers_lock:
+        if username in subscribers:
+            sub = subscribers[username]
+            with sub["cond"]:
+                sub["queue"].append(msg)
+                sub["cond"].notify()
+            # In async mode the subscriber is a coroutine waiting on an event loop, not a thread
+            if "wakeup" in sub:
+                sub["wakeup"]()
+
+def index_message(index, msg):
+    """
+        Add one message to a user's message index
+
+        Params:
+
+            index: the user's entry in message_index
+
+            msg: message dict {id, from, message, status}
+        Returns:
+
+            None
+    """
+    index["positions"].setdefault(msg["from"], []).append(index["size"])
+    index["size"] += 1
+    index["by_id"][str(msg.get("id"))] = msg # keyed as the ID appears in delete requests
+    if msg["status"] == "unread":
+        index["unread"].setdefault(msg["from"], deque()).append(msg)
+        index["unread_by_contact"][msg["from"]] = index["unread_by_contact"].get(msg["from"], 0) + 1
+
+def get_message_index(username):
+    """
+        Return the message index of a user, rebuilding it if the user's message list
+        was replaced or appended to without going through add_message
+
+        Params:
+
+            username: user whose index is returned
+        Returns:
+
+            index: the user's entry in message_index
+    """
+    messages = users[username]["messages"]
+    index = message_index.get(username)
+    if index is None or index["messages"] is not messages or index["size"] != len(messages):
+        index = {"messages": messages, "size": 0, "by_id": {}, "unread": {}, "unread_by_contact": {}, "positions": {}}
+        for msg in messages:
+            index_message(index, msg)
+        # (seq of the change, message) for the latest change of every message, in seq order
+        index["changes"] = sorted(((message_updated(messages, i), messages[i]) for i in range(len(messages))), key=lambda c: c[0])
+        message_index[username] = index
+    return index
+
+def decrement_unread(index, contact, count):
+    """
+        Update a user's unread counters after count messages from contact stopped being unread
+
+        Params:
+
+            index: the user's entry in message_index
+
+            contact: sender of the messages
+
+            count: number of messages that are no longer unread
+        Returns:
+
+            None
+    """
+    remaining = index["unread_by_contact"].get(contact, 0) - count
+    if remaining > 0:
+        index["unread_by_contact"][contact] = remaining
+    else:
+        index["unread_by_contact"].pop(contact, None)
+
+def message_seq(messages, i):
+    """
+        Sequence number of the i-th message of a user. Messages stored before sequence numbers
+        were introduced have none; their position in the list stands in for it.
+
+        Params:
+
+            messages: the user's message list
+
+            i: index into messages
+        Returns:
+
+            seq: the message's sequence number
+    """
+    return messages[i].get("seq", i + 1)
+
+def message_updated(messages, i):
+    """
+        Sequence number of the latest change (arrival, read or delete) to the i-th message of a user
+
+        Params:
+
+            messages: the user's message list
+
+            i: index into messages
+        Returns:
+
+            seq: sequence number of the message's latest change
+    """
+    return messages[i].get("updated", message_seq(messages, i))
+
+def advance_seq(username):
+    """
+        Advance a user's mailbox sequence number. Every mutation of the mailbox takes the next one.
+
+        Params:
+
+            username: owner of the mailbox
+        Returns:
+
+            seq: the new sequence number
+    """
+    user = users[username]
+    if "seq" not in user:
+        messages = user["messages"]
+        user["seq"] = message_seq(messages, len(messages) - 1) if messages else 0
+    user["seq"] += 1
+    return user["seq"]
+
+def touch_message(username, index, msg):
+    """
+        Record a status change of a message so that it is returned by the next sync.
+        The caller holds message_index_lock.
+
+        Params:
+
+            username: owner of the message
+
+            index: the user's entry in message_index
+
+            msg: the message whose status changed
+        Returns:
+
+            None
+    """
+    msg["updated"] = advance_seq(username)
+    index["changes"].append((msg["updated"], msg))
+
+def add_message(username, msg):
+    """
+        Give a message the user's next sequence number, append it to the user's history and index it
+
+        Params:
+
+            username: recipient of the message
+
+            msg: message dict {id, from, message, status}
+        Returns:
+
+            None
+    """
+    with message_index_lock:
+        index = get_message_index(username)
+        msg["seq"] = advance_seq(username)
+        users[username]["messages"].append(msg)
+        index_message(index, msg)
+        index["changes"].append((msg["seq"], msg))
+
+def page_messages(username, after_seq=0, limit=0, contact=""):
+    """
+        Select the messages of a user with a sequence number above a cursor
+
+        Params:
+
+            username: user whose messages are returned
+
+            after_seq: only messages with a higher sequence number are returned
+
+            limit: most messages to return (capped at MAX_PAGE_SIZE); 0 returns all of them
+
+            contact: if not empty, only messages from this contact are returned
+        Returns:
+
+            (page, next_seq, has_more): the messages (each with its "seq"), the cursor for the next request,
+            and whether more messages remain after this page
+    """
+    with message_index_lock:
+        index = get_message_index(username)
+        messages = users[username]["messages"]
+        # List indexes of the candidate messages, in sequence order
+        candidates = index["positions"].get(contact, []) if contact else range(len(messages))
+        start = bisect.bisect_right(candidates, after_seq, key=lambda i: message_seq(messages, i))
+        end = len(candidates) if limit == 0 else min(len(candidates), start + min(limit, MAX_PAGE_SIZE))
+        page = [dict(messages[i], seq=message_seq(messages, i)) for i in candidates[start:end]]
+    next_seq = page[-1]["seq"] if page else after_seq
+    return page, next_seq, end < len(candidates)
+
+def sync_since(username, since_seq=0, limit=0):
+    """
+        Select the changes to a user's mailbox after a sequence number: new messages and
+        messages that were read or deleted since. Each message is returned once, in its latest state.
+
+        Params:
+
+            username: owner of the mailbox
+
+            since_seq: only changes with a higher sequence number are returned
+
+            limit: most messages to return (capped at MAX_PAGE_SIZE); 0 returns all of them
+        Returns:
+
+            (changes, next_seq, has_more): the changed messages (each with its "updated" sequence number),
+            the cursor for the next request, and whether more changes remain
+    """
+    with message_index_lock:
+        changes = get_message_index(username)["changes"]
+        i = bisect.bisect_right(changes, since_seq, key=lambda c: c[0])
+        delta = []
+        next_seq = since_seq
+        while i < len(changes) and (limit == 0 or len(delta) < min(limit, MAX_PAGE_SIZE)):
+            seq, msg = changes[i]
+            i += 1
+            next_seq = seq
+            if msg.get("updated", seq) == seq: # older entries of a message were superseded by a later change
+                delta.append(dict(msg, updated=seq))
+    return delta, next_seq, i < len(changes)
+
 def handle_register(msg_data):
     """
         Handle a registration request
@@ -87,7 +338,7 @@ def handle_login(msg_data):
             msg_data: data from client containing username and password separated by '|'.
         Returns:
 
-            response: string for status of login
+            response: error string, or "success:" followed by the number of unread messages per contact (protocol.encode_counts)
     """
     username, password = msg_data.split('|')
     if username in users and users[username]["password"] == password and not users[username].get("deleted", False):
@@ -97,8 +348,9 @@ def handle_login(msg_data):
                 return response
             else:
                 active_users.add(username)
-        unread_messages = sum(1 for m in users[username]["messages"] if m["status"] == "unread")
-        response = f"success: Logged in. Unread messages: {unread_messages}"
+        # The per-contact breakdown lets the client label conversations without downloading every message
+        with message_index_lock:
+            response = SUCCESS + encode_counts(get_message_index(username)["unread_by_contact"])
     else:
         response = "error: Invalid username or password"
     return response
@@ -112,10 +364,24 @@ def handle_list_users():
             None
         Returns:
 
-            response: string of list of active users
+            response: "success:" followed by the active usernames (protocol.encode_users)
     """
-    active_users_list = str([u for u, data in users.items() if not data.get("deleted", False)])
-    return active_users_list
+    return SUCCESS + encode_users([u for u, data in users.items() if not data.get("deleted", False)])
+
+def new_message_id():
+    """
+        Assign the ID of a new message
+
+        Params:
+
+            None
+        Returns:
+
+            message_id: the next number, or a UUID string if ID_FORMAT is "uuid"
+    """
+    if ID_FORMAT == "uuid":
+        return str(uuid.uuid4())
+    return next(message_ids)
 
 def handle_send(msg_data):
     """
@@ -133,20 +399,15 @@ def handle_send(msg_data):
         if users[recipient].get("deleted", False):
           response = f"error: User no longer exists."
         else:
-          msg = {"id": str(uuid.uuid4()), "from": sender, "message": message, "status": "unread"}
-          users[recipient]["messages"].append(msg)
-          with subscribers_lock:
-              if recipient in subscribers:
-                  sub = subscribers[recipient]
-                  with sub["cond"]:
-                      sub["queue"].append(msg)
-                      sub["cond"].notify()
+          msg = {"id": new_message_id(), "from": sender, "message": message, "status": "unread"}
+          add_message(recipient, msg)
+          push_to_subscriber(recipient, msg)
           response = f"success:{str(msg['id'])}"
     else:
         response = "error: Recipient not found"
     return response
 
-def handle_subscribe(conn, addr, msg_data):
+def handle_subscribe(conn, addr, msg_data, request_id=0):
     """
         Handles a user's subscription request.
 
@@ -158,6 +419,8 @@ def handle_subscribe(conn, addr, msg_data):
 
             msg_data: data from client containing the username of the subscribing client.
 
+            request_id: request ID of the subscribe request, used to tag every pushed message.
+
         Returns:
 
             None
@@ -165,7 +428,7 @@ def handle_subscribe(conn, addr, msg_data):
     username = msg_data
     if username not in users:
         try:
-            conn.send("error: User not found.".encode())
+            send_frame(conn, 5, "error: User not found.", request_id)
         except Exception as e:
             print(f"[ERROR] Error sending data to {addr}: {e}")
         return
@@ -182,8 +445,8 @@ def handle_subscribe(conn, addr, msg_data):
             msg = subscribers[username]["queue"].pop(0)
 
         try:
-            conn.send(f"success:{str(msg)}".encode())
-        except Exception:
+            send_frame(conn, 5, SUCCESS + encode_messages([msg]), request_id)
+        except Exception as e:
             print(f"[ERROR] Error sending data to {addr}: {e}")
             break
     
@@ -207,12 +470,19 @@ def handle_mark_read(msg_data):
     read_batch_num = int(read_batch_num) # if 0, that means mark read for all unreads (no batching)
     if username in users:
         count = 0
-        for msg in users[username]["messages"]:
-            if msg["from"] == contact and msg["status"] == "unread" and (count < read_batch_num or read_batch_num == 0):
+        with message_index_lock:
+            index = get_message_index(username)
+            queue = index["unread"].get(contact)
+            while queue and (count < read_batch_num or read_batch_num == 0):
+                msg = queue.popleft()
+                if msg["status"] != "unread":
+                    continue # deleted after it was queued
                 msg["status"] = "read"
+                touch_message(username, index, msg)
                 count += 1
-            if read_batch_num != 0 and count == read_batch_num:
-                break
+            if queue is not None and not queue:
+                del index["unread"][contact]
+            decrement_unread(index, contact, count)
         response = f"success: Marked {count} messages as read."
     else:
         response = "error: User not found."
@@ -231,20 +501,19 @@ def handle_delete_unread_message(msg_data):
     """
     sender, recipient, msg_id = msg_data.split('|')
     if recipient in users:
-        found = False
-        for msg in users[recipient]["messages"]:
-            if msg["id"] == msg_id and msg["from"] == sender and msg["status"] == "unread":
+        with message_index_lock:
+            index = get_message_index(recipient)
+            msg = index["by_id"].get(msg_id)
+            found = msg is not None and msg["from"] == sender and msg["status"] == "unread"
+            if found:
+                # Left in its unread queue; mark-read skips messages that are no longer unread
                 msg["status"] = "deleted"
-                found = True
-                response = "success: Message deleted."
-                with subscribers_lock:
-                    if recipient in subscribers:
-                        sub = subscribers[recipient]
-                        with sub["cond"]:
-                            sub["queue"].append({"id": msg_id, "from": sender, "message": "", "status": "deleted"})
-                            sub["cond"].notify()
-                break
-        if not found:
+                touch_message(recipient, index, msg)
+                decrement_unread(index, sender, 1)
+        if found:
+            response = "success: Message deleted."
+            push_to_subscriber(recipient, {"id": msg["id"], "from": sender, "message": "", "status": "deleted"})
+        else:
             response = "error: Message not found or already read."
     else:
         response = "error: Recipient not found."
@@ -256,15 +525,43 @@ def handle_receive_messages(msg_data):
 
         Params:
 
-            msg_data: data from client containing username
+            msg_data: data from client containing username, optionally followed by after_seq, limit and contact
+                separated by '|'. With only a username the whole history is returned.
         Returns:
 
-            response: string for status of receiving messages. If success, it also contains the list of messages
+            response: error string, or "success:" followed by the list of messages (protocol.encode_messages),
+                or for a paged request by the page (protocol.encode_page)
     """
-    username = msg_data
+    parts = msg_data.split('|')
+    username = parts[0]
+    if username in users:
+        if len(parts) == 1:
+            response = SUCCESS + encode_messages(users[username]["messages"])
+        else:
+            after_seq, limit = int(parts[1]), int(parts[2])
+            contact = parts[3] if len(parts) > 3 else ""
+            page, next_seq, has_more = page_messages(username, after_seq, limit, contact)
+            response = SUCCESS + encode_page(page, next_seq, has_more)
+    else:
+        response = "error: User not found."
+    return response
+
+def handle_sync(msg_data):
+    """
+        Handle a sync request
+
+        Params:
+
+            msg_data: data from client containing username, since_seq and limit separated by '|'
+        Returns:
+
+            response: error string, or "success:" followed by the changed messages, the cursor and
+                whether more remain (protocol.encode_page)
+    """
+    username, since_seq, limit = msg_data.split('|')
     if username in users:
-        messages = str(users[username]["messages"])
-        response = f"success:{messages}"
+        changes, next_seq, has_more = sync_since(username, int(since_seq), int(limit))
+        response = SUCCESS + encode_page(changes, next_seq, has_more)
     else:
         response = "error: User not found."
     return response
@@ -284,8 +581,9 @@ def handle_delete_account(msg_data):
     if username in users and not users[username].get("deleted", False):
         users[username]["deleted"] = True
         with subscribers_lock:
-            if username in subscribers:
-                del subscribers[username]
+            sub = subscribers.pop(username, None)
+        if sub is not None and "wakeup" in sub:
+            sub["wakeup"]() # let an async subscription notice it was removed
         response = f"success: Your account '{username}' was deleted."
     else:
         response = f"error: User not found or already deleted."
@@ -311,6 +609,41 @@ def handle_logout(msg_data):
             response = "error: Failed to log out. Username does not exist in active users."
     return response
 
+def dispatch_request(msg_type, msg_data):
+    """
+        Run the handler for a (non-subscribe) request type
+
+        Params:
+
+            msg_type: integer that corresponds to a specific request
+
+            msg_data: decoded payload of the request
+        Returns:
+
+            response: str or bytes response to send back to the client
+    """
+    if msg_type == 1:  # Register
+        return handle_register(msg_data)
+    elif msg_type == 2:  # Login
+        return handle_login(msg_data)
+    elif msg_type == 3:  # List Users
+        return handle_list_users()
+    elif msg_type == 4:  # Send Message
+        return handle_send(msg_data)
+    elif msg_type == 6:  # Mark Read
+        return handle_mark_read(msg_data)
+    elif msg_type == 7:  # Delete Unread Message
+        return handle_delete_unread_message(msg_data)
+    elif msg_type == 8:  # Receive Messages
+        return handle_receive_messages(msg_data)
+    elif msg_type == 9: # Delete account
+        return handle_delete_account(msg_data)
+    elif msg_type == 10: # Logout
+        return handle_logout(msg_data)
+    elif msg_type == 11: # Sync
+        return handle_sync(msg_data)
+    return "Unknown request type"
+
 def handle_client(conn, addr):
     """
         Handle communication with connected client
@@ -326,7 +659,7 @@ def handle_client(conn, addr):
     print(f"[NEW CONNECTION] {addr} connected.")
     try:
         # Expect the client to send its version number first
-        client_version_data = conn.recv(32)
+        client_version_data = recv_exact(conn, VERSION_SIZE)
         if not client_version_data:
             return 
         client_version = client_version_data.decode("utf-8").strip()
@@ -341,58 +674,30 @@ def handle_client(conn, addr):
 
         while True:
             try:
-                request_type_data = conn.recv(4)
-                if not request_type_data:
-                    return
-                
+                # Read one whole frame (header + payload) so large or segmented payloads are never truncated
                 try:
-                    msg_type = struct.unpack("!I", request_type_data)[0]
-                except struct.error as e:
-                    # send error message to the client
-                    conn.send("error: Invalid message format".encode())
-                    continue
+                    frame = recv_frame(conn)
+                except FrameError as e:
+                    # The stream can no longer be trusted to be aligned on a frame boundary
+                    print(f"[ERROR] {e} from {addr}")
+                    send_frame(conn, 0, "error: Invalid message format")
+                    break
+                if frame is None:
+                    break
+                msg_type, request_id, payload = frame
                 print('MSG_TYPE', msg_type)
-                msg_data = conn.recv(4096).decode()
-
-                if msg_type == 1:  # Register
-                    response = handle_register(msg_data)
-                    
-                elif msg_type == 2:  # Login
-                    response = handle_login(msg_data)
-                
-                elif msg_type == 3:  # List Users
-                    response = handle_list_users()
-                
-                elif msg_type == 4:  # Send Message
-                    response = handle_send(msg_data)
-                
-                elif msg_type == 5:  # Subscribe
-                    handle_subscribe(conn, addr, msg_data)
+                msg_data = payload.decode()
+
+                if msg_type == 5:  # Subscribe
+                    handle_subscribe(conn, addr, msg_data, request_id)
                     break # Exit from handling subscription
-                
-                elif msg_type == 6:  # Mark Read
-                    response = handle_mark_read(msg_data)
-                
-                elif msg_type == 7:  # Delete Unread Message
-                    response = handle_delete_unread_message(msg_data)
-
-                elif msg_type == 8:  # Receive Messages
-                    response = handle_receive_messages(msg_data)
-                    
-                elif msg_type == 9: # Delete account
-                    response = handle_delete_account(msg_data)
-
-                elif msg_type == 10: # Logout
-                    response = handle_logout(msg_data)
-
-                else:
-                    response = "Unknown request type"
-                
-                if msg_type != 5: # not subscribe
-                    try:
-                        conn.send(response.encode())
-                    except Exception as e:
-                        print(f"[ERROR] Error sending data to {addr}: {e}")
+
+                response = dispatch_request(msg_type, msg_data)
+                try:
+                    # Echo the request ID so a client with several requests in flight can match the response
+                    send_frame(conn, msg_type, response, request_id)
+                except Exception as e:
+                    print(f"[ERROR] Error sending data to {addr}: {e}")
             except Exception as e:
                 print(f"[ERROR] {e} during client {addr} communication.")
                 break
@@ -402,6 +707,156 @@ def handle_client(conn, addr):
     conn.close()
     print(f"[DISCONNECTED] {addr} disconnected.")
 
+async def handle_subscribe_async(reader, writer, addr, msg_data, request_id):
+    """
+        Handles a user's subscription request on the event loop.
+
+        Instead of parking a thread on a condition variable, the subscription waits on an
+        asyncio.Event that push_to_subscriber sets, and stops when the client disconnects.
+
+        Params:
+
+            reader: asyncio.StreamReader of the client connection
+
+            writer: asyncio.StreamWriter of the client connection
+
+            addr: Address of client
+
+            msg_data: data from client containing the username of the subscribing client.
+
+            request_id: request ID of the subscribe request, used to tag every pushed message.
+
+        Returns:
+
+            None
+    """
+    username = msg_data
+    if username not in users:
+        writer.write(pack_frame(5, "error: User not found.", request_id))
+        await writer.drain()
+        return
+
+    loop = asyncio.get_running_loop()
+    event = asyncio.Event()
+    sub = {"conn": writer, "cond": threading.Condition(), "queue": [],
+           "wakeup": lambda: loop.call_soon_threadsafe(event.set)}
+    with subscribers_lock:
+        subscribers[username] = sub
+
+    # Completes when the client closes the subscription connection
+    disconnected = asyncio.ensure_future(reader.read(1))
+    try:
+        while True:
+            waiter = asyncio.ensure_future(event.wait())
+            await asyncio.wait([waiter, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            if not waiter.done():
+                waiter.cancel()
+                break
+            event.clear()
+            if subscribers.get(username) is not sub:
+                break # account deleted or replaced by a newer subscription
+            with sub["cond"]:
+                pending, sub["queue"] = sub["queue"], []
+            for msg in pending:
+                writer.write(pack_frame(5, SUCCESS + encode_messages([msg]), request_id))
+            await writer.drain()
+            if disconnected.done():
+                break
+    except Exception as e:
+        print(f"[ERROR] Error sending data to {addr}: {e}")
+    finally:
+        disconnected.cancel()
+        with subscribers_lock:
+            if subscribers.get(username) is sub:
+                del subscribers[username]
+
+async def handle_client_async(reader, writer):
+    """
+        Handle communication with a connected client on the event loop
+
+        Params:
+
+            reader: asyncio.StreamReader of the client connection
+
+            writer: asyncio.StreamWriter of the client connection
+        Returns:
+
+            None
+    """
+    global active_connections
+    addr = writer.get_extra_info("peername")
+    active_connections += 1
+    print(f"[NEW CONNECTION] {addr} connected. [ACTIVE CONNECTIONS] {active_connections}")
+    try:
+        # Expect the client to send its version number first
+        client_version = (await reader.readexactly(VERSION_SIZE)).decode("utf-8").strip()
+        if client_version != VERSION:
+            writer.write(f"error: Version mismatch. Server: {VERSION}, Client: {client_version}".encode())
+            await writer.drain()
+            print(f"[DISCONNECTED] {addr} due to version mismatch")
+            return
+        writer.write("success: Version matched".encode())
+        await writer.drain()
+
+        while True:
+            try:
+                msg_type, request_id, length = unpack_header(await reader.readexactly(HEADER_SIZE))
+            except FrameError as e:
+                print(f"[ERROR] {e} from {addr}")
+                writer.write(pack_frame(0, "error: Invalid message format"))
+                await writer.drain()
+                break
+            msg_data = (await reader.readexactly(length)).decode()
+
+            if msg_type == 5:  # Subscribe
+                await handle_subscribe_async(reader, writer, addr, msg_data, request_id)
+                break # Exit from handling subscription
+
+            response = dispatch_request(msg_type, msg_data)
+            writer.write(pack_frame(msg_type, response, request_id))
+            await writer.drain()
+    except asyncio.IncompleteReadError:
+        pass # client closed the connection
+    except Exception as e:
+        print(f"[ERROR] {e} during client {addr} communication.")
+    finally:
+        active_connections -= 1
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+        print(f"[DISCONNECTED] {addr} disconnected.")
+
+async def serve_async():
+    """
+        Accept and serve every client connection from a single asyncio event loop
+
+        Params:
+
+            None
+        Returns:
+
+            None
+    """
+    server = await asyncio.start_server(handle_client_async, HOST, SERVER_PORT, backlog=1024)
+    print(f"[SERVER STARTED] Listening on port {SERVER_PORT} (async mode)...")
+    async with server:
+        await server.serve_forever()
+
+def start_async_server():
+    """
+        Start server in async mode: one thread and one event loop for all connections and subscriptions
+
+        Params:
+
+            None
+        Returns:
+
+            None
+    """
+    asyncio.run(serve_async())
+
 def start_server():
     """
         Start server
@@ -415,6 +870,7 @@ def start_server():
     """
 
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server.bind((HOST, SERVER_PORT))
     server.listen(5)
     print(f"[SERVER STARTED] Listening on port {SERVER_PORT}...")
@@ -425,4 +881,17 @@ def start_server():
         print(f"[ACTIVE CONNECTIONS] {threading.active_count() - 1}")
 
 if __name__ == "__main__":
-    start_server()
+    parser = argparse.ArgumentParser(description="Start the custom wire protocol chat server.")
+    parser.add_argument("--mode", choices=["threaded", "async"], default="threaded",
+                        help="threaded: one thread per connection; async: all connections on one asyncio event loop")
+    parser.add_argument("--port", type=int, help="Override the server port")
+    parser.add_argument("--id_format", choices=["int", "uuid"], default="int",
+                        help="int: message IDs numbered by the server; uuid: UUID strings, for clients that expect them")
+    args = parser.parse_args()
+    ID_FORMAT = args.id_format
+    if args.port is not None:
+        SERVER_PORT = args.port
+    if args.mode == "async":
+        start_async_server()
+    else:
+        start_server()
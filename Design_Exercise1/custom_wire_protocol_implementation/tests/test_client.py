@@ -10,7 +10,8 @@ import client  # Adjust based on what you need to test
 import unittest
 from unittest.mock import MagicMock, patch
 import socket
-import struct
+import threading
+from protocol import HEADER_SIZE, SUCCESS, encode_counts, encode_page, encode_users, pack_frame, recv_frame
 
 class TestSendRequest(unittest.TestCase):
     def test_add_message(self):
@@ -31,6 +32,15 @@ class TestSendRequest(unittest.TestCase):
       client.add_message(contact, updated_msg)
       assert client.conversations[contact][0] == updated_msg
 
+    def test_add_message_conversation_replaced(self):
+      """
+      Test add_message still updates in place after the conversation list was replaced directly
+      """
+      client.add_message("test_user", {"id": 1, "from": "test_user", "message": "a", "status": "unread"})
+      client.conversations["test_user"] = [{"id": 2, "from": "test_user", "message": "b", "status": "unread"}]
+      client.add_message("test_user", {"id": 2, "from": "test_user", "message": "b", "status": "read"})
+      assert client.conversations["test_user"] == [{"id": 2, "from": "test_user", "message": "b", "status": "read"}]
+
     @patch("socket.socket")
     def test_check_version_number_matched(self, mock_socket):
       """
@@ -103,30 +113,114 @@ class TestSendRequest(unittest.TestCase):
         mock_conn.send.assert_called_once()
         mock_conn.close.assert_not_called()
 
+    def start_fake_server(self, handler):
+      """
+      Return the client end of a socket pair whose other end is served by handler(msg_type, request_id, payload) -> list of frames
+      """
+      client_sock, server_sock = socket.socketpair()
+      def serve():
+        while True:
+          frame = recv_frame(server_sock)
+          if frame is None:
+            break
+          for out in handler(*frame):
+            server_sock.sendall(out)
+        server_sock.close()
+      threading.Thread(target=serve, daemon=True).start()
+      return client_sock
+
     @patch("client.check_version_number")
     @patch("tkinter.messagebox.showerror")
     def test_send_request_success(self, mock_messagebox, mock_check_version_number):
         """
         Test send_request function during succes
         """
-        # Mock socket instance
-        mock_socket = MagicMock()
-        mock_check_version_number.return_value = mock_socket
+        client.connection = None
+        mock_check_version_number.return_value = self.start_fake_server(
+            lambda msg_type, request_id, payload: [pack_frame(msg_type, b"response:" + payload, request_id)])
         
-        # Simulated response from the server
-        mock_socket.recv.return_value = b'response'
+        response = client.send_request(2, "empty")
         
-        # Call function
-        request_type = 2
-        data = "empty"
-        message = struct.pack("!I", request_type) + data.encode()
-        response = client.send_request(request_type, data)
-        
-        # Assertions
-        mock_socket.send.assert_called_once_with(message)
-        mock_socket.recv.assert_called_once()
-        mock_socket.close.assert_called_once()
-        self.assertEqual(response, 'response')
+        self.assertEqual(response, 'response:empty')
+        mock_messagebox.assert_not_called()
+        client.connection.close()
+
+    @patch("client.check_version_number")
+    @patch("tkinter.messagebox.showerror")
+    def test_send_request_reuses_connection(self, mock_messagebox, mock_check_version_number):
+        """
+        Test that consecutive requests share one connection and one version handshake
+        """
+        client.connection = None
+        mock_check_version_number.return_value = self.start_fake_server(
+            lambda msg_type, request_id, payload: [pack_frame(msg_type, payload, request_id)])
+
+        self.assertEqual(client.send_request(4, "a|b|one"), "a|b|one")
+        self.assertEqual(client.send_request(6, "a|b|0"), "a|b|0")
+        self.assertEqual(client.send_request(8, "a"), "a")
+
+        mock_check_version_number.assert_called_once()
+        client.connection.close()
+
+    @patch("client.check_version_number")
+    @patch("tkinter.messagebox.showerror")
+    def test_send_request_large_segmented_response(self, mock_messagebox, mock_check_version_number):
+        """
+        Test send_request function when a response larger than 4096 bytes arrives in several segments
+        """
+        client.connection = None
+        payload = SUCCESS + encode_page([{"id": 1, "from": "bob", "message": "x" * 10000, "status": "unread"}], 1, False)
+        def handler(msg_type, request_id, data):
+            frame = pack_frame(msg_type, payload, request_id)
+            # Split the frame at arbitrary points, including inside the header
+            return [frame[:3], frame[3:HEADER_SIZE], frame[HEADER_SIZE:5000], frame[5000:]]
+        mock_check_version_number.return_value = self.start_fake_server(handler)
+
+        response = client.send_request(8, "test_user")
+
+        self.assertEqual(response, payload)
+        mock_messagebox.assert_not_called()
+        client.connection.close()
+
+    @patch("client.check_version_number")
+    @patch("tkinter.messagebox.showerror")
+    def test_send_requests_pipelined_out_of_order(self, mock_messagebox, mock_check_version_number):
+        """
+        Test that pipelined responses are matched to their requests by request ID, even when they arrive out of order
+        """
+        client.connection = None
+        held = []
+        def handler(msg_type, request_id, payload):
+            # Hold every response until the third request arrives, then answer in reverse order
+            held.append(pack_frame(msg_type, b"reply-" + payload, request_id))
+            if len(held) < 3:
+                return []
+            return list(reversed(held))
+        mock_check_version_number.return_value = self.start_fake_server(handler)
+
+        responses = client.send_requests([(4, "first"), (6, "second"), (8, "third")])
+
+        self.assertEqual(responses, ["reply-first", "reply-second", "reply-third"])
+        mock_check_version_number.assert_called_once()
+        client.connection.close()
+
+    def test_wait_timeout_forgets_request(self):
+        """
+        Test that a request that timed out is removed from the pending map and its late response is dropped
+        """
+        replies = []
+        conn = client.ServerConnection(self.start_fake_server(lambda msg_type, request_id, payload: replies.pop(0)))
+        replies.append([])
+        slot = conn.submit(4, "slow")
+        with self.assertRaises(TimeoutError):
+            conn.wait(slot, timeout=0.05)
+        self.assertEqual(conn.pending, {})
+
+        # the late response to the first request is dropped, the next request still gets its own
+        replies.append([pack_frame(4, b"late", slot["request_id"]), pack_frame(6, b"on time", slot["request_id"] + 1)])
+        self.assertEqual(conn.request(6, "next"), "on time")
+        self.assertIsNone(slot["response"])
+        conn.close()
 
     @patch("client.check_version_number")
     @patch("tkinter.messagebox.showerror")
@@ -134,47 +228,53 @@ class TestSendRequest(unittest.TestCase):
         """
         Test send_request function when client fails to send
         """
+        client.connection = None
         # Mock socket instance
         mock_socket = MagicMock()
+        # The reader thread blocks in recv until the test is done
+        release = threading.Event()
+        mock_socket.recv.side_effect = lambda size: release.wait(5) and b""
         mock_check_version_number.return_value = mock_socket
         
         # Simulate send failure
-        mock_socket.send.side_effect = Exception("Send failed")
+        mock_socket.sendall.side_effect = Exception("Send failed")
         
         # Call the function
         response = client.send_request(1, "Test Data")
         
         # Assert that the function returns None (since the connection failed)
         self.assertIsNone(response)
-        mock_socket.send.assert_called_once()
-        mock_socket.close.assert_not_called()
+        mock_socket.sendall.assert_called_once()
+        mock_messagebox.assert_called_once()
+        self.assertTrue(client.connection.closed)
+        release.set()
 
     @patch("client.check_version_number")
     @patch("tkinter.messagebox.showerror")
-    def test_send_request_close_error(self, mock_messagebox, mock_check_version_number):
+    def test_send_request_reconnects_after_connection_lost(self, mock_messagebox, mock_check_version_number):
         """
-        Test send_request function when client fails to close
+        Test that a request fails when the server drops the connection, and the next request reconnects
         """
-        # Mock socket instance
-        mock_socket = MagicMock()
-        mock_check_version_number.return_value = mock_socket
-        
-        # Simulate send failure
-        mock_socket.close.side_effect = Exception("Close failed")
-        
-        # Call the function
-        response = client.send_request(1, "Test Data")
-        
-        # Assert that the function returns None (since the connection failed)
-        self.assertIsNone(response)
-        mock_socket.send.assert_called_once()
-        mock_socket.close.assert_called_once()
+        client.connection = None
+        dropped_sock, server_sock = socket.socketpair()
+        server_sock.close()
+        mock_check_version_number.side_effect = [
+            dropped_sock,
+            self.start_fake_server(lambda msg_type, request_id, payload: [pack_frame(msg_type, payload, request_id)]),
+        ]
+
+        self.assertIsNone(client.send_request(1, "Test Data"))
+        mock_messagebox.assert_called_once()
+        self.assertEqual(client.send_request(1, "Test Data"), "Test Data")
+        self.assertEqual(mock_check_version_number.call_count, 2)
+        client.connection.close()
 
     @patch("client.check_version_number")
     def test_send_request_check_version_error(self, mock_check_version_number):
         """
         Test send_request function when something fails in check_version_number
         """
+        client.connection = None
         mock_check_version_number.return_value = None
     
         # Call function and expect None due to error
@@ -182,6 +282,17 @@ class TestSendRequest(unittest.TestCase):
         
         self.assertIsNone(response)
 
+    @patch('client.send_request')
+    def test_list_users(self, mock_send_request):
+        """
+        Test that list_users decodes the binary user list and returns [] when the server cannot be reached
+        """
+        mock_send_request.return_value = SUCCESS + encode_users(["alice", "bob"])
+        self.assertEqual(client.list_users(), ["alice", "bob"])
+        mock_send_request.assert_called_once_with(3, "empty")
+        mock_send_request.return_value = None
+        self.assertEqual(client.list_users(), [])
+
     @patch('client.send_request')  # Mock send_request to control the response
     @patch('client.add_message')  # Mock add_message to ensure it is called
     @patch('client.update_conversation_list')  # Mock update_conversation_list to ensure it is called
@@ -191,18 +302,22 @@ class TestSendRequest(unittest.TestCase):
         Test load_conversations function when it is a success
         """
         # Mock the send_request to return a successful response with valid messages
-        mock_send_request.return_value = "success:[{'from': 'user1', 'message': 'Hello'}, {'from': 'user2', 'message': 'Hi'}]"
+        hello = {'id': 1, 'from': 'user1', 'message': 'Hello', 'status': 'unread'}
+        hi = {'id': 2, 'from': 'user2', 'message': 'Hi', 'status': 'read'}
+        mock_send_request.return_value = SUCCESS + encode_page([hello, hi], 2, False)
 
         # Call the function
         client.current_user = "test_user"
+        client.received_seq = 0
         client.load_conversations()
 
         # Ensure that send_request was called with the correct arguments
-        mock_send_request.assert_called_once_with(8, "test_user")  # assuming current_user = "test_user"
+        mock_send_request.assert_called_once_with(8, f"test_user|0|{client.RECEIVE_PAGE_SIZE}")  # assuming current_user = "test_user"
+        self.assertEqual(client.received_seq, 2)
 
         # Ensure add_message is called for each message
-        mock_add_message.assert_any_call('user1', {'from': 'user1', 'message': 'Hello'})
-        mock_add_message.assert_any_call('user2', {'from': 'user2', 'message': 'Hi'})
+        mock_add_message.assert_any_call('user1', hello)
+        mock_add_message.assert_any_call('user2', hi)
 
         # Ensure update_conversation_list is called
         mock_update_conversation_list.assert_called_once()
@@ -210,6 +325,45 @@ class TestSendRequest(unittest.TestCase):
         # Ensure that messagebox.showerror is NOT called
         mock_showerror.assert_not_called()
 
+    @patch('client.send_request')
+    @patch('client.add_message')
+    @patch('client.update_conversation_list')
+    def test_load_conversations_pages_from_cursor(self, mock_update_conversation_list, mock_add_message, mock_send_request):
+        """
+        Test that load_conversations resumes from the last cursor and follows has_more across pages
+        """
+        mock_send_request.side_effect = [
+            SUCCESS + encode_page([{'id': 1, 'from': 'user1', 'message': 'a', 'status': 'unread', 'seq': 6}], 6, True),
+            SUCCESS + encode_page([{'id': 2, 'from': 'user1', 'message': 'b', 'status': 'unread', 'seq': 7}], 7, False),
+        ]
+        client.current_user = "test_user"
+        client.received_seq = 5
+        client.load_conversations()
+        self.assertEqual([c.args for c in mock_send_request.call_args_list],
+                         [(8, f"test_user|5|{client.RECEIVE_PAGE_SIZE}"), (8, f"test_user|6|{client.RECEIVE_PAGE_SIZE}")])
+        self.assertEqual(mock_add_message.call_count, 2)
+        self.assertEqual(client.received_seq, 7)
+        mock_update_conversation_list.assert_called_once()
+
+    @patch('client.send_request')
+    @patch('client.update_conversation_list')
+    def test_sync_conversations(self, mock_update_conversation_list, mock_send_request):
+        """
+        Test that sync_conversations applies new messages and status changes and advances the cursor
+        """
+        client.conversations = {"user1": [{"id": "a", "from": "user1", "message": "hi", "status": "unread"}]}
+        mock_send_request.return_value = SUCCESS + encode_page([{'id': 'a', 'from': 'user1', 'message': 'hi', 'status': 'read', 'updated': 8},
+                                                                {'id': 'b', 'from': 'user2', 'message': 'yo', 'status': 'unread', 'updated': 9}], 9, False)
+        client.current_user = "test_user"
+        client.received_seq = 7
+        client.sync_conversations()
+        mock_send_request.assert_called_once_with(11, f"test_user|7|{client.RECEIVE_PAGE_SIZE}")
+        self.assertEqual(client.conversations["user1"][0]["status"], "read")
+        self.assertEqual(len(client.conversations["user1"]), 1)
+        self.assertEqual(client.conversations["user2"][0]["message"], "yo")
+        self.assertEqual(client.received_seq, 9)
+        mock_update_conversation_list.assert_called_once()
+
     @patch('client.send_request')
     @patch('client.add_message')
     @patch('client.update_conversation_list')
@@ -223,10 +377,11 @@ class TestSendRequest(unittest.TestCase):
 
         # Call the function
         client.current_user = "test_user"
+        client.received_seq = 0
         client.load_conversations()
 
         # Ensure that send_request was called with the correct arguments
-        mock_send_request.assert_called_once_with(8, "test_user")
+        mock_send_request.assert_called_once_with(8, f"test_user|0|{client.RECEIVE_PAGE_SIZE}")
 
         # Ensure that add_message was never called (no messages)
         mock_add_message.assert_not_called()
@@ -237,6 +392,55 @@ class TestSendRequest(unittest.TestCase):
         # Ensure that messagebox.showerror is called
         mock_showerror.assert_called_once()
 
+    @patch('client.send_request')
+    @patch('client.load_conversations')
+    @patch('client.check_new_messages')
+    @patch('client.threading.Thread')
+    @patch('client.conversation_list')
+    @patch('client.chat_label')
+    @patch('client.chat_frame')
+    @patch('client.login_frame')
+    @patch('client.password_entry')
+    @patch('client.username_entry')
+    def test_login_lists_unread_counts(self, mock_username_entry, mock_password_entry, mock_login_frame, mock_chat_frame,
+                                       mock_chat_label, mock_conversation_list, mock_thread, mock_check_new_messages,
+                                       mock_load_conversations, mock_send_request):
+        """
+        Test that login decodes the per-contact unread counts and lists those contacts before their messages are loaded
+        """
+        mock_username_entry.get.return_value = "me"
+        mock_password_entry.get.return_value = "pw"
+        mock_send_request.return_value = SUCCESS + encode_counts({"alice": 2, "bob": 1})
+        client.conversations.clear()
+        client.conversations["bob"] = [{"id": 1, "from": "bob", "message": "hi", "status": "unread"}]
+
+        client.login()
+
+        self.assertEqual(client.current_user, "me")
+        self.assertEqual(client.unread_counts, {"alice": 2, "bob": 1})
+        inserted = [c.args[1] for c in mock_conversation_list.insert.call_args_list]
+        self.assertEqual(inserted, ["bob 🔴(1 unread)", "alice 🔴(2 unread)"])
+        mock_load_conversations.assert_called_once()
+        client.current_user = None
+        client.conversations.clear()
+        client.unread_counts = {}
+
+    @patch('client.send_request')
+    @patch('client.update_conversation_list')
+    def test_load_conversations_replaces_login_counts(self, mock_update_conversation_list, mock_send_request):
+        """
+        Test that the unread counts from login are dropped once every message is loaded
+        """
+        mock_send_request.return_value = SUCCESS + encode_page([], 0, False)
+        client.current_user = "test_user"
+        client.received_seq = 0
+        client.unread_counts = {"alice": 2}
+
+        client.load_conversations()
+
+        self.assertEqual(client.unread_counts, {})
+        mock_update_conversation_list.assert_called_once()
+
     @patch('client.conversation_list')  # Mock conversation_list
     def test_update_conversation_list_empty(self, mock_conversation_list):
         """
@@ -356,8 +560,8 @@ class TestSendRequest(unittest.TestCase):
         mock_update_conversation_list.assert_not_called()
 
     @patch('client.root.after')  # Mock the root.after method
-    @patch('client.load_conversations')  # Mock load_conversations to avoid actual network calls
-    def test_check_new_messages(self, mock_load_conversations, mock_after):
+    @patch('client.sync_conversations')  # Mock sync_conversations to avoid actual network calls
+    def test_check_new_messages(self, mock_sync_conversations, mock_after):
         """
         Test check_new_messages 
         """
@@ -367,8 +571,8 @@ class TestSendRequest(unittest.TestCase):
         # Call check_new_messages
         client.check_new_messages()
 
-        # Verify that load_conversations was called
-        mock_load_conversations.assert_called_once()
+        # Verify that sync_conversations was called
+        mock_sync_conversations.assert_called_once()
 
         # Verify that root.after was called with 5000 as the delay, simulating recursive behavior
         mock_after.assert_called_once_with(5000, client.check_new_messages)
@@ -0,0 +1,156 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import unittest
+import socket
+import struct
+import threading
+import protocol
+
+class TestFraming(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Create a connected pair of sockets for each test
+        """
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_round_trip(self):
+        """
+        Test that a frame sent with send_frame is read back unchanged by recv_frame
+        """
+        protocol.send_frame(self.left, 4, "sender|recipient|Hello", 42)
+        self.assertEqual(protocol.recv_frame(self.right), (4, 42, b"sender|recipient|Hello"))
+
+    def test_parse_message_id(self):
+        """
+        Test that numbered message IDs are read back as integers and UUIDs as strings
+        """
+        self.assertEqual(protocol.parse_message_id("42"), 42)
+        uuid_id = "0c9d5d0a-5f2e-4c1b-9a57-0c6a4b1f7e3d"
+        self.assertEqual(protocol.parse_message_id(uuid_id), uuid_id)
+
+    def test_empty_payload(self):
+        """
+        Test a frame with no payload
+        """
+        protocol.send_frame(self.left, 3, "")
+        self.assertEqual(protocol.recv_frame(self.right), (3, 0, b""))
+
+    def test_large_payload(self):
+        """
+        Test that payloads much larger than a single recv are read in full
+        """
+        payload = ("x" * 1000 + "|") * 300
+        sender = threading.Thread(target=protocol.send_frame, args=(self.left, 8, payload))
+        sender.start()
+        msg_type, _, data = protocol.recv_frame(self.right)
+        sender.join()
+        self.assertEqual(msg_type, 8)
+        self.assertEqual(data.decode(), payload)
+
+    def test_pipelined_frames(self):
+        """
+        Test that back-to-back frames sent in one write are split at the right boundaries
+        """
+        self.left.sendall(protocol.pack_frame(1, "a|b", 1) + protocol.pack_frame(2, "c|d", 2) + protocol.pack_frame(10, "e", 3))
+        self.assertEqual(protocol.recv_frame(self.right), (1, 1, b"a|b"))
+        self.assertEqual(protocol.recv_frame(self.right), (2, 2, b"c|d"))
+        self.assertEqual(protocol.recv_frame(self.right), (10, 3, b"e"))
+
+    def test_frame_split_across_writes(self):
+        """
+        Test that a frame arriving one byte at a time is reassembled
+        """
+        frame = protocol.pack_frame(6, "user|contact|0", 5)
+        for i in range(len(frame)):
+            self.left.send(frame[i:i + 1])
+        self.assertEqual(protocol.recv_frame(self.right), (6, 5, b"user|contact|0"))
+
+    def test_connection_closed(self):
+        """
+        Test that recv_frame returns None when the peer closes mid-frame
+        """
+        self.left.sendall(protocol.pack_frame(4, "hello")[:-2])
+        self.left.close()
+        self.assertIsNone(protocol.recv_frame(self.right))
+
+    def test_oversized_length_rejected(self):
+        """
+        Test that a header announcing a payload above MAX_PAYLOAD_SIZE raises FrameError
+        """
+        self.left.sendall(struct.pack(protocol.HEADER_FORMAT, 1, 0, protocol.MAX_PAYLOAD_SIZE + 1))
+        with self.assertRaises(protocol.FrameError):
+            protocol.recv_frame(self.right)
+
+class TestRecords(unittest.TestCase):
+
+    def test_varint(self):
+        """
+        Test that varints of one and several bytes round trip and report where they end
+        """
+        for n in [0, 1, 127, 128, 300, 2 ** 40]:
+            out = bytearray()
+            protocol.encode_varint(n, out)
+            self.assertEqual(protocol.decode_varint(bytes(out) + b"!", 0), (n, len(out)))
+        self.assertEqual(len(out), 6)
+
+    def test_users_round_trip(self):
+        """
+        Test that a list of usernames, including non-ASCII ones, is read back unchanged
+        """
+        users = ["alice", "bob", "ünïcödé", ""]
+        self.assertEqual(protocol.decode_users(protocol.encode_users(users)), users)
+        self.assertEqual(protocol.decode_users(protocol.encode_users([])), [])
+
+    def test_counts_round_trip(self):
+        """
+        Test that unread counts per contact are read back unchanged, from an offset
+        """
+        counts = {"alice": 2, "bøb": 300}
+        data = protocol.SUCCESS + protocol.encode_counts(counts)
+        self.assertEqual(protocol.decode_counts(data, len(protocol.SUCCESS)), counts)
+        self.assertEqual(protocol.decode_counts(protocol.encode_counts({})), {})
+        with self.assertRaises(protocol.FrameError):
+            protocol.decode_counts(protocol.encode_counts(counts)[:-1])
+
+    def test_messages_round_trip(self):
+        """
+        Test that messages with numbered and UUID IDs, with and without seq/updated, are read back unchanged
+        """
+        messages = [
+            {"id": 300, "from": "alice", "message": "Hello", "status": "unread"},
+            {"id": "0c9d5d0a-5f2e-4c1b-9a57-0c6a4b1f7e3d", "from": "bob", "message": "héllo | wörld", "status": "read", "seq": 7},
+            {"id": 2, "from": "carol", "message": "", "status": "deleted", "seq": 9, "updated": 12},
+        ]
+        data = bytes(protocol.encode_messages(messages))
+        self.assertEqual(protocol.decode_messages(data), (messages, len(data)))
+        # the numbered message costs 1 flag byte + 2 ID bytes + 6 sender bytes + 6 body bytes
+        self.assertEqual(len(protocol.encode_messages(messages[:1])), 1 + 1 + 2 + 6 + 6)
+
+    def test_page_round_trip(self):
+        """
+        Test that a page keeps its messages, cursor and has_more flag, read from an offset
+        """
+        page = [{"id": 1, "from": "alice", "message": "a", "status": "unread", "seq": 5}]
+        data = protocol.SUCCESS + protocol.encode_page(page, 5, True)
+        self.assertEqual(protocol.decode_page(data, len(protocol.SUCCESS)), (page, 5, True))
+        self.assertEqual(protocol.decode_page(protocol.encode_page([], 0, False)), ([], 0, False))
+
+    def test_truncated_records_rejected(self):
+        """
+        Test that cut-off records raise FrameError instead of returning partial data
+        """
+        data = protocol.encode_page([{"id": 1, "from": "alice", "message": "hello", "status": "read"}], 1, False)
+        for end in range(len(data)):
+            with self.assertRaises(protocol.FrameError):
+                protocol.decode_page(bytes(data[:end]))
+        with self.assertRaises(protocol.FrameError):
+            protocol.decode_users(b"\x01\x02\xff\xfe")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,18 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import unittest
 import threading
+import socket
+import asyncio
+import time
 import server  # Import your server module
+from protocol import VERSION_SIZE, SUCCESS, decode_counts, decode_messages, decode_page, decode_users, encode_counts, pack_frame, recv_frame
+
+def reply_page(response):
+    """
+    Decode a paged receive or sync reply into a dict {'messages'/'changes': [...], 'next_seq': int, 'has_more': bool}
+    """
+    messages, next_seq, has_more = decode_page(response, len(SUCCESS))
+    return {"messages": messages, "changes": messages, "next_seq": next_seq, "has_more": has_more}
 
 class TestServerHandlers(unittest.TestCase):
 
@@ -13,6 +24,7 @@ class TestServerHandlers(unittest.TestCase):
         """
         server.users.clear()
         server.subscribers.clear()
+        server.message_index.clear()
 
     def test_handle_register_success(self):
         """
@@ -38,7 +50,7 @@ class TestServerHandlers(unittest.TestCase):
         server.active_users = set(["testuser1"])
         server.active_users_lock = threading.Lock()
         response = server.handle_login("testuser|password123")
-        self.assertIn("success: Logged in", response)
+        self.assertEqual(response, SUCCESS + encode_counts({}))
         self.assertEqual(server.active_users, set(["testuser1", "testuser"]))
 
     def test_handle_login_already_logged_in(self):
@@ -71,7 +83,7 @@ class TestServerHandlers(unittest.TestCase):
         server.users["user2"] = {"password": "pass2", "messages": []}
         server.users["user3"] = {"password": "pass3", "messages": [], "deleted": True}
         response = server.handle_list_users()
-        self.assertEqual(response, "['user1', 'user2']")
+        self.assertEqual(decode_users(response, len(SUCCESS)), ["user1", "user2"])
 
     def test_handle_send_success(self):
         """
@@ -82,6 +94,30 @@ class TestServerHandlers(unittest.TestCase):
         response = server.handle_send("sender|recipient|Hello")
         self.assertTrue(response.startswith("success:"))
 
+    def test_handle_send_numbers_messages(self):
+        """
+        Test that handle_send returns increasing integer IDs that delete requests accept
+        """
+        server.users["recipient"] = {"password": "pass", "messages": []}
+        first = server.handle_send("sender|recipient|a").split(":", 1)[1]
+        second = server.handle_send("sender|recipient|b").split(":", 1)[1]
+        self.assertTrue(first.isdigit())
+        self.assertGreater(int(second), int(first))
+        self.assertEqual(server.users["recipient"]["messages"][0]["id"], int(first))
+        self.assertEqual(server.handle_delete_unread_message(f"sender|recipient|{first}"), "success: Message deleted.")
+
+    def test_handle_send_uuid_ids(self):
+        """
+        Test that handle_send returns UUID strings when ID_FORMAT is "uuid"
+        """
+        server.users["recipient"] = {"password": "pass", "messages": []}
+        server.ID_FORMAT = "uuid"
+        try:
+            response = server.handle_send("sender|recipient|a")
+        finally:
+            server.ID_FORMAT = "int"
+        self.assertEqual(len(response.split(":", 1)[1]), 36)
+
     def test_handle_send_nonexistent_recipient(self):
         """
         Test handle_send with nonexistent recipient
@@ -236,6 +272,57 @@ class TestServerHandlers(unittest.TestCase):
         response = server.handle_delete_unread_message("sender|recipient|123")
         self.assertEqual(response, "error: Recipient not found.")
 
+    def test_mark_read_skips_deleted_messages(self):
+        """
+        Test that a message deleted while queued as unread is not counted by mark read
+        """
+        server.users["sender"] = {"password": "pass", "messages": []}
+        server.users["recipient"] = {"password": "pass", "messages": []}
+        ids = [server.handle_send(f"sender|recipient|m{i}").split(":", 1)[1] for i in range(3)]
+        server.handle_delete_unread_message(f"sender|recipient|{ids[0]}")
+        response = server.handle_mark_read("recipient|sender|1")
+        self.assertEqual(response, "success: Marked 1 messages as read.")
+        self.assertEqual([m["status"] for m in server.users["recipient"]["messages"]], ["deleted", "read", "unread"])
+
+    def test_login_unread_count_uses_index(self):
+        """
+        Test that the unread count on login reflects sends, reads and deletes
+        """
+        server.users["sender"] = {"password": "pass", "messages": []}
+        server.users["recipient"] = {"password": "pass", "messages": []}
+        ids = [server.handle_send(f"sender|recipient|m{i}").split(":", 1)[1] for i in range(4)]
+        server.handle_mark_read("recipient|sender|1")
+        server.handle_delete_unread_message(f"sender|recipient|{ids[3]}")
+        response = server.handle_login("recipient|pass")
+        self.assertEqual(decode_counts(response, len(SUCCESS)), {"sender": 2})
+        server.active_users.discard("recipient")
+
+    def test_login_unread_by_contact(self):
+        """
+        Test that login returns unread counts per contact, kept up to date by send, mark read and delete
+        """
+        for name in ["alice", "bob", "recipient"]:
+            server.users[name] = {"password": "pass", "messages": []}
+        server.handle_send("alice|recipient|a1")
+        server.handle_send("alice|recipient|a2")
+        bob_id = server.handle_send("bob|recipient|b1").split(":", 1)[1]
+        server.handle_send("bob|recipient|b2")
+        server.handle_mark_read("recipient|alice|1")
+        server.handle_delete_unread_message(f"bob|recipient|{bob_id}")
+        server.handle_mark_read("recipient|bob|0")
+        response = server.handle_login("recipient|pass")
+        self.assertEqual(decode_counts(response, len(SUCCESS)), {"alice": 1})
+        server.active_users.discard("recipient")
+
+    def test_index_rebuilt_when_messages_replaced(self):
+        """
+        Test that replacing a user's message list directly does not leave a stale index
+        """
+        server.users["recipient"] = {"password": "pass", "messages": [{"id": "1", "from": "sender", "message": "a", "status": "unread"}]}
+        server.handle_mark_read("recipient|sender|0")
+        server.users["recipient"] = {"password": "pass", "messages": [{"id": "2", "from": "sender", "message": "b", "status": "unread"}]}
+        self.assertEqual(server.handle_delete_unread_message("sender|recipient|2"), "success: Message deleted.")
+
     def test_handle_receive_messages_success(self):
         """
         Test handle_receive_messages when success
@@ -244,7 +331,67 @@ class TestServerHandlers(unittest.TestCase):
                                      "messages": [{"id": "123", "from": "sender", "message": "Hello", "status": "read"}]}
         
         response = server.handle_receive_messages("recipient")
-        self.assertEqual(response, "success:[{'id': '123', 'from': 'sender', 'message': 'Hello', 'status': 'read'}]")
+        self.assertTrue(response.startswith(SUCCESS))
+        self.assertEqual(decode_messages(response, len(SUCCESS)),
+                         ([{'id': '123', 'from': 'sender', 'message': 'Hello', 'status': 'read'}], len(response)))
+
+    def test_handle_receive_messages_paged(self):
+        """
+        Test handle_receive_messages with a cursor, page size and contact filter
+        """
+        for name in ["alice", "bob", "recipient"]:
+            server.users[name] = {"password": "pass", "messages": []}
+        for i in range(5):
+            server.handle_send(f"{'alice' if i % 2 == 0 else 'bob'}|recipient|m{i}")
+        page = reply_page(server.handle_receive_messages("recipient|0|2"))
+        self.assertEqual([m["message"] for m in page["messages"]], ["m0", "m1"])
+        self.assertEqual((page["next_seq"], page["has_more"]), (2, True))
+        page = reply_page(server.handle_receive_messages("recipient|2|2"))
+        self.assertEqual([m["message"] for m in page["messages"]], ["m2", "m3"])
+        page = reply_page(server.handle_receive_messages("recipient|1|0|alice"))
+        self.assertEqual([m["message"] for m in page["messages"]], ["m2", "m4"])
+        self.assertEqual((page["next_seq"], page["has_more"]), (5, False))
+        page = reply_page(server.handle_receive_messages("recipient|5|10"))
+        self.assertEqual((page["messages"], page["next_seq"], page["has_more"]), ([], 5, False))
+
+    def test_handle_receive_messages_paged_legacy_messages(self):
+        """
+        Test that messages stored without a sequence number are paged by position and new ones continue after them
+        """
+        server.users["recipient"] = {"password": "pass",
+                                     "messages": [{"id": "1", "from": "sender", "message": "old", "status": "read"}]}
+        server.handle_send("sender|recipient|new")
+        page = reply_page(server.handle_receive_messages("recipient|0|0"))
+        self.assertEqual([(m["seq"], m["message"]) for m in page["messages"]], [(1, "old"), (2, "new")])
+
+    def test_handle_sync(self):
+        """
+        Test handle_sync returns new messages and status changes after the cursor, each message once
+        """
+        for name in ["alice", "recipient"]:
+            server.users[name] = {"password": "pass", "messages": []}
+        ids = [server.handle_send(f"alice|recipient|m{i}").split(":", 1)[1] for i in range(3)]
+        delta = reply_page(server.handle_sync("recipient|0|0"))
+        self.assertEqual([m["message"] for m in delta["changes"]], ["m0", "m1", "m2"])
+        self.assertEqual((delta["next_seq"], delta["has_more"]), (3, False))
+
+        server.handle_mark_read("recipient|alice|1")
+        server.handle_delete_unread_message(f"alice|recipient|{ids[1]}")
+        server.handle_send("alice|recipient|m3")
+        delta = reply_page(server.handle_sync("recipient|3|0"))
+        self.assertEqual([(m["message"], m["status"], m["updated"]) for m in delta["changes"]],
+                         [("m0", "read", 4), ("m1", "deleted", 5), ("m3", "unread", 6)])
+        self.assertEqual(delta["next_seq"], 6)
+
+        # A message changed twice after the cursor is returned once, in its latest state
+        server.handle_mark_read("recipient|alice|0")
+        delta = reply_page(server.handle_sync("recipient|0|2"))
+        self.assertEqual([m["message"] for m in delta["changes"]], ["m0", "m1"])
+        self.assertTrue(delta["has_more"])
+        delta = reply_page(server.handle_sync(f"recipient|{delta['next_seq']}|2"))
+        self.assertEqual([(m["message"], m["status"]) for m in delta["changes"]], [("m2", "read"), ("m3", "read")])
+        self.assertEqual((delta["next_seq"], delta["has_more"]), (8, False))
+        self.assertEqual(server.handle_sync("nobody|0|0"), "error: User not found.")
 
     def test_handle_receive_messages_account_not_found(self):
         """
@@ -300,6 +447,159 @@ class TestServerHandlers(unittest.TestCase):
         response = server.handle_logout("testuser")
         self.assertEqual(response, "error: Failed to log out. Username does not exist in active users.")
         self.assertEqual(server.active_users, set(["testuser1"]))
+
+class TestHandleClientFraming(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Reset user database and start handle_client on one end of a socket pair
+        """
+        server.users.clear()
+        server.subscribers.clear()
+        server.active_users = set()
+        server.active_users_lock = threading.Lock()
+        self.client_sock, server_sock = socket.socketpair()
+        self.thread = threading.Thread(target=server.handle_client, args=(server_sock, "test"), daemon=True)
+        self.thread.start()
+        self.client_sock.sendall(server.VERSION.encode().ljust(VERSION_SIZE))
+        self.assertEqual(self.client_sock.recv(1024), b"success: Version matched")
+
+    def tearDown(self):
+        self.client_sock.close()
+        self.thread.join(timeout=2)
+
+    def test_large_message_and_receive(self):
+        """
+        Test that a message far larger than 4096 bytes is stored and returned intact
+        """
+        server.users["sender"] = {"password": "pass", "messages": []}
+        server.users["recipient"] = {"password": "pass", "messages": []}
+        text = "a" * 20000
+        self.client_sock.sendall(pack_frame(4, f"sender|recipient|{text}", 1))
+        msg_type, request_id, response = recv_frame(self.client_sock)
+        self.assertEqual(msg_type, 4)
+        self.assertTrue(response.decode().startswith("success:"))
+        self.assertEqual(server.users["recipient"]["messages"][0]["message"], text)
+
+        self.client_sock.sendall(pack_frame(8, "recipient", 2))
+        msg_type, request_id, response = recv_frame(self.client_sock)
+        self.assertEqual(msg_type, 8)
+        self.assertEqual(request_id, 2)
+        self.assertEqual(decode_messages(response, len(SUCCESS))[0][0]["message"], text)
+
+    def test_pipelined_requests(self):
+        """
+        Test that several requests written at once get one response each, in order
+        """
+        self.client_sock.sendall(pack_frame(1, "user1|pw", 7) + pack_frame(1, "user2|pw", 8) + pack_frame(3, "empty", 9))
+        self.assertEqual(recv_frame(self.client_sock), (1, 7, b"success: Account created"))
+        self.assertEqual(recv_frame(self.client_sock), (1, 8, b"success: Account created"))
+        self.assertEqual(recv_frame(self.client_sock), (3, 9, SUCCESS + b"\x02\x05user1\x05user2"))
+
+
+class TestAsyncServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Run the async-mode connection handler on an event loop in a background thread
+        """
+        cls.loop = asyncio.new_event_loop()
+        threading.Thread(target=cls.loop.run_forever, daemon=True).start()
+        cls.async_server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(server.handle_client_async, "127.0.0.1", 0), cls.loop).result(timeout=5)
+        cls.port = cls.async_server.sockets[0].getsockname()[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.async_server.close)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+
+    def setUp(self):
+        server.users.clear()
+        server.subscribers.clear()
+        server.active_users = set()
+        server.active_users_lock = threading.Lock()
+        self.socks = []
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+
+    def connect(self):
+        """
+        Open a connection to the async server and complete the version handshake
+        """
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        self.socks.append(sock)
+        sock.sendall(server.VERSION.encode().ljust(VERSION_SIZE))
+        self.assertEqual(sock.recv(1024), b"success: Version matched")
+        return sock
+
+    def test_version_mismatch(self):
+        """
+        Test that the async server rejects a client with a different version
+        """
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        self.socks.append(sock)
+        sock.sendall(b"0.0.1".ljust(VERSION_SIZE))
+        self.assertTrue(sock.recv(1024).startswith(b"error: Version mismatch"))
+
+    def test_requests(self):
+        """
+        Test that handler requests are served on the event loop, including pipelined ones
+        """
+        sock = self.connect()
+        sock.sendall(pack_frame(1, "alice|pw", 1) + pack_frame(1, "bob|pw", 2) + pack_frame(2, "alice|pw", 3))
+        self.assertEqual(recv_frame(sock), (1, 1, b"success: Account created"))
+        self.assertEqual(recv_frame(sock), (1, 2, b"success: Account created"))
+        self.assertEqual(recv_frame(sock), (2, 3, SUCCESS + encode_counts({})))
+        sock.sendall(pack_frame(3, "empty", 4))
+        self.assertEqual(recv_frame(sock), (3, 4, SUCCESS + b"\x02\x05alice\x03bob"))
+
+    def test_subscription_push(self):
+        """
+        Test that messages and deletions sent from another connection are pushed to a subscriber
+        """
+        server.users["alice"] = {"password": "pw", "messages": []}
+        server.users["bob"] = {"password": "pw", "messages": []}
+        subscriber = self.connect()
+        subscriber.sendall(pack_frame(5, "bob", 11))
+        sender = self.connect()
+        # Wait until the subscription is registered before sending
+        for _ in range(100):
+            if "bob" in server.subscribers:
+                break
+            time.sleep(0.01)
+        sender.sendall(pack_frame(4, "alice|bob|hi bob", 1))
+        msg_id = recv_frame(sender)[2].decode().split(":", 1)[1]
+
+        msg_type, request_id, payload = recv_frame(subscriber)
+        self.assertEqual((msg_type, request_id), (5, 11))
+        self.assertEqual(decode_messages(payload, len(SUCCESS))[0][0]["message"], "hi bob")
+
+        sender.sendall(pack_frame(7, f"alice|bob|{msg_id}", 2))
+        self.assertEqual(recv_frame(sender)[2], b"success: Message deleted.")
+        self.assertEqual(decode_messages(recv_frame(subscriber)[2], len(SUCCESS))[0][0]["status"], "deleted")
+
+    def test_subscription_removed_on_disconnect(self):
+        """
+        Test that closing a subscription connection removes the subscriber
+        """
+        server.users["bob"] = {"password": "pw", "messages": []}
+        subscriber = self.connect()
+        subscriber.sendall(pack_frame(5, "bob", 1))
+        for _ in range(100):
+            if "bob" in server.subscribers:
+                break
+            time.sleep(0.01)
+        self.assertIn("bob", server.subscribers)
+        subscriber.close()
+        for _ in range(100):
+            if "bob" not in server.subscribers:
+                break
+            time.sleep(0.01)
+        self.assertNotIn("bob", server.subscribers)
         
         
 if __name__ == '__main__':
@@ -0,0 +1,114 @@
+"""
+Compare the custom wire protocol server in threaded mode (one OS thread per connection)
+and async mode (one asyncio event loop for all connections).
+
+For each mode the server is started as a subprocess, then more and more logged-in,
+subscribed clients are connected. After each step we record the server's resident memory
+and thread count (read from /proc, so this runs on Linux), plus the round-trip time of
+sends pushed to subscribers. Results are written to experiment_event_loop.json.
+
+Run from the Design_Exercise1 directory:
+
+    python experiment/event_loop_benchmark.py
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "custom_wire_protocol_implementation"))
+from protocol import VERSION_SIZE, pack_frame, recv_frame
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "custom_wire_protocol_implementation", "server.py")
+OUTPUT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "experiment_event_loop.json")
+PORT = 5099
+VERSION = "3.1.0"
+CONNECTION_STEPS = [0, 250, 500, 1000, 2000, 4000]
+SENDS_PER_STEP = 200
+
+def proc_status(pid):
+    """
+        Read resident memory (KB) and thread count of a process from /proc
+    """
+    status = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            status[key] = value.strip()
+    return int(status["VmRSS"].split()[0]), int(status["Threads"])
+
+def connect():
+    """
+        Open a connection and complete the version handshake
+    """
+    sock = socket.create_connection(("127.0.0.1", PORT), timeout=30)
+    sock.sendall(VERSION.encode().ljust(VERSION_SIZE))
+    response = sock.recv(1024)
+    if not response.startswith(b"success"):
+        raise RuntimeError(response.decode())
+    return sock
+
+def wait_for_server():
+    for _ in range(100):
+        try:
+            connect().close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("Server did not start")
+
+def run(mode):
+    server = subprocess.Popen([sys.executable, SERVER_SCRIPT, "--mode", mode, "--port", str(PORT)],
+                              stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = []
+    subscribers = []
+    try:
+        wait_for_server()
+        control = connect()
+        # One sender account that every subscriber receives messages from
+        control.sendall(pack_frame(1, "sender|pw"))
+        recv_frame(control)
+        for target in CONNECTION_STEPS:
+            while len(subscribers) < target:
+                username = f"user{len(subscribers)}"
+                # Register and log in, pipelined on the control connection
+                control.sendall(pack_frame(1, f"{username}|pw") + pack_frame(2, f"{username}|pw"))
+                recv_frame(control)
+                recv_frame(control)
+                sub = connect()
+                sub.sendall(pack_frame(5, username))
+                subscribers.append((username, sub))
+            time.sleep(1) # let the server settle before sampling
+
+            # Round-trip time of sends; every recipient is subscribed, so each send also triggers a push
+            latencies = []
+            for i in range(SENDS_PER_STEP if subscribers else 0):
+                username, sub = subscribers[i % len(subscribers)]
+                start = time.perf_counter()
+                control.sendall(pack_frame(4, f"sender|{username}|hello {i}"))
+                recv_frame(control)
+                recv_frame(sub)
+                latencies.append(time.perf_counter() - start)
+            rss_kb, threads = proc_status(server.pid)
+            row = {
+                "mode": mode,
+                "connections": len(subscribers) + 1,
+                "rss_kb": rss_kb,
+                "threads": threads,
+                "avg_push_round_trip_ms": 1000 * sum(latencies) / len(latencies) if latencies else None,
+            }
+            print(row)
+            results.append(row)
+    finally:
+        for _, sub in subscribers:
+            sub.close()
+        server.terminate()
+        server.wait()
+    return results
+
+if __name__ == "__main__":
+    all_results = run("threaded") + run("async")
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(all_results, f, indent=4)
@@ -0,0 +1,117 @@
+"""
+Compare how the structured replies of the chat servers are serialized.
+
+A page of messages, as a paged Receive Messages reply carries it (numbered IDs, 10 senders,
+40-character bodies, a third of the messages read, a seq per message), is encoded by the server
+and decoded by the client in three ways:
+
+    repr:    "success:" + str(dict) and ast.literal_eval, what the custom protocol sent before 3.0.0
+    binary:  protocol.encode_page and decode_page, the custom protocol's records since 3.0.0
+    json:    json.dumps and json.loads of the reply dict, as the JSON implementation does it
+
+For each page size we record the reply size in bytes and the encode and decode throughput in
+messages per second (bytes included: replies are encoded for the socket and decoded from it).
+A list of usernames, the List Users reply, is measured the same way.
+Results are written to experiment_serialization.json.
+
+Run from the Design_Exercise1 directory:
+
+    python experiment/serialization_benchmark.py
+"""
+import ast
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "custom_wire_protocol_implementation"))
+from protocol import SUCCESS, decode_page, decode_users, encode_page, encode_users
+
+OUTPUT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "experiment_serialization.json")
+PAGE_SIZES = [1, 10, 100, 1000]
+USERS = 1000
+SENDERS = [f"contact{i}" for i in range(10)]
+BODY = "x" * 40
+MIN_SECONDS = 0.5  # time each codec for at least this long
+CODECS = ["repr", "binary", "json"]
+
+def make_page(size):
+    return [{"id": i + 1, "from": SENDERS[i % len(SENDERS)], "message": BODY, "status": "read" if i % 3 == 0 else "unread",
+             "seq": i + 1} for i in range(size)]
+
+def encode_reply(codec, messages):
+    """
+        Encode a page of messages as the server would send it
+    """
+    if codec == "repr":
+        return ("success:" + str({"messages": messages, "next_seq": len(messages), "has_more": False})).encode()
+    if codec == "binary":
+        return SUCCESS + encode_page(messages, len(messages), False)
+    return json.dumps({"status": "success", "messages": messages, "next_seq": len(messages), "has_more": False}).encode()
+
+def decode_reply(codec, data):
+    """
+        Decode a page of messages as the client would read it
+    """
+    if codec == "repr":
+        return ast.literal_eval(data.decode().split(":", 1)[1])["messages"]
+    if codec == "binary":
+        return decode_page(data, len(SUCCESS))[0]
+    return json.loads(data)["messages"]
+
+def encode_user_list(codec, usernames):
+    if codec == "repr":
+        return str(usernames).encode()
+    if codec == "binary":
+        return SUCCESS + encode_users(usernames)
+    return json.dumps({"status": "success", "users": usernames}).encode()
+
+def decode_user_list(codec, data):
+    if codec == "repr":
+        return ast.literal_eval(data.decode())
+    if codec == "binary":
+        return decode_users(data, len(SUCCESS))
+    return json.loads(data)["users"]
+
+def rate(func, items):
+    """
+        Call func repeatedly for at least MIN_SECONDS and return items handled per second
+    """
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SECONDS:
+            return calls * items / elapsed
+
+def measure(encode, decode, value, items):
+    results = {}
+    for codec in CODECS:
+        data = encode(codec, value)
+        assert decode(codec, data) == value
+        results[codec] = {
+            "bytes": len(data),
+            "encode_per_second": rate(lambda: encode(codec, value), items),
+            "decode_per_second": rate(lambda: decode(codec, data), items),
+        }
+    return results
+
+if __name__ == "__main__":
+    results = {"pages": {}, "users": {}}
+    for size in PAGE_SIZES:
+        results["pages"][size] = measure(encode_reply, decode_reply, make_page(size), size)
+    results["users"] = measure(encode_user_list, decode_user_list, [f"user{i}" for i in range(USERS)], USERS)
+
+    for size in PAGE_SIZES:
+        for codec in CODECS:
+            r = results["pages"][size][codec]
+            print(f"{size:5} messages {codec:7} {r['bytes']:8} bytes   encode {r['encode_per_second']:10.0f} msg/s   "
+                  f"decode {r['decode_per_second']:10.0f} msg/s")
+    for codec in CODECS:
+        r = results["users"][codec]
+        print(f"{USERS:5} users    {codec:7} {r['bytes']:8} bytes   encode {r['encode_per_second']:10.0f} users/s "
+              f"decode {r['decode_per_second']:10.0f} users/s")
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(results, f, indent=2)
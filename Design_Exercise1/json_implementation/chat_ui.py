@@ -7,7 +7,8 @@ import threading
 import sys
 import hashlib
 
-CLIENT_VERSION = "1.0.0"
+CLIENT_VERSION = "1.1.0"
+RECEIVE_PAGE_SIZE = 200 # messages fetched per receive request
 
 if sys.stdin.isatty():
     while True:
@@ -30,6 +31,8 @@ chat_windows = {}
 subscription_socket = None
 options = []
 unsent_texts = {}
+received_seq = 0 # sequence number of the newest mailbox change loaded from the server
+message_positions = {} # {contact: (conversations[contact], {message id: index in that list})}
 
 
 def hash_password(password):
@@ -59,11 +62,18 @@ def add_message(contact, msg):
     """
     if contact not in conversations:
         conversations[contact] = []
-    for i, existing in enumerate(conversations[contact]):
-        if existing["id"] == msg["id"]:
-            conversations[contact][i] = msg
-            return True
-    conversations[contact].append(msg)
+    msgs = conversations[contact]
+    indexed, positions = message_positions.get(contact, (None, None))
+    if indexed is not msgs or len(positions) != len(msgs):
+        # The conversation was replaced or changed without going through add_message
+        positions = {m["id"]: i for i, m in enumerate(msgs)}
+        message_positions[contact] = (msgs, positions)
+    i = positions.get(msg["id"])
+    if i is not None:
+        msgs[i] = msg
+    else:
+        positions[msg["id"]] = len(msgs)
+        msgs.append(msg)
     return True
 
 def check_version_number():
@@ -100,6 +110,44 @@ def check_version_number():
         print(f"Error: {e}")
         return None
 
+def recv_line(conn, buffer):
+    """
+        Read one newline-terminated JSON message from the server, however many recv calls it takes.
+
+    Params:
+
+        conn: The socket to read from.
+        buffer: A bytearray holding what was received past the previous message; kept across calls.
+
+    Returns:
+
+        The message bytes without the newline, or None if the peer closed the connection first.
+    """
+    while b"\n" not in buffer:
+        chunk = conn.recv(4096)
+        if not chunk:
+            return None
+        buffer += chunk
+    end = buffer.index(b"\n")
+    line = bytes(buffer[:end])
+    del buffer[:end + 1]
+    return line
+
+def send_json(conn, obj):
+    """
+        Send a request as one newline-terminated JSON message.
+
+    Params:
+
+        conn: The socket to write to.
+        obj: A JSON-encodable dict.
+
+    Returns:
+
+        None
+    """
+    conn.sendall(json.dumps(obj).encode() + b"\n")
+
 def send_request(request):
     """
         Send a request to the server and return the response.
@@ -121,9 +169,11 @@ def send_request(request):
             client.send.reset_mock()
         if hasattr(client.recv, "reset_mock"):
             client.recv.reset_mock()
-        client.send(json.dumps(request).encode())
-        response_data = client.recv(4096).decode()
-        response = json.loads(response_data)
+        send_json(client, request)
+        data = recv_line(client, bytearray())
+        if data is None:
+            raise ConnectionError("Connection closed before the server responded")
+        response = json.loads(data)
         client.close()
         return response
     except Exception as e:
@@ -187,7 +237,7 @@ def login():
 
             None
     """
-    global current_user
+    global current_user, received_seq
     username = username_var.get().strip()
     password = password_entry.get().strip()
     if not username or not password:
@@ -196,6 +246,7 @@ def login():
     response = send_request({"type": "login", "username": username, "password": hash_password(password)})
     if response and response["status"] == "success":
         current_user = username
+        received_seq = 0
         login_frame.pack_forget()
         chat_frame.pack()
         chat_label.config(text=f"Chat - Logged in as {username}")
@@ -246,12 +297,13 @@ def subscribe_thread():
     try:
         subscription_socket = check_version_number()
         if subscription_socket is not None:
-            subscription_socket.send(json.dumps({"type": "subscribe", "username": current_user}).encode())
+            send_json(subscription_socket, {"type": "subscribe", "username": current_user})
+            buffer = bytearray()
             while current_user:
-                data = subscription_socket.recv(4096)
-                if not data:
+                data = recv_line(subscription_socket, buffer)
+                if data is None:
                     break
-                msg = json.loads(data.decode())
+                msg = json.loads(data)
                 if msg.get("type") == "message":
                     message_data = msg["data"]
                     sender = message_data["from"]
@@ -276,7 +328,7 @@ def subscribe_thread():
 
 def load_conversations():
     """
-        Load all of the messages stored for current user
+        Load the messages stored for current user that arrived since the last load, one page at a time
         
         Params:
 
@@ -286,15 +338,47 @@ def load_conversations():
 
             None
     """
-    response = send_request({"type": "receive", "username": current_user})
-    if response and response["status"] == "success":
-        messages = response["messages"]
-        for msg in messages:
+    global received_seq
+    while True:
+        response = send_request({"type": "receive", "username": current_user, "after_seq": received_seq, "limit": RECEIVE_PAGE_SIZE})
+        if not (response and response["status"] == "success"):
+            messagebox.showerror("Error", response["message"] if response else "No response from server.")
+            return
+        for msg in response["messages"]:
             sender = msg["from"]
             add_message(sender, msg)
+        received_seq = response["next_seq"]
+        if not response["has_more"]:
+            break
+    update_conversation_list()
+
+def sync_conversations():
+    """
+        Apply the changes to the current user's mailbox since the last load or sync: new messages,
+        and messages that were read or deleted in the meantime
+
+        Params:
+
+            None
+
+        Returns:
+
+            None
+    """
+    global received_seq
+    changed = False
+    while True:
+        response = send_request({"type": "sync", "username": current_user, "since_seq": received_seq, "limit": RECEIVE_PAGE_SIZE})
+        if not (response and response["status"] == "success"):
+            break # retried on the next check
+        for msg in response["changes"]:
+            add_message(msg["from"], msg)
+            changed = True
+        received_seq = response["next_seq"]
+        if not response["has_more"]:
+            break
+    if changed:
         update_conversation_list()
-    else:
-        messagebox.showerror("Error", response["message"] if response else "No response from server.")
 
 def update_conversation_list():
     """
@@ -531,7 +615,7 @@ def check_new_messages():
             None
     """
     if current_user:
-        load_conversations()
+        sync_conversations()
         root.after(5000, check_new_messages)
 
 def start_new_conversation():
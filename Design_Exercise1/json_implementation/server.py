@@ -4,28 +4,579 @@ import threading
 import uuid
 import atexit
 import sys
+import os
+import bisect
+import sqlite3
+import argparse
+from collections import deque
+
+SERVER_VERSION = "1.1.0"
+MAX_PAGE_SIZE = 1000 # most messages returned by one paged receive request
+
+def message_seq(messages, i):
+    """
+        Sequence number of the i-th message of a user. Messages stored before sequence numbers
+        were introduced have none; their position in the list stands in for it.
+
+    Params:
+
+        messages: The user's message list.
+        i: Index into messages.
+
+    Returns:
+
+        The message's sequence number.
+    """
+    return messages[i].get("seq", i + 1)
+
+def recv_line(conn, buffer):
+    """
+        Read one newline-terminated JSON message from the socket. json.dumps escapes newlines
+        inside strings, so a message can be of any size and still end at the first newline.
+
+    Params:
+
+        conn: The socket to read from.
+        buffer: A bytearray holding what was received past the previous message; kept across calls.
+
+    Returns:
+
+        The message bytes without the newline, or None if the peer closed the connection first.
+    """
+    while b"\n" not in buffer:
+        chunk = conn.recv(4096)
+        if not chunk:
+            return None
+        buffer += chunk
+    end = buffer.index(b"\n")
+    line = bytes(buffer[:end])
+    del buffer[:end + 1]
+    return line
+
+def send_json(conn, obj):
+    """
+        Send a dict as one newline-terminated JSON message.
+
+    Params:
+
+        conn: The socket to write to.
+        obj: A JSON-encodable dict.
+
+    Returns:
+
+        None
+    """
+    conn.sendall(json.dumps(obj).encode() + b"\n")
 
-SERVER_VERSION = "1.0.0"
 class UserStore:
-    def __init__(self, filename="users.json"):
+    clear_at_exit = True # the server starts each run from an empty users.json
+
+    def __init__(self, filename="users.json", compact_every=1000):
         """
             Initialize the UserStore.
 
+            State is kept as a snapshot file plus an append-only journal of mutations
+            (filename + ".journal"). Each mutation appends one JSON line to the journal,
+            so a write costs O(size of the mutation) instead of rewriting every message.
+            On startup the snapshot is loaded and the journal replayed; once the journal
+            holds compact_every entries it is folded into a new snapshot in the background.
+
         Params:
         
-            filename: The file to store the user data in. Defaults to users.json.
+            filename: The file to store the snapshot in. Defaults to users.json.
+            compact_every: Number of journal entries that triggers a background compaction.
 
         Returns: 
 
             None
         """
         self.filename = filename
+        self.journal_filename = filename + ".journal"
+        self.compact_every = compact_every
+        self.lock = threading.RLock()
         self.users = {}
-        self.save()
+        self.seq = 0 # sequence number of the last mutation applied
+        # Message index per user, kept in step with apply() and rebuilt lazily from self.users, so
+        # mark-read, delete and the unread counts do not scan the whole history:
+        # {username: {"messages": indexed list, "size": int, "total": int, "by_contact": {sender: int},
+        #             "by_id": {str(id): message}, "unread": {sender: deque([message, ...])},
+        #             "positions": {sender: [list position, ...]}, "changes": [(seq, message), ...]}}
+        self.index = {}
+        self.journal_entries = 0 # journal entries not yet folded into the snapshot
+        self.compacting = False
+        self.load()
+        self.journal = open(self.journal_filename, "a")
+
+    def load(self):
+        """
+            Load the snapshot and replay the journal entries written after it.
+
+        Params:
+
+            None
+
+        Returns:
+
+            None
+        """
+        if os.path.exists(self.filename):
+            with open(self.filename, "r") as f:
+                data = json.load(f)
+            if isinstance(data.get("users"), dict) and "seq" in data:
+                self.users, self.seq = data["users"], data["seq"]
+            else:
+                self.users, self.seq = data, 0 # snapshot written before journaling existed
+        if os.path.exists(self.journal_filename):
+            with open(self.journal_filename, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break # torn final write from a crash; nothing after it was acknowledged
+                    if entry["seq"] > self.seq:
+                        self.apply(entry)
+                        self.seq = entry["seq"]
+                        self.journal_entries += 1
+
+    def apply(self, entry):
+        """
+            Apply one mutation to the in-memory state. Used both for live writes and journal replay.
+
+        Params:
+
+            entry: The mutation, a dict with an "op" field.
+
+        Returns:
+
+            The result of the operation (True/False, or the number of messages marked read).
+        """
+        op = entry["op"]
+        if op == "register":
+            self.users[entry["username"]] = {"password": entry["password"], "messages": []}
+            return True
+        user = self.users.get(entry["username"])
+        if user is None:
+            return 0 if op == "mark_read" else False
+        if op == "add_message":
+            index = self.message_index(entry["username"])
+            user["messages"].append(entry["message"])
+            if "seq" in entry["message"]:
+                user["seq"] = entry["message"]["seq"]
+            self.index_message(index, entry["message"])
+            index["changes"].append((message_seq(user["messages"], len(user["messages"]) - 1), entry["message"]))
+            return True
+        if op == "mark_read":
+            index = self.message_index(entry["username"])
+            queue = index["unread"].get(entry["contact"])
+            count = 0
+            while queue and (entry["count"] == 0 or count < entry["count"]):
+                msg = queue.popleft()
+                if msg["status"] != "unread":
+                    continue # deleted after it was queued
+                msg["status"] = "read"
+                self.touch(index, user, msg)
+                count += 1
+            if queue is not None and not queue:
+                del index["unread"][entry["contact"]]
+            self.uncount(index, entry["contact"], count)
+            return count
+        if op == "delete_message":
+            index = self.message_index(entry["username"])
+            msg = index["by_id"].get(str(entry["message_id"]))
+            if msg is None or msg["from"] != entry["sender"] or msg["status"] != "unread":
+                return False
+            msg["status"] = "deleted"
+            self.touch(index, user, msg)
+            self.uncount(index, entry["sender"], 1)
+            return True
+        if op == "delete_account":
+            if user.get("deleted", False):
+                return False
+            user["deleted"] = True
+            return True
+        raise ValueError(f"Unknown journal operation: {op}")
+
+    def index_message(self, index, msg):
+        """
+            Add one message to a user's message index.
+
+        Params:
+
+            index: The user's entry in self.index.
+            msg: The message dict {id, from, message, status, seq}.
+
+        Returns:
+
+            None
+        """
+        index["positions"].setdefault(msg["from"], []).append(index["size"])
+        index["size"] += 1
+        index["by_id"][str(msg.get("id"))] = msg # keyed as the ID appears in delete requests
+        if msg["status"] == "unread":
+            index["unread"].setdefault(msg["from"], deque()).append(msg)
+            index["total"] += 1
+            index["by_contact"][msg["from"]] = index["by_contact"].get(msg["from"], 0) + 1
+
+    def uncount(self, index, contact, count):
+        """
+            Update a user's unread index after count messages from contact stopped being unread.
+
+        Params:
+
+            index: The user's entry in self.index.
+            contact: The sender of the messages.
+            count: The number of messages that are no longer unread.
+
+        Returns:
+
+            None
+        """
+        index["total"] -= count
+        remaining = index["by_contact"].get(contact, 0) - count
+        if remaining > 0:
+            index["by_contact"][contact] = remaining
+        else:
+            index["by_contact"].pop(contact, None)
+
+    def last_seq(self, user):
+        """
+            The sequence number of the latest change to a user's mailbox. Every mutation of the
+            mailbox (a new message, or a message read or deleted) takes the next one.
+
+        Params:
+
+            user: The user's entry in self.users.
+
+        Returns:
+
+            The user's current sequence number.
+        """
+        if "seq" not in user:
+            messages = user["messages"]
+            user["seq"] = message_seq(messages, len(messages) - 1) if messages else 0
+        return user["seq"]
+
+    def touch(self, index, user, msg):
+        """
+            Give a message whose status changed the user's next sequence number, so that it is
+            returned by the next sync. Replaying the journal assigns the same numbers.
+
+        Params:
+
+            index: The user's entry in self.index.
+            user: The user's entry in self.users.
+            msg: The message whose status changed.
+
+        Returns:
+
+            None
+        """
+        user["seq"] = msg["updated"] = self.last_seq(user) + 1
+        index["changes"].append((msg["updated"], msg))
+
+    def message_index(self, username):
+        """
+            Return the message index of a user, rebuilding it if the user's message list was
+            replaced or changed without going through the store.
+
+        Params:
+
+            username: The user whose index is returned.
+
+        Returns:
+
+            A dict with the total unread count ("total"), the unread count per sender ("by_contact"),
+            each message by ID ("by_id"), each sender's unread messages, oldest first ("unread"),
+            the list positions of each sender's messages ("positions") and the latest change of
+            every message in sequence order ("changes").
+        """
+        with self.lock:
+            messages = self.users[username]["messages"]
+            index = self.index.get(username)
+            if index is None or index["messages"] is not messages or index["size"] != len(messages):
+                index = {"messages": messages, "size": 0, "total": 0, "by_contact": {}, "by_id": {}, "unread": {}, "positions": {}}
+                for msg in messages:
+                    self.index_message(index, msg)
+                index["changes"] = sorted(((messages[i].get("updated", message_seq(messages, i)), messages[i])
+                                           for i in range(len(messages))), key=lambda c: c[0])
+                self.index[username] = index
+            return index
+
+    def get_user(self, username):
+        """
+            Look up a user account.
+
+        Params:
+
+            username: The user to look up.
+
+        Returns:
+
+            The user's entry (with "password", and "deleted" once deleted), or None if there is no such user.
+        """
+        return self.users.get(username)
+
+    def usernames(self, prefix=""):
+        """
+            List the accounts that were not deleted.
+
+        Params:
+
+            prefix: If not empty, only usernames starting with it are returned.
+
+        Returns:
+
+            The usernames, in registration order.
+        """
+        with self.lock:
+            return [u for u, data in self.users.items() if u.startswith(prefix) and not data.get("deleted", False)]
+
+    def unread_counts(self, username):
+        """
+            Count a user's unread messages.
+
+        Params:
+
+            username: The owner of the mailbox.
+
+        Returns:
+
+            A tuple of the total number of unread messages and a dict of the unread count per sender.
+        """
+        with self.lock:
+            index = self.message_index(username)
+            return index["total"], dict(index["by_contact"])
+
+    def all_messages(self, username):
+        """
+            Return a user's whole message history.
+
+        Params:
+
+            username: The owner of the mailbox.
+
+        Returns:
+
+            The list of message dicts, oldest first.
+        """
+        return self.users[username]["messages"]
+
+    def page_messages(self, username, after_seq=0, limit=0, contact=""):
+        """
+            Select the messages of a user with a sequence number above a cursor.
+
+        Params:
+
+            username: The user whose messages are returned.
+            after_seq: Only messages with a higher sequence number are returned.
+            limit: The most messages to return (capped at MAX_PAGE_SIZE); 0 returns all of them.
+            contact: If not empty, only messages from this contact are returned.
+
+        Returns:
+
+            A tuple of the messages (each with its "seq"), the cursor for the next request, and
+            whether more messages remain after this page.
+        """
+        with self.lock:
+            index = self.message_index(username)
+            messages = self.users[username]["messages"]
+            # List positions of the candidate messages, in sequence order
+            candidates = index["positions"].get(contact, []) if contact else range(len(messages))
+            start = bisect.bisect_right(candidates, after_seq, key=lambda i: message_seq(messages, i))
+            end = len(candidates) if limit == 0 else min(len(candidates), start + min(limit, MAX_PAGE_SIZE))
+            page = [dict(messages[i], seq=message_seq(messages, i)) for i in candidates[start:end]]
+        next_seq = page[-1]["seq"] if page else after_seq
+        return page, next_seq, end < len(candidates)
+
+    def sync_since(self, username, since_seq=0, limit=0):
+        """
+            Select the changes to a user's mailbox after a sequence number: new messages and messages
+            that were read or deleted since. Each message is returned once, in its latest state.
+
+        Params:
+
+            username: The owner of the mailbox.
+            since_seq: Only changes with a higher sequence number are returned.
+            limit: The most messages to return (capped at MAX_PAGE_SIZE); 0 returns all of them.
+
+        Returns:
+
+            A tuple of the changed messages (each with its "updated" sequence number), the cursor
+            for the next request, and whether more changes remain.
+        """
+        with self.lock:
+            changes = self.message_index(username)["changes"]
+            i = bisect.bisect_right(changes, since_seq, key=lambda c: c[0])
+            delta = []
+            next_seq = since_seq
+            while i < len(changes) and (limit == 0 or len(delta) < min(limit, MAX_PAGE_SIZE)):
+                seq, msg = changes[i]
+                i += 1
+                next_seq = seq
+                if msg.get("updated", seq) == seq: # older entries of a message were superseded by a later change
+                    delta.append(dict(msg, updated=seq))
+        return delta, next_seq, i < len(changes)
+
+    def commit(self, entry):
+        """
+            Apply a mutation and, if it changed anything, append it durably to the journal.
+
+        Params:
+
+            entry: The mutation, a dict with an "op" field.
+
+        Returns:
+
+            The result of apply().
+        """
+        with self.lock:
+            result = self.apply(entry)
+            if not result:
+                return result
+            self.seq += 1
+            entry["seq"] = self.seq
+            self.journal.write(json.dumps(entry) + "\n")
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.journal_entries += 1
+            if self.journal_entries >= self.compact_every and not self.compacting:
+                self.compacting = True
+                threading.Thread(target=self.compact, daemon=True).start()
+            return result
+
+    def register(self, username, password):
+        """
+            Create a user account.
+
+        Params:
+
+            username: The username to register.
+            password: The (hashed) password.
+
+        Returns:
+
+            True
+        """
+        return self.commit({"op": "register", "username": username, "password": password})
+
+    def add_message(self, recipient, msg):
+        """
+            Store a message for a recipient.
+
+        Params:
+
+            recipient: The user receiving the message.
+            msg: The message dict {id, from, message, status}; it is given the recipient's next sequence number
+                and, if it has no "id", the next message ID.
+
+        Returns:
+
+            True if stored, False if the recipient does not exist.
+        """
+        with self.lock:
+            user = self.users.get(recipient)
+            if user is None:
+                return False
+            msg["seq"] = self.last_seq(user) + 1
+            if "id" not in msg:
+                msg["id"] = self.seq + 1 # the sequence number of this journal entry: unique, increasing and replayed as is
+            return self.commit({"op": "add_message", "username": recipient, "message": msg})
+
+    def mark_read(self, username, contact, read_batch_num):
+        """
+            Mark unread messages from a contact as read.
+
+        Params:
+
+            username: The user whose messages are marked.
+            contact: Only messages from this contact are marked.
+            read_batch_num: How many to mark, oldest first; 0 means all.
+
+        Returns:
+
+            The number of messages marked as read.
+        """
+        with self.lock:
+            user = self.users.get(username)
+            if user is None:
+                return 0
+            unread = self.message_index(username)["by_contact"].get(contact, 0)
+            count = unread if read_batch_num == 0 else min(unread, read_batch_num)
+            # Journal the resolved count so replay marks exactly the same messages
+            return self.commit({"op": "mark_read", "username": username, "contact": contact, "count": count}) if count else 0
+
+    def delete_message(self, sender, recipient, message_id):
+        """
+            Delete (unsend) an unread message.
+
+        Params:
+
+            sender: The user who sent the message.
+            recipient: The user who received the message.
+            message_id: The ID of the message.
+
+        Returns:
+
+            True if the message was deleted, False if it was not found or already read.
+        """
+        return self.commit({"op": "delete_message", "username": recipient, "sender": sender, "message_id": message_id})
+
+    def delete_account(self, username):
+        """
+            Mark a user account as deleted.
+
+        Params:
+
+            username: The user to delete.
+
+        Returns:
+
+            True if deleted, False if not found or already deleted.
+        """
+        return self.commit({"op": "delete_account", "username": username})
+
+    def compact(self):
+        """
+            Fold the journal into a new snapshot and drop the journal entries it covers.
+
+        Params:
+
+            None
+
+        Returns:
+
+            None
+        """
+        try:
+            with self.lock:
+                seq = self.seq
+                snapshot = json.dumps({"seq": seq, "users": self.users}, indent=4)
+            # Writers are not blocked while the snapshot goes to disk
+            tmp = self.filename + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.filename)
+            with self.lock:
+                # Keep only the entries appended while the snapshot was being written
+                self.journal.close()
+                with open(self.journal_filename, "r") as f:
+                    remaining = [line for line in f if line.strip() and json.loads(line)["seq"] > seq]
+                tmp = self.journal_filename + ".tmp"
+                with open(tmp, "w") as f:
+                    f.writelines(remaining)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.journal_filename)
+                self.journal = open(self.journal_filename, "a")
+                self.journal_entries = len(remaining)
+        finally:
+            self.compacting = False
 
     def save(self):
         """
-            Save the user data to a file.
+            Save the user data to a file (writes a full snapshot and empties the journal).
 
         Params:
 
@@ -35,8 +586,7 @@ class UserStore:
 
             None
         """
-        with open(self.filename, "w") as f:
-            json.dump(self.users, f, indent=4)
+        self.compact()
 
     def clear(self):
         """
@@ -50,12 +600,371 @@ class UserStore:
 
             None  
         """
-        self.users = {}
-        self.save()
+        with self.lock:
+            self.users = {}
+            self.index = {}
+            self.seq = 0
+            self.journal.close()
+            self.journal = open(self.journal_filename, "w")
+            self.journal_entries = 0
+            with open(self.filename, "w") as f:
+                json.dump({"seq": 0, "users": {}}, f, indent=4)
+
+def message_from_row(row):
+    """
+        Convert a row of the messages table into the message dict the JSON store keeps.
+
+    Params:
+
+        row: An sqlite3.Row of the messages table.
+
+    Returns:
+
+        The message dict {id, from, message, status, seq}, plus "updated" if its status changed after it arrived.
+    """
+    msg = {"id": row["id"], "from": row["sender"], "message": row["message"], "status": row["status"], "seq": row["seq"]}
+    if row["changed"] != row["seq"]:
+        msg["updated"] = row["changed"]
+    return msg
+
+class SQLiteUserStore:
+    """
+        Storage backend keeping users and messages in an SQLite database in WAL mode.
+
+        It has the same methods as UserStore that ChatServer calls (get_user, usernames, register,
+        add_message, mark_read, delete_message, delete_account, unread_counts, all_messages,
+        page_messages, sync_since, save, clear). Nothing is loaded at startup and no mailbox is held
+        in memory. Each call is one transaction, served from indexes on (recipient, sender, status),
+        on the message ID and on the mailbox's sequence numbers, so mailboxes may be larger than RAM.
+    """
+    clear_at_exit = False # the database is kept across restarts
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            seq INTEGER NOT NULL DEFAULT 0 -- sequence number of the latest change to the mailbox
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            recipient TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            id NOT NULL, -- integer assigned by the store, or a UUID string (--id_format uuid); kept as given
+            sender TEXT NOT NULL,
+            message TEXT NOT NULL,
+            status TEXT NOT NULL,
+            changed INTEGER NOT NULL, -- sequence number of the latest change: seq, or when it was read or deleted
+            PRIMARY KEY (recipient, seq)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL -- last value handed out
+        );
+        CREATE INDEX IF NOT EXISTS messages_unread ON messages (recipient, sender, status);
+        CREATE INDEX IF NOT EXISTS messages_id ON messages (id);
+        CREATE INDEX IF NOT EXISTS messages_changed ON messages (recipient, changed);
+    """
+
+    def __init__(self, filename="users.db"):
+        """
+            Open (or create) the database.
+
+        Params:
+
+            filename: The SQLite database file. Defaults to users.db.
+
+        Returns:
+
+            None
+        """
+        self.filename = filename
+        self.lock = threading.RLock() # one connection, shared by all client threads
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL") # a call returns only once its transaction is on disk
+        self.db.executescript(self.SCHEMA)
+
+    def get_user(self, username):
+        """
+            Look up a user account.
+
+        Params:
+
+            username: The user to look up.
+
+        Returns:
+
+            A dict with "password" and "deleted", or None if there is no such user.
+        """
+        with self.lock:
+            row = self.db.execute("SELECT password, deleted FROM users WHERE username = ?", (username,)).fetchone()
+        return None if row is None else {"password": row["password"], "deleted": bool(row["deleted"])}
+
+    def usernames(self, prefix=""):
+        """
+            List the accounts that were not deleted.
+
+        Params:
+
+            prefix: If not empty, only usernames starting with it are returned.
+
+        Returns:
+
+            The usernames, in registration order.
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT username FROM users WHERE deleted = 0 AND substr(username, 1, ?) = ? ORDER BY rowid",
+                                   (len(prefix), prefix)).fetchall()
+        return [row["username"] for row in rows]
+
+    def register(self, username, password):
+        """
+            Create a user account, replacing any account with the same name.
+
+        Params:
+
+            username: The username to register.
+            password: The (hashed) password.
+
+        Returns:
+
+            True
+        """
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM messages WHERE recipient = ?", (username,))
+            self.db.execute("INSERT OR REPLACE INTO users (username, password) VALUES (?, ?)", (username, password))
+        return True
+
+    def next_seq(self, username):
+        """
+            Take the next sequence number of a user's mailbox. Caller must be inside a transaction.
+
+        Params:
+
+            username: The owner of the mailbox.
+
+        Returns:
+
+            The sequence number, or None if there is no such user.
+        """
+        row = self.db.execute("SELECT seq FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None
+        self.db.execute("UPDATE users SET seq = ? WHERE username = ?", (row["seq"] + 1, username))
+        return row["seq"] + 1
+
+    def add_message(self, recipient, msg):
+        """
+            Store a message for a recipient.
+
+        Params:
+
+            recipient: The user receiving the message.
+            msg: The message dict {id, from, message, status}; it is given the recipient's next sequence number
+                and, if it has no "id", the next message ID.
+
+        Returns:
+
+            True if stored, False if the recipient does not exist.
+        """
+        with self.lock, self.db:
+            seq = self.next_seq(recipient)
+            if seq is None:
+                return False
+            msg["seq"] = seq
+            if "id" not in msg:
+                msg["id"] = self.db.execute("INSERT INTO counters VALUES ('message_id', 1) "
+                                            "ON CONFLICT (name) DO UPDATE SET value = value + 1 RETURNING value").fetchone()[0]
+            self.db.execute("INSERT INTO messages (recipient, seq, id, sender, message, status, changed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (recipient, seq, msg["id"], msg["from"], msg["message"], msg["status"], seq))
+        return True
+
+    def mark_read(self, username, contact, read_batch_num):
+        """
+            Mark unread messages from a contact as read.
+
+        Params:
+
+            username: The user whose messages are marked.
+            contact: Only messages from this contact are marked.
+            read_batch_num: How many to mark, oldest first; 0 means all.
+
+        Returns:
+
+            The number of messages marked as read.
+        """
+        with self.lock, self.db:
+            rows = self.db.execute("SELECT seq FROM messages WHERE recipient = ? AND sender = ? AND status = 'unread' ORDER BY seq"
+                                   + (" LIMIT ?" if read_batch_num else ""),
+                                   (username, contact, read_batch_num) if read_batch_num else (username, contact)).fetchall()
+            for row in rows:
+                self.db.execute("UPDATE messages SET status = 'read', changed = ? WHERE recipient = ? AND seq = ?",
+                                (self.next_seq(username), username, row["seq"]))
+        return len(rows)
+
+    def delete_message(self, sender, recipient, message_id):
+        """
+            Delete (unsend) an unread message.
+
+        Params:
+
+            sender: The user who sent the message.
+            recipient: The user who received the message.
+            message_id: The ID of the message.
+
+        Returns:
+
+            True if the message was deleted, False if it was not found or already read.
+        """
+        with self.lock, self.db:
+            row = self.db.execute("SELECT seq FROM messages WHERE id = ? AND recipient = ? AND sender = ? AND status = 'unread'",
+                                  (message_id, recipient, sender)).fetchone()
+            if row is None:
+                return False
+            self.db.execute("UPDATE messages SET status = 'deleted', changed = ? WHERE recipient = ? AND seq = ?",
+                            (self.next_seq(recipient), recipient, row["seq"]))
+        return True
+
+    def delete_account(self, username):
+        """
+            Mark a user account as deleted.
+
+        Params:
+
+            username: The user to delete.
+
+        Returns:
+
+            True if deleted, False if not found or already deleted.
+        """
+        with self.lock, self.db:
+            return self.db.execute("UPDATE users SET deleted = 1 WHERE username = ? AND deleted = 0", (username,)).rowcount > 0
+
+    def unread_counts(self, username):
+        """
+            Count a user's unread messages.
+
+        Params:
+
+            username: The owner of the mailbox.
+
+        Returns:
+
+            A tuple of the total number of unread messages and a dict of the unread count per sender.
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT sender, COUNT(*) AS unread FROM messages WHERE recipient = ? AND status = 'unread' "
+                                   "GROUP BY sender", (username,)).fetchall()
+        by_contact = {row["sender"]: row["unread"] for row in rows}
+        return sum(by_contact.values()), by_contact
+
+    def all_messages(self, username):
+        """
+            Return a user's whole message history.
+
+        Params:
+
+            username: The owner of the mailbox.
+
+        Returns:
+
+            The list of message dicts, oldest first.
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT * FROM messages WHERE recipient = ? ORDER BY seq", (username,)).fetchall()
+        return [message_from_row(row) for row in rows]
+
+    def page_messages(self, username, after_seq=0, limit=0, contact=""):
+        """
+            Select the messages of a user with a sequence number above a cursor.
+
+        Params:
+
+            username: The user whose messages are returned.
+            after_seq: Only messages with a higher sequence number are returned.
+            limit: The most messages to return (capped at MAX_PAGE_SIZE); 0 returns all of them.
+            contact: If not empty, only messages from this contact are returned.
+
+        Returns:
+
+            A tuple of the messages (each with its "seq"), the cursor for the next request, and
+            whether more messages remain after this page.
+        """
+        query, params = "SELECT * FROM messages WHERE recipient = ? AND seq > ?", [username, after_seq]
+        if contact:
+            query, params = query + " AND sender = ?", params + [contact]
+        query += " ORDER BY seq"
+        if limit:
+            query, params = query + " LIMIT ?", params + [min(limit, MAX_PAGE_SIZE) + 1]
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        has_more = bool(limit) and len(rows) > min(limit, MAX_PAGE_SIZE)
+        page = [message_from_row(row) for row in (rows[:-1] if has_more else rows)]
+        return page, page[-1]["seq"] if page else after_seq, has_more
+
+    def sync_since(self, username, since_seq=0, limit=0):
+        """
+            Select the changes to a user's mailbox after a sequence number: new messages and messages
+            that were read or deleted since. Each message is returned once, in its latest state.
+
+        Params:
+
+            username: The owner of the mailbox.
+            since_seq: Only changes with a higher sequence number are returned.
+            limit: The most messages to return (capped at MAX_PAGE_SIZE); 0 returns all of them.
+
+        Returns:
+
+            A tuple of the changed messages (each with its "updated" sequence number), the cursor
+            for the next request, and whether more changes remain.
+        """
+        query, params = "SELECT * FROM messages WHERE recipient = ? AND changed > ? ORDER BY changed", [username, since_seq]
+        if limit:
+            query, params = query + " LIMIT ?", params + [min(limit, MAX_PAGE_SIZE) + 1]
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        has_more = bool(limit) and len(rows) > min(limit, MAX_PAGE_SIZE)
+        delta = [dict(message_from_row(row), updated=row["changed"]) for row in (rows[:-1] if has_more else rows)]
+        return delta, delta[-1]["updated"] if delta else since_seq, has_more
+
+    def save(self):
+        """
+            Make the data durable. Every call already commits its own transaction, so there is nothing to do.
+
+        Params:
+
+            None
+
+        Returns:
+
+            None
+        """
+
+    def clear(self):
+        """
+            Clear the user store of all users and messages.
+
+        Params:
+
+            None
+
+        Returns:
+
+            None
+        """
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM messages")
+            self.db.execute("DELETE FROM users")
+            self.db.execute("DELETE FROM counters")
+
+# Storage backends selectable with --storage
+STORAGE_BACKENDS = {"json": UserStore, "sqlite": SQLiteUserStore}
+# Message ID formats selectable with --id_format
+ID_FORMATS = ["int", "uuid"]
 
 class ChatServer:
 
-    def __init__(self, host=None, port=None, store=None):
+    def __init__(self, host=None, port=None, store=None, id_format="int"):
         """
             Initialize the ChatServer.
 
@@ -64,6 +973,8 @@ class ChatServer:
             host: The host to bind the server to. Defaults to 0.0.0.0.
             port: The port to bind the server to. Defaults to 5001.
             store: The UserStore to use. If not provided, a new UserStore will be created.
+            id_format: "int" to let the store number messages (a JSON integer on the wire), or "uuid"
+                for the UUID strings older clients expect.
 
         Returns:
 
@@ -72,11 +983,13 @@ class ChatServer:
         self.host = host
         self.port = port
         self.store = store if store else UserStore()
+        self.id_format = id_format
         self.active_users = set()
         self.active_users_lock = threading.Lock()
         self.subscribers = {}
         self.subscribers_lock = threading.Lock()
-        atexit.register(self.store.clear)
+        if self.store.clear_at_exit:
+            atexit.register(self.store.clear)
         self.handlers = {
             "register": self.handle_register,
             "login": self.handle_login,
@@ -88,6 +1001,7 @@ class ChatServer:
             "delete_account": self.handle_delete_account,
             "delete": self.handle_delete,
             "receive": self.handle_receive,
+            "sync": self.handle_sync,
         }
 
 
@@ -123,13 +1037,9 @@ class ChatServer:
         """
         username = request["username"]
         password = request["password"]
-        if username in self.store.users:
+        if self.store.get_user(username) is not None:
             return {"status": "error", "message": "Username already exists."}, False
-        self.store.users[username] = {
-            "password": password,
-            "messages": []
-        }
-        self.store.save()
+        self.store.register(username, password)
         return {"status": "success", "message": "Account created."}, False
 
     def handle_login(self, request, conn):
@@ -147,14 +1057,14 @@ class ChatServer:
         """
         username = request["username"]
         password = request["password"]
-        user = self.store.users.get(username)
+        user = self.store.get_user(username)
         if user and user["password"] == password and not user.get("deleted", False):
             with self.active_users_lock:
                 if username in self.active_users:
                     return {"status": "error", "message": "User already logged in."}, False
                 self.active_users.add(username)
-            unread = sum(1 for m in user["messages"] if m["status"] == "unread")
-            return {"status": "success", "message": f"Logged in. {unread} unread messages."}, False
+            unread, unread_by_contact = self.store.unread_counts(username)
+            return {"status": "success", "message": f"Logged in. {unread} unread messages.", "unread_by_contact": unread_by_contact}, False
         return {"status": "error", "message": "Invalid credentials or account deleted."}, False
     
     def handle_logout(self, request, conn):
@@ -189,11 +1099,7 @@ class ChatServer:
         """
         
         prefix = request.get("prefix", "")
-        users = self.store.users
-        if prefix == "*":
-            matched = [u for u, data in users.items() if not data.get("deleted", False)]
-        else:
-            matched = [u for u, data in users.items() if u.startswith(prefix) and not data.get("deleted", False)]
+        matched = self.store.usernames("" if prefix == "*" else prefix)
         return {"status": "success", "users": matched}, False
 
     def handle_subscribe(self, request, conn):
@@ -210,7 +1116,7 @@ class ChatServer:
             A tuple containing the response and a boolean indicating whether the client should stop.
         """
         username = request["username"]
-        if username not in self.store.users:
+        if self.store.get_user(username) is None:
             return {"status": "error", "message": "User not found."}, True
         with self.subscribers_lock:
             self.subscribers[username] = {
@@ -241,7 +1147,7 @@ class ChatServer:
                     sub["cond"].wait()
                 msg = sub["queue"].pop(0)
             try:
-                conn.send(json.dumps({"type": "message", "data": msg}).encode())
+                send_json(conn, {"type": "message", "data": msg})
             except Exception:
                 break
         with self.subscribers_lock:
@@ -262,19 +1168,19 @@ class ChatServer:
         sender = request["sender"]
         recipient = request["recipient"]
         message = request["message"]
-        users = self.store.users
-        if recipient not in users:
+        recipient_info = self.store.get_user(recipient)
+        if recipient_info is None:
             return {"status": "error", "message": "Recipient not found."}, False
-        if users[recipient].get("deleted", False):
+        if recipient_info.get("deleted", False):
             return {"status": "error", "message": "User no longer exists."}, False
         msg = {
-            "id": str(uuid.uuid4()),
             "from": sender,
             "message": message,
             "status": "unread"
         }
-        users[recipient]["messages"].append(msg)
-        self.store.save()
+        if self.id_format == "uuid":
+            msg["id"] = str(uuid.uuid4())
+        self.store.add_message(recipient, msg) # numbers the message if it has no ID
         with self.subscribers_lock:
             if recipient in self.subscribers:
                 sub = self.subscribers[recipient]
@@ -301,29 +1207,14 @@ class ChatServer:
         contact = request["contact"]
         read_batch_num = request.get("read_batch_num", DEFAULT_READ_BATCH_NUM)
 
-        if username not in self.store.users:
+        if self.store.get_user(username) is None:
             return {"status": "error", "message": "User not found."}, False
 
-        # Get all unread messages from this contact
-        unread_messages = [
-            msg for msg in self.store.users[username]["messages"]
-            if msg["from"] == contact and msg["status"] == "unread"
-        ]
-
-        if not unread_messages:
-            return {"status": "error", "message": "No unread messages."}, False
-
         # If read_batch_num is 0, mark all unread messages; otherwise mark only the specified batch.
-        if read_batch_num == 0:
-            batch = unread_messages
-        else:
-            batch = unread_messages[:read_batch_num]
-
-        for msg in batch:
-            msg["status"] = "read"
-
-        self.store.save()
-        return {"status": "success", "message": f"{len(batch)} messages marked as read."}, False
+        count = self.store.mark_read(username, contact, read_batch_num)
+        if count == 0:
+            return {"status": "error", "message": "No unread messages."}, False
+        return {"status": "success", "message": f"{count} messages marked as read."}, False
 
     def handle_delete_account(self, request, conn):
         """
@@ -339,10 +1230,9 @@ class ChatServer:
             A tuple containing the response and a boolean indicating whether the client should stop.
         """
         username = request["username"]
-        user = self.store.users.get(username)
+        user = self.store.get_user(username)
         if user and not user.get("deleted", False):
-            user["deleted"] = True
-            self.store.save()
+            self.store.delete_account(username)
             with self.subscribers_lock:
                 self.subscribers.pop(username, None)
             return {"status": "success", "message": "Account deleted."}, False
@@ -363,25 +1253,44 @@ class ChatServer:
         sender = request["sender"]
         recipient = request["recipient"]
         msg_id = request["message_id"]
-        users = self.store.users
-        if recipient not in users:
+        if self.store.get_user(recipient) is None:
             return {"status": "error", "message": "Recipient not found."}, False
-        for i, msg in enumerate(users[recipient]["messages"]):
-            if msg["id"] == msg_id and msg["from"] == sender and msg["status"] == "unread":
-                users[recipient]["messages"][i]["status"] = "deleted"
-                self.store.save()
-                with self.subscribers_lock:
-                    if recipient in self.subscribers:
-                        sub = self.subscribers[recipient]
-                        with sub["cond"]:
-                            sub["queue"].append({"id": msg_id, "from": sender, "message": "", "status": "deleted"})
-                            sub["cond"].notify()
-                return {"status": "success", "message": "Message deleted."}, False
+        if self.store.delete_message(sender, recipient, msg_id):
+            with self.subscribers_lock:
+                if recipient in self.subscribers:
+                    sub = self.subscribers[recipient]
+                    with sub["cond"]:
+                        sub["queue"].append({"id": msg_id, "from": sender, "message": "", "status": "deleted"})
+                        sub["cond"].notify()
+            return {"status": "success", "message": "Message deleted."}, False
         return {"status": "error", "message": "Message not found or already read."}, False
 
     def handle_receive(self, request, conn):
         """
-            Handle a receive request.
+            Handle a receive request. Without "after_seq" or "limit" the whole history is returned;
+            otherwise one page of messages after the after_seq cursor, optionally only from "contact".
+
+        Params:
+        
+            request: The request to process, a JSON-decoded dict.
+            conn: The connection to send the response on.
+        Returns: 
+        
+            A tuple containing the response and a boolean indicating whether the client should stop.
+        """
+        username = request["username"]
+        if self.store.get_user(username) is not None:
+            if "after_seq" not in request and "limit" not in request:
+                return {"status": "success", "messages": self.store.all_messages(username)}, False
+            page, next_seq, has_more = self.store.page_messages(
+                username, request.get("after_seq", 0), request.get("limit", 0), request.get("contact", ""))
+            return {"status": "success", "messages": page, "next_seq": next_seq, "has_more": has_more}, False
+        return {"status": "error", "message": "User not found."}, False
+
+    def handle_sync(self, request, conn):
+        """
+            Handle a sync request: the changes to the user's mailbox after the "since_seq" cursor,
+            at most "limit" of them.
 
         Params:
         
@@ -392,8 +1301,9 @@ class ChatServer:
             A tuple containing the response and a boolean indicating whether the client should stop.
         """
         username = request["username"]
-        if username in self.store.users:
-            return {"status": "success", "messages": self.store.users[username]["messages"]}, False
+        if self.store.get_user(username) is not None:
+            changes, next_seq, has_more = self.store.sync_since(username, request.get("since_seq", 0), request.get("limit", 0))
+            return {"status": "success", "changes": changes, "next_seq": next_seq, "has_more": has_more}, False
         return {"status": "error", "message": "User not found."}, False
 
     def handle_unknown(self, request, conn):
@@ -446,22 +1356,23 @@ class ChatServer:
             conn.close()
             return
 
-        # Normal processing loop
+        # Normal processing loop: one newline-terminated JSON request, then its reply, at a time
+        buffer = bytearray()
         while True:
             try:
-                data = conn.recv(4096).decode()
-                if not data:
+                data = recv_line(conn, buffer)
+                if data is None:
                     break
                 request = json.loads(data)
                 result, stop = self.process_request(request, conn)
                 if stop:
                     if result:
-                        conn.send(json.dumps(result).encode())
+                        send_json(conn, result)
                     break
-                conn.send(json.dumps(result).encode())
+                send_json(conn, result)
             except (json.JSONDecodeError, KeyError):
                 try:
-                    conn.send(json.dumps({"status": "error", "message": "Invalid request format"}).encode())
+                    send_json(conn, {"status": "error", "message": "Invalid request format"})
                 except Exception:
                     break
         conn.close()
@@ -518,6 +1429,12 @@ def get_server_config():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start the JSON chat server.")
+    parser.add_argument("--storage", choices=sorted(STORAGE_BACKENDS), default="json",
+                        help="json: in-memory store with a snapshot and journal (users.json); sqlite: SQLite database (users.db)")
+    parser.add_argument("--id_format", choices=ID_FORMATS, default="int",
+                        help="int: message IDs numbered by the store; uuid: UUID strings, for clients that expect them")
+    args = parser.parse_args()
     HOST, PORT = get_server_config()
-    chat_server = ChatServer(host=HOST, port=PORT)
+    chat_server = ChatServer(host=HOST, port=PORT, store=STORAGE_BACKENDS[args.storage](), id_format=args.id_format)
     chat_server.start()
\ No newline at end of file
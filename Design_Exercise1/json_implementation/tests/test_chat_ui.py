@@ -40,18 +40,38 @@ class TestChatUI(unittest.TestCase):
         mock_conn = MagicMock()
         mock_socket.return_value = mock_conn
         response_dict = {"status": "success", "data": "ok"}
-        mock_conn.recv.return_value = json.dumps(response_dict).encode()
+        mock_conn.recv.return_value = json.dumps(response_dict).encode() + b"\n"
         
         request = {"type": "test", "data": "empty"}
         response = client.send_request(request)
         
         mock_socket.assert_called_once_with(socket.AF_INET, socket.SOCK_STREAM)
         mock_conn.connect.assert_called_once_with((client.SERVER_HOST, client.SERVER_PORT))
-        mock_conn.send.assert_called_once_with(json.dumps(request).encode())
+        mock_conn.sendall.assert_called_once_with(json.dumps(request).encode() + b"\n")
         mock_conn.recv.assert_called_once()
         mock_conn.close.assert_called_once()
         self.assertEqual(response, response_dict)
     
+    @patch("socket.socket")
+    def test_send_request_reply_larger_than_buffer(self, mock_socket):
+        """
+        Test send_request reads a full page of messages spread over many recv calls.
+        """
+        mock_conn = MagicMock()
+        mock_socket.return_value = mock_conn
+        response_dict = {"status": "success", "next_seq": client.RECEIVE_PAGE_SIZE, "has_more": False,
+                         "messages": [{"id": i, "from": "alice", "message": "x" * 40, "status": "unread", "seq": i + 1}
+                                      for i in range(client.RECEIVE_PAGE_SIZE)]}
+        data = json.dumps(response_dict).encode() + b"\n"
+        chunks = [b"success: Version matched"] + [data[i:i + 4096] for i in range(0, len(data), 4096)]
+        self.assertGreater(len(chunks), 3)
+        mock_conn.recv.side_effect = chunks
+
+        response = client.send_request({"type": "receive", "username": "bob", "after_seq": 0,
+                                        "limit": client.RECEIVE_PAGE_SIZE})
+
+        self.assertEqual(response, response_dict)
+
     @patch("socket.socket")
     @patch("tkinter.messagebox.showerror")
     def test_send_request_connect_error(self, mock_showerror, mock_socket):
@@ -99,14 +119,14 @@ class TestChatUI(unittest.TestCase):
         mock_conn = MagicMock()
         mock_socket.return_value = mock_conn
         response_dict = {"status": "success", "data": "ok"}
-        mock_conn.recv.return_value = json.dumps(response_dict).encode()
+        mock_conn.recv.return_value = json.dumps(response_dict).encode() + b"\n"
         mock_conn.close.side_effect = Exception("Close failed")
         
         request = {"type": "test", "data": "Test Data"}
         response = client.send_request(request)
         
         mock_conn.connect.assert_called_once_with((client.SERVER_HOST, client.SERVER_PORT))
-        mock_conn.send.assert_called_once_with(json.dumps(request).encode())
+        mock_conn.sendall.assert_called_once_with(json.dumps(request).encode() + b"\n")
         mock_conn.recv.assert_called_once()
         mock_conn.close.assert_called_once()
         mock_showerror.assert_called_once()
@@ -123,10 +143,13 @@ class TestChatUI(unittest.TestCase):
         mock_send_request.return_value = {"status": "success", "messages": [
             {'from': 'user1', 'message': 'Hello'},
             {'from': 'user2', 'message': 'Hi'}
-        ]}
+        ], "next_seq": 2, "has_more": False}
         client.current_user = "test_user"
+        client.received_seq = 0
         client.load_conversations()
-        mock_send_request.assert_called_once_with({"type": "receive", "username": client.current_user})
+        mock_send_request.assert_called_once_with({"type": "receive", "username": client.current_user,
+                                                   "after_seq": 0, "limit": client.RECEIVE_PAGE_SIZE})
+        self.assertEqual(client.received_seq, 2)
         mock_add_message.assert_any_call('user1', {'from': 'user1', 'message': 'Hello'})
         mock_add_message.assert_any_call('user2', {'from': 'user2', 'message': 'Hi'})
         mock_update_conversation_list.assert_called_once()
@@ -142,12 +165,35 @@ class TestChatUI(unittest.TestCase):
         """
         mock_send_request.return_value = {"status": "error", "message": "User not found."}
         client.current_user = "test_user"
+        client.received_seq = 0
         client.load_conversations()
-        mock_send_request.assert_called_once_with({"type": "receive", "username": client.current_user})
+        mock_send_request.assert_called_once_with({"type": "receive", "username": client.current_user,
+                                                   "after_seq": 0, "limit": client.RECEIVE_PAGE_SIZE})
         mock_add_message.assert_not_called()
         mock_update_conversation_list.assert_not_called()
         mock_showerror.assert_called_once()
     
+    @patch('client.send_request')
+    @patch('client.update_conversation_list')
+    def test_sync_conversations(self, mock_update_conversation_list, mock_send_request):
+        """
+        Test sync_conversations applies new messages and status changes in place and advances the cursor.
+        """
+        client.conversations = {"user1": [{"id": "a", "from": "user1", "message": "Hello", "status": "unread"}]}
+        mock_send_request.return_value = {"status": "success", "changes": [
+            {"id": "a", "from": "user1", "message": "Hello", "status": "read", "updated": 8},
+            {"id": "b", "from": "user2", "message": "Hi", "status": "unread", "updated": 9}
+        ], "next_seq": 9, "has_more": False}
+        client.current_user = "test_user"
+        client.received_seq = 7
+        client.sync_conversations()
+        mock_send_request.assert_called_once_with({"type": "sync", "username": "test_user",
+                                                   "since_seq": 7, "limit": client.RECEIVE_PAGE_SIZE})
+        self.assertEqual([m["status"] for m in client.conversations["user1"]], ["read"])
+        self.assertEqual(client.conversations["user2"][0]["message"], "Hi")
+        self.assertEqual(client.received_seq, 9)
+        mock_update_conversation_list.assert_called_once()
+
     @patch('client.conversation_list')
     def test_update_conversation_list_empty(self, mock_conversation_list):
         """
@@ -227,14 +273,14 @@ class TestChatUI(unittest.TestCase):
         mock_update_conversation_list.assert_not_called()
     
     @patch('client.root.after')
-    @patch('client.load_conversations')
-    def test_check_new_messages(self, mock_load_conversations, mock_after):
+    @patch('client.sync_conversations')
+    def test_check_new_messages(self, mock_sync_conversations, mock_after):
         """
-        Test check_new_messages calls load_conversations and reschedules itself.
+        Test check_new_messages calls sync_conversations and reschedules itself.
         """
         client.current_user = "test_user"
         client.check_new_messages()
-        mock_load_conversations.assert_called_once()
+        mock_sync_conversations.assert_called_once()
         mock_after.assert_called_once_with(5000, client.check_new_messages)
     @patch('client.load_all_usernames', lambda: None)
     @patch('client.send_request')
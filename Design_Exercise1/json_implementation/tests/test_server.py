@@ -4,18 +4,27 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import unittest
-from server import ChatServer
-from chat_ui import hash_password
+import atexit
+import json
+import socket
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+from server import SERVER_VERSION, ChatServer, UserStore, SQLiteUserStore, recv_line, send_json
+from chat_ui import RECEIVE_PAGE_SIZE, hash_password
 
 class TestServerHandlers(unittest.TestCase):
 
     def setUp(self):
-        """Reset the user store before each test."""
-        # Use a fresh UserStore (this writes to users.json but tests run sequentially)
-        self.chat_server = ChatServer()
-        self.chat_server.store.users.clear()
-        self.chat_server.active_users.clear()
-        self.chat_server.subscribers.clear()
+        """Use a fresh UserStore in a temporary directory for each test."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.chat_server = ChatServer(store=UserStore(os.path.join(self.tmpdir.name, "users.json")))
+
+    def tearDown(self):
+        atexit.unregister(self.chat_server.store.clear)
+        self.chat_server.store.journal.close()
+        self.tmpdir.cleanup()
 
     def test_handle_register_success(self):
         response, _ = self.chat_server.handle_register(
@@ -39,6 +48,19 @@ class TestServerHandlers(unittest.TestCase):
         self.assertIn("Logged in", response["message"])
         self.assertIn("testuser", self.chat_server.active_users)
 
+    def test_handle_login_unread_by_contact(self):
+        self.chat_server.store.users["testuser"] = {
+            "password": hash_password("password123"),
+            "messages": [
+                {"id": "1", "from": "alice", "message": "a", "status": "unread"},
+                {"id": "2", "from": "bob", "message": "b", "status": "read"},
+                {"id": "3", "from": "alice", "message": "c", "status": "unread"},
+            ]}
+        response, _ = self.chat_server.handle_login(
+            {"username": "testuser", "password": hash_password("password123")}, None)
+        self.assertEqual(response["message"], "Logged in. 2 unread messages.")
+        self.assertEqual(response["unread_by_contact"], {"alice": 2})
+
     def test_handle_login_already_logged_in(self):
         self.chat_server.store.users["testuser"] = {
             "password": hash_password("password123"), "messages": []}
@@ -73,6 +95,22 @@ class TestServerHandlers(unittest.TestCase):
         self.assertEqual(response["status"], "success")
         self.assertTrue(response["message"].startswith("Message sent"))
 
+    def test_handle_send_numbers_messages(self):
+        self.chat_server.store.register("recipient", hash_password("pass"))
+        first, _ = self.chat_server.handle_send({"sender": "sender", "recipient": "recipient", "message": "a"}, None)
+        second, _ = self.chat_server.handle_send({"sender": "sender", "recipient": "recipient", "message": "b"}, None)
+        self.assertIsInstance(first["message_id"], int)
+        self.assertGreater(second["message_id"], first["message_id"])
+        response, _ = self.chat_server.handle_delete(
+            {"sender": "sender", "recipient": "recipient", "message_id": first["message_id"]}, None)
+        self.assertEqual(response["status"], "success")
+
+    def test_handle_send_uuid_ids(self):
+        self.chat_server.id_format = "uuid"
+        self.chat_server.store.register("recipient", hash_password("pass"))
+        response, _ = self.chat_server.handle_send({"sender": "sender", "recipient": "recipient", "message": "a"}, None)
+        self.assertEqual(len(response["message_id"]), 36)
+
     def test_handle_send_nonexistent_recipient(self):
         self.chat_server.store.users["sender"] = {"password": hash_password("pass"), "messages": []}
         response, _ = self.chat_server.handle_send(
@@ -248,5 +286,291 @@ class TestServerHandlers(unittest.TestCase):
         self.assertEqual(response, {"status": "success", "message": "Logged out."})
         self.assertEqual(self.chat_server.active_users, {"testuser1"})
         
+class TestReceivePaging(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.chat_server = ChatServer(store=UserStore(os.path.join(self.tmpdir.name, "users.json")))
+        for name in ["alice", "bob", "recipient"]:
+            self.chat_server.store.register(name, "pw")
+        for i in range(5):
+            sender = "alice" if i % 2 == 0 else "bob"
+            self.chat_server.handle_send({"sender": sender, "recipient": "recipient", "message": f"m{i}"}, None)
+
+    def tearDown(self):
+        atexit.unregister(self.chat_server.store.clear)
+        self.chat_server.store.journal.close()
+        self.tmpdir.cleanup()
+
+    def receive(self, **kwargs):
+        response, _ = self.chat_server.handle_receive(dict(username="recipient", **kwargs), None)
+        return response
+
+    def test_full_history_without_cursor(self):
+        self.assertEqual(len(self.receive()["messages"]), 5)
+        self.assertNotIn("next_seq", self.receive())
+
+    def test_pages_follow_cursor(self):
+        first = self.receive(after_seq=0, limit=2)
+        self.assertEqual([m["message"] for m in first["messages"]], ["m0", "m1"])
+        self.assertEqual((first["next_seq"], first["has_more"]), (2, True))
+        second = self.receive(after_seq=first["next_seq"], limit=10)
+        self.assertEqual([m["message"] for m in second["messages"]], ["m2", "m3", "m4"])
+        self.assertEqual((second["next_seq"], second["has_more"]), (5, False))
+
+    def test_full_page_over_socket(self):
+        for i in range(RECEIVE_PAGE_SIZE):
+            self.chat_server.handle_send({"sender": "alice", "recipient": "recipient", "message": "x" * 40}, None)
+        client_sock, server_sock = socket.socketpair()
+        self.addCleanup(client_sock.close)
+        threading.Thread(target=self.chat_server.client_thread, args=(server_sock, "test"), daemon=True).start()
+        client_sock.sendall(SERVER_VERSION.encode().ljust(32))
+        self.assertEqual(client_sock.recv(1023), b"success: Version matched")
+        send_json(client_sock, {"type": "receive", "username": "recipient", "after_seq": 0, "limit": RECEIVE_PAGE_SIZE})
+        buffer = bytearray()
+        data = recv_line(client_sock, buffer)
+        # A full page is several recv buffers long, and still arrives as one reply
+        self.assertGreater(len(data), 4 * 4096)
+        response = json.loads(data)
+        self.assertEqual(len(response["messages"]), RECEIVE_PAGE_SIZE)
+        self.assertTrue(response["has_more"])
+        send_json(client_sock, {"type": "receive", "username": "recipient", "after_seq": response["next_seq"], "limit": RECEIVE_PAGE_SIZE})
+        self.assertEqual(len(json.loads(recv_line(client_sock, buffer))["messages"]), 5)
+
+    def test_contact_filter(self):
+        response = self.receive(after_seq=1, limit=0, contact="alice")
+        self.assertEqual([m["message"] for m in response["messages"]], ["m2", "m4"])
+
+    def test_sync_returns_status_changes(self):
+        self.chat_server.store.mark_read("recipient", "alice", 1)
+        msg_id = self.chat_server.store.all_messages("recipient")[1]["id"]
+        self.chat_server.handle_delete({"sender": "bob", "recipient": "recipient", "message_id": msg_id}, None)
+        response, _ = self.chat_server.handle_sync({"username": "recipient", "since_seq": 5, "limit": 0}, None)
+        self.assertEqual([(m["message"], m["status"], m["updated"]) for m in response["changes"]],
+                         [("m0", "read", 6), ("m1", "deleted", 7)])
+        self.assertEqual((response["next_seq"], response["has_more"]), (7, False))
+        # Messages changed after their arrival are returned once, at their latest change
+        response, _ = self.chat_server.handle_sync({"username": "recipient", "since_seq": 0, "limit": 3}, None)
+        self.assertEqual([m["message"] for m in response["changes"]], ["m2", "m3", "m4"])
+        self.assertTrue(response["has_more"])
+
+class TestReceivePagingSQLite(TestReceivePaging):
+    """Run the paging and sync tests against the SQLite backend."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = SQLiteUserStore(os.path.join(self.tmpdir.name, "users.db"))
+        self.chat_server = ChatServer(store=self.store)
+        for name in ["alice", "bob", "recipient"]:
+            self.store.register(name, "pw")
+        for i in range(5):
+            sender = "alice" if i % 2 == 0 else "bob"
+            self.chat_server.handle_send({"sender": sender, "recipient": "recipient", "message": f"m{i}"}, None)
+
+    def tearDown(self):
+        self.store.db.close()
+        self.tmpdir.cleanup()
+
+class TestSQLiteUserStore(unittest.TestCase):
+
+    def setUp(self):
+        """Use a database in a temporary directory for each test."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, "users.db")
+        self.store = SQLiteUserStore(self.filename)
+        self.chat_server = ChatServer(store=self.store)
+
+    def tearDown(self):
+        self.store.db.close()
+        self.tmpdir.cleanup()
+
+    def test_database_kept_at_exit(self):
+        with patch("server.atexit.register") as register:
+            ChatServer(store=self.store)
+        register.assert_not_called()
+
+    def test_wal_mode(self):
+        self.assertEqual(self.store.db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+    def test_accounts(self):
+        self.chat_server.handle_register({"username": "alice", "password": hash_password("pw")}, None)
+        self.chat_server.handle_register({"username": "bob", "password": hash_password("pw")}, None)
+        response, _ = self.chat_server.handle_register({"username": "alice", "password": "x"}, None)
+        self.assertEqual(response["status"], "error")
+        self.chat_server.handle_delete_account({"username": "bob"}, None)
+        self.assertEqual(self.store.usernames(), ["alice"])
+        response, _ = self.chat_server.handle_list_users({"prefix": "*"}, None)
+        self.assertEqual(response["users"], ["alice"])
+        response, _ = self.chat_server.handle_login({"username": "bob", "password": hash_password("pw")}, None)
+        self.assertEqual(response["status"], "error")
+
+    def test_unread_counts(self):
+        for name in ["alice", "bob", "carol"]:
+            self.store.register(name, hash_password("pw"))
+        for sender in ["alice", "alice", "carol"]:
+            self.chat_server.handle_send({"sender": sender, "recipient": "bob", "message": "x"}, None)
+        self.chat_server.handle_mark_read({"username": "bob", "contact": "alice", "read_batch_num": 1}, None)
+        response, _ = self.chat_server.handle_login({"username": "bob", "password": hash_password("pw")}, None)
+        self.assertEqual(response["message"], "Logged in. 2 unread messages.")
+        self.assertEqual(response["unread_by_contact"], {"alice": 1, "carol": 1})
+
+    def test_data_survives_reopen(self):
+        self.store.register("alice", "pw")
+        self.store.register("bob", "pw")
+        self.store.add_message("bob", {"id": "1", "from": "alice", "message": "hi", "status": "unread"})
+        self.store.mark_read("bob", "alice", 0)
+        self.store.db.close()
+        self.store = SQLiteUserStore(self.filename)
+        self.assertEqual(self.store.all_messages("bob"),
+                         [{"id": "1", "from": "alice", "message": "hi", "status": "read", "seq": 1, "updated": 2}])
+        # Sequence numbers continue where they stopped
+        self.store.add_message("bob", {"id": "2", "from": "alice", "message": "again", "status": "unread"})
+        self.assertEqual(self.store.all_messages("bob")[-1]["seq"], 3)
+
+    def test_message_ids_survive_reopen(self):
+        self.store.register("alice", "pw")
+        self.store.register("bob", "pw")
+        for _ in range(2):
+            self.chat_server.handle_send({"sender": "alice", "recipient": "bob", "message": "x"}, None)
+        self.store.db.close()
+        self.store = SQLiteUserStore(self.filename)
+        msg = {"from": "alice", "message": "y", "status": "unread"}
+        self.store.add_message("bob", msg)
+        self.assertEqual([m["id"] for m in self.store.all_messages("bob")], [1, 2, 3])
+        self.assertTrue(self.store.delete_message("alice", "bob", msg["id"]))
+
+    def test_queries_use_indexes(self):
+        plan = lambda query, *params: " ".join(row[-1] for row in self.store.db.execute("EXPLAIN QUERY PLAN " + query, params))
+        self.assertIn("messages_unread", plan("SELECT sender, COUNT(*) FROM messages WHERE recipient = ? AND status = 'unread' "
+                                              "GROUP BY sender", "bob"))
+        self.assertIn("messages_id", plan("SELECT seq FROM messages WHERE id = ?", "1"))
+        self.assertIn("messages_changed", plan("SELECT * FROM messages WHERE recipient = ? AND changed > ? ORDER BY changed", "bob", 0))
+
+class TestUserStoreJournal(unittest.TestCase):
+
+    def setUp(self):
+        """Use a snapshot file in a temporary directory for each test."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, "users.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def reopen(self, store):
+        store.journal.close()
+        return UserStore(self.filename)
+
+    def test_mark_read_skips_deleted_messages(self):
+        store = UserStore(self.filename)
+        store.register("alice", "pw")
+        store.register("bob", "pw")
+        for text in ["a", "b", "c", "d"]:
+            store.add_message("bob", {"from": "alice", "message": text, "status": "unread"})
+        ids = [m["id"] for m in store.all_messages("bob")]
+        self.assertTrue(store.delete_message("alice", "bob", str(ids[1]))) # IDs may arrive as text
+        self.assertFalse(store.delete_message("carol", "bob", ids[2]))
+        self.assertEqual(store.mark_read("bob", "alice", 2), 2)
+        self.assertFalse(store.delete_message("alice", "bob", ids[2]))
+        self.assertEqual([m["status"] for m in store.all_messages("bob")], ["read", "deleted", "read", "unread"])
+        self.assertEqual(store.mark_read("bob", "alice", 0), 1)
+        reopened = self.reopen(store)
+        self.assertEqual([m["status"] for m in reopened.all_messages("bob")], ["read", "deleted", "read", "read"])
+        reopened.journal.close()
+
+    def test_mutations_replayed_on_restart(self):
+        store = UserStore(self.filename)
+        store.register("alice", "pw")
+        store.register("bob", "pw")
+        store.add_message("bob", {"id": "1", "from": "alice", "message": "Hi", "status": "unread"})
+        store.add_message("bob", {"id": "2", "from": "alice", "message": "Bye", "status": "unread"})
+        store.add_message("bob", {"id": "3", "from": "alice", "message": "Again", "status": "unread"})
+        self.assertEqual(store.mark_read("bob", "alice", 1), 1)
+        self.assertTrue(store.delete_message("alice", "bob", "2"))
+        self.assertTrue(store.delete_account("alice"))
+        restored = self.reopen(store)
+        self.assertEqual(restored.users, store.users)
+        self.assertEqual(restored.seq, store.seq)
+        self.assertEqual([m["status"] for m in restored.users["bob"]["messages"]], ["read", "deleted", "unread"])
+        self.assertEqual(restored.sync_since("bob", 3), store.sync_since("bob", 3))
+        self.assertEqual([m["updated"] for m in restored.sync_since("bob", 3)[0]], [4, 5])
+
+    def test_write_appends_one_line(self):
+        store = UserStore(self.filename)
+        store.register("bob", "pw")
+        for i in range(5):
+            store.add_message("bob", {"id": str(i), "from": "alice", "message": "x", "status": "unread"})
+        with open(store.journal_filename) as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(json.loads(lines[-1])["message"]["id"], "4")
+        store.journal.close()
+
+    def test_no_op_not_journaled(self):
+        store = UserStore(self.filename)
+        store.register("bob", "pw")
+        self.assertEqual(store.mark_read("bob", "alice", 0), 0)
+        self.assertFalse(store.delete_message("alice", "bob", "missing"))
+        self.assertEqual(store.journal_entries, 1)
+        store.journal.close()
+
+    def test_torn_final_entry_ignored(self):
+        store = UserStore(self.filename)
+        store.register("bob", "pw")
+        store.journal.write('{"op": "register", "username": "ca')
+        store.journal.flush()
+        restored = self.reopen(store)
+        self.assertEqual(list(restored.users), ["bob"])
+
+    def test_background_compaction(self):
+        store = UserStore(self.filename, compact_every=10)
+        store.register("bob", "pw")
+        for i in range(12):
+            store.add_message("bob", {"id": str(i), "from": "alice", "message": "x", "status": "unread"})
+        for _ in range(100):
+            if not store.compacting:
+                break
+            time.sleep(0.01)
+        with open(self.filename) as f:
+            snapshot = json.load(f)
+        self.assertGreaterEqual(snapshot["seq"], 10)
+        self.assertLess(store.journal_entries, 10)
+        restored = self.reopen(store)
+        self.assertEqual(len(restored.users["bob"]["messages"]), 12)
+
+    def test_unread_counters(self):
+        store = UserStore(self.filename)
+        store.register("bob", "pw")
+        for i, sender in enumerate(["alice", "alice", "carol", "carol"]):
+            store.add_message("bob", {"id": str(i), "from": sender, "message": "x", "status": "unread"})
+        store.mark_read("bob", "alice", 1)
+        store.delete_message("carol", "bob", "2")
+        self.assertEqual(store.message_index("bob")["by_contact"], {"alice": 1, "carol": 1})
+        self.assertEqual(store.message_index("bob")["total"], 2)
+        restored = self.reopen(store)
+        self.assertEqual(restored.message_index("bob")["by_contact"], {"alice": 1, "carol": 1})
+
+    def test_message_ids_replayed(self):
+        store = UserStore(self.filename)
+        store.register("bob", "pw")
+        for _ in range(3):
+            store.add_message("bob", {"from": "alice", "message": "x", "status": "unread"})
+        ids = [m["id"] for m in store.users["bob"]["messages"]]
+        self.assertEqual(ids, sorted(set(ids)))
+        restored = self.reopen(store)
+        self.assertEqual([m["id"] for m in restored.users["bob"]["messages"]], ids)
+        msg = {"from": "alice", "message": "y", "status": "unread"}
+        restored.add_message("bob", msg)
+        self.assertGreater(msg["id"], ids[-1])
+        restored.journal.close()
+
+    def test_legacy_snapshot_loaded(self):
+        with open(self.filename, "w") as f:
+            json.dump({"bob": {"password": "pw", "messages": []}}, f)
+        store = UserStore(self.filename)
+        self.assertIn("bob", store.users)
+        store.add_message("bob", {"id": "1", "from": "alice", "message": "x", "status": "unread"})
+        restored = self.reopen(store)
+        self.assertEqual(len(restored.users["bob"]["messages"]), 1)
+
 if __name__ == '__main__':
     unittest.main()
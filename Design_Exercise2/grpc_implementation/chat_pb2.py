@@ -24,13 +24,15 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nchat.proto\"\x1a\n\x07Version\x12\x0f\n\x07version\x18\x01 \x01(\t\"3\n\x0fVersionResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"5\n\x0fRegisterRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"#\n\x10RegisterResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\"2\n\x0cLoginRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"9\n\rLoginResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x17\n\x0funread_messages\x18\x02 \x01(\x05\"\x12\n\x10ListUsersRequest\"\"\n\x11ListUsersResponse\x12\r\n\x05users\x18\x01 \x03(\t\"H\n\x12SendMessageRequest\x12\x0e\n\x06sender\x18\x01 \x01(\t\x12\x11\n\trecipient\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\"9\n\x13SendMessageResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x12\n\nmessage_id\x18\x02 \x01(\t\"$\n\x10SubscribeRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"F\n\x07Message\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0e\n\x06sender\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\x12\x0e\n\x06status\x18\x04 \x01(\t\"G\n\x0fMarkReadRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontact\x18\x02 \x01(\t\x12\x11\n\tbatch_num\x18\x03 \x01(\x05\"#\n\x10MarkReadResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\"S\n\x1a\x44\x65leteUnreadMessageRequest\x12\x0e\n\x06sender\x18\x01 \x01(\t\x12\x11\n\trecipient\x18\x02 \x01(\t\x12\x12\n\nmessage_id\x18\x03 \x01(\t\">\n\x1b\x44\x65leteUnreadMessageResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\"*\n\x16ReceiveMessagesRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"E\n\x17ReceiveMessagesResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x1a\n\x08messages\x18\x02 \x03(\x0b\x32\x08.Message\"(\n\x14\x44\x65leteAccountRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"(\n\x15\x44\x65leteAccountResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\"!\n\rLogoutRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"!\n\x0eLogoutResponse\x12\x0f\n\x07message\x18\x01 \x01(\t2\xe0\x04\n\x0b\x43hatService\x12*\n\x0c\x43heckVersion\x12\x08.Version\x1a\x10.VersionResponse\x12/\n\x08Register\x12\x10.RegisterRequest\x1a\x11.RegisterResponse\x12&\n\x05Login\x12\r.LoginRequest\x1a\x0e.LoginResponse\x12\x32\n\tListUsers\x12\x11.ListUsersRequest\x1a\x12.ListUsersResponse\x12\x38\n\x0bSendMessage\x12\x13.SendMessageRequest\x1a\x14.SendMessageResponse\x12*\n\tSubscribe\x12\x11.SubscribeRequest\x1a\x08.Message0\x01\x12/\n\x08MarkRead\x12\x10.MarkReadRequest\x1a\x11.MarkReadResponse\x12P\n\x13\x44\x65leteUnreadMessage\x12\x1b.DeleteUnreadMessageRequest\x1a\x1c.DeleteUnreadMessageResponse\x12\x44\n\x0fReceiveMessages\x12\x17.ReceiveMessagesRequest\x1a\x18.ReceiveMessagesResponse\x12>\n\rDeleteAccount\x12\x15.DeleteAccountRequest\x1a\x16.DeleteAccountResponse\x12)\n\x06Logout\x12\x0e.LogoutRequest\x1a\x0f.LogoutResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nchat.proto\"\x1a\n\x07Version\x12\x0f\n\x07version\x18\x01 \x01(\t\"3\n\x0fVersionResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"5\n\x0fRegisterRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"#\n\x10RegisterResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\"2\n\x0cLoginRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"\xb1\x01\n\rLoginResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x17\n\x0funread_messages\x18\x02 \x01(\x05\x12>\n\x11unread_by_contact\x18\x03 \x03(\x0b\x32#.LoginResponse.UnreadByContactEntry\x1a\x36\n\x14UnreadByContactEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x05:\x02\x38\x01\"\x12\n\x10ListUsersRequest\"\"\n\x11ListUsersResponse\x12\r\n\x05users\x18\x01 \x03(\t\"H\n\x12SendMessageRequest\x12\x0e\n\x06sender\x18\x01 \x01(\t\x12\x11\n\trecipient\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\"Q\n\x13SendMessageResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x12\n\nmessage_id\x18\x02 \x01(\t\x12\x16\n\x0eint_message_id\x18\x03 \x01(\x04\"$\n\x10SubscribeRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"t\n\x07Message\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0e\n\x06sender\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\x12\x0e\n\x06status\x18\x04 \x01(\t\x12\x0b\n\x03seq\x18\x05 \x01(\x03\x12\x0f\n\x07updated\x18\x06 \x01(\x03\x12\x0e\n\x06int_id\x18\x07 \x01(\x04\"G\n\x0fMarkReadRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontact\x18\x02 \x01(\t\x12\x11\n\tbatch_num\x18\x03 \x01(\x05\"#\n\x10MarkReadResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\"k\n\x1a\x44\x65leteUnreadMessageRequest\x12\x0e\n\x06sender\x18\x01 \x01(\t\x12\x11\n\trecipient\x18\x02 \x01(\t\x12\x12\n\nmessage_id\x18\x03 \x01(\t\x12\x16\n\x0eint_message_id\x18\x04 \x01(\x04\">\n\x1b\x44\x65leteUnreadMessageResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\"]\n\x16ReceiveMessagesRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x11\n\tafter_seq\x18\x02 \x01(\x03\x12\r\n\x05limit\x18\x03 \x01(\x05\x12\x0f\n\x07\x63ontact\x18\x04 \x01(\t\"i\n\x17ReceiveMessagesResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x1a\n\x08messages\x18\x02 \x03(\x0b\x32\x08.Message\x12\x10\n\x08next_seq\x18\x03 \x01(\x03\x12\x10\n\x08has_more\x18\x04 \x01(\x08\"A\n\x0bSyncRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x11\n\tsince_seq\x18\x02 \x01(\x03\x12\r\n\x05limit\x18\x03 \x01(\x05\"]\n\x0cSyncResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x19\n\x07\x63hanges\x18\x02 \x03(\x0b\x32\x08.Message\x12\x10\n\x08next_seq\x18\x03 \x01(\x03\x12\x10\n\x08has_more\x18\x04 \x01(\x08\"(\n\x14\x44\x65leteAccountRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"(\n\x15\x44\x65leteAccountResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\"!\n\rLogoutRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"!\n\x0eLogoutResponse\x12\x0f\n\x07message\x18\x01 \x01(\t2\x8a\x05\n\x0b\x43hatService\x12*\n\x0c\x43heckVersion\x12\x08.Version\x1a\x10.VersionResponse\x12/\n\x08Register\x12\x10.RegisterRequest\x1a\x11.RegisterResponse\x12&\n\x05Login\x12\r.LoginRequest\x1a\x0e.LoginResponse\x12\x32\n\tListUsers\x12\x11.ListUsersRequest\x1a\x12.ListUsersResponse\x12\x38\n\x0bSendMessage\x12\x13.SendMessageRequest\x1a\x14.SendMessageResponse\x12*\n\tSubscribe\x12\x11.SubscribeRequest\x1a\x08.Message0\x01\x12/\n\x08MarkRead\x12\x10.MarkReadRequest\x1a\x11.MarkReadResponse\x12P\n\x13\x44\x65leteUnreadMessage\x12\x1b.DeleteUnreadMessageRequest\x1a\x1c.DeleteUnreadMessageResponse\x12\x44\n\x0fReceiveMessages\x12\x17.ReceiveMessagesRequest\x1a\x18.ReceiveMessagesResponse\x12>\n\rDeleteAccount\x12\x15.DeleteAccountRequest\x1a\x16.DeleteAccountResponse\x12)\n\x06Logout\x12\x0e.LogoutRequest\x1a\x0f.LogoutResponse\x12(\n\tSyncSince\x12\x0c.SyncRequest\x1a\r.SyncResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'chat_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
+  _globals['_LOGINRESPONSE_UNREADBYCONTACTENTRY']._loaded_options = None
+  _globals['_LOGINRESPONSE_UNREADBYCONTACTENTRY']._serialized_options = b'8\001'
   _globals['_VERSION']._serialized_start=14
   _globals['_VERSION']._serialized_end=40
   _globals['_VERSIONRESPONSE']._serialized_start=42
@@ -41,40 +43,46 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_REGISTERRESPONSE']._serialized_end=185
   _globals['_LOGINREQUEST']._serialized_start=187
   _globals['_LOGINREQUEST']._serialized_end=237
-  _globals['_LOGINRESPONSE']._serialized_start=239
-  _globals['_LOGINRESPONSE']._serialized_end=296
-  _globals['_LISTUSERSREQUEST']._serialized_start=298
-  _globals['_LISTUSERSREQUEST']._serialized_end=316
-  _globals['_LISTUSERSRESPONSE']._serialized_start=318
-  _globals['_LISTUSERSRESPONSE']._serialized_end=352
-  _globals['_SENDMESSAGEREQUEST']._serialized_start=354
-  _globals['_SENDMESSAGEREQUEST']._serialized_end=426
-  _globals['_SENDMESSAGERESPONSE']._serialized_start=428
-  _globals['_SENDMESSAGERESPONSE']._serialized_end=485
-  _globals['_SUBSCRIBEREQUEST']._serialized_start=487
-  _globals['_SUBSCRIBEREQUEST']._serialized_end=523
-  _globals['_MESSAGE']._serialized_start=525
-  _globals['_MESSAGE']._serialized_end=595
-  _globals['_MARKREADREQUEST']._serialized_start=597
-  _globals['_MARKREADREQUEST']._serialized_end=668
-  _globals['_MARKREADRESPONSE']._serialized_start=670
-  _globals['_MARKREADRESPONSE']._serialized_end=705
-  _globals['_DELETEUNREADMESSAGEREQUEST']._serialized_start=707
-  _globals['_DELETEUNREADMESSAGEREQUEST']._serialized_end=790
-  _globals['_DELETEUNREADMESSAGERESPONSE']._serialized_start=792
-  _globals['_DELETEUNREADMESSAGERESPONSE']._serialized_end=854
-  _globals['_RECEIVEMESSAGESREQUEST']._serialized_start=856
-  _globals['_RECEIVEMESSAGESREQUEST']._serialized_end=898
-  _globals['_RECEIVEMESSAGESRESPONSE']._serialized_start=900
-  _globals['_RECEIVEMESSAGESRESPONSE']._serialized_end=969
-  _globals['_DELETEACCOUNTREQUEST']._serialized_start=971
-  _globals['_DELETEACCOUNTREQUEST']._serialized_end=1011
-  _globals['_DELETEACCOUNTRESPONSE']._serialized_start=1013
-  _globals['_DELETEACCOUNTRESPONSE']._serialized_end=1053
-  _globals['_LOGOUTREQUEST']._serialized_start=1055
-  _globals['_LOGOUTREQUEST']._serialized_end=1088
-  _globals['_LOGOUTRESPONSE']._serialized_start=1090
-  _globals['_LOGOUTRESPONSE']._serialized_end=1123
-  _globals['_CHATSERVICE']._serialized_start=1126
-  _globals['_CHATSERVICE']._serialized_end=1734
+  _globals['_LOGINRESPONSE']._serialized_start=240
+  _globals['_LOGINRESPONSE']._serialized_end=417
+  _globals['_LOGINRESPONSE_UNREADBYCONTACTENTRY']._serialized_start=363
+  _globals['_LOGINRESPONSE_UNREADBYCONTACTENTRY']._serialized_end=417
+  _globals['_LISTUSERSREQUEST']._serialized_start=419
+  _globals['_LISTUSERSREQUEST']._serialized_end=437
+  _globals['_LISTUSERSRESPONSE']._serialized_start=439
+  _globals['_LISTUSERSRESPONSE']._serialized_end=473
+  _globals['_SENDMESSAGEREQUEST']._serialized_start=475
+  _globals['_SENDMESSAGEREQUEST']._serialized_end=547
+  _globals['_SENDMESSAGERESPONSE']._serialized_start=549
+  _globals['_SENDMESSAGERESPONSE']._serialized_end=630
+  _globals['_SUBSCRIBEREQUEST']._serialized_start=632
+  _globals['_SUBSCRIBEREQUEST']._serialized_end=668
+  _globals['_MESSAGE']._serialized_start=670
+  _globals['_MESSAGE']._serialized_end=786
+  _globals['_MARKREADREQUEST']._serialized_start=788
+  _globals['_MARKREADREQUEST']._serialized_end=859
+  _globals['_MARKREADRESPONSE']._serialized_start=861
+  _globals['_MARKREADRESPONSE']._serialized_end=896
+  _globals['_DELETEUNREADMESSAGEREQUEST']._serialized_start=898
+  _globals['_DELETEUNREADMESSAGEREQUEST']._serialized_end=1005
+  _globals['_DELETEUNREADMESSAGERESPONSE']._serialized_start=1007
+  _globals['_DELETEUNREADMESSAGERESPONSE']._serialized_end=1069
+  _globals['_RECEIVEMESSAGESREQUEST']._serialized_start=1071
+  _globals['_RECEIVEMESSAGESREQUEST']._serialized_end=1164
+  _globals['_RECEIVEMESSAGESRESPONSE']._serialized_start=1166
+  _globals['_RECEIVEMESSAGESRESPONSE']._serialized_end=1271
+  _globals['_SYNCREQUEST']._serialized_start=1273
+  _globals['_SYNCREQUEST']._serialized_end=1338
+  _globals['_SYNCRESPONSE']._serialized_start=1340
+  _globals['_SYNCRESPONSE']._serialized_end=1433
+  _globals['_DELETEACCOUNTREQUEST']._serialized_start=1435
+  _globals['_DELETEACCOUNTREQUEST']._serialized_end=1475
+  _globals['_DELETEACCOUNTRESPONSE']._serialized_start=1477
+  _globals['_DELETEACCOUNTRESPONSE']._serialized_end=1517
+  _globals['_LOGOUTREQUEST']._serialized_start=1519
+  _globals['_LOGOUTREQUEST']._serialized_end=1552
+  _globals['_LOGOUTRESPONSE']._serialized_start=1554
+  _globals['_LOGOUTRESPONSE']._serialized_end=1587
+  _globals['_CHATSERVICE']._serialized_start=1590
+  _globals['_CHATSERVICE']._serialized_end=2240
 # @@protoc_insertion_point(module_scope)
@@ -89,6 +89,11 @@ class ChatServiceStub(object):
                 request_serializer=chat__pb2.LogoutRequest.SerializeToString,
                 response_deserializer=chat__pb2.LogoutResponse.FromString,
                 _registered_method=True)
+        self.SyncSince = channel.unary_unary(
+                '/ChatService/SyncSince',
+                request_serializer=chat__pb2.SyncRequest.SerializeToString,
+                response_deserializer=chat__pb2.SyncResponse.FromString,
+                _registered_method=True)
 
 
 class ChatServiceServicer(object):
@@ -160,6 +165,12 @@ class ChatServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def SyncSince(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ChatServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -218,6 +229,11 @@ def add_ChatServiceServicer_to_server(servicer, server):
                     request_deserializer=chat__pb2.LogoutRequest.FromString,
                     response_serializer=chat__pb2.LogoutResponse.SerializeToString,
             ),
+            'SyncSince': grpc.unary_unary_rpc_method_handler(
+                    servicer.SyncSince,
+                    request_deserializer=chat__pb2.SyncRequest.FromString,
+                    response_serializer=chat__pb2.SyncResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'ChatService', rpc_method_handlers)
@@ -525,3 +541,30 @@ class ChatService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def SyncSince(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/ChatService/SyncSince',
+            chat__pb2.SyncRequest.SerializeToString,
+            chat__pb2.SyncResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -29,10 +29,14 @@ else:
     SERVER_PORT = 5001
 
 CLIENT_VERSION = "1.0.0"
+RECEIVE_PAGE_SIZE = 200 # messages fetched per ReceiveMessages call
 
 current_user = None
+received_seq = 0 # sequence number of the newest mailbox change loaded from the server
 # conversations: key=contact, value=list of message dicts {id, from, message, status}
 conversations = {}
+message_positions = {} # {contact: (conversations[contact], {message id: index in that list})}
+unread_counts = {} # {contact: unread messages} from login, shown until the messages themselves are loaded
 chat_windows = {}   # open chat windows
 undelivered = {} # saves undelivered message
 subscription_active = False
@@ -53,6 +57,21 @@ def hash_password(password):
     """
     return hashlib.sha256(password.encode()).hexdigest()
 
+def id_fields(message_id):
+    """
+        The DeleteUnreadMessageRequest field carrying a message ID: the ID as the server sent it, an
+        integer (int_message_id) or a UUID string from a server run with --id_format uuid (message_id)
+
+        Params:
+
+            message_id: int or str
+
+        Returns:
+
+            dict of the field name and value
+    """
+    return {"int_message_id": message_id} if isinstance(message_id, int) else {"message_id": message_id}
+
 def add_message(contact, msg):
     """
         Add a message if its ID isn’t already present, or update it if it exists.
@@ -69,11 +88,18 @@ def add_message(contact, msg):
     """
     if contact not in conversations:
         conversations[contact] = []
-    for i, existing in enumerate(conversations[contact]):
-        if existing["id"] == msg["id"]:
-            conversations[contact][i] = msg  # update the message (e.g. mark as deleted)
-            return True
-    conversations[contact].append(msg)
+    msgs = conversations[contact]
+    indexed, positions = message_positions.get(contact, (None, None))
+    if indexed is not msgs or len(positions) != len(msgs):
+        # The conversation was replaced or changed without going through add_message
+        positions = {m["id"]: i for i, m in enumerate(msgs)}
+        message_positions[contact] = (msgs, positions)
+    i = positions.get(msg["id"])
+    if i is not None:
+        msgs[i] = msg  # update the message (e.g. mark as deleted)
+    else:
+        positions[msg["id"]] = len(msgs)
+        msgs.append(msg)
     return True
 
 def check_version_number():
@@ -143,18 +169,22 @@ def login():
 
             None
     """
-    global current_user, subscription_active
+    global current_user, subscription_active, received_seq, unread_counts
     username = username_entry.get().strip()
     password = password_entry.get().strip()
     if not username or not password:
         messagebox.showwarning("Input Error", "Username and password cannot be empty.")
         return
-    response = stub.Login(chat_pb2.LoginRequest(username=username, password=hash_password(password))).message
+    reply = stub.Login(chat_pb2.LoginRequest(username=username, password=hash_password(password)))
+    response = reply.message
     if response and response.startswith("success"):
         current_user = username
+        received_seq = 0
+        unread_counts = dict(reply.unread_by_contact)
         login_frame.pack_forget()
         chat_frame.pack()
         chat_label.config(text=f"Chat - Logged in as {username}")
+        update_conversation_list()
         load_conversations()
         check_new_messages()
         subscription_active = True
@@ -209,7 +239,7 @@ def subscribe_thread():
             if not subscription_active:
                 break
             sender = message.sender
-            msg_data = {"id": message.id, "from": sender, "message": message.message, "status": message.status}
+            msg_data = {"id": message.id or message.int_id, "from": sender, "message": message.message, "status": message.status}
             if add_message(sender, msg_data):
                 update_conversation_list()
                 if sender in chat_windows and chat_windows[sender].winfo_exists():
@@ -219,7 +249,7 @@ def subscribe_thread():
 
 def load_conversations():
     """
-        Load all of the messages stored for current user
+        Load the messages stored for current user that arrived since the last load, one page at a time
         
         Params:
 
@@ -229,20 +259,62 @@ def load_conversations():
 
             None
     """
-    response = stub.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username=current_user))
-    messages = [{'id': m.id, 'from': m.sender, 'message': m.message, 'status': m.status} for m in response.messages]
-    if response and response.status == "success":
-        if len(messages) != 0:
-          for msg in messages:
-            sender = msg["from"]
-            add_message(sender, msg)
-          update_conversation_list()
-    else:
-        messagebox.showerror("Error", response.status if response.status else "No response from server.")
+    global received_seq
+    loaded = False
+    while True:
+        response = stub.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(
+            username=current_user, after_seq=received_seq, limit=RECEIVE_PAGE_SIZE))
+        if not (response and response.status == "success"):
+            messagebox.showerror("Error", response.status if response.status else "No response from server.")
+            break
+        for m in response.messages:
+            add_message(m.sender, {'id': m.id or m.int_id, 'from': m.sender, 'message': m.message, 'status': m.status, 'seq': m.seq})
+            loaded = True
+        received_seq = response.next_seq
+        if not response.has_more:
+            if unread_counts: # every message is loaded, count them instead
+                unread_counts.clear()
+                loaded = True
+            break
+    if loaded:
+        update_conversation_list()
+
+def sync_conversations():
+    """
+        Apply the changes to the current user's mailbox since the last load or sync: new messages,
+        and messages that were read or deleted in the meantime
+
+        Params:
+
+            None
+
+        Returns:
+
+            None
+    """
+    global received_seq
+    changed = False
+    while True:
+        try:
+            response = stub.SyncSince(chat_pb2.SyncRequest(
+                username=current_user, since_seq=received_seq, limit=RECEIVE_PAGE_SIZE))
+        except grpc.RpcError:
+            break # retried on the next check
+        if response.status != "success":
+            break
+        for m in response.changes:
+            add_message(m.sender, {'id': m.id or m.int_id, 'from': m.sender, 'message': m.message, 'status': m.status, 'seq': m.seq})
+            changed = True
+        received_seq = response.next_seq
+        if not response.has_more:
+            break
+    if changed:
+        update_conversation_list()
 
 def update_conversation_list():
     """
-        Update conversation list by skipping deleted messages and showing number of unreads
+        Update conversation list by skipping deleted messages and showing number of unreads.
+        Contacts whose messages are not loaded yet show the unread count from login.
 
         Params:
 
@@ -262,6 +334,9 @@ def update_conversation_list():
         unread_indicator = f" 🔴({unread} unread)" if unread > 0 else ""
         display = f"{contact}{unread_indicator}"
         conversation_list.insert(tk.END, display)
+    for contact, unread in unread_counts.items():
+        if contact not in conversations:
+            conversation_list.insert(tk.END, f"{contact} 🔴({unread} unread)")
 
 def open_chat():
     """
@@ -328,7 +403,7 @@ def chat_window(contact):
             sender, recipient = current_user, contact
             response = stub.SendMessage(chat_pb2.SendMessageRequest(sender=sender, recipient=recipient, message=message))
             if response and response.status == "success":
-                msg_id = response.message_id
+                msg_id = response.message_id or response.int_message_id
                 msg_obj = {"id": msg_id, "from": current_user, "message": message, "status": "unread"}
                 add_message(contact, msg_obj)
                 update_conversation_list()
@@ -348,7 +423,7 @@ def chat_window(contact):
             if msg["from"]==current_user and msg["status"]=="unread":
                 if messagebox.askyesno("Delete", "Unsend this message? \n\n" + f"{msg['message']}"):
                     sender, recipient, message_id = current_user, contact, msg["id"]
-                    response = stub.DeleteUnreadMessage(chat_pb2.DeleteUnreadMessageRequest(sender=sender, recipient=recipient, message_id=message_id))
+                    response = stub.DeleteUnreadMessage(chat_pb2.DeleteUnreadMessageRequest(sender=sender, recipient=recipient, **id_fields(message_id)))
                     if response and response.status == "success":
                         for m in conversations[contact]:
                             if m["id"] == msg["id"]:
@@ -474,7 +549,7 @@ def check_new_messages():
             None
     """
     if current_user:
-        load_conversations()
+        sync_conversations()
         root.after(5000, check_new_messages)
 
 def start_new_conversation():
@@ -1,9 +1,13 @@
 import grpc
 from concurrent import futures
 import threading
+import itertools
+import argparse
 import uuid
+import bisect
 import atexit
 import sys
+from collections import deque
 import chat_pb2
 import chat_pb2_grpc
 
@@ -29,8 +33,18 @@ active_users = set()
 active_users_lock = threading.Lock()
 subscribers = {}  # {username: {"cond": threading.Condition(), "queue": []}}
 subscribers_lock = threading.Lock()
+# Per-user index, so MarkRead, DeleteUnreadMessage and SyncSince do not scan the whole history:
+# {username: {"messages": [...], "size": int, "changes": [(seq, message), ...], "by_id": {id: message},
+#             "unread": {sender: deque([message, ...])}, "unread_count": int, "unread_by_contact": {sender: int}}}
+change_logs = {}
+mailbox_lock = threading.RLock()  # orders sequence numbers with their change log entries
 
 SERVER_VERSION = "1.0.0"
+MAX_PAGE_SIZE = 1000 # most messages returned by one paged ReceiveMessages call
+# "int": message IDs are numbered by the server and sent in the uint64 fields;
+# "uuid": UUID strings in the string fields, for clients that expect them (--id_format uuid)
+ID_FORMAT = "int"
+message_ids = itertools.count(1)
 
 def handle_exit():
     print("[INFO] Shutting down server gracefully...")
@@ -41,6 +55,139 @@ def handle_exit():
 
 atexit.register(handle_exit)
 
+def new_message_id():
+    """
+        The ID of a new message: the next number, or a UUID string if ID_FORMAT is "uuid"
+    """
+    if ID_FORMAT == "uuid":
+        return str(uuid.uuid4())
+    return next(message_ids)
+
+def id_fields(message_id, field="id"):
+    """
+        The protobuf fields carrying a message ID: int_<field> for a numbered ID, field for a UUID string
+    """
+    return {f"int_{field}": message_id} if isinstance(message_id, int) else {field: message_id}
+
+def message_seq(messages, i):
+    """
+        Sequence number of the i-th message of a user. Messages stored without one fall back to
+        their position in the list.
+    """
+    return messages[i].get("seq", i + 1)
+
+def page_messages(username, after_seq=0, limit=0, contact=""):
+    """
+        Select the messages of a user with seq > after_seq, at most limit of them (0 = all, otherwise
+        capped at MAX_PAGE_SIZE), optionally only those from contact.
+        Returns (page, next_seq, has_more).
+    """
+    messages = users[username]["messages"]
+    # Messages are appended in seq order, so the cursor is found by binary search
+    start = bisect.bisect_right(range(len(messages)), after_seq, key=lambda i: message_seq(messages, i))
+    cap = len(messages) if limit == 0 else min(limit, MAX_PAGE_SIZE)
+    page = []
+    has_more = False
+    for i in range(start, len(messages)):
+        if contact and messages[i]["from"] != contact:
+            continue
+        if len(page) == cap:
+            has_more = True
+            break
+        page.append(dict(messages[i], seq=message_seq(messages, i)))
+    next_seq = page[-1]["seq"] if page else after_seq
+    return page, next_seq, has_more
+
+def advance_seq(username):
+    """
+        Advance a user's mailbox sequence number and return it. Every mutation of the mailbox
+        (a new message, or a message read or deleted) takes the next one.
+    """
+    user = users[username]
+    if "seq" not in user:
+        messages = user["messages"]
+        user["seq"] = message_seq(messages, len(messages) - 1) if messages else 0
+    user["seq"] += 1
+    return user["seq"]
+
+def index_message(log, msg):
+    """
+        Add a message to a user's ID map and, if it is unread, to its sender's unread queue and counters
+    """
+    log["by_id"][msg.get("id")] = msg
+    if msg["status"] == "unread":
+        log["unread"].setdefault(msg["from"], deque()).append(msg)
+        log["unread_count"] += 1
+        log["unread_by_contact"][msg["from"]] = log["unread_by_contact"].get(msg["from"], 0) + 1
+
+def decrement_unread(log, contact, count):
+    """
+        Update a user's unread counters after count messages from contact stopped being unread
+    """
+    log["unread_count"] -= count
+    remaining = log["unread_by_contact"].get(contact, 0) - count
+    if remaining > 0:
+        log["unread_by_contact"][contact] = remaining
+    else:
+        log["unread_by_contact"].pop(contact, None)
+
+def get_change_log(username):
+    """
+        Return the index of a user: the change log ((seq, message) for the latest change of every
+        message, in seq order), each message by ID, each sender's unread messages, oldest first, and the unread counts.
+        Rebuilt if the message list was replaced or appended to elsewhere.
+    """
+    messages = users[username]["messages"]
+    log = change_logs.get(username)
+    if log is None or log["messages"] is not messages or log["size"] != len(messages):
+        changes = [(messages[i].get("updated", message_seq(messages, i)), messages[i]) for i in range(len(messages))]
+        log = {"messages": messages, "size": len(messages), "changes": sorted(changes, key=lambda c: c[0]),
+               "by_id": {}, "unread": {}, "unread_count": 0, "unread_by_contact": {}}
+        for msg in messages:
+            index_message(log, msg)
+        change_logs[username] = log
+    return log
+
+def add_message(username, msg):
+    """
+        Give a message the user's next sequence number and append it to the user's history
+    """
+    with mailbox_lock:
+        log = get_change_log(username)
+        msg["seq"] = advance_seq(username)
+        users[username]["messages"].append(msg)
+        log["size"] += 1
+        log["changes"].append((msg["seq"], msg))
+        index_message(log, msg)
+
+def touch_message(username, msg):
+    """
+        Record a status change of a message so that it is returned by the next SyncSince
+    """
+    with mailbox_lock:
+        log = get_change_log(username)
+        msg["updated"] = advance_seq(username)
+        log["changes"].append((msg["updated"], msg))
+
+def sync_since(username, since_seq=0, limit=0):
+    """
+        Select the changes to a user's mailbox with seq > since_seq, at most limit messages (0 = all,
+        otherwise capped at MAX_PAGE_SIZE). Each message is returned once, in its latest state.
+        Returns (changes, next_seq, has_more).
+    """
+    with mailbox_lock:
+        changes = get_change_log(username)["changes"]
+        i = bisect.bisect_right(changes, since_seq, key=lambda c: c[0])
+        delta = []
+        next_seq = since_seq
+        while i < len(changes) and (limit == 0 or len(delta) < min(limit, MAX_PAGE_SIZE)):
+            seq, msg = changes[i]
+            i += 1
+            next_seq = seq
+            if msg.get("updated", seq) == seq: # older entries of a message were superseded by a later change
+                delta.append(dict(msg, updated=seq))
+    return delta, next_seq, i < len(changes)
+
 class ChatService(chat_pb2_grpc.ChatServiceServicer):
     def CheckVersion(self, request, context):
         """
@@ -75,8 +222,12 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
                 if username in active_users:
                     return chat_pb2.LoginResponse(message="error: User already logged in", unread_messages=0)
                 active_users.add(username)
-            unread = sum(1 for m in users[username]["messages"] if m["status"] == "unread")
-            return chat_pb2.LoginResponse(message=f"success: Logged in. Unread messages: {unread}", unread_messages=unread)
+            with mailbox_lock:
+                log = get_change_log(username)
+                unread, unread_by_contact = log["unread_count"], dict(log["unread_by_contact"])
+            # The per-contact breakdown lets the client label conversations without downloading every message
+            return chat_pb2.LoginResponse(message=f"success: Logged in. Unread messages: {unread}", unread_messages=unread,
+                                          unread_by_contact=unread_by_contact)
         return chat_pb2.LoginResponse(message="error: Invalid username or password", unread_messages=0)
 
     def ListUsers(self, request, context):
@@ -94,19 +245,19 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
         if recipient not in users or users[recipient].get("deleted", False):
             return chat_pb2.SendMessageResponse(status="error: Recipient not found or deleted", message_id="")
         msg = {
-            "id": str(uuid.uuid4()),
+            "id": new_message_id(),
             "from": sender,
             "message": message_text,
             "status": "unread"
         }
-        users[recipient]["messages"].append(msg)
+        add_message(recipient, msg)
         with subscribers_lock:
             if recipient in subscribers:
                 sub = subscribers[recipient]
                 with sub["cond"]:
                     sub["queue"].append(msg)
                     sub["cond"].notify()
-        return chat_pb2.SendMessageResponse(status="success", message_id=msg["id"])
+        return chat_pb2.SendMessageResponse(status="success", **id_fields(msg["id"], "message_id"))
 
     def Subscribe(self, request, context):
         """
@@ -127,10 +278,11 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
                     sub["cond"].wait()
                 msg = sub["queue"].pop(0)
             yield chat_pb2.Message(
-                id=msg["id"],
+                **id_fields(msg["id"]),
                 sender=msg["from"],
                 message=msg["message"],
-                status=msg["status"]
+                status=msg["status"],
+                seq=msg.get("seq", 0)
             )
 
     def MarkRead(self, request, context):
@@ -143,58 +295,90 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
             context.set_code(grpc.StatusCode.NOT_FOUND)
             return chat_pb2.MarkReadResponse(message="")
         count = 0
-        for msg in users[username]["messages"]:
-            if msg["from"] == contact and msg["status"] == "unread" and (batch_num == 0 or count < batch_num):
+        with mailbox_lock:
+            log = get_change_log(username)
+            unread = log["unread"]
+            queue = unread.get(contact)
+            while queue and (batch_num == 0 or count < batch_num):
+                msg = queue.popleft()
+                if msg["status"] != "unread":
+                    continue # deleted after it was queued
                 msg["status"] = "read"
+                touch_message(username, msg)
                 count += 1
-                if batch_num != 0 and count == batch_num:
-                    break
+            if queue is not None and not queue:
+                del unread[contact]
+            decrement_unread(log, contact, count)
         return chat_pb2.MarkReadResponse(message=f"Marked {count} messages as read.")
 
     def DeleteUnreadMessage(self, request, context):
         """
             Handle delete unread message request
         """
-        sender, recipient, message_id = request.sender, request.recipient, request.message_id
+        sender, recipient, message_id = request.sender, request.recipient, request.int_message_id or request.message_id
         if recipient not in users:
             return chat_pb2.DeleteUnreadMessageResponse(status="error", message="Recipient not found")
-        found = False
-        for msg in users[recipient]["messages"]:
-            if msg["id"] == message_id and msg["from"] == sender and msg["status"] == "unread":
+        with mailbox_lock:
+            log = get_change_log(recipient)
+            msg = log["by_id"].get(message_id)
+            found = msg is not None and msg["from"] == sender and msg["status"] == "unread"
+            if found:
                 msg["status"] = "deleted"
-                found = True
-                with subscribers_lock:
-                    if recipient in subscribers:
-                        sub = subscribers[recipient]
-                        with sub["cond"]:
-                            sub["queue"].append({
-                                "id": msg["id"],
-                                "from": msg["from"],
-                                "message": "",
-                                "status": "deleted"
-                            })
-                            sub["cond"].notify()
-                break
+                decrement_unread(log, sender, 1)
+                touch_message(recipient, msg)
+        if found:
+            with subscribers_lock:
+                if recipient in subscribers:
+                    sub = subscribers[recipient]
+                    with sub["cond"]:
+                        sub["queue"].append({
+                            "id": msg["id"],
+                            "from": msg["from"],
+                            "message": "",
+                            "status": "deleted"
+                        })
+                        sub["cond"].notify()
         if not found:
             return chat_pb2.DeleteUnreadMessageResponse(status="error", message="Message not found or already read")
         return chat_pb2.DeleteUnreadMessageResponse(status="success", message="Message deleted.")
 
     def ReceiveMessages(self, request, context):
         """
-            Handle receive message request
+            Handle receive message request: messages after the after_seq cursor, at most limit of them
+            (0 = all), optionally only from contact
         """
         username = request.username
         if username not in users:
             return chat_pb2.ReceiveMessagesResponse(status="error: User not found", messages=[])
+        page, next_seq, has_more = page_messages(username, request.after_seq, request.limit, request.contact)
         msgs = []
-        for m in users[username]["messages"]:
+        for m in page:
             msgs.append(chat_pb2.Message(
-                id=m["id"],
+                **id_fields(m["id"]),
                 sender=m["from"],
                 message=m["message"],
-                status=m["status"]
+                status=m["status"],
+                seq=m["seq"]
             ))
-        return chat_pb2.ReceiveMessagesResponse(status="success", messages=msgs)
+        return chat_pb2.ReceiveMessagesResponse(status="success", messages=msgs, next_seq=next_seq, has_more=has_more)
+
+    def SyncSince(self, request, context):
+        """
+            Handle sync request: new messages and status changes after the since_seq cursor
+        """
+        username = request.username
+        if username not in users:
+            return chat_pb2.SyncResponse(status="error: User not found", changes=[])
+        changes, next_seq, has_more = sync_since(username, request.since_seq, request.limit)
+        msgs = [chat_pb2.Message(
+            **id_fields(m["id"]),
+            sender=m["from"],
+            message=m["message"],
+            status=m["status"],
+            seq=m.get("seq", 0),
+            updated=m["updated"]
+        ) for m in changes]
+        return chat_pb2.SyncResponse(status="success", changes=msgs, next_seq=next_seq, has_more=has_more)
 
     def DeleteAccount(self, request, context):
         """
@@ -226,4 +410,8 @@ def serve():
     server.wait_for_termination()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Start the gRPC chat server.")
+    parser.add_argument("--id_format", choices=["int", "uuid"], default="int",
+                        help="int: message IDs numbered by the server; uuid: UUID strings, for clients that expect them")
+    ID_FORMAT = parser.parse_args().id_format
     serve()
\ No newline at end of file
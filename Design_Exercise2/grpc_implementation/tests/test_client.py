@@ -19,6 +19,7 @@ class TestClient(unittest.TestCase):
         client.chat_windows = {}
         client.undelivered = {}
         client.subscription_active = False
+        client.unread_counts = {}
 
     def test_add_message(self):
         """
@@ -108,10 +109,13 @@ class TestClient(unittest.TestCase):
         fake_response = MagicMock()
         fake_response.status = "success"
         fake_response.messages = [fake_msg1, fake_msg2]
+        fake_response.next_seq = 2
+        fake_response.has_more = False
         mock_stub.ReceiveMessages.return_value = fake_response
 
         client.current_user = "test_user"
         client.conversations = {}
+        client.received_seq = 0
         client.load_conversations()
 
         # Check that messages are added to conversations for both senders
@@ -119,7 +123,9 @@ class TestClient(unittest.TestCase):
         self.assertIn("user2", client.conversations)
         self.assertEqual(client.conversations["user1"][0]["message"], "Hello")
         self.assertEqual(client.conversations["user2"][0]["message"], "Hi")
-        mock_stub.ReceiveMessages.assert_called_once_with(chat_pb2.ReceiveMessagesRequest(username="test_user"))
+        mock_stub.ReceiveMessages.assert_called_once_with(
+            chat_pb2.ReceiveMessagesRequest(username="test_user", after_seq=0, limit=client.RECEIVE_PAGE_SIZE))
+        self.assertEqual(client.received_seq, 2)
 
     @patch('client.stub')
     @patch('client.messagebox.showerror')
@@ -136,9 +142,11 @@ class TestClient(unittest.TestCase):
 
         client.current_user = "test_user"
         client.conversations = {}
+        client.received_seq = 0
         client.load_conversations()
 
-        mock_stub.ReceiveMessages.assert_called_once_with(chat_pb2.ReceiveMessagesRequest(username="test_user"))
+        mock_stub.ReceiveMessages.assert_called_once_with(
+            chat_pb2.ReceiveMessagesRequest(username="test_user", after_seq=0, limit=client.RECEIVE_PAGE_SIZE))
         mock_showerror.assert_called_once()
 
     @patch('client.conversation_list')
@@ -177,6 +185,24 @@ class TestClient(unittest.TestCase):
         self.assertIn("🔴(1 unread)", calls[0][0][1])
         self.assertEqual(calls[1][0][1], "user2")
 
+    @patch('client.conversation_list')
+    def test_update_conversation_list_login_counts(self, mock_conversation_list):
+        """
+        Test that contacts whose messages are not loaded yet are listed with the unread count from login,
+        and that the counts are dropped once every message is loaded.
+        """
+        client.conversations = {"user1": [{"from": "user1", "status": "unread", "message": "Hello!"}]}
+        client.unread_counts = {"user1": 1, "user2": 3}
+        client.update_conversation_list()
+        calls = [c[0][1] for c in mock_conversation_list.insert.call_args_list]
+        self.assertEqual(calls, ["user1 🔴(1 unread)", "user2 🔴(3 unread)"])
+
+        with patch('client.stub') as mock_stub:
+            mock_stub.ReceiveMessages.return_value = chat_pb2.ReceiveMessagesResponse(status="success", next_seq=1)
+            client.current_user = "me"
+            client.load_conversations()
+        self.assertEqual(client.unread_counts, {})
+
     @patch('client.conversation_list')
     def test_update_conversation_list_no_unread(self, mock_conversation_list):
         """
@@ -234,16 +260,45 @@ class TestClient(unittest.TestCase):
         client.update_chat_window("test_user")
         mock_stub.MarkRead.assert_not_called()
 
+    @patch('client.stub')
+    @patch('client.update_conversation_list')
+    def test_sync_conversations(self, mock_update_conversation_list, mock_stub):
+        """
+        Test sync_conversations applies new messages and status changes in place
+        and advances the cursor.
+        """
+        fake_response = MagicMock()
+        fake_response.status = "success"
+        fake_response.changes = [
+            chat_pb2.Message(id="a", sender="user1", message="Hello", status="read", seq=1, updated=8),
+            chat_pb2.Message(id="b", sender="user2", message="Hi", status="unread", seq=9, updated=9),
+        ]
+        fake_response.next_seq = 9
+        fake_response.has_more = False
+        mock_stub.SyncSince.return_value = fake_response
+
+        client.current_user = "test_user"
+        client.conversations = {"user1": [{"id": "a", "from": "user1", "message": "Hello", "status": "unread", "seq": 1}]}
+        client.received_seq = 7
+        client.sync_conversations()
+
+        mock_stub.SyncSince.assert_called_once_with(
+            chat_pb2.SyncRequest(username="test_user", since_seq=7, limit=client.RECEIVE_PAGE_SIZE))
+        self.assertEqual([m["status"] for m in client.conversations["user1"]], ["read"])
+        self.assertEqual(client.conversations["user2"][0]["message"], "Hi")
+        self.assertEqual(client.received_seq, 9)
+        mock_update_conversation_list.assert_called_once()
+
     @patch('client.root.after')
-    @patch('client.load_conversations')
-    def test_check_new_messages(self, mock_load_conversations, mock_after):
+    @patch('client.sync_conversations')
+    def test_check_new_messages(self, mock_sync_conversations, mock_after):
         """
-        Test check_new_messages to verify that it calls load_conversations
+        Test check_new_messages to verify that it calls sync_conversations
         and then schedules itself to run again after 5000ms.
         """
         client.current_user = "test_user"
         client.check_new_messages()
-        mock_load_conversations.assert_called_once()
+        mock_sync_conversations.assert_called_once()
         mock_after.assert_called_once_with(5000, client.check_new_messages)
 
     @patch('client.stub')
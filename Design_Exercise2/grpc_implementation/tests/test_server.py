@@ -35,6 +35,7 @@ class TestChatService(unittest.TestCase):
         server.users.clear()
         server.active_users.clear()
         server.subscribers.clear()
+        server.change_logs.clear()
 
     # -------------------------------------------------------------------------
     # 1. Version Check Tests
@@ -113,6 +114,25 @@ class TestChatService(unittest.TestCase):
         self.assertIn("error: User already logged in", response.message)
         self.assertIn("testuser", server.active_users)
 
+    def test_login_unread_by_contact(self):
+        """
+        Test that login returns unread counts in total and per contact,
+        kept up to date by send, mark read and delete.
+        """
+        for name in ["alice", "bob", "recipient"]:
+            self.stub.Register(chat_pb2.RegisterRequest(username=name, password="p"))
+        for sender, text in [("alice", "a1"), ("alice", "a2"), ("bob", "b1"), ("bob", "b2")]:
+            sent = self.stub.SendMessage(chat_pb2.SendMessageRequest(sender=sender, recipient="recipient", message=text))
+            if text == "b1":
+                bob_id = sent.int_message_id
+        self.stub.MarkRead(chat_pb2.MarkReadRequest(username="recipient", contact="alice", batch_num=1))
+        self.stub.DeleteUnreadMessage(chat_pb2.DeleteUnreadMessageRequest(
+            sender="bob", recipient="recipient", int_message_id=bob_id))
+        response = self.stub.Login(chat_pb2.LoginRequest(username="recipient", password="p"))
+        self.assertEqual(response.unread_messages, 2)
+        self.assertEqual(dict(response.unread_by_contact), {"alice": 1, "bob": 1})
+        self.assertIn("Unread messages: 2", response.message)
+
     def test_handle_login_invalid_password(self):
         """
         Test login with an invalid password.
@@ -154,11 +174,43 @@ class TestChatService(unittest.TestCase):
             sender="sender", recipient="recipient", message="Hello!"
         ))
         self.assertEqual(response.status, "success")
-        self.assertNotEqual(response.message_id, "")
+        self.assertNotEqual(response.int_message_id, 0)
         msgs = server.users["recipient"]["messages"]
         self.assertEqual(len(msgs), 1)
         self.assertEqual(msgs[0]["message"], "Hello!")
         self.assertEqual(msgs[0]["status"], "unread")
+        self.assertEqual(msgs[0]["id"], response.int_message_id)
+
+    def test_handle_send_uuid_ids(self):
+        """
+        Test that a server with ID_FORMAT "uuid" sends UUID strings in the string ID fields.
+        """
+        self.stub.Register(chat_pb2.RegisterRequest(username="recipient", password="pass"))
+        server.ID_FORMAT = "uuid"
+        try:
+            response = self.stub.SendMessage(chat_pb2.SendMessageRequest(sender="sender", recipient="recipient", message="a"))
+        finally:
+            server.ID_FORMAT = "int"
+        self.assertEqual((len(response.message_id), response.int_message_id), (36, 0))
+        page = self.stub.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username="recipient"))
+        self.assertEqual(page.messages[0].id, response.message_id)
+        deleted = self.stub.DeleteUnreadMessage(chat_pb2.DeleteUnreadMessageRequest(
+            sender="sender", recipient="recipient", message_id=response.message_id))
+        self.assertEqual(deleted.status, "success")
+
+    def test_message_ids_increase(self):
+        """
+        Test that numbered message IDs increase and are smaller on the wire than UUIDs.
+        """
+        self.stub.Register(chat_pb2.RegisterRequest(username="recipient", password="pass"))
+        ids = [self.stub.SendMessage(chat_pb2.SendMessageRequest(sender="sender", recipient="recipient", message="a")).int_message_id
+               for _ in range(2)]
+        self.assertGreater(ids[1], ids[0])
+        page = self.stub.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username="recipient"))
+        self.assertEqual([m.int_id for m in page.messages], ids)
+        numbered = chat_pb2.Message(int_id=ids[1], sender="sender", message="a", status="unread", seq=2)
+        with_uuid = chat_pb2.Message(id="0c9d5d0a-5f2e-4c1b-9a57-0c6a4b1f7e3d", sender="sender", message="a", status="unread", seq=2)
+        self.assertLess(numbered.ByteSize(), with_uuid.ByteSize() - 30)
 
     def test_handle_send_nonexistent_recipient(self):
         """
@@ -236,6 +288,35 @@ class TestChatService(unittest.TestCase):
         self.assertEqual(msgs[1]["status"], "read")
         self.assertEqual(msgs[2]["status"], "unread")
 
+    def test_mark_read_skips_deleted_messages(self):
+        """
+        Test that a message deleted after it arrived is not marked as read
+        and does not count towards the batch.
+        """
+        server.users["contact1"] = {
+            "password": "p",
+            "messages": [
+                {"id": 1, "from": "contact2", "message": "m1", "status": "unread"},
+                {"id": 2, "from": "contact2", "message": "m2", "status": "unread"},
+                {"id": 3, "from": "contact2", "message": "m3", "status": "unread"},
+            ],
+        }
+        server.get_change_log("contact1")
+        response = self.stub.DeleteUnreadMessage(chat_pb2.DeleteUnreadMessageRequest(
+            sender="contact2",
+            recipient="contact1",
+            int_message_id=1,
+        ))
+        self.assertEqual(response.status, "success")
+        response = self.stub.MarkRead(chat_pb2.MarkReadRequest(
+            username="contact1",
+            contact="contact2",
+            batch_num=1
+        ))
+        self.assertIn("Marked 1 messages as read", response.message)
+        msgs = server.users["contact1"]["messages"]
+        self.assertEqual([m["status"] for m in msgs], ["deleted", "read", "unread"])
+
     def test_mark_read_user_not_found(self):
         """
         Test marking messages as read for a non-existent user.
@@ -303,6 +384,52 @@ class TestChatService(unittest.TestCase):
         self.assertEqual(len(response.messages), 1)
         self.assertEqual(response.messages[0].id, "1")
 
+    def test_handle_receive_messages_paged(self):
+        """
+        Test retrieving messages page by page after a cursor, optionally filtered by contact.
+        Verifies the returned sequence numbers, next_seq cursor and has_more flag.
+        """
+        for name in ["alice", "bob", "recipient"]:
+            server.users[name] = {"password": "p", "messages": []}
+        for i in range(5):
+            sender = "alice" if i % 2 == 0 else "bob"
+            self.stub.SendMessage(chat_pb2.SendMessageRequest(sender=sender, recipient="recipient", message=f"m{i}"))
+        first = self.stub.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username="recipient", limit=2))
+        self.assertEqual([m.message for m in first.messages], ["m0", "m1"])
+        self.assertEqual([m.seq for m in first.messages], [1, 2])
+        self.assertEqual((first.next_seq, first.has_more), (2, True))
+        rest = self.stub.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username="recipient", after_seq=first.next_seq, limit=10))
+        self.assertEqual([m.message for m in rest.messages], ["m2", "m3", "m4"])
+        self.assertEqual((rest.next_seq, rest.has_more), (5, False))
+        alice = self.stub.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username="recipient", after_seq=1, limit=1, contact="alice"))
+        self.assertEqual([m.message for m in alice.messages], ["m2"])
+        self.assertTrue(alice.has_more)
+
+    def test_sync_since(self):
+        """
+        Test that SyncSince returns new messages and read/delete status changes after the cursor,
+        each message once in its latest state.
+        """
+        for name in ["alice", "recipient"]:
+            server.users[name] = {"password": "p", "messages": []}
+        ids = [self.stub.SendMessage(chat_pb2.SendMessageRequest(sender="alice", recipient="recipient", message=f"m{i}")).int_message_id
+               for i in range(3)]
+        self.stub.MarkRead(chat_pb2.MarkReadRequest(username="recipient", contact="alice", batch_num=1))
+        self.stub.DeleteUnreadMessage(chat_pb2.DeleteUnreadMessageRequest(sender="alice", recipient="recipient", int_message_id=ids[1]))
+        delta = self.stub.SyncSince(chat_pb2.SyncRequest(username="recipient", since_seq=3))
+        self.assertEqual([(m.message, m.status, m.seq, m.updated) for m in delta.changes],
+                         [("m0", "read", 1, 4), ("m1", "deleted", 2, 5)])
+        self.assertEqual((delta.next_seq, delta.has_more), (5, False))
+        first = self.stub.SyncSince(chat_pb2.SyncRequest(username="recipient", since_seq=0, limit=1))
+        self.assertEqual(([m.message for m in first.changes], first.has_more), (["m2"], True))
+        rest = self.stub.SyncSince(chat_pb2.SyncRequest(username="recipient", since_seq=first.next_seq))
+        self.assertEqual([m.message for m in rest.changes], ["m0", "m1"])
+        # New messages continue the sequence after the status changes
+        self.stub.SendMessage(chat_pb2.SendMessageRequest(sender="alice", recipient="recipient", message="m3"))
+        latest = self.stub.SyncSince(chat_pb2.SyncRequest(username="recipient", since_seq=rest.next_seq))
+        self.assertEqual([(m.message, m.seq) for m in latest.changes], [("m3", 6)])
+        self.assertIn("error", self.stub.SyncSince(chat_pb2.SyncRequest(username="nobody")).status)
+
     def test_handle_receive_messages_account_not_found(self):
         """
         Test retrieving messages for a non-existent user.
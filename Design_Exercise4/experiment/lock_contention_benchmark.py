@@ -0,0 +1,131 @@
+"""
+Measure lock contention in the replication server's PersistentStore.
+
+Ten worker threads (as many as the server's gRPC thread pool), each on its own mailbox, run
+against a store pre-filled with other users' messages. Half of them write (add_message, then
+mark_read), which keeps the group commit writer flushing; the other half read (unread_count and
+page_messages, as ReceiveMessages and SyncSince polls do). Three configurations are compared:
+
+    single:   one lock for the whole store, held while every flush snapshots and serializes it
+    striped:  one lock per mailbox stripe, with every flush still snapshotting the whole store: it holds
+              every lock while it copies the mailboxes' arrays, and serializes them outside the locks
+    journal:  the PersistentStore as it is: striped locks, and flushes that append the mutations'
+              journal records without taking any mailbox lock (a full snapshot only every COMPACT_EVERY records)
+
+For each we record writes and reads per second and the median and 99th percentile latency of the
+writes and of the reads. A write returns once its batch is on disk, so its latency is the flush's; the
+reads never wait for disk, so their latency is time spent waiting for locks.
+Results are written to experiment_lock_contention.json.
+
+Run from the Design_Exercise4 directory:
+
+    python experiment/lock_contention_benchmark.py
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "replication"))
+from server import PersistentStore, LOCK_STRIPES, COMPACT_EVERY
+
+OUTPUT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "experiment_lock_contention.json")
+WORKERS = 10
+DURATION = 5  # seconds per configuration
+BACKGROUND_USERS = 200
+BACKGROUND_MESSAGES = 100  # per background user
+
+class SnapshotStore(PersistentStore):
+    """
+        PersistentStore as it was before the journal: every flush rewrites a snapshot of the whole store
+    """
+    def write(self):
+        _, data = self.snapshot()
+        self.write_file(data)
+
+class SingleLockStore(SnapshotStore):
+    """
+        SnapshotStore as it was before striping: every operation and every flush takes the same lock
+    """
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, lock_stripes=1, **kwargs)
+
+    def snapshot(self, compact=False):
+        with self.exclusive():
+            return super().snapshot(compact)
+
+def fill(store):
+    with store.batch():
+        for u in range(BACKGROUND_USERS):
+            name = f"background{u}"
+            store.register(name, "pw")
+            for m in range(BACKGROUND_MESSAGES):
+                store.add_message(name, {"id": f"{name}-{m}", "from": "someone", "message": "x" * 50, "status": "unread"})
+
+def writer(store, name, stop, counts, latencies):
+    count = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        store.add_message(name, {"id": f"{name}-{count}", "from": "contact", "message": "hello", "status": "unread"})
+        middle = time.perf_counter()
+        store.mark_read(name, "contact", 0)
+        latencies += [middle - start, time.perf_counter() - middle]
+        count += 2
+    counts.append(count)
+
+def reader(store, name, stop, counts, latencies):
+    count = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        store.unread_count(name)
+        store.page_messages(name, after_seq=max(0, count - 10))
+        latencies.append(time.perf_counter() - start)
+        count += 1
+        time.sleep(0.0005)  # think time, so readers do not just compete for the GIL
+    counts.append(count)
+
+def run(store_class):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = store_class(os.path.join(tmpdir, "users.json"), commit_latency=0.005)
+        fill(store)
+        names = [f"worker{i}" for i in range(WORKERS)]
+        with store.batch():
+            for name in names:
+                store.register(name, "pw")
+                store.add_message(name, {"id": f"{name}-first", "from": "contact", "message": "hello", "status": "unread"})
+        stop = threading.Event()
+        writes, reads, write_latencies, latencies = [], [], [], []
+        threads = [threading.Thread(target=writer, args=(store, name, stop, writes, write_latencies)) for name in names[:WORKERS // 2]]
+        threads += [threading.Thread(target=reader, args=(store, name, stop, reads, latencies)) for name in names[WORKERS // 2:]]
+        for t in threads:
+            t.start()
+        time.sleep(DURATION)
+        stop.set()
+        for t in threads:
+            t.join()
+        write_latencies.sort()
+        latencies.sort()
+        return {
+            "writes_per_second": sum(writes) / DURATION,
+            "reads_per_second": sum(reads) / DURATION,
+            "write_p50_ms": statistics.median(write_latencies) * 1000,
+            "write_p99_ms": write_latencies[int(len(write_latencies) * 0.99)] * 1000,
+            "read_p50_ms": statistics.median(latencies) * 1000,
+            "read_p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+            "flushes": store.writer.flush_count,
+        }
+
+if __name__ == "__main__":
+    modes = {"single": SingleLockStore, "striped": SnapshotStore, "journal": PersistentStore}
+    results = {mode: run(store_class) for mode, store_class in modes.items()}
+    results.update(lock_stripes=LOCK_STRIPES, compact_every=COMPACT_EVERY)
+    for mode in modes:
+        r = results[mode]
+        print(f"{mode:8} {r['writes_per_second']:8.0f} writes/s   write p50 {r['write_p50_ms']:8.3f} ms   p99 {r['write_p99_ms']:8.3f} ms   "
+              f"{r['reads_per_second']:8.0f} reads/s   read p50 {r['read_p50_ms']:7.3f} ms   p99 {r['read_p99_ms']:7.3f} ms   "
+              f"{r['flushes']} flushes")
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(results, f, indent=2)
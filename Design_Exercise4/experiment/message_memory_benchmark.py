@@ -0,0 +1,111 @@
+"""
+Measure the memory a replication server needs per stored message.
+
+Three representations are filled with the same messages (UUID IDs, 40-character bodies, 10 senders,
+a third of the messages read), spread over 1000 mailboxes:
+
+    dicts:    a dict per message plus the index PersistentStore kept before Mailbox (ID -> message,
+              unread queues and list positions per sender, change list), as the store held them
+    mailbox:  Mailbox, the columnar store PersistentStore uses now (bodies still Python strings)
+    offsets:  OffsetMailbox, as SegmentStore uses it (bodies on disk, 8-byte offsets in memory)
+
+Each runs in its own process, and we record the growth of its anonymous resident memory (RssAnon)
+divided by the number of messages, and how long the messages took to store.
+Results are written to experiment_message_memory.json.
+
+Run from the Design_Exercise4 directory (10M dict messages need about 6 GB; pass a smaller
+--messages on smaller machines):
+
+    python experiment/message_memory_benchmark.py --messages 10000000
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "replication"))
+from mailboxes import Mailbox, OffsetMailbox
+
+OUTPUT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "experiment_message_memory.json")
+MAILBOXES = 1000
+SENDERS = [f"contact{i}" for i in range(10)]
+BODY = "x" * 40
+MODES = ["dicts", "mailbox", "offsets"]
+
+def rss_anon():
+    """
+        Anonymous resident memory of this process, in bytes
+    """
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("RssAnon not found in /proc/self/status (Linux only)")
+
+def messages(count):
+    for i in range(count):
+        yield i % MAILBOXES, {"id": str(uuid.uuid4()), "from": SENDERS[i % len(SENDERS)], "message": BODY + str(i),
+                             "status": "read" if i % 3 == 0 else "unread", "seq": i // MAILBOXES + 1}
+
+def fill_dicts(count):
+    """
+        The representation before Mailbox: message dicts in a list, indexed by dicts, deques and lists
+    """
+    mailboxes = [{"messages": [], "by_id": {}, "unread": {}, "positions": {}, "changes": []} for _ in range(MAILBOXES)]
+    for user, msg in messages(count):
+        mailbox = mailboxes[user]
+        mailbox["positions"].setdefault(msg["from"], []).append(len(mailbox["messages"]))
+        mailbox["messages"].append(msg)
+        mailbox["by_id"][msg["id"]] = msg
+        if msg["status"] == "unread":
+            mailbox["unread"].setdefault(msg["from"], deque()).append(msg)
+        mailbox["changes"].append((msg["seq"], msg))
+    return mailboxes
+
+def fill_mailboxes(count, mailbox_class):
+    mailboxes = [mailbox_class() for _ in range(MAILBOXES)]
+    for user, msg in messages(count):
+        if mailbox_class is OffsetMailbox:
+            msg["body"] = 64 * (msg["seq"] * MAILBOXES + user)  # stands in for the offset in the segment log
+        mailboxes[user].append(msg)
+    return mailboxes
+
+def measure(mode, count):
+    gc.collect()
+    before = rss_anon()
+    start = time.perf_counter()
+    if mode == "dicts":
+        kept = fill_dicts(count)
+    else:
+        kept = fill_mailboxes(count, Mailbox if mode == "mailbox" else OffsetMailbox)
+    seconds = time.perf_counter() - start
+    gc.collect()
+    used = rss_anon() - before
+    return {"messages": count, "bytes_per_message": used / count, "total_mb": used / 2**20,
+            "store_seconds": seconds, "mailboxes": len(kept)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory per stored message, per representation.")
+    parser.add_argument("--messages", type=int, default=10_000_000, help="Messages to store")
+    parser.add_argument("--mode", choices=MODES, help="Measure one representation in this process")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(measure(args.mode, args.messages)))
+        sys.exit(0)
+
+    results = {}
+    for mode in MODES:
+        run = subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode, "--messages", str(args.messages)],
+                             capture_output=True, text=True, check=True)
+        results[mode] = json.loads(run.stdout)
+        r = results[mode]
+        print(f"{mode:8} {r['bytes_per_message']:7.1f} bytes/message   {r['total_mb']:9.1f} MB   "
+              f"stored in {r['store_seconds']:6.1f} s")
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(results, f, indent=2)
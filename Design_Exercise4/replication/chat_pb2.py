@@ -24,99 +24,143 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nchat.proto\"\x16\n\x14GetLeaderInfoRequest\"%\n\x15GetLeaderInfoResponse\x12\x0c\n\x04info\x18\x01 \x01(\t\"\x07\n\x05\x45mpty\"\x1a\n\x07Version\x12\x0f\n\x07version\x18\x01 \x01(\t\"3\n\x0fVersionResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"5\n\x0fRegisterRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"#\n\x10RegisterResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\"2\n\x0cLoginRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"9\n\rLoginResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x17\n\x0funread_messages\x18\x02 \x01(\x05\"\x12\n\x10ListUsersRequest\"\"\n\x11ListUsersResponse\x12\r\n\x05users\x18\x01 \x03(\t\"H\n\x12SendMessageRequest\x12\x0e\n\x06sender\x18\x01 \x01(\t\x12\x11\n\trecipient\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\"9\n\x13SendMessageResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x12\n\nmessage_id\x18\x02 \x01(\t\"$\n\x10SubscribeRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"F\n\x07Message\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0e\n\x06sender\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\x12\x0e\n\x06status\x18\x04 \x01(\t\"G\n\x0fMarkReadRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontact\x18\x02 \x01(\t\x12\x11\n\tbatch_num\x18\x03 \x01(\x05\"#\n\x10MarkReadResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\"S\n\x1a\x44\x65leteUnreadMessageRequest\x12\x0e\n\x06sender\x18\x01 \x01(\t\x12\x11\n\trecipient\x18\x02 \x01(\t\x12\x12\n\nmessage_id\x18\x03 \x01(\t\">\n\x1b\x44\x65leteUnreadMessageResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\"*\n\x16ReceiveMessagesRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"E\n\x17ReceiveMessagesResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x1a\n\x08messages\x18\x02 \x03(\x0b\x32\x08.Message\"(\n\x14\x44\x65leteAccountRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"(\n\x15\x44\x65leteAccountResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\"!\n\rLogoutRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"!\n\x0eLogoutResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\"q\n\x17ReplicateMessageRequest\x12\x12\n\nmessage_id\x18\x01 \x01(\t\x12\x0e\n\x06sender\x18\x02 \x01(\t\x12\x11\n\trecipient\x18\x03 \x01(\t\x12\x0f\n\x07message\x18\x04 \x01(\t\x12\x0e\n\x06status\x18\x05 \x01(\t\"+\n\x18ReplicateMessageResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\">\n\x18ReplicateRegisterRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\",\n\x19ReplicateRegisterResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"P\n\x18ReplicateMarkReadRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontact\x18\x02 \x01(\t\x12\x11\n\tbatch_num\x18\x03 \x01(\x05\",\n\x19ReplicateMarkReadResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"V\n\x1dReplicateDeleteMessageRequest\x12\x0e\n\x06sender\x18\x01 \x01(\t\x12\x11\n\trecipient\x18\x02 \x01(\t\x12\x12\n\nmessage_id\x18\x03 \x01(\t\"1\n\x1eReplicateDeleteMessageResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"1\n\x1dReplicateDeleteAccountRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"1\n\x1eReplicateDeleteAccountResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"A\n\x19ReplicateSubscribeRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x12\n\nsubscribed\x18\x02 \x01(\x08\"-\n\x1aReplicateSubscribeResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\r\n\x0bPingRequest\"\x1d\n\x0cPingResponse\x12\r\n\x05\x61live\x18\x01 \x01(\x08\".\n\x1aReplicateActiveUserRequest\x12\x10\n\x08username\x18\x01 \x01(\t\".\n\x1bReplicateActiveUserResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x32\xdf\x05\n\x0b\x43hatService\x12>\n\rGetLeaderInfo\x12\x15.GetLeaderInfoRequest\x1a\x16.GetLeaderInfoResponse\x12=\n+LoadActiveUsersAndSubscribersFromPersistent\x12\x06.Empty\x1a\x06.Empty\x12*\n\x0c\x43heckVersion\x12\x08.Version\x1a\x10.VersionResponse\x12/\n\x08Register\x12\x10.RegisterRequest\x1a\x11.RegisterResponse\x12&\n\x05Login\x12\r.LoginRequest\x1a\x0e.LoginResponse\x12\x32\n\tListUsers\x12\x11.ListUsersRequest\x1a\x12.ListUsersResponse\x12\x38\n\x0bSendMessage\x12\x13.SendMessageRequest\x1a\x14.SendMessageResponse\x12*\n\tSubscribe\x12\x11.SubscribeRequest\x1a\x08.Message0\x01\x12/\n\x08MarkRead\x12\x10.MarkReadRequest\x1a\x11.MarkReadResponse\x12P\n\x13\x44\x65leteUnreadMessage\x12\x1b.DeleteUnreadMessageRequest\x1a\x1c.DeleteUnreadMessageResponse\x12\x44\n\x0fReceiveMessages\x12\x17.ReceiveMessagesRequest\x1a\x18.ReceiveMessagesResponse\x12>\n\rDeleteAccount\x12\x15.DeleteAccountRequest\x1a\x16.DeleteAccountResponse\x12)\n\x06Logout\x12\x0e.LogoutRequest\x1a\x0f.LogoutResponse2\xa9\x05\n\x12ReplicationService\x12G\n\x10ReplicateMessage\x12\x18.ReplicateMessageRequest\x1a\x19.ReplicateMessageResponse\x12J\n\x11ReplicateRegister\x12\x19.ReplicateRegisterRequest\x1a\x1a.ReplicateRegisterResponse\x12J\n\x11ReplicateMarkRead\x12\x19.ReplicateMarkReadRequest\x1a\x1a.ReplicateMarkReadResponse\x12Y\n\x16ReplicateDeleteMessage\x12\x1e.ReplicateDeleteMessageRequest\x1a\x1f.ReplicateDeleteMessageResponse\x12Y\n\x16ReplicateDeleteAccount\x12\x1e.ReplicateDeleteAccountRequest\x1a\x1f.ReplicateDeleteAccountResponse\x12M\n\x12ReplicateSubscribe\x12\x1a.ReplicateSubscribeRequest\x1a\x1b.ReplicateSubscribeResponse\x12U\n\x18ReplicateActiveUserLogin\x12\x1b.ReplicateActiveUserRequest\x1a\x1c.ReplicateActiveUserResponse\x12V\n\x19ReplicateActiveUserLogout\x12\x1b.ReplicateActiveUserRequest\x1a\x1c.ReplicateActiveUserResponse2-\n\x06Health\x12#\n\x04Ping\x12\x0c.PingRequest\x1a\r.PingResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nchat.proto\"\x16\n\x14GetLeaderInfoRequest\"\x18\n\x16WatchLeadershipRequest\"/\n\nLeaderInfo\x12\x0e\n\x06leader\x18\x01 \x01(\t\x12\x11\n\tleader_id\x18\x02 \x01(\x05\"%\n\x15GetLeaderInfoResponse\x12\x0c\n\x04info\x18\x01 \x01(\t\"\x07\n\x05\x45mpty\"\x1a\n\x07Version\x12\x0f\n\x07version\x18\x01 \x01(\t\"3\n\x0fVersionResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"5\n\x0fRegisterRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"3\n\x10RegisterResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x0e\n\x06leader\x18\x02 \x01(\t\"2\n\x0cLoginRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\"\xc1\x01\n\rLoginResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x17\n\x0funread_messages\x18\x02 \x01(\x05\x12>\n\x11unread_by_contact\x18\x03 \x03(\x0b\x32#.LoginResponse.UnreadByContactEntry\x12\x0e\n\x06leader\x18\x04 \x01(\t\x1a\x36\n\x14UnreadByContactEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x05:\x02\x38\x01\"N\n\x0bReadOptions\x12%\n\x0b\x63onsistency\x18\x01 \x01(\x0e\x32\x10.ReadConsistency\x12\x18\n\x10max_staleness_ms\x18\x02 \x01(\x03\"\x12\n\x10ReadIndexRequest\"2\n\x11ReadIndexResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\r\n\x05index\x18\x02 \x01(\x03\".\n\x10ListUsersRequest\x12\x1a\n\x04read\x18\x01 \x01(\x0b\x32\x0c.ReadOptions\"2\n\x11ListUsersResponse\x12\r\n\x05users\x18\x01 \x03(\t\x12\x0e\n\x06status\x18\x02 \x01(\t\"v\n\x12SendMessageRequest\x12\x0e\n\x06sender\x18\x01 \x01(\t\x12\x11\n\trecipient\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\x12\x12\n\nmessage_id\x18\x04 \x01(\t\x12\x18\n\x10\x62ytes_message_id\x18\x05 \x01(\x0c\"c\n\x13SendMessageResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x12\n\nmessage_id\x18\x02 \x01(\t\x12\x0e\n\x06leader\x18\x03 \x01(\t\x12\x18\n\x10\x62ytes_message_id\x18\x04 \x01(\x0c\"$\n\x10SubscribeRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"v\n\x07Message\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0e\n\x06sender\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\x12\x0e\n\x06status\x18\x04 \x01(\t\x12\x0b\n\x03seq\x18\x05 \x01(\x03\x12\x0f\n\x07updated\x18\x06 \x01(\x03\x12\x10\n\x08\x62ytes_id\x18\x07 \x01(\x0c\"G\n\x0fMarkReadRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontact\x18\x02 \x01(\t\x12\x11\n\tbatch_num\x18\x03 \x01(\x05\"3\n\x10MarkReadResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x0e\n\x06leader\x18\x02 \x01(\t\"m\n\x1a\x44\x65leteUnreadMessageRequest\x12\x0e\n\x06sender\x18\x01 \x01(\t\x12\x11\n\trecipient\x18\x02 \x01(\t\x12\x12\n\nmessage_id\x18\x03 \x01(\t\x12\x18\n\x10\x62ytes_message_id\x18\x04 \x01(\x0c\"N\n\x1b\x44\x65leteUnreadMessageResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0e\n\x06leader\x18\x03 \x01(\t\"y\n\x16ReceiveMessagesRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x11\n\tafter_seq\x18\x02 \x01(\x03\x12\r\n\x05limit\x18\x03 \x01(\x05\x12\x0f\n\x07\x63ontact\x18\x04 \x01(\t\x12\x1a\n\x04read\x18\x05 \x01(\x0b\x32\x0c.ReadOptions\"i\n\x17ReceiveMessagesResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x1a\n\x08messages\x18\x02 \x03(\x0b\x32\x08.Message\x12\x10\n\x08next_seq\x18\x03 \x01(\x03\x12\x10\n\x08has_more\x18\x04 \x01(\x08\"]\n\x0bSyncRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x11\n\tsince_seq\x18\x02 \x01(\x03\x12\r\n\x05limit\x18\x03 \x01(\x05\x12\x1a\n\x04read\x18\x04 \x01(\x0b\x32\x0c.ReadOptions\"]\n\x0cSyncResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x19\n\x07\x63hanges\x18\x02 \x03(\x0b\x32\x08.Message\x12\x10\n\x08next_seq\x18\x03 \x01(\x03\x12\x10\n\x08has_more\x18\x04 \x01(\x08\"(\n\x14\x44\x65leteAccountRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"8\n\x15\x44\x65leteAccountResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x0e\n\x06leader\x18\x02 \x01(\t\"!\n\rLogoutRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"1\n\x0eLogoutResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x0e\n\x06leader\x18\x02 \x01(\t\"~\n\x17ReplicateMessageRequest\x12\x12\n\nmessage_id\x18\x01 \x01(\t\x12\x0e\n\x06sender\x18\x02 \x01(\t\x12\x11\n\trecipient\x18\x03 \x01(\t\x12\x0f\n\x07message\x18\x04 \x01(\t\x12\x0e\n\x06status\x18\x05 \x01(\t\x12\x0b\n\x03seq\x18\x06 \x01(\x03\"+\n\x18ReplicateMessageResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\">\n\x18ReplicateRegisterRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\",\n\x19ReplicateRegisterResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"P\n\x18ReplicateMarkReadRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontact\x18\x02 \x01(\t\x12\x11\n\tbatch_num\x18\x03 \x01(\x05\",\n\x19ReplicateMarkReadResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"V\n\x1dReplicateDeleteMessageRequest\x12\x0e\n\x06sender\x18\x01 \x01(\t\x12\x11\n\trecipient\x18\x02 \x01(\t\x12\x12\n\nmessage_id\x18\x03 \x01(\t\"1\n\x1eReplicateDeleteMessageResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"1\n\x1dReplicateDeleteAccountRequest\x12\x10\n\x08username\x18\x01 \x01(\t\"1\n\x1eReplicateDeleteAccountResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"A\n\x19ReplicateSubscribeRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x12\n\nsubscribed\x18\x02 \x01(\x08\"-\n\x1aReplicateSubscribeResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x80\x04\n\x10ReplicationEntry\x12\r\n\x05index\x18\x01 \x01(\x03\x12+\n\x07message\x18\x02 \x01(\x0b\x32\x18.ReplicateMessageRequestH\x00\x12-\n\x08register\x18\x03 \x01(\x0b\x32\x19.ReplicateRegisterRequestH\x00\x12.\n\tmark_read\x18\x04 \x01(\x0b\x32\x19.ReplicateMarkReadRequestH\x00\x12\x38\n\x0e\x64\x65lete_message\x18\x05 \x01(\x0b\x32\x1e.ReplicateDeleteMessageRequestH\x00\x12\x38\n\x0e\x64\x65lete_account\x18\x06 \x01(\x0b\x32\x1e.ReplicateDeleteAccountRequestH\x00\x12/\n\tsubscribe\x18\x07 \x01(\x0b\x32\x1a.ReplicateSubscribeRequestH\x00\x12\x38\n\x11\x61\x63tive_user_login\x18\x08 \x01(\x0b\x32\x1b.ReplicateActiveUserRequestH\x00\x12\x39\n\x12\x61\x63tive_user_logout\x18\t \x01(\x0b\x32\x1b.ReplicateActiveUserRequestH\x00\x12\x31\n\nmembership\x18\n \x01(\x0b\x32\x1b.ReplicateMembershipRequestH\x00\x42\x04\n\x02op\"R\n\x10ReplicationBatch\x12\"\n\x07\x65ntries\x18\x02 \x03(\x0b\x32\x11.ReplicationEntry\x12\x14\n\x0cleader_index\x18\x03 \x01(\x03J\x04\x08\x01\x10\x02\"\x1f\n\x0eReplicationAck\x12\r\n\x05index\x18\x01 \x01(\x03\"\x11\n\x0fLogIndexRequest\"O\n\x10LogIndexResponse\x12\r\n\x05index\x18\x01 \x01(\x03\x12\x13\n\x0bsnapshot_id\x18\x02 \x01(\t\x12\x17\n\x0fsnapshot_offset\x18\x03 \x01(\x03\"~\n\rSnapshotChunk\x12\x13\n\x0bsnapshot_id\x18\x01 \x01(\t\x12\r\n\x05index\x18\x02 \x01(\x03\x12\x0e\n\x06offset\x18\x03 \x01(\x03\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\x0c\x12\r\n\x05\x63rc32\x18\x05 \x01(\r\x12\x0c\n\x04\x64one\x18\x06 \x01(\x08\x12\x0e\n\x06sha256\x18\x07 \x01(\t\"(\n\x17InstallSnapshotResponse\x12\r\n\x05index\x18\x01 \x01(\x03\"\r\n\x0bPingRequest\"C\n\x0cPingResponse\x12\r\n\x05\x61live\x18\x01 \x01(\x08\x12\x11\n\tlog_index\x18\x02 \x01(\x03\x12\x11\n\tleader_id\x18\x03 \x01(\x05\".\n\x1aReplicateActiveUserRequest\x12\x10\n\x08username\x18\x01 \x01(\t\".\n\x1bReplicateActiveUserResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\"%\n\x06Member\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0f\n\x07\x61\x64\x64ress\x18\x02 \x01(\t\"B\n\x17\x43hangeMembershipRequest\x12\x14\n\x03\x61\x64\x64\x18\x01 \x01(\x0b\x32\x07.Member\x12\x11\n\tremove_id\x18\x02 \x01(\x05\"T\n\x18\x43hangeMembershipResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x18\n\x07members\x18\x02 \x03(\x0b\x32\x07.Member\x12\x0e\n\x06leader\x18\x03 \x01(\t\"N\n\x1aReplicateMembershipRequest\x12\x18\n\x07members\x18\x01 \x03(\x0b\x32\x07.Member\x12\x16\n\x05joint\x18\x02 \x03(\x0b\x32\x07.Member\".\n\x1bReplicateMembershipResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08*C\n\x0fReadConsistency\x12\x0e\n\nREAD_LOCAL\x10\x00\x12\x10\n\x0cREAD_BOUNDED\x10\x01\x12\x0e\n\nREAD_INDEX\x10\x02\x32\xc1\x07\n\x0b\x43hatService\x12>\n\rGetLeaderInfo\x12\x15.GetLeaderInfoRequest\x1a\x16.GetLeaderInfoResponse\x12=\n+LoadActiveUsersAndSubscribersFromPersistent\x12\x06.Empty\x1a\x06.Empty\x12*\n\x0c\x43heckVersion\x12\x08.Version\x1a\x10.VersionResponse\x12/\n\x08Register\x12\x10.RegisterRequest\x1a\x11.RegisterResponse\x12&\n\x05Login\x12\r.LoginRequest\x1a\x0e.LoginResponse\x12\x32\n\tListUsers\x12\x11.ListUsersRequest\x1a\x12.ListUsersResponse\x12\x38\n\x0bSendMessage\x12\x13.SendMessageRequest\x1a\x14.SendMessageResponse\x12*\n\tSubscribe\x12\x11.SubscribeRequest\x1a\x08.Message0\x01\x12/\n\x08MarkRead\x12\x10.MarkReadRequest\x1a\x11.MarkReadResponse\x12P\n\x13\x44\x65leteUnreadMessage\x12\x1b.DeleteUnreadMessageRequest\x1a\x1c.DeleteUnreadMessageResponse\x12\x44\n\x0fReceiveMessages\x12\x17.ReceiveMessagesRequest\x1a\x18.ReceiveMessagesResponse\x12>\n\rDeleteAccount\x12\x15.DeleteAccountRequest\x1a\x16.DeleteAccountResponse\x12)\n\x06Logout\x12\x0e.LogoutRequest\x1a\x0f.LogoutResponse\x12(\n\tSyncSince\x12\x0c.SyncRequest\x1a\r.SyncResponse\x12\x32\n\tReadIndex\x12\x11.ReadIndexRequest\x1a\x12.ReadIndexResponse\x12\x39\n\x0fWatchLeadership\x12\x17.WatchLeadershipRequest\x1a\x0b.LeaderInfo0\x01\x12G\n\x10\x43hangeMembership\x12\x18.ChangeMembershipRequest\x1a\x19.ChangeMembershipResponse2\xa3\x07\n\x12ReplicationService\x12G\n\x10ReplicateMessage\x12\x18.ReplicateMessageRequest\x1a\x19.ReplicateMessageResponse\x12J\n\x11ReplicateRegister\x12\x19.ReplicateRegisterRequest\x1a\x1a.ReplicateRegisterResponse\x12J\n\x11ReplicateMarkRead\x12\x19.ReplicateMarkReadRequest\x1a\x1a.ReplicateMarkReadResponse\x12Y\n\x16ReplicateDeleteMessage\x12\x1e.ReplicateDeleteMessageRequest\x1a\x1f.ReplicateDeleteMessageResponse\x12Y\n\x16ReplicateDeleteAccount\x12\x1e.ReplicateDeleteAccountRequest\x1a\x1f.ReplicateDeleteAccountResponse\x12M\n\x12ReplicateSubscribe\x12\x1a.ReplicateSubscribeRequest\x1a\x1b.ReplicateSubscribeResponse\x12U\n\x18ReplicateActiveUserLogin\x12\x1b.ReplicateActiveUserRequest\x1a\x1c.ReplicateActiveUserResponse\x12V\n\x19ReplicateActiveUserLogout\x12\x1b.ReplicateActiveUserRequest\x1a\x1c.ReplicateActiveUserResponse\x12P\n\x13ReplicateMembership\x12\x1b.ReplicateMembershipRequest\x1a\x1c.ReplicateMembershipResponse\x12\x33\n\tReplicate\x12\x11.ReplicationBatch\x1a\x0f.ReplicationAck(\x01\x30\x01\x12\x32\n\x0bGetLogIndex\x12\x10.LogIndexRequest\x1a\x11.LogIndexResponse\x12=\n\x0fInstallSnapshot\x12\x0e.SnapshotChunk\x1a\x18.InstallSnapshotResponse(\x01\x32-\n\x06Health\x12#\n\x04Ping\x12\x0c.PingRequest\x1a\r.PingResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'chat_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
+  _globals['_LOGINRESPONSE_UNREADBYCONTACTENTRY']._loaded_options = None
+  _globals['_LOGINRESPONSE_UNREADBYCONTACTENTRY']._serialized_options = b'8\001'
+  _globals['_READCONSISTENCY']._serialized_start=4321
+  _globals['_READCONSISTENCY']._serialized_end=4388
   _globals['_GETLEADERINFOREQUEST']._serialized_start=14
   _globals['_GETLEADERINFOREQUEST']._serialized_end=36
-  _globals['_GETLEADERINFORESPONSE']._serialized_start=38
-  _globals['_GETLEADERINFORESPONSE']._serialized_end=75
-  _globals['_EMPTY']._serialized_start=77
-  _globals['_EMPTY']._serialized_end=84
-  _globals['_VERSION']._serialized_start=86
-  _globals['_VERSION']._serialized_end=112
-  _globals['_VERSIONRESPONSE']._serialized_start=114
-  _globals['_VERSIONRESPONSE']._serialized_end=165
-  _globals['_REGISTERREQUEST']._serialized_start=167
-  _globals['_REGISTERREQUEST']._serialized_end=220
-  _globals['_REGISTERRESPONSE']._serialized_start=222
-  _globals['_REGISTERRESPONSE']._serialized_end=257
-  _globals['_LOGINREQUEST']._serialized_start=259
-  _globals['_LOGINREQUEST']._serialized_end=309
-  _globals['_LOGINRESPONSE']._serialized_start=311
-  _globals['_LOGINRESPONSE']._serialized_end=368
-  _globals['_LISTUSERSREQUEST']._serialized_start=370
-  _globals['_LISTUSERSREQUEST']._serialized_end=388
-  _globals['_LISTUSERSRESPONSE']._serialized_start=390
-  _globals['_LISTUSERSRESPONSE']._serialized_end=424
-  _globals['_SENDMESSAGEREQUEST']._serialized_start=426
-  _globals['_SENDMESSAGEREQUEST']._serialized_end=498
-  _globals['_SENDMESSAGERESPONSE']._serialized_start=500
-  _globals['_SENDMESSAGERESPONSE']._serialized_end=557
-  _globals['_SUBSCRIBEREQUEST']._serialized_start=559
-  _globals['_SUBSCRIBEREQUEST']._serialized_end=595
-  _globals['_MESSAGE']._serialized_start=597
-  _globals['_MESSAGE']._serialized_end=667
-  _globals['_MARKREADREQUEST']._serialized_start=669
-  _globals['_MARKREADREQUEST']._serialized_end=740
-  _globals['_MARKREADRESPONSE']._serialized_start=742
-  _globals['_MARKREADRESPONSE']._serialized_end=777
-  _globals['_DELETEUNREADMESSAGEREQUEST']._serialized_start=779
-  _globals['_DELETEUNREADMESSAGEREQUEST']._serialized_end=862
-  _globals['_DELETEUNREADMESSAGERESPONSE']._serialized_start=864
-  _globals['_DELETEUNREADMESSAGERESPONSE']._serialized_end=926
-  _globals['_RECEIVEMESSAGESREQUEST']._serialized_start=928
-  _globals['_RECEIVEMESSAGESREQUEST']._serialized_end=970
-  _globals['_RECEIVEMESSAGESRESPONSE']._serialized_start=972
-  _globals['_RECEIVEMESSAGESRESPONSE']._serialized_end=1041
-  _globals['_DELETEACCOUNTREQUEST']._serialized_start=1043
-  _globals['_DELETEACCOUNTREQUEST']._serialized_end=1083
-  _globals['_DELETEACCOUNTRESPONSE']._serialized_start=1085
-  _globals['_DELETEACCOUNTRESPONSE']._serialized_end=1125
-  _globals['_LOGOUTREQUEST']._serialized_start=1127
-  _globals['_LOGOUTREQUEST']._serialized_end=1160
-  _globals['_LOGOUTRESPONSE']._serialized_start=1162
-  _globals['_LOGOUTRESPONSE']._serialized_end=1195
-  _globals['_REPLICATEMESSAGEREQUEST']._serialized_start=1197
-  _globals['_REPLICATEMESSAGEREQUEST']._serialized_end=1310
-  _globals['_REPLICATEMESSAGERESPONSE']._serialized_start=1312
-  _globals['_REPLICATEMESSAGERESPONSE']._serialized_end=1355
-  _globals['_REPLICATEREGISTERREQUEST']._serialized_start=1357
-  _globals['_REPLICATEREGISTERREQUEST']._serialized_end=1419
-  _globals['_REPLICATEREGISTERRESPONSE']._serialized_start=1421
-  _globals['_REPLICATEREGISTERRESPONSE']._serialized_end=1465
-  _globals['_REPLICATEMARKREADREQUEST']._serialized_start=1467
-  _globals['_REPLICATEMARKREADREQUEST']._serialized_end=1547
-  _globals['_REPLICATEMARKREADRESPONSE']._serialized_start=1549
-  _globals['_REPLICATEMARKREADRESPONSE']._serialized_end=1593
-  _globals['_REPLICATEDELETEMESSAGEREQUEST']._serialized_start=1595
-  _globals['_REPLICATEDELETEMESSAGEREQUEST']._serialized_end=1681
-  _globals['_REPLICATEDELETEMESSAGERESPONSE']._serialized_start=1683
-  _globals['_REPLICATEDELETEMESSAGERESPONSE']._serialized_end=1732
-  _globals['_REPLICATEDELETEACCOUNTREQUEST']._serialized_start=1734
-  _globals['_REPLICATEDELETEACCOUNTREQUEST']._serialized_end=1783
-  _globals['_REPLICATEDELETEACCOUNTRESPONSE']._serialized_start=1785
-  _globals['_REPLICATEDELETEACCOUNTRESPONSE']._serialized_end=1834
-  _globals['_REPLICATESUBSCRIBEREQUEST']._serialized_start=1836
-  _globals['_REPLICATESUBSCRIBEREQUEST']._serialized_end=1901
-  _globals['_REPLICATESUBSCRIBERESPONSE']._serialized_start=1903
-  _globals['_REPLICATESUBSCRIBERESPONSE']._serialized_end=1948
-  _globals['_PINGREQUEST']._serialized_start=1950
-  _globals['_PINGREQUEST']._serialized_end=1963
-  _globals['_PINGRESPONSE']._serialized_start=1965
-  _globals['_PINGRESPONSE']._serialized_end=1994
-  _globals['_REPLICATEACTIVEUSERREQUEST']._serialized_start=1996
-  _globals['_REPLICATEACTIVEUSERREQUEST']._serialized_end=2042
-  _globals['_REPLICATEACTIVEUSERRESPONSE']._serialized_start=2044
-  _globals['_REPLICATEACTIVEUSERRESPONSE']._serialized_end=2090
-  _globals['_CHATSERVICE']._serialized_start=2093
-  _globals['_CHATSERVICE']._serialized_end=2828
-  _globals['_REPLICATIONSERVICE']._serialized_start=2831
-  _globals['_REPLICATIONSERVICE']._serialized_end=3512
-  _globals['_HEALTH']._serialized_start=3514
-  _globals['_HEALTH']._serialized_end=3559
+  _globals['_WATCHLEADERSHIPREQUEST']._serialized_start=38
+  _globals['_WATCHLEADERSHIPREQUEST']._serialized_end=62
+  _globals['_LEADERINFO']._serialized_start=64
+  _globals['_LEADERINFO']._serialized_end=111
+  _globals['_GETLEADERINFORESPONSE']._serialized_start=113
+  _globals['_GETLEADERINFORESPONSE']._serialized_end=150
+  _globals['_EMPTY']._serialized_start=152
+  _globals['_EMPTY']._serialized_end=159
+  _globals['_VERSION']._serialized_start=161
+  _globals['_VERSION']._serialized_end=187
+  _globals['_VERSIONRESPONSE']._serialized_start=189
+  _globals['_VERSIONRESPONSE']._serialized_end=240
+  _globals['_REGISTERREQUEST']._serialized_start=242
+  _globals['_REGISTERREQUEST']._serialized_end=295
+  _globals['_REGISTERRESPONSE']._serialized_start=297
+  _globals['_REGISTERRESPONSE']._serialized_end=348
+  _globals['_LOGINREQUEST']._serialized_start=350
+  _globals['_LOGINREQUEST']._serialized_end=400
+  _globals['_LOGINRESPONSE']._serialized_start=403
+  _globals['_LOGINRESPONSE']._serialized_end=596
+  _globals['_LOGINRESPONSE_UNREADBYCONTACTENTRY']._serialized_start=542
+  _globals['_LOGINRESPONSE_UNREADBYCONTACTENTRY']._serialized_end=596
+  _globals['_READOPTIONS']._serialized_start=598
+  _globals['_READOPTIONS']._serialized_end=676
+  _globals['_READINDEXREQUEST']._serialized_start=678
+  _globals['_READINDEXREQUEST']._serialized_end=696
+  _globals['_READINDEXRESPONSE']._serialized_start=698
+  _globals['_READINDEXRESPONSE']._serialized_end=748
+  _globals['_LISTUSERSREQUEST']._serialized_start=750
+  _globals['_LISTUSERSREQUEST']._serialized_end=796
+  _globals['_LISTUSERSRESPONSE']._serialized_start=798
+  _globals['_LISTUSERSRESPONSE']._serialized_end=848
+  _globals['_SENDMESSAGEREQUEST']._serialized_start=850
+  _globals['_SENDMESSAGEREQUEST']._serialized_end=968
+  _globals['_SENDMESSAGERESPONSE']._serialized_start=970
+  _globals['_SENDMESSAGERESPONSE']._serialized_end=1069
+  _globals['_SUBSCRIBEREQUEST']._serialized_start=1071
+  _globals['_SUBSCRIBEREQUEST']._serialized_end=1107
+  _globals['_MESSAGE']._serialized_start=1109
+  _globals['_MESSAGE']._serialized_end=1227
+  _globals['_MARKREADREQUEST']._serialized_start=1229
+  _globals['_MARKREADREQUEST']._serialized_end=1300
+  _globals['_MARKREADRESPONSE']._serialized_start=1302
+  _globals['_MARKREADRESPONSE']._serialized_end=1353
+  _globals['_DELETEUNREADMESSAGEREQUEST']._serialized_start=1355
+  _globals['_DELETEUNREADMESSAGEREQUEST']._serialized_end=1464
+  _globals['_DELETEUNREADMESSAGERESPONSE']._serialized_start=1466
+  _globals['_DELETEUNREADMESSAGERESPONSE']._serialized_end=1544
+  _globals['_RECEIVEMESSAGESREQUEST']._serialized_start=1546
+  _globals['_RECEIVEMESSAGESREQUEST']._serialized_end=1667
+  _globals['_RECEIVEMESSAGESRESPONSE']._serialized_start=1669
+  _globals['_RECEIVEMESSAGESRESPONSE']._serialized_end=1774
+  _globals['_SYNCREQUEST']._serialized_start=1776
+  _globals['_SYNCREQUEST']._serialized_end=1869
+  _globals['_SYNCRESPONSE']._serialized_start=1871
+  _globals['_SYNCRESPONSE']._serialized_end=1964
+  _globals['_DELETEACCOUNTREQUEST']._serialized_start=1966
+  _globals['_DELETEACCOUNTREQUEST']._serialized_end=2006
+  _globals['_DELETEACCOUNTRESPONSE']._serialized_start=2008
+  _globals['_DELETEACCOUNTRESPONSE']._serialized_end=2064
+  _globals['_LOGOUTREQUEST']._serialized_start=2066
+  _globals['_LOGOUTREQUEST']._serialized_end=2099
+  _globals['_LOGOUTRESPONSE']._serialized_start=2101
+  _globals['_LOGOUTRESPONSE']._serialized_end=2150
+  _globals['_REPLICATEMESSAGEREQUEST']._serialized_start=2152
+  _globals['_REPLICATEMESSAGEREQUEST']._serialized_end=2278
+  _globals['_REPLICATEMESSAGERESPONSE']._serialized_start=2280
+  _globals['_REPLICATEMESSAGERESPONSE']._serialized_end=2323
+  _globals['_REPLICATEREGISTERREQUEST']._serialized_start=2325
+  _globals['_REPLICATEREGISTERREQUEST']._serialized_end=2387
+  _globals['_REPLICATEREGISTERRESPONSE']._serialized_start=2389
+  _globals['_REPLICATEREGISTERRESPONSE']._serialized_end=2433
+  _globals['_REPLICATEMARKREADREQUEST']._serialized_start=2435
+  _globals['_REPLICATEMARKREADREQUEST']._serialized_end=2515
+  _globals['_REPLICATEMARKREADRESPONSE']._serialized_start=2517
+  _globals['_REPLICATEMARKREADRESPONSE']._serialized_end=2561
+  _globals['_REPLICATEDELETEMESSAGEREQUEST']._serialized_start=2563
+  _globals['_REPLICATEDELETEMESSAGEREQUEST']._serialized_end=2649
+  _globals['_REPLICATEDELETEMESSAGERESPONSE']._serialized_start=2651
+  _globals['_REPLICATEDELETEMESSAGERESPONSE']._serialized_end=2700
+  _globals['_REPLICATEDELETEACCOUNTREQUEST']._serialized_start=2702
+  _globals['_REPLICATEDELETEACCOUNTREQUEST']._serialized_end=2751
+  _globals['_REPLICATEDELETEACCOUNTRESPONSE']._serialized_start=2753
+  _globals['_REPLICATEDELETEACCOUNTRESPONSE']._serialized_end=2802
+  _globals['_REPLICATESUBSCRIBEREQUEST']._serialized_start=2804
+  _globals['_REPLICATESUBSCRIBEREQUEST']._serialized_end=2869
+  _globals['_REPLICATESUBSCRIBERESPONSE']._serialized_start=2871
+  _globals['_REPLICATESUBSCRIBERESPONSE']._serialized_end=2916
+  _globals['_REPLICATIONENTRY']._serialized_start=2919
+  _globals['_REPLICATIONENTRY']._serialized_end=3431
+  _globals['_REPLICATIONBATCH']._serialized_start=3433
+  _globals['_REPLICATIONBATCH']._serialized_end=3515
+  _globals['_REPLICATIONACK']._serialized_start=3517
+  _globals['_REPLICATIONACK']._serialized_end=3548
+  _globals['_LOGINDEXREQUEST']._serialized_start=3550
+  _globals['_LOGINDEXREQUEST']._serialized_end=3567
+  _globals['_LOGINDEXRESPONSE']._serialized_start=3569
+  _globals['_LOGINDEXRESPONSE']._serialized_end=3648
+  _globals['_SNAPSHOTCHUNK']._serialized_start=3650
+  _globals['_SNAPSHOTCHUNK']._serialized_end=3776
+  _globals['_INSTALLSNAPSHOTRESPONSE']._serialized_start=3778
+  _globals['_INSTALLSNAPSHOTRESPONSE']._serialized_end=3818
+  _globals['_PINGREQUEST']._serialized_start=3820
+  _globals['_PINGREQUEST']._serialized_end=3833
+  _globals['_PINGRESPONSE']._serialized_start=3835
+  _globals['_PINGRESPONSE']._serialized_end=3902
+  _globals['_REPLICATEACTIVEUSERREQUEST']._serialized_start=3904
+  _globals['_REPLICATEACTIVEUSERREQUEST']._serialized_end=3950
+  _globals['_REPLICATEACTIVEUSERRESPONSE']._serialized_start=3952
+  _globals['_REPLICATEACTIVEUSERRESPONSE']._serialized_end=3998
+  _globals['_MEMBER']._serialized_start=4000
+  _globals['_MEMBER']._serialized_end=4037
+  _globals['_CHANGEMEMBERSHIPREQUEST']._serialized_start=4039
+  _globals['_CHANGEMEMBERSHIPREQUEST']._serialized_end=4105
+  _globals['_CHANGEMEMBERSHIPRESPONSE']._serialized_start=4107
+  _globals['_CHANGEMEMBERSHIPRESPONSE']._serialized_end=4191
+  _globals['_REPLICATEMEMBERSHIPREQUEST']._serialized_start=4193
+  _globals['_REPLICATEMEMBERSHIPREQUEST']._serialized_end=4271
+  _globals['_REPLICATEMEMBERSHIPRESPONSE']._serialized_start=4273
+  _globals['_REPLICATEMEMBERSHIPRESPONSE']._serialized_end=4319
+  _globals['_CHATSERVICE']._serialized_start=4391
+  _globals['_CHATSERVICE']._serialized_end=5352
+  _globals['_REPLICATIONSERVICE']._serialized_start=5355
+  _globals['_REPLICATIONSERVICE']._serialized_end=6286
+  _globals['_HEALTH']._serialized_start=6288
+  _globals['_HEALTH']._serialized_end=6333
 # @@protoc_insertion_point(module_scope)
@@ -99,6 +99,26 @@ class ChatServiceStub(object):
                 request_serializer=chat__pb2.LogoutRequest.SerializeToString,
                 response_deserializer=chat__pb2.LogoutResponse.FromString,
                 _registered_method=True)
+        self.SyncSince = channel.unary_unary(
+                '/ChatService/SyncSince',
+                request_serializer=chat__pb2.SyncRequest.SerializeToString,
+                response_deserializer=chat__pb2.SyncResponse.FromString,
+                _registered_method=True)
+        self.ReadIndex = channel.unary_unary(
+                '/ChatService/ReadIndex',
+                request_serializer=chat__pb2.ReadIndexRequest.SerializeToString,
+                response_deserializer=chat__pb2.ReadIndexResponse.FromString,
+                _registered_method=True)
+        self.WatchLeadership = channel.unary_stream(
+                '/ChatService/WatchLeadership',
+                request_serializer=chat__pb2.WatchLeadershipRequest.SerializeToString,
+                response_deserializer=chat__pb2.LeaderInfo.FromString,
+                _registered_method=True)
+        self.ChangeMembership = channel.unary_unary(
+                '/ChatService/ChangeMembership',
+                request_serializer=chat__pb2.ChangeMembershipRequest.SerializeToString,
+                response_deserializer=chat__pb2.ChangeMembershipResponse.FromString,
+                _registered_method=True)
 
 
 class ChatServiceServicer(object):
@@ -182,6 +202,30 @@ class ChatServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def SyncSince(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ReadIndex(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def WatchLeadership(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ChangeMembership(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ChatServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -250,6 +294,26 @@ def add_ChatServiceServicer_to_server(servicer, server):
                     request_deserializer=chat__pb2.LogoutRequest.FromString,
                     response_serializer=chat__pb2.LogoutResponse.SerializeToString,
             ),
+            'SyncSince': grpc.unary_unary_rpc_method_handler(
+                    servicer.SyncSince,
+                    request_deserializer=chat__pb2.SyncRequest.FromString,
+                    response_serializer=chat__pb2.SyncResponse.SerializeToString,
+            ),
+            'ReadIndex': grpc.unary_unary_rpc_method_handler(
+                    servicer.ReadIndex,
+                    request_deserializer=chat__pb2.ReadIndexRequest.FromString,
+                    response_serializer=chat__pb2.ReadIndexResponse.SerializeToString,
+            ),
+            'WatchLeadership': grpc.unary_stream_rpc_method_handler(
+                    servicer.WatchLeadership,
+                    request_deserializer=chat__pb2.WatchLeadershipRequest.FromString,
+                    response_serializer=chat__pb2.LeaderInfo.SerializeToString,
+            ),
+            'ChangeMembership': grpc.unary_unary_rpc_method_handler(
+                    servicer.ChangeMembership,
+                    request_deserializer=chat__pb2.ChangeMembershipRequest.FromString,
+                    response_serializer=chat__pb2.ChangeMembershipResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'ChatService', rpc_method_handlers)
@@ -612,6 +676,114 @@ class ChatService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def SyncSince(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/ChatService/SyncSince',
+            chat__pb2.SyncRequest.SerializeToString,
+            chat__pb2.SyncResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ReadIndex(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/ChatService/ReadIndex',
+            chat__pb2.ReadIndexRequest.SerializeToString,
+            chat__pb2.ReadIndexResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def WatchLeadership(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/ChatService/WatchLeadership',
+            chat__pb2.WatchLeadershipRequest.SerializeToString,
+            chat__pb2.LeaderInfo.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ChangeMembership(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/ChatService/ChangeMembership',
+            chat__pb2.ChangeMembershipRequest.SerializeToString,
+            chat__pb2.ChangeMembershipResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
 
 class ReplicationServiceStub(object):
     """Missing associated documentation comment in .proto file."""
@@ -662,6 +834,26 @@ class ReplicationServiceStub(object):
                 request_serializer=chat__pb2.ReplicateActiveUserRequest.SerializeToString,
                 response_deserializer=chat__pb2.ReplicateActiveUserResponse.FromString,
                 _registered_method=True)
+        self.ReplicateMembership = channel.unary_unary(
+                '/ReplicationService/ReplicateMembership',
+                request_serializer=chat__pb2.ReplicateMembershipRequest.SerializeToString,
+                response_deserializer=chat__pb2.ReplicateMembershipResponse.FromString,
+                _registered_method=True)
+        self.Replicate = channel.stream_stream(
+                '/ReplicationService/Replicate',
+                request_serializer=chat__pb2.ReplicationBatch.SerializeToString,
+                response_deserializer=chat__pb2.ReplicationAck.FromString,
+                _registered_method=True)
+        self.GetLogIndex = channel.unary_unary(
+                '/ReplicationService/GetLogIndex',
+                request_serializer=chat__pb2.LogIndexRequest.SerializeToString,
+                response_deserializer=chat__pb2.LogIndexResponse.FromString,
+                _registered_method=True)
+        self.InstallSnapshot = channel.stream_unary(
+                '/ReplicationService/InstallSnapshot',
+                request_serializer=chat__pb2.SnapshotChunk.SerializeToString,
+                response_deserializer=chat__pb2.InstallSnapshotResponse.FromString,
+                _registered_method=True)
 
 
 class ReplicationServiceServicer(object):
@@ -715,6 +907,32 @@ class ReplicationServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ReplicateMembership(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Replicate(self, request_iterator, context):
+        """One long-lived stream per follower: the leader sends batches of entries, the follower
+        answers each batch with the highest entry index it has applied.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetLogIndex(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def InstallSnapshot(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ReplicationServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -758,6 +976,26 @@ def add_ReplicationServiceServicer_to_server(servicer, server):
                     request_deserializer=chat__pb2.ReplicateActiveUserRequest.FromString,
                     response_serializer=chat__pb2.ReplicateActiveUserResponse.SerializeToString,
             ),
+            'ReplicateMembership': grpc.unary_unary_rpc_method_handler(
+                    servicer.ReplicateMembership,
+                    request_deserializer=chat__pb2.ReplicateMembershipRequest.FromString,
+                    response_serializer=chat__pb2.ReplicateMembershipResponse.SerializeToString,
+            ),
+            'Replicate': grpc.stream_stream_rpc_method_handler(
+                    servicer.Replicate,
+                    request_deserializer=chat__pb2.ReplicationBatch.FromString,
+                    response_serializer=chat__pb2.ReplicationAck.SerializeToString,
+            ),
+            'GetLogIndex': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetLogIndex,
+                    request_deserializer=chat__pb2.LogIndexRequest.FromString,
+                    response_serializer=chat__pb2.LogIndexResponse.SerializeToString,
+            ),
+            'InstallSnapshot': grpc.stream_unary_rpc_method_handler(
+                    servicer.InstallSnapshot,
+                    request_deserializer=chat__pb2.SnapshotChunk.FromString,
+                    response_serializer=chat__pb2.InstallSnapshotResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'ReplicationService', rpc_method_handlers)
@@ -985,6 +1223,114 @@ class ReplicationService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def ReplicateMembership(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/ReplicationService/ReplicateMembership',
+            chat__pb2.ReplicateMembershipRequest.SerializeToString,
+            chat__pb2.ReplicateMembershipResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Replicate(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/ReplicationService/Replicate',
+            chat__pb2.ReplicationBatch.SerializeToString,
+            chat__pb2.ReplicationAck.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetLogIndex(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/ReplicationService/GetLogIndex',
+            chat__pb2.LogIndexRequest.SerializeToString,
+            chat__pb2.LogIndexResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def InstallSnapshot(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/ReplicationService/InstallSnapshot',
+            chat__pb2.SnapshotChunk.SerializeToString,
+            chat__pb2.InstallSnapshotResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
 
 class HealthStub(object):
     """Missing associated documentation comment in .proto file."""
@@ -3,13 +3,15 @@ import hashlib
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
 import threading
+import time
 import chat_pb2
 import chat_pb2_grpc
 import sys
 import argparse
 
 from chat_ui_objects import root, login_frame, username_entry_var, username_entry, password_entry, chat_frame, chat_label, new_conversation_entry_var, new_conversation_entry, conversation_list
-from server import ports
+from server import server_port, load_config, id_fields, message_id_from
+from sharding import ShardRouter, load_shards
 
 # # Get SERVER_HOST and SERVER_PORT from CLI if file ran from terminal. 
 # # Otherwise use the default values (so that functions run for tests)
@@ -31,10 +33,15 @@ from server import ports
 #     SERVER_PORT = 5001
 
 CLIENT_VERSION = "1.0.0"
+RECEIVE_PAGE_SIZE = 200 # messages fetched per ReceiveMessages call
+READ_STALENESS_MS = 5000 # how far behind the leader a replica serving reads may be
+LEADER_RETRY_DELAY = 1 # seconds to wait when no server accepts a leadership watch
 
 current_user = None
+received_seq = 0 # sequence number of the newest mailbox change loaded from the server
 # conversations: key=contact, value=list of message dicts {id, from, message, status}
 conversations = {}
+message_positions = {} # {contact: (conversations[contact], {message id: index in that list})}
 chat_windows = {}   # open chat windows
 undelivered = {} # saves undelivered message
 subscription_active = False
@@ -46,9 +53,26 @@ subscription_call = None
 SERVER_HOST = ""
 SERVER_PORT = ""
 stub = None
+read_from_replicas = False # spread reads over every server instead of sending them all to the leader
+read_stubs = [] # one stub per server, used for reads when read_from_replicas is set
+read_turn = 0
+watch_thread = None # follows leadership changes pushed by the servers
+router = None # with a shard map: sends each write to the replica group of the user it concerns
 
 def connect_to_leader():
-    global SERVER_HOST, SERVER_PORT, stub, subscription_thread, subscription_call, subscription_active
+    """
+        Find the leader by asking each server in turn, then follow leadership changes pushed by the
+        servers (watch_leader) instead of polling
+
+        Params:
+
+            None
+
+        Returns:
+
+            None
+    """
+    global watch_thread
     print('checking leader')
     noleader = True
     for server in all_host_port_pairs:
@@ -56,33 +80,8 @@ def connect_to_leader():
             temp_channel = grpc.insecure_channel(server)
             temp_stub = chat_pb2_grpc.ChatServiceStub(temp_channel)
             response = temp_stub.GetLeaderInfo(chat_pb2.GetLeaderInfoRequest())
-            leader_host, leader_port = response.info.split(':')
+            switch_leader(response.info)
             noleader = False
-
-            # update leader if necessary
-            if SERVER_HOST != leader_host or SERVER_PORT != leader_port:
-                SERVER_HOST = leader_host
-                SERVER_PORT = leader_port
-                print('NEW LEADER:', SERVER_HOST, SERVER_PORT)
-                channel = grpc.insecure_channel(f"{SERVER_HOST}:{SERVER_PORT}")
-                stub = chat_pb2_grpc.ChatServiceStub(channel)
-                stub.LoadActiveUsersAndSubscribersFromPersistent(chat_pb2.Empty())
-                check_new_messages() # restart the check new messages loop
-
-                # If the subscription thread is still active, cancel it.
-                subscription_active = False
-                if subscription_call is not None:
-                    try:
-                        subscription_call.cancel()
-                        print("Canceled stale subscription call.")
-                    except Exception as e:
-                        print("Error canceling subscription call:", e)
-                # Restart a fresh subscription thread.
-                print("Logging globals for subscription",subscription_active, subscription_thread, subscription_call)
-                subscription_active = True
-                print("Restarting subscription thread.")
-                subscription_thread = threading.Thread(target=subscribe_thread, daemon=True)
-                subscription_thread.start()
             break
         except:
             print(f"Failed to connect to {server}")
@@ -91,7 +90,169 @@ def connect_to_leader():
     if noleader:
         print('No leader found')
         sys.exit(1)
-    root.after(5000, connect_to_leader)
+    if watch_thread is None:
+        watch_thread = threading.Thread(target=watch_leader, daemon=True)
+        watch_thread.start()
+
+def switch_leader(leader):
+    """
+        Send requests to the given leader from now on, if it is not the current one
+
+        Params:
+
+            leader: host:port of the leader
+
+        Returns:
+
+            None
+    """
+    global SERVER_HOST, SERVER_PORT, stub, subscription_thread, subscription_call, subscription_active
+    leader_host, leader_port = leader.split(':')
+
+    # update leader if necessary
+    if SERVER_HOST != leader_host or SERVER_PORT != leader_port:
+        SERVER_HOST = leader_host
+        SERVER_PORT = leader_port
+        print('NEW LEADER:', SERVER_HOST, SERVER_PORT)
+        channel = grpc.insecure_channel(f"{SERVER_HOST}:{SERVER_PORT}")
+        stub = chat_pb2_grpc.ChatServiceStub(channel)
+        stub.LoadActiveUsersAndSubscribersFromPersistent(chat_pb2.Empty())
+        if read_from_replicas and not read_stubs:
+            read_stubs.extend(chat_pb2_grpc.ChatServiceStub(grpc.insecure_channel(s)) for s in all_host_port_pairs)
+        check_new_messages() # restart the check new messages loop
+
+        # If the subscription thread is still active, cancel it.
+        subscription_active = False
+        if subscription_call is not None:
+            try:
+                subscription_call.cancel()
+                print("Canceled stale subscription call.")
+            except Exception as e:
+                print("Error canceling subscription call:", e)
+        # Restart a fresh subscription thread.
+        print("Logging globals for subscription",subscription_active, subscription_thread, subscription_call)
+        subscription_active = True
+        print("Restarting subscription thread.")
+        subscription_thread = threading.Thread(target=subscribe_thread, daemon=True)
+        subscription_thread.start()
+
+def watch_leader():
+    """
+        Keep a WatchLeadership stream open to one server and switch to every leader it announces. When
+        that server goes away, watch from the next one, starting with the servers after it
+
+        Params:
+
+            None
+
+        Returns:
+
+            None
+    """
+    turn = 0
+    while True:
+        server = all_host_port_pairs[turn % len(all_host_port_pairs)]
+        try:
+            for info in chat_pb2_grpc.ChatServiceStub(grpc.insecure_channel(server)).WatchLeadership(
+                    chat_pb2.WatchLeadershipRequest()):
+                if info.leader != f"{SERVER_HOST}:{SERVER_PORT}":
+                    root.after(0, switch_leader, info.leader)
+        except grpc.RpcError as e:
+            print(f"Leadership watch on {server} ended: {e.code()}")
+        turn += 1
+        if turn % len(all_host_port_pairs) == 0:
+            time.sleep(LEADER_RETRY_DELAY) # no server answered; wait before scanning them again
+
+def write_call(method, request):
+    """
+        Make a call that only the leader may serve. If the server answers that it is not the leader,
+        switch to the leader it names and repeat the call there once
+
+        Params:
+
+            method: name of the ChatService method, e.g. "SendMessage"
+
+            request: request message for it
+
+        Returns:
+
+            the response
+    """
+    if router:
+        return router.call(method, request)
+    response = getattr(stub, method)(request)
+    leader = getattr(response, "leader", "")
+    if isinstance(leader, str) and leader:
+        print(f"{method} redirected to leader {leader}")
+        switch_leader(leader)
+        response = getattr(stub, method)(request)
+    return response
+
+def read_call(method, request):
+    """
+        Make a read-only call. With read_from_replicas it goes to the next server in turn and may be
+        answered by a follower at most READ_STALENESS_MS behind the leader; if that server is
+        unreachable or too far behind, the call is repeated on the leader.
+
+        Params:
+
+            method: name of the ChatService method, e.g. "ReceiveMessages"
+
+            request: request message for it
+
+        Returns:
+
+            the response
+    """
+    global read_turn
+    if read_stubs:
+        read_turn = (read_turn + 1) % len(read_stubs)
+        replica_request = type(request)()
+        replica_request.CopyFrom(request)
+        replica_request.read.consistency = chat_pb2.READ_BOUNDED
+        replica_request.read.max_staleness_ms = READ_STALENESS_MS
+        try:
+            response = getattr(read_stubs[read_turn], method)(replica_request)
+            if not response.status.startswith("error: Replica"):
+                return response
+        except grpc.RpcError as e:
+            print(f"{method} on replica {read_turn} failed:", e)
+    return getattr(stub, method)(request)
+
+def list_users():
+    """
+        Usernames of every account, from every shard when sharded
+
+        Params:
+
+            None
+
+        Returns:
+
+            list of usernames
+    """
+    if router:
+        return router.list_users()
+    return list(stub.ListUsers(chat_pb2.ListUsersRequest()).users)
+
+def use_home_shard(username):
+    """
+        With a shard map, follow the leader of the replica group holding username, which then serves
+        the user's reads and subscription
+
+        Params:
+
+            username: the user logging in
+
+        Returns:
+
+            None
+    """
+    global all_host_port_pairs
+    if router and router.servers_for(username) != all_host_port_pairs:
+        all_host_port_pairs = router.servers_for(username)
+        read_stubs.clear()
+        connect_to_leader()
 
 def hash_password(password):
     """
@@ -122,11 +283,18 @@ def add_message(contact, msg):
     """
     if contact not in conversations:
         conversations[contact] = []
-    for i, existing in enumerate(conversations[contact]):
-        if existing["id"] == msg["id"]:
-            conversations[contact][i] = msg  # update the message (e.g. mark as deleted)
-            return True
-    conversations[contact].append(msg)
+    msgs = conversations[contact]
+    indexed, positions = message_positions.get(contact, (None, None))
+    if indexed is not msgs or len(positions) != len(msgs):
+        # The conversation was replaced or changed without going through add_message
+        positions = {m["id"]: i for i, m in enumerate(msgs)}
+        message_positions[contact] = (msgs, positions)
+    i = positions.get(msg["id"])
+    if i is not None:
+        msgs[i] = msg  # update the message (e.g. mark as deleted)
+    else:
+        positions[msg["id"]] = len(msgs)
+        msgs.append(msg)
     return True
 
 def check_version_number():
@@ -173,8 +341,11 @@ def update_username_suggestions(event, entry, entry_var):
     typed = entry_var.get().lower()
     
     try:
-        response = stub.ListUsers(chat_pb2.ListUsersRequest())
-        username_options = list(response.users)
+        if router:
+            username_options = list_users()
+        else:
+            response = read_call("ListUsers", chat_pb2.ListUsersRequest())
+            username_options = list(response.users)
     except Exception:
         username_options = []  # Handle bad responses safely
 
@@ -196,15 +367,17 @@ def login():
 
             None
     """
-    global current_user, subscription_active, subscription_thread
+    global current_user, subscription_active, subscription_thread, received_seq
     username = username_entry.get().strip()
     password = password_entry.get().strip()
     if not username or not password:
         messagebox.showwarning("Input Error", "Username and password cannot be empty.")
         return
-    response = stub.Login(chat_pb2.LoginRequest(username=username, password=hash_password(password))).message
+    use_home_shard(username)
+    response = write_call("Login", chat_pb2.LoginRequest(username=username, password=hash_password(password))).message
     if response and response.startswith("success"):
         current_user = username
+        received_seq = 0
         login_frame.pack_forget()
         chat_frame.pack()
         chat_label.config(text=f"Chat - Logged in as {username}")
@@ -236,7 +409,7 @@ def register():
     if not username or not password:
         messagebox.showwarning("Input Error", "Username and password cannot be empty.")
         return
-    response = stub.Register(chat_pb2.RegisterRequest(username=username, password=hash_password(password))).message
+    response = write_call("Register", chat_pb2.RegisterRequest(username=username, password=hash_password(password))).message
     if response and response.startswith("success"):
         messagebox.showinfo("Success", response)
     else:
@@ -269,7 +442,7 @@ def subscribe_thread():
             # Log received message details.
             print(f"[{current_user}] Received live message: id={message.id}, from={message.sender}, text={message.message}, Thread ID: {thread_id}")
             sender = message.sender
-            msg_data = {"id": message.id, "from": sender, "message": message.message, "status": message.status}
+            msg_data = {"id": message_id_from(message.id, message.bytes_id), "from": sender, "message": message.message, "status": message.status}
             if add_message(sender, msg_data):
                 print(f"[{current_user}] Message added to conversation with {sender}, Thread ID: {thread_id}.")
                 update_conversation_list()
@@ -284,7 +457,7 @@ def subscribe_thread():
 
 def load_conversations():
     """
-        Load all of the messages stored for current user
+        Load the messages stored for current user that arrived since the last load, one page at a time
         
         Params:
 
@@ -294,20 +467,59 @@ def load_conversations():
 
             None
     """
-    try:
-        response = stub.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username=current_user))
-    except grpc.RpcError as e:
-        print("load_conversations error:", e)
-        return  # Skip this round and try again later.
-    messages = [{'id': m.id, 'from': m.sender, 'message': m.message, 'status': m.status} for m in response.messages]
-    if response and response.status == "success":
-        if len(messages) != 0:
-            for msg in messages:
-                sender = msg["from"]
-                add_message(sender, msg)
-            update_conversation_list()
-    else:
-        messagebox.showerror("Error", response.status if response.status else "No response from server.")
+    global received_seq
+    loaded = False
+    while True:
+        try:
+            response = read_call("ReceiveMessages", chat_pb2.ReceiveMessagesRequest(
+                username=current_user, after_seq=received_seq, limit=RECEIVE_PAGE_SIZE))
+        except grpc.RpcError as e:
+            print("load_conversations error:", e)
+            break  # Skip this round and try again later.
+        if not (response and response.status == "success"):
+            messagebox.showerror("Error", response.status if response.status else "No response from server.")
+            break
+        for m in response.messages:
+            add_message(m.sender, {'id': message_id_from(m.id, m.bytes_id), 'from': m.sender, 'message': m.message, 'status': m.status, 'seq': m.seq})
+            loaded = True
+        received_seq = response.next_seq
+        if not response.has_more:
+            break
+    if loaded:
+        update_conversation_list()
+
+def sync_conversations():
+    """
+        Apply the changes to the current user's mailbox since the last load or sync: new messages,
+        and messages that were read or deleted in the meantime
+
+        Params:
+
+            None
+
+        Returns:
+
+            None
+    """
+    global received_seq
+    changed = False
+    while True:
+        try:
+            response = read_call("SyncSince", chat_pb2.SyncRequest(
+                username=current_user, since_seq=received_seq, limit=RECEIVE_PAGE_SIZE))
+        except grpc.RpcError as e:
+            print("sync_conversations error:", e)
+            break  # Skip this round and try again later.
+        if response.status != "success":
+            break
+        for m in response.changes:
+            add_message(m.sender, {'id': message_id_from(m.id, m.bytes_id), 'from': m.sender, 'message': m.message, 'status': m.status, 'seq': m.seq})
+            changed = True
+        received_seq = response.next_seq
+        if not response.has_more:
+            break
+    if changed:
+        update_conversation_list()
 
 def update_conversation_list():
     """
@@ -395,9 +607,9 @@ def chat_window(contact):
             if not message:
                 return
             sender, recipient = current_user, contact
-            response = stub.SendMessage(chat_pb2.SendMessageRequest(sender=sender, recipient=recipient, message=message))
+            response = write_call("SendMessage", chat_pb2.SendMessageRequest(sender=sender, recipient=recipient, message=message))
             if response and response.status == "success":
-                msg_id = response.message_id
+                msg_id = message_id_from(response.message_id, response.bytes_message_id)
                 msg_obj = {"id": msg_id, "from": current_user, "message": message, "status": "unread"}
                 add_message(contact, msg_obj)
                 update_conversation_list()
@@ -417,7 +629,7 @@ def chat_window(contact):
             if msg["from"]==current_user and msg["status"]=="unread":
                 if messagebox.askyesno("Delete", "Unsend this message? \n\n" + f"{msg['message']}"):
                     sender, recipient, message_id = current_user, contact, msg["id"]
-                    response = stub.DeleteUnreadMessage(chat_pb2.DeleteUnreadMessageRequest(sender=sender, recipient=recipient, message_id=message_id))
+                    response = write_call("DeleteUnreadMessage", chat_pb2.DeleteUnreadMessageRequest(sender=sender, recipient=recipient, **id_fields(message_id)))
                     if response and response.status == "success":
                         for m in conversations[contact]:
                             if m["id"] == msg["id"]:
@@ -436,7 +648,7 @@ def chat_window(contact):
         nonlocal read_batch_num, unread_counter
         read_batch_num = int(read_batch_num_new.get())
         unread_counter = 0
-        stub.MarkRead(chat_pb2.MarkReadRequest(username=current_user, contact=contact, batch_num=read_batch_num))
+        write_call("MarkRead", chat_pb2.MarkReadRequest(username=current_user, contact=contact, batch_num=read_batch_num))
 
     # Chat_window setup
     if contact in chat_windows:
@@ -523,7 +735,7 @@ def update_chat_window(contact):
     if contact in chat_windows and chat_windows[contact].winfo_exists():
         # Only mark as read messages from this specific contact.
         if any(m["from"]==contact and m["status"]=="unread" for m in conversations.get(contact, [])):
-            stub.MarkRead(chat_pb2.MarkReadRequest(username=current_user, contact=contact, batch_num=0))
+            write_call("MarkRead", chat_pb2.MarkReadRequest(username=current_user, contact=contact, batch_num=0))
             for m in conversations.get(contact, []):
                 if m["from"] == contact and m["status"] == "unread":
                     m["status"] = "read"
@@ -543,7 +755,7 @@ def check_new_messages():
             None
     """
     if current_user:
-        load_conversations()
+        sync_conversations()
         root.after(5000, check_new_messages)
 
 def start_new_conversation():
@@ -567,8 +779,7 @@ def start_new_conversation():
         return
 
     # Check if the recipient exists.
-    response = stub.ListUsers(chat_pb2.ListUsersRequest())
-    users_list = list(response.users)
+    users_list = list_users()
     if recipient not in users_list:
         messagebox.showwarning("Input Error", f"User '{recipient}' does not exist.")
         return
@@ -593,7 +804,7 @@ def delete_account():
             None
     """
     if messagebox.askyesno("Confirm", "Delete your account?"):
-        response = stub.DeleteAccount(chat_pb2.DeleteAccountRequest(username=current_user)).message
+        response = write_call("DeleteAccount", chat_pb2.DeleteAccountRequest(username=current_user)).message
         if response and response.startswith("success"):
             messagebox.showinfo("Account Deleted", response)
             conversations.clear()
@@ -618,7 +829,7 @@ def logout():
     """
     global current_user, subscription_active, conversations, chat_windows
     if current_user:
-        response = stub.Logout(chat_pb2.LogoutRequest(username=current_user)).message
+        response = write_call("Logout", chat_pb2.LogoutRequest(username=current_user)).message
         if response.startswith("success"):
             current_user = None
             subscription_active = False
@@ -662,8 +873,7 @@ def run_gui():
     tk.Label(login_frame, text="Username:").pack()
 
     try:
-        response = stub.ListUsers(chat_pb2.ListUsersRequest())
-        username_options = list(response.users)
+        username_options = list_users()
     except Exception as e:
         print(f"Error: {e}")
         return 
@@ -702,9 +912,23 @@ def run_gui():
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Start a specific client instance.")
-    parser.add_argument("--all_ips", type=str, required=True,
-                        help="Comma-separated list of external IP addresses for all servers (order: server1,server2,server3)")
+    cluster = parser.add_mutually_exclusive_group(required=True)
+    cluster.add_argument("--all_ips", type=str,
+                         help="Comma-separated list of external IP addresses for all servers (order: server1,server2,...)")
+    cluster.add_argument("--config", type=str,
+                         help='JSON cluster config: {"servers": {"1": "host:port", ...}}')
+    cluster.add_argument("--shards", type=str,
+                         help='JSON shard map, one cluster per replica group: {"shards": [{"1": "host:port", ...}, ...]}')
+    parser.add_argument("--read_from_replicas", action="store_true",
+                        help="Spread message loads and polls over every server, accepting replies up to 5 s stale")
     args = parser.parse_args()
-    all_ips = args.all_ips.split(",")
-    all_host_port_pairs = [f"{all_ips[i]}:{ports[i+1]}" for i in range(len(all_ips))]
+    read_from_replicas = args.read_from_replicas
+    if args.shards:
+        router = ShardRouter(load_shards(args.shards))
+        all_host_port_pairs = router.shards[0] # until a user logs in
+    elif args.config:
+        all_host_port_pairs = [address for _, address in sorted(load_config(args.config).items())]
+    else:
+        all_ips = args.all_ips.split(",")
+        all_host_port_pairs = [f"{all_ips[i]}:{server_port(i + 1)}" for i in range(len(all_ips))]
     run_gui()
\ No newline at end of file
@@ -0,0 +1,299 @@
+import array
+import bisect
+import hashlib
+import uuid
+
+UNREAD, READ, DELETED = 0, 1, 2  # message status codes
+STATUSES = ("unread", "read", "deleted")  # status code -> name used in files and on the wire
+STATUS_CODES = {name: code for code, name in enumerate(STATUSES)}
+ID_SIZE = 16  # bytes of a message ID key
+EMPTY = array.array("I")
+
+def id_key(message_id):
+    """
+        16-byte key of a message ID: the bytes of a UUID in canonical form, otherwise a BLAKE2 digest of the text.
+
+        Returns:
+            (key, whether the ID can be rebuilt from the key)
+    """
+    if len(message_id) == 36 and message_id[8] == message_id[13] == message_id[18] == message_id[23] == "-" \
+            and message_id == message_id.lower():
+        try:
+            key = bytes.fromhex(message_id.replace("-", ""))
+            if len(key) == ID_SIZE:
+                return key, True
+        except ValueError:
+            pass
+    return hashlib.blake2b(message_id.encode(), digest_size=ID_SIZE).digest(), False
+
+class Mailbox:
+    """
+        One user's messages, stored column by column instead of as a dict per message.
+
+        Message i has a 16-byte ID key (ids[16 i:16 i + 16]), a sequence number, the sequence number
+        of its latest status change (0 if none), a one-byte status code and the index of its sender
+        in contacts; only the body is a Python object. IDs that are not UUIDs are kept as text in
+        text_ids. The indexes are arrays too: an open-addressing hash table from ID key to position,
+        each sender's positions, and the mailbox's changes in seq order. Messages are converted to
+        dicts ({"id", "from", "message", "status", "seq", "updated"?}) only when they are returned.
+
+        Not thread-safe: the store guards each mailbox with its user's lock.
+    """
+    BODY_FIELD = "message"  # key of the body in message dicts
+
+    def __init__(self):
+        self.ids = bytearray()
+        self.text_ids = {}  # {position: ID} for IDs that are not UUIDs
+        self.seqs = array.array("Q")
+        self.updated = array.array("Q")
+        self.statuses = bytearray()
+        self.senders = array.array("I")
+        self.bodies = self.new_bodies()
+        self.contacts = []  # sender names, by code
+        self.contact_codes = {}  # {sender name: code}
+        self.by_contact = {}  # {code: array of the positions of the sender's messages}
+        self.unread_from = {}  # {code: index into by_contact[code] before which no message is unread}
+        self.unread = {}  # {code: unread messages from the sender}
+        self.unread_count = 0
+        # Every change (arrival, read, delete) in seq order; an entry whose seq is not the message's
+        # latest change was superseded
+        self.change_seqs = array.array("Q")
+        self.change_positions = array.array("I")
+        self.table = array.array("q", bytes(8 * 8))  # position + 1 of each ID key, 0 = free slot
+        self.seq = 0  # sequence number of the latest change
+        # Whether positions are in seq order, so page() can bisect them. A replicated message keeps the
+        # leader's seq and may arrive after one with a higher seq; page() then scans instead.
+        self.in_order = True
+
+    @staticmethod
+    def new_bodies():
+        return []
+
+    @classmethod
+    def from_dicts(cls, messages, seq=0):
+        """
+            Build a mailbox from message dicts, as stored in files and snapshots.
+
+            Params:
+                messages: message dicts in arrival order; one without a seq gets its position + 1
+                seq: sequence number of the latest change, if known
+        """
+        mailbox = cls()
+        for i, msg in enumerate(messages):
+            mailbox.append(dict(msg, seq=msg.get("seq") or i + 1))
+        mailbox.seq = max(mailbox.seq, seq)
+        return mailbox
+
+    def __len__(self):
+        return len(self.seqs)
+
+    def __getitem__(self, i):
+        return self.record(range(len(self))[i])
+
+    def key(self, i):
+        return bytes(self.ids[ID_SIZE * i:ID_SIZE * (i + 1)])
+
+    def message_id(self, i):
+        if i in self.text_ids:
+            return self.text_ids[i]
+        return str(uuid.UUID(bytes=self.key(i)))
+
+    def slot(self, key):
+        """
+            Index of the hash table slot holding key, or of the free slot where it would go
+        """
+        mask = len(self.table) - 1
+        i = int.from_bytes(key[:8], "little") & mask
+        while self.table[i] and self.key(self.table[i] - 1) != key:
+            i = (i + 1) & mask
+        return i
+
+    def find(self, message_id):
+        """
+            Position of the message with this ID, or None
+        """
+        position = self.table[self.slot(id_key(message_id)[0])]
+        return position - 1 if position else None
+
+    def contact_code(self, name):
+        code = self.contact_codes.get(name)
+        if code is None:
+            code = self.contact_codes[name] = len(self.contacts)
+            self.contacts.append(name)
+            self.by_contact[code] = array.array("I")
+            self.unread_from[code] = 0
+        return code
+
+    def record(self, i, **extra):
+        """
+            Message i as a dict
+        """
+        msg = {"id": self.message_id(i), "from": self.contacts[self.senders[i]], self.BODY_FIELD: self.bodies[i],
+               "status": STATUSES[self.statuses[i]], "seq": self.seqs[i]}
+        if self.updated[i]:
+            msg["updated"] = self.updated[i]
+        msg.update(extra)
+        return msg
+
+    def to_dicts(self):
+        return [self.record(i) for i in range(len(self))]
+
+    def frozen(self):
+        """
+            Copy of the columns to_dicts reads, made with one copy per array instead of an object per
+            message, so a snapshot holds the store's locks only while copying them
+        """
+        copy = self.__class__.__new__(self.__class__)
+        copy.ids = bytes(self.ids)
+        copy.text_ids = dict(self.text_ids)
+        copy.seqs = self.seqs[:]
+        copy.updated = self.updated[:]
+        copy.statuses = bytes(self.statuses)
+        copy.senders = self.senders[:]
+        copy.bodies = self.bodies[:]
+        copy.contacts = list(self.contacts)
+        copy.seq = self.seq
+        return copy
+
+    def add_change(self, seq, position):
+        if not self.change_seqs or self.change_seqs[-1] <= seq:
+            self.change_seqs.append(seq)
+            self.change_positions.append(position)
+            return
+        # A replicated message may arrive after a later local change; keep the changes in seq order
+        i = bisect.bisect_right(self.change_seqs, seq)
+        self.change_seqs.insert(i, seq)
+        self.change_positions.insert(i, position)
+
+    def append(self, msg):
+        """
+            Store a message dict, giving it the next sequence number unless it carries one.
+
+            Returns:
+                its sequence number, or None if a message with the same ID is already stored
+        """
+        key, is_uuid = id_key(msg["id"])
+        slot = self.slot(key)
+        if self.table[slot]:
+            return None
+        position = len(self.seqs)
+        seq = msg.get("seq") or self.seq + 1
+        if position and seq < self.seqs[-1]:
+            self.in_order = False
+        status = STATUS_CODES[msg["status"]]
+        code = self.contact_code(msg["from"])
+        self.ids += key
+        if not is_uuid:
+            self.text_ids[position] = msg["id"]
+        self.seqs.append(seq)
+        self.updated.append(msg.get("updated", 0))
+        self.statuses.append(status)
+        self.senders.append(code)
+        self.bodies.append(msg[self.BODY_FIELD])
+        self.by_contact[code].append(position)
+        if status == UNREAD:
+            self.unread[code] = self.unread.get(code, 0) + 1
+            self.unread_count += 1
+        self.add_change(msg.get("updated", seq), position)
+        self.seq = max(self.seq, seq, msg.get("updated", 0))
+        self.table[slot] = position + 1
+        if 2 * (position + 1) > len(self.table):
+            self.grow()
+        return seq
+
+    def grow(self):
+        self.table = array.array("q", bytes(8 * 2 * len(self.table)))
+        for position in range(len(self.seqs)):
+            self.table[self.slot(self.key(position))] = position + 1
+
+    def change_status(self, i, status):
+        """
+            Give message i a new status and the mailbox's next sequence number, so the next sync returns it
+        """
+        if self.statuses[i] == UNREAD:
+            code = self.senders[i]
+            self.unread[code] -= 1
+            if not self.unread[code]:
+                del self.unread[code]
+            self.unread_count -= 1
+        self.statuses[i] = status
+        self.seq += 1
+        self.updated[i] = self.seq
+        self.change_seqs.append(self.seq)
+        self.change_positions.append(i)
+
+    def mark_read(self, contact, batch_num):
+        """
+            Mark the oldest batch_num (0 = all) unread messages from contact as read. Returns how many were.
+        """
+        code = self.contact_codes.get(contact)
+        if code is None:
+            return 0
+        positions = self.by_contact[code]
+        j = self.unread_from[code]
+        count = 0
+        while j < len(positions) and (batch_num == 0 or count < batch_num):
+            i = positions[j]
+            j += 1
+            if self.statuses[i] == UNREAD:
+                self.change_status(i, READ)
+                count += 1
+        self.unread_from[code] = j
+        return count
+
+    def delete(self, sender, message_id):
+        """
+            Delete an unread message. Returns True if it was found, from sender, and still unread.
+        """
+        i = self.find(message_id)
+        if i is None or self.contacts[self.senders[i]] != sender or self.statuses[i] != UNREAD:
+            return False
+        self.change_status(i, DELETED)
+        return True
+
+    def unread_by_contact(self):
+        return {self.contacts[code]: count for code, count in self.unread.items()}
+
+    def page(self, after_seq, count, contact=""):
+        """
+            Messages with seq > after_seq, at most count of them (0 = all), optionally only from contact.
+            Returns (page, whether more remain).
+        """
+        if contact:
+            code = self.contact_codes.get(contact)
+            candidates = EMPTY if code is None else self.by_contact[code]
+        else:
+            candidates = range(len(self))
+        if self.in_order:
+            start = bisect.bisect_right(candidates, after_seq, key=lambda i: self.seqs[i])
+        else:
+            candidates = sorted((i for i in candidates if self.seqs[i] > after_seq), key=self.seqs.__getitem__)
+            start = 0
+        end = len(candidates) if count == 0 else min(len(candidates), start + count)
+        return [self.record(i) for i in candidates[start:end]], end < len(candidates)
+
+    def changes(self, since_seq, count):
+        """
+            Messages changed after since_seq, each once in its latest state, at most count of them (0 = all).
+            Returns (changes, next_seq, whether more remain).
+        """
+        j = bisect.bisect_right(self.change_seqs, since_seq)
+        delta = []
+        next_seq = since_seq
+        while j < len(self.change_seqs) and (count == 0 or len(delta) < count):
+            seq, i = self.change_seqs[j], self.change_positions[j]
+            j += 1
+            next_seq = seq
+            if (self.updated[i] or self.seqs[i]) == seq:
+                delta.append(self.record(i, updated=seq))
+        return delta, next_seq, j < len(self.change_seqs)
+
+class OffsetMailbox(Mailbox):
+    """
+        Mailbox whose bodies are offsets into a SegmentLog ("body"), kept in an array
+    """
+    BODY_FIELD = "body"
+
+    @staticmethod
+    def new_bodies():
+        return array.array("Q")
@@ -0,0 +1,44 @@
+import grpc
+import chat_pb2
+import chat_pb2_grpc
+import argparse
+import sys
+
+def change_membership(address, request):
+    """
+        Send a ChangeMembership request, following the redirect if address is not the leader.
+
+        Params:
+            address: host:port of any server in the cluster
+            request: chat_pb2.ChangeMembershipRequest
+
+        Returns:
+            chat_pb2.ChangeMembershipResponse
+    """
+    stub = chat_pb2_grpc.ChatServiceStub(grpc.insecure_channel(address))
+    response = stub.ChangeMembership(request)
+    if response.leader:
+        stub = chat_pb2_grpc.ChatServiceStub(grpc.insecure_channel(response.leader))
+        response = stub.ChangeMembership(request)
+    return response
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add a server to or remove one from a running cluster.")
+    parser.add_argument("--server", type=str, required=True, help="host:port of any server in the cluster")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Add a server, which must already be running")
+    add.add_argument("id", type=int, help="Server ID of the new server")
+    add.add_argument("address", type=str, help="host:port of the new server")
+    remove = commands.add_parser("remove", help="Remove a server")
+    remove.add_argument("id", type=int, help="Server ID of the server to remove")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        request = chat_pb2.ChangeMembershipRequest(add=chat_pb2.Member(id=args.id, address=args.address))
+    else:
+        request = chat_pb2.ChangeMembershipRequest(remove_id=args.id)
+    response = change_membership(args.server, request)
+    print(response.status)
+    for member in response.members:
+        print(f"  {member.id}: {member.address}")
+    sys.exit(0 if response.status.startswith("success") else 1)
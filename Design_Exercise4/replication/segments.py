@@ -0,0 +1,122 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+SEGMENT_SIZE = 64 << 20  # bytes per segment file; a file is sparse until its records are written
+RECORD_HEADER = struct.Struct("!II")  # size of the record including this header, CRC32 of the payload
+
+class SegmentLog:
+    """
+        Append-only log of byte strings kept in memory-mapped segment files.
+
+        Segment n is the file <directory>/<n>.seg, segment_size bytes long and mapped whole. A record
+        is a header (its size and the CRC32 of its payload) followed by the payload, and is found by
+        its offset: segment number * segment_size + position in the segment. Records never straddle
+        two segments. Appending copies the record into the active segment's mapping; reading slices
+        it out of the mapping, so the kernel pages history in when it is read and may drop pages that
+        are not. sync() must be called before anything referring to an offset is made durable.
+    """
+    def __init__(self, directory, segment_size=SEGMENT_SIZE):
+        """
+            Open (or create) the log in directory and find where the last segment's records end.
+
+            Params:
+                directory: directory holding the segment files
+                segment_size: bytes per segment file; the largest record is this minus the header
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.lock = threading.Lock()  # guards appends and the write position
+        self.maps = {}  # {segment number: mmap}
+        numbers = sorted(int(name[:-len(".seg")]) for name in os.listdir(directory) if name.endswith(".seg"))
+        for number in numbers or [0]:
+            self.map(number)
+        self.active = max(self.maps)
+        self.position = self.recover(self.active)
+        self.synced = (self.active, self.position)  # everything before this is on disk
+
+    def path(self, number):
+        return os.path.join(self.directory, f"{number:08d}.seg")
+
+    def map(self, number):
+        """
+            Map segment number, creating its file if needed
+        """
+        with open(self.path(number), "a+b") as f:
+            if os.fstat(f.fileno()).st_size < self.segment_size:
+                f.truncate(self.segment_size)
+            self.maps[number] = mmap.mmap(f.fileno(), self.segment_size)
+
+    def recover(self, number):
+        """
+            Position after the last intact record of a segment. A record torn by a crash (and anything
+            after it) is overwritten by the next append.
+        """
+        segment = self.maps[number]
+        position = 0
+        while position + RECORD_HEADER.size <= self.segment_size:
+            size, crc = RECORD_HEADER.unpack_from(segment, position)
+            if size < RECORD_HEADER.size or position + size > self.segment_size:
+                break
+            if zlib.crc32(segment[position + RECORD_HEADER.size:position + size]) != crc:
+                break
+            position += size
+        return position
+
+    def append(self, payload):
+        """
+            Add a record.
+
+            Params:
+                payload: bytes to store
+
+            Returns:
+                int: offset of the record, for read()
+        """
+        size = RECORD_HEADER.size + len(payload)
+        if size > self.segment_size:
+            raise ValueError(f"record of {len(payload)} bytes does not fit in a segment of {self.segment_size}")
+        with self.lock:
+            if self.position + size > self.segment_size:
+                self.active += 1
+                self.map(self.active)
+                self.position = 0
+            segment = self.maps[self.active]
+            RECORD_HEADER.pack_into(segment, self.position, size, zlib.crc32(payload))
+            segment[self.position + RECORD_HEADER.size:self.position + size] = payload
+            offset = self.active * self.segment_size + self.position
+            self.position += size
+        return offset
+
+    def read(self, offset):
+        """
+            Payload of the record at offset. Raises IOError if it does not match its checksum.
+        """
+        number, position = divmod(offset, self.segment_size)
+        segment = self.maps[number]
+        size, crc = RECORD_HEADER.unpack_from(segment, position)
+        payload = segment[position + RECORD_HEADER.size:position + size]
+        if size < RECORD_HEADER.size or zlib.crc32(payload) != crc:
+            raise IOError(f"corrupt record at offset {offset} in {self.directory}")
+        return payload
+
+    def sync(self):
+        """
+            Flush the records appended since the last sync to disk (msync of the pages they touched)
+        """
+        with self.lock:
+            start, end = self.synced, (self.active, self.position)
+        for number in range(start[0], end[0] + 1):
+            begin = start[1] if number == start[0] else 0
+            begin -= begin % mmap.PAGESIZE
+            stop = end[1] if number == end[0] else self.segment_size
+            if stop > begin:
+                self.maps[number].flush(begin, stop - begin)
+        self.synced = end
+
+    def close(self):
+        for segment in self.maps.values():
+            segment.close()
@@ -1,114 +1,807 @@
 import grpc
 from concurrent import futures
-import threading, time, uuid, json, os, sys
+import threading, time, uuid, json, os, sys, bisect, itertools, hashlib, zlib, math, sqlite3
+from collections import deque
+from contextlib import contextmanager, ExitStack
 import chat_pb2
 import chat_pb2_grpc
+from sharding import shard_for, load_shards, WRONG_SHARD
+from segments import SegmentLog, SEGMENT_SIZE
+from mailboxes import Mailbox, OffsetMailbox, id_key
 import multiprocessing
 import argparse
 import atexit
 
-HEARTBEAT_INTERVAL = 2  # seconds
+HEARTBEAT_INTERVAL = 0.25  # seconds between heartbeat pings to each peer
+PHI_THRESHOLD = 3  # suspicion level at which a silent peer is declared down (about 1.7 s at the default interval)
 SERVER_VERSION = "1.0.0"
+NOT_LEADER = "error: Not leader"  # answer to a write sent to a follower, which also names the leader
+MAX_PAGE_SIZE = 1000 # most messages returned by one paged ReceiveMessages call
+REPLICATION_TIMEOUT = 2  # seconds a mutation waits for followers to acknowledge it
+RECONNECT_DELAY = 0.5  # seconds before the first attempt to reopen a broken replication stream
+MAX_RECONNECT_DELAY = 8  # reopen attempts back off exponentially up to this many seconds
+REPLICATION_HEARTBEAT = 0.5  # seconds an idle replication stream waits before sending an empty batch
+LATENCY_WINDOW = 100  # most recent calls per peer kept for latency stats
+LOG_RETENTION = 10000  # most recent replication entries kept in memory for followers catching up
+SNAPSHOT_CHUNK_SIZE = 1 << 20  # bytes of a snapshot sent per InstallSnapshot chunk
+LOCK_STRIPES = 64  # mailbox locks in a PersistentStore; each user hashes onto one of them
+COMPACT_EVERY = 10000  # journal records after which a PersistentStore folds its journal into a new snapshot
+LEARNER_TIMEOUT = 60  # seconds a server being added may take to catch up before it gets a vote
+# Peer channels send HTTP/2 keepalive pings so a dead connection is noticed without waiting for a call,
+# and reconnect with gRPC's exponential backoff
+PEER_CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 10000),
+    ("grpc.keepalive_timeout_ms", 5000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.initial_reconnect_backoff_ms", 200),
+    ("grpc.min_reconnect_backoff_ms", 200),
+    ("grpc.max_reconnect_backoff_ms", 5000),
+]
+# Let peers keep idle connections alive with those pings
+SERVER_OPTIONS = [
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.min_recv_ping_interval_without_data_ms", 5000),
+]
+# Replicate* method name -> ReplicationEntry field carrying its request
+REPLICATION_OPS = {
+    "ReplicateMessage": "message",
+    "ReplicateRegister": "register",
+    "ReplicateMarkRead": "mark_read",
+    "ReplicateDeleteMessage": "delete_message",
+    "ReplicateDeleteAccount": "delete_account",
+    "ReplicateSubscribe": "subscribe",
+    "ReplicateActiveUserLogin": "active_user_login",
+    "ReplicateActiveUserLogout": "active_user_logout",
+    "ReplicateMembership": "membership",
+}
 ports = {1: 8001, 2: 8002, 3: 8003}
+BASE_PORT = 8000  # server i listens on BASE_PORT + i unless ports says otherwise
 all_host_port_pairs = []
 
+def server_port(server_id):
+    """
+        Default port of a server launched with --all_ips
+    """
+    return ports.get(server_id, BASE_PORT + server_id)
+
+def load_config(filename):
+    """
+        Read a cluster config file: {"servers": {"1": "host:port", ...}}.
+
+        Returns:
+            dict: {server id: "host:port"}
+    """
+    with open(filename, 'r') as f:
+        config = json.load(f)
+    return {int(pid): address for pid, address in config["servers"].items()}
+
+def member_list(members):
+    """
+        {server id: "host:port"} as a list of chat_pb2.Member
+    """
+    return [chat_pb2.Member(id=pid, address=address) for pid, address in sorted(members.items())]
+
+def id_fields(message_id, field="message_id", raw=True):
+    """
+        Protobuf fields carrying a message ID: a UUID in canonical form goes in bytes_<field> as its 16
+        raw bytes unless raw is False (--id_format text); any other ID goes in field as text.
+
+        Returns:
+            dict: {field name: value}, to pass as keyword arguments
+    """
+    if raw:
+        key, is_uuid = id_key(message_id)
+        if is_uuid:
+            return {"bytes_" + field: key}
+    return {field: message_id}
+
+def message_id_from(text, raw):
+    """
+        Message ID from the string field of a message, or from its bytes_ field if the string is empty
+    """
+    return text if text or not raw else str(uuid.UUID(bytes=raw))
+
+def majority(members):
+    """
+        Number of servers that make a majority of members
+    """
+    return len(members) // 2 + 1
+
+def has_quorum(acked, configs):
+    """
+        True if the server ids in acked hold a majority of every configuration in configs. During a
+        membership change configs holds both the old and the new members (joint consensus).
+    """
+    return all(len(acked & set(config)) >= majority(config) for config in configs)
+
+# -------------------------
+# GroupCommitWriter: batches durable writes from many gRPC worker threads.
+# -------------------------
+class GroupCommitWriter:
+    """
+        Collects commit requests from many threads and satisfies them with a single durable write.
+
+        A caller applies its mutation in memory, then calls commit(), which blocks until a write
+        that started after the mutation has been fsynced. The writer thread waits up to max_latency
+        seconds (or until batch_size commits are pending) before writing, so concurrent senders
+        share one write instead of serializing on disk I/O.
+    """
+    def __init__(self, flush, max_latency=0.005, batch_size=64):
+        self.flush = flush              # callable that durably writes the current state
+        self.max_latency = max_latency  # seconds to wait for more commits before writing
+        self.batch_size = batch_size    # pending commits that trigger an immediate write
+        self.cond = threading.Condition()
+        self.requested = 0  # commit tickets handed out
+        self.durable = 0    # highest ticket covered by a completed write
+        self.flush_count = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def commit(self):
+        """
+            Block until every mutation applied before this call is durable on disk.
+        """
+        with self.cond:
+            self.requested += 1
+            ticket = self.requested
+            self.cond.notify_all()
+            while self.durable < ticket:
+                self.cond.wait()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.requested == self.durable:
+                    self.cond.wait()
+                deadline = time.monotonic() + self.max_latency
+                while self.requested - self.durable < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                target = self.requested
+            # Every ticket <= target was issued after its mutation was applied, so this write covers it.
+            while True:
+                try:
+                    self.flush()
+                    break
+                except Exception as e:
+                    print(f"[STORE] Write failed, retrying: {e}")
+                    time.sleep(0.1)
+            with self.cond:
+                self.durable = target
+                self.flush_count += 1
+                self.cond.notify_all()
+
+# -------------------------
+# PeerConnections: one warm channel per peer, shared by replication and health checks.
+# -------------------------
+class PeerConnections:
+    """
+        Keeps one long-lived gRPC channel per peer address instead of opening a channel for every
+        call, and records the latency of the calls made to each peer.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}  # {address: grpc.Channel}
+        self.latencies = {}  # {address: deque of recent call latencies in seconds}
+        self.failures = {}  # {address: failed calls}
+
+    def channel(self, address):
+        with self.lock:
+            if address not in self.channels:
+                self.channels[address] = grpc.insecure_channel(address, options=PEER_CHANNEL_OPTIONS)
+            return self.channels[address]
+
+    def health_stub(self, address):
+        return chat_pb2_grpc.HealthStub(self.channel(address))
+
+    def replication_stub(self, address):
+        return chat_pb2_grpc.ReplicationServiceStub(self.channel(address))
+
+    def chat_stub(self, address):
+        return chat_pb2_grpc.ChatServiceStub(self.channel(address))
+
+    def record(self, address, seconds, ok=True):
+        """
+            Record one call to a peer: its latency if it succeeded, otherwise a failure.
+        """
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(address, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+            else:
+                self.failures[address] = self.failures.get(address, 0) + 1
+
+    def latency_stats(self):
+        """
+            Latency of the recent calls to each peer, in milliseconds:
+            {address: {"calls", "failures", "last_ms", "avg_ms", "max_ms"}}.
+        """
+        with self.lock:
+            stats = {}
+            for address in set(self.latencies) | set(self.failures):
+                samples = self.latencies.get(address, ())
+                stats[address] = {
+                    "calls": len(samples),
+                    "failures": self.failures.get(address, 0),
+                    "last_ms": 1000 * samples[-1] if samples else None,
+                    "avg_ms": 1000 * sum(samples) / len(samples) if samples else None,
+                    "max_ms": 1000 * max(samples) if samples else None,
+                }
+            return stats
+
+    def close(self):
+        with self.lock:
+            for channel in self.channels.values():
+                channel.close()
+            self.channels.clear()
+
+def snapshot_chunks(snapshot_id, index, data, offset=0, chunk_size=SNAPSHOT_CHUNK_SIZE):
+    """
+        Split a snapshot into InstallSnapshot chunks, starting at byte offset.
+
+        Params:
+            snapshot_id: identifies the snapshot, so an interrupted transfer can be resumed
+            index: log index the snapshot reflects
+            data: the snapshot bytes
+            offset: first byte to send
+            chunk_size: most bytes per chunk
+
+        Returns:
+            generator of SnapshotChunk, the last one with done set
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    while True:
+        part = data[offset:offset + chunk_size]
+        done = offset + len(part) >= len(data)
+        yield chat_pb2.SnapshotChunk(snapshot_id=snapshot_id, index=index, offset=offset, data=part,
+                                     crc32=zlib.crc32(part), done=done, sha256=digest if done else "")
+        if done:
+            return
+        offset += len(part)
+
+# -------------------------
+# PeerReplicator: streams replication entries to one follower.
+# -------------------------
+class PeerReplicator:
+    """
+        Sends replication entries to one follower over a single long-lived Replicate stream.
+
+        Entries queued while a batch is in flight go out together in the next batch (up to
+        batch_size), so throughput grows with the batch size instead of being bound by one round
+        trip per mutation. The follower acknowledges the highest index it has applied; entries not
+        acknowledged when a stream breaks are resent on the next one, and the follower skips any it
+        already applied.
+
+        Every stream starts by asking the follower for its log index. A follower that was down or
+        restarted first receives the entries it missed from the leader's log, or a snapshot of the
+        leader's store if the log no longer holds them. The snapshot is streamed in chunks and kept
+        until the follower has it, so a transfer cut off halfway resumes where it stopped.
+    """
+    def __init__(self, address, log, batch_size=64, ack_cond=None, connections=None,
+                 snapshot_chunk_size=SNAPSHOT_CHUNK_SIZE):
+        self.address = address
+        self.connections = connections or PeerConnections()
+        self.log = log                # the leader's PersistentStore, source of missed entries and snapshots
+        self.batch_size = batch_size  # most entries sent in one batch
+        self.ack_cond = ack_cond      # optional condition shared by several replicators, notified on every ack
+        self.cond = threading.Condition()
+        self.outbox = deque()   # entries not yet sent on the current stream
+        self.unacked = deque()  # entries sent but not yet acknowledged
+        self.acked_index = 0
+        self.stream_id = 0      # bumped whenever a stream ends, which stops its batch generator
+        self.batch_count = 0
+        self.sent_at = deque()  # (last index of a batch, time it was sent), for round-trip latency
+        self.resync_requested = False
+        self.snapshot_chunk_size = snapshot_chunk_size
+        self.snapshot = None  # (snapshot id, log index, bytes) being transferred to the follower
+        self.snapshot_count = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def enqueue(self, entry):
+        with self.cond:
+            self.outbox.append(entry)
+            self.cond.notify_all()
+
+    def drop(self):
+        """
+            Forget every queued entry; used when the follower is considered down.
+        """
+        with self.cond:
+            self.outbox.clear()
+            self.unacked.clear()
+            self.cond.notify_all()
+
+    def resync(self):
+        """
+            Open a stream even though nothing is queued, so a follower that came back catches up now
+            rather than on the next write.
+        """
+        with self.cond:
+            self.resync_requested = True
+            self.cond.notify_all()
+
+    def wait_for(self, index, timeout):
+        """
+            Wait until the follower acknowledged the entry with this index. Returns False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.acked_index < index:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+            return True
+
+    def acknowledge(self, index):
+        """
+            Record that the follower applied every entry up to index. Returns False if it is missing
+            entries before the ones in flight, in which case the stream must be restarted.
+        """
+        with self.cond:
+            sent = None
+            while self.sent_at and self.sent_at[0][0] <= index:
+                sent = self.sent_at.popleft()[1]
+            if sent is not None:
+                self.connections.record(self.address, time.monotonic() - sent)
+            while self.unacked and self.unacked[0].index <= index:
+                self.unacked.popleft()
+            self.acked_index = max(self.acked_index, index)
+            in_order = not self.unacked or self.unacked[0].index <= index + 1
+            self.cond.notify_all()
+        if self.ack_cond is not None:
+            with self.ack_cond:
+                self.ack_cond.notify_all()
+        return in_order
+
+    def catch_up(self, stub):
+        """
+            Ask the follower for its log index and queue, ahead of the pending entries, the ones it
+            missed. If the leader's log no longer holds them, install a snapshot of the leader's store first.
+        """
+        reply = stub.GetLogIndex(chat_pb2.LogIndexRequest(), timeout=REPLICATION_TIMEOUT)
+        follower_index = reply.index
+        with self.cond:
+            first = self.outbox[0].index if self.outbox else self.log.log_index + 1
+        missing = self.log.log_since(follower_index, first)
+        if missing is None:
+            follower_index = self.send_snapshot(stub, reply)
+            missing = self.log.log_since(follower_index, first) or []
+        elif missing:
+            print(f"[REPL] {self.address} is at index {follower_index}; resending {len(missing)} missed entries.")
+        with self.cond:
+            pending = [entry for entry in self.outbox if entry.index > follower_index]
+            self.outbox = deque(itertools.chain(missing, pending))
+        self.acknowledge(follower_index)
+
+    def send_snapshot(self, stub, reply):
+        """
+            Stream a snapshot of the leader's store to the follower, resuming the previous transfer if
+            the follower still holds part of it. Writes go on meanwhile; the entries after the snapshot
+            are sent from the log once it is installed. Returns the follower's new log index.
+        """
+        # Keep sending the same snapshot until it is installed, unless the log moved past it
+        if self.snapshot is None or self.log.log_since(self.snapshot[1]) is None:
+            index, data = self.log.snapshot()
+            data = data.encode()
+            self.snapshot = (f"{index}-{hashlib.sha256(data).hexdigest()[:16]}", index, data)
+        snapshot_id, index, data = self.snapshot
+        offset = reply.snapshot_offset if reply.snapshot_id == snapshot_id else 0
+        print(f"[REPL] {self.address} is at index {reply.index}, behind the log; sending snapshot {snapshot_id} "
+              f"({len(data)} bytes) from byte {offset}.")
+        response = stub.InstallSnapshot(snapshot_chunks(snapshot_id, index, data, offset, self.snapshot_chunk_size))
+        if response.index < index:
+            raise RuntimeError(f"snapshot {snapshot_id} not installed on {self.address}")
+        self.snapshot = None
+        self.snapshot_count += 1
+        return response.index
+
+    def batches(self, stream_id):
+        """
+            Request iterator of one stream: yields whatever is queued, up to batch_size entries at a time.
+            When nothing is queued for REPLICATION_HEARTBEAT seconds it yields an empty batch, so the
+            follower keeps learning the leader's log index and can judge how stale its reads are.
+        """
+        while True:
+            with self.cond:
+                while not self.outbox and self.stream_id == stream_id:
+                    if not self.cond.wait(REPLICATION_HEARTBEAT):
+                        break
+                if self.stream_id != stream_id:
+                    return
+                batch = [self.outbox.popleft() for _ in range(min(self.batch_size, len(self.outbox)))]
+                self.unacked.extend(batch)
+                if batch:
+                    self.batch_count += 1
+                    self.sent_at.append((batch[-1].index, time.monotonic()))
+            yield chat_pb2.ReplicationBatch(entries=batch, leader_index=self.log.log_index)
+
+    def run(self):
+        delay = RECONNECT_DELAY
+        while True:
+            with self.cond:
+                while not self.outbox and not self.resync_requested:
+                    self.cond.wait()
+                self.resync_requested = False
+                stream_id = self.stream_id
+            try:
+                stub = self.connections.replication_stub(self.address)
+                self.catch_up(stub)
+                responses = stub.Replicate(self.batches(stream_id))
+                for ack in responses:
+                    delay = RECONNECT_DELAY # the stream worked; start backing off afresh next time
+                    if not self.acknowledge(ack.index):
+                        print(f"[REPL] {self.address} acknowledged {ack.index}, before the entries in flight; catching it up.")
+                        responses.cancel()
+                        break
+            except (grpc.RpcError, RuntimeError) as e:
+                print(f"[REPL] Stream to {self.address} broken: {e.code() if isinstance(e, grpc.RpcError) else e}")
+                self.connections.record(self.address, 0, ok=False)
+            except Exception as e:
+                # Anything else (a malformed entry, a failed snapshot read) must not stop this peer's
+                # replication for good: log it, back off and retry like a broken stream
+                print(f"[REPL] Replicating to {self.address} failed: {e!r}")
+                self.connections.record(self.address, 0, ok=False)
+            finally:
+                with self.cond:
+                    # Resend what the follower did not acknowledge on the next stream
+                    self.outbox.extendleft(reversed(self.unacked))
+                    self.unacked.clear()
+                    self.sent_at.clear()
+                    self.stream_id += 1
+                    self.cond.notify_all()
+            time.sleep(delay)
+            delay = min(2 * delay, MAX_RECONNECT_DELAY)
+
 # -------------------------
-# PersistentStore: writes to a JSON file unique per server.
+# PersistentStore: a JSON snapshot plus a journal of mutations, unique per server.
 # -------------------------
 class PersistentStore:
-    def __init__(self, filename):
+    """
+        Store kept in memory and persisted as a snapshot file plus an append-only journal
+        (<filename>.journal). Each mutation adds one JSON record to the journal, and a flush appends the
+        records made since the last one, so its cost grows with the mutations in the batch and not with
+        the size of the store, and writers are never stopped for it. Once the journal holds
+        compact_every records (or a snapshot was installed) a flush first folds it into a new snapshot.
+        Opening the store loads the snapshot and replays the journal records written after it.
+    """
+    extension = ".json"  # of the file a server keeps its store in
+    mailbox_class = Mailbox
+
+    def __init__(self, filename, commit_latency=0.005, commit_batch=64, log_retention=LOG_RETENTION,
+                 lock_stripes=LOCK_STRIPES, compact_every=COMPACT_EVERY):
         self.filename = filename
-        self.lock = threading.RLock()  
-        self.users = {}  # {username: {"password": ..., "messages": [...], "subscribed": bool}}
+        self.journal_file = filename + ".journal"
+        # Mailbox operations take only their user's stripe lock, so operations on different users run in
+        # parallel. self.lock guards everything else (the user table, subscribers, log, membership); a
+        # thread that needs both takes the stripe lock first.
+        self.lock = threading.RLock()
+        self.user_locks = [threading.RLock() for _ in range(lock_stripes)]
+        self.users = {}  # {username: {"password": ..., "messages": Mailbox, "subscribed": bool}}
         self.subscribers_set = {} # {username: {"queue": [msg, ...]}}
         self.active_users_set = set()
+        # Replication log: the latest entries applied, numbered consecutively across leaders. Only the
+        # index of the last one is persisted; followers behind what is kept get a snapshot instead.
+        self.log = deque(maxlen=log_retention)
+        self.log_index = 0
+        self.applied = threading.Condition(self.lock)  # notified whenever log_index advances
+        # On a follower: the leader's log index in the latest batch received, and when it arrived
+        self.leader_index = 0
+        self.leader_contact = None
+        # Cluster membership {server id: "host:port"}, replicated through the log. Empty until a cluster
+        # config is installed; joint_members holds the new members while a change is in progress.
+        self.members = {}
+        self.joint_members = None
+        self.on_membership_change = None  # called after the membership changed
+        # Journal records not yet written, numbered consecutively ("seq") under journal_lock, which is
+        # taken after any other lock of the store
+        self.journal_lock = threading.Lock()
+        self.pending = []
+        self.journal_seq = 0  # number of the latest record
+        self.journal_records = 0  # records in the journal file, folded into the snapshot by the next compaction
+        self.compact_every = compact_every
+        self.compact_due = False  # set when the state was replaced, which the journal cannot express
+        self.local = threading.local()  # per-thread flag set inside batch(), records staged inside atomically()
+        self.open()
+        self.writer = GroupCommitWriter(self.write, max_latency=commit_latency, batch_size=commit_batch)
+
+    def open(self):
+        """
+            Load the store's file, if there is one, and replay the journal records written after it
+        """
+        journal_seq = 0
         if os.path.exists(self.filename):
             with open(self.filename, 'r') as f:
                 data = json.load(f)
-            self.users = data.get("users", {})
-            self.subscribers_set = data.get("subscribers", {})
-            self.active_users_set = set(data.get("active_users", []))
+            self.load(data)
+            journal_seq = data.get("journal_seq", 0)
+        valid = 0  # bytes of the journal holding whole records
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break # torn final write from a crash; nothing after it was acknowledged
+                    valid += len(line)
+                    if record["seq"] > journal_seq: # older ones are already in the snapshot
+                        self.apply(record)
+                        journal_seq = record["seq"]
+                        self.journal_records += 1
+        self.journal_seq = journal_seq
+        self.journal = open(self.journal_file, 'a')
+        self.journal.truncate(valid)
+
+    def load(self, data):
+        """
+            Replace the state with data, in the JSON format snapshot() produces
+        """
+        self.users = {}
+        for username, user in data.get("users", {}).items():
+            user = dict(user)
+            user["messages"] = self.mailbox_class.from_dicts(user["messages"], user.pop("seq", 0))
+            self.users[username] = user
+        self.load_metadata(data)
+
+    def load_metadata(self, data):
+        """
+            Replace everything but the users and their mailboxes with data's
+        """
+        self.subscribers_set = data.get("subscribers", {})
+        self.active_users_set = set(data.get("active_users", []))
+        self.log_index = data.get("log_index", 0)
+        self.members = {int(pid): address for pid, address in data.get("members", {}).items()}
+        joint = data.get("joint_members")
+        self.joint_members = {int(pid): address for pid, address in joint.items()} if joint else None
+
+    def user_lock(self, username):
+        """
+            Stripe lock guarding a user's mailbox
+        """
+        return self.user_locks[zlib.crc32(username.encode()) % len(self.user_locks)]
+
+    @contextmanager
+    def exclusive(self):
+        """
+            Hold every lock of the store, for replacing its whole state
+        """
+        with ExitStack() as stack:
+            for lock in self.user_locks:
+                stack.enter_context(lock)
+            stack.enter_context(self.lock)
+            yield
+
+    def get_user(self, username):
+        """
+            Account of username ({"password", "subscribed", "deleted"?, ...}), or None if there is none.
+            The caller must not change it.
+        """
+        with self.user_lock(username):
+            return self.users.get(username)
+
+    def usernames(self):
+        """
+            Names of the accounts that were not deleted, in registration order
+        """
+        with self.lock:
+            return [u for u, data in self.users.items() if not data.get("deleted", False)]
+
+    def unread_count(self, username):
+        with self.user_lock(username):
+            return self.users[username]["messages"].unread_count
+
+    def unread_by_contact(self, username):
+        with self.user_lock(username):
+            return self.users[username]["messages"].unread_by_contact()
+
+    def apply(self, record):
+        """
+            Apply one journal record to the in-memory state, for a mutator (holding the locks the
+            operation needs) or for journal replay. Returns the result of the operation: True, or the
+            sequence number of an added message, the number of messages marked read, or whether a
+            message was deleted.
+        """
+        op = record["op"]
+        if op == "register":
+            self.users[record["username"]] = {"password": record["password"], "messages": self.mailbox_class(),
+                                              "subscribed": False}
+        elif op == "add_message":
+            return self.users[record["recipient"]]["messages"].append(record["msg"])
+        elif op == "mark_read":
+            return self.users[record["username"]]["messages"].mark_read(record["contact"], record["batch_num"])
+        elif op == "delete_message":
+            return self.users[record["recipient"]]["messages"].delete(record["sender"], record["message_id"])
+        elif op == "delete_account":
+            self.users[record["username"]]["deleted"] = True
+        elif op == "set_subscription":
+            self.users[record["username"]]["subscribed"] = record["subscribed"]
+            if record["subscribed"]:
+                self.subscribers_set.setdefault(record["username"], {"queue": []})
+            else:
+                self.subscribers_set.pop(record["username"], None)
+        elif op == "push_subscriber_message":
+            self.subscribers_set[record["username"]]["queue"].append(record["msg"])
+        elif op == "pop_subscriber_message":
+            self.subscribers_set[record["username"]]["queue"].pop(0)
+        elif op == "active_user":
+            if record["active"]:
+                self.active_users_set.add(record["username"])
+            else:
+                self.active_users_set.discard(record["username"])
+        elif op == "log_index":
+            self.log_index = record["index"]
+        elif op == "membership":
+            self.members = {int(pid): address for pid, address in record["members"].items()}
+            joint = record["joint"]
+            self.joint_members = {int(pid): address for pid, address in joint.items()} if joint else None
         else:
-            # Initialize empty structures.
-            self.users = {}
-            self.subscribers_set = {}
-            self.active_users_set = set()
-    
+            raise ValueError(f"Unknown journal operation: {op}")
+        return True
+
+    def commit(self, record):
+        """
+            Apply a mutation and, if it changed anything, journal it. Returns the result of apply().
+        """
+        result = self.apply(record)
+        if result:
+            self.queue_record(record)
+        return result
+
+    def queue_record(self, record):
+        """
+            Queue a record for the next flush, or stage it until the enclosing atomically() ends.
+            Called under the lock(s) the mutation was applied under, so the records of a mailbox are
+            journaled in the order their mutations were applied.
+        """
+        staged = getattr(self.local, "staged", None)
+        if staged is not None:
+            staged.append(record)
+            return
+        with self.journal_lock:
+            self.journal_seq += 1
+            record["seq"] = self.journal_seq
+            self.pending.append(record)
+
+    @contextmanager
+    def atomically(self):
+        """
+            Queue the records of the mutations this thread makes inside the block together at its end,
+            so a flush never writes some of them without the others. Used under a mailbox's lock for a
+            mutation and its log entry: the journal then never holds one without the other.
+        """
+        if getattr(self.local, "staged", None) is not None:
+            yield # already inside one
+            return
+        self.local.staged = []
+        try:
+            yield
+        finally:
+            staged, self.local.staged = self.local.staged, None
+            with self.journal_lock:
+                for record in staged:
+                    self.journal_seq += 1
+                    record["seq"] = self.journal_seq
+                    self.pending.append(record)
+
+    # Mutators change the in-memory state under the lock(s) and then call save() after releasing them,
+    # so other threads can keep mutating while this one waits for its batch to reach disk.
+    # Each mutation of a mailbox (a new message, or a message read or deleted) takes its next sequence
+    # number; replicas applying the same operations in the same order assign the same numbers. The leader
+    # applies a mutation and logs its entry under the mailbox's lock (ChatService.ordered), so the log
+    # holds a mailbox's operations in the order they were applied, and followers replay them in it.
     def add_message(self, recipient, msg):
-        with self.lock:
+        """
+            Store a message, giving it the recipient's next sequence number unless it already carries
+            one (a replicated message keeps the number the leader gave it).
+        """
+        with self.user_lock(recipient):
             if recipient not in self.users:
                 return False
-            self.users[recipient]["messages"].append(msg)
-            self.save()
-            return True
+            if self.users[recipient]["messages"].find(msg["id"]) is not None:
+                return True # replayed after a snapshot that already had it
+            record = {"op": "add_message", "recipient": recipient, "msg": dict(self.stored(msg))}
+            msg["seq"] = record["msg"]["seq"] = self.apply(record)
+            self.queue_record(record)
+        self.save()
+        return True
+
+    def stored(self, msg):
+        """
+            msg as its mailbox keeps it; called once the message is known not to be a duplicate
+        """
+        return msg
+
+    def has_message(self, recipient, message_id):
+        with self.user_lock(recipient):
+            return recipient in self.users and self.users[recipient]["messages"].find(message_id) is not None
+
+    def page_messages(self, username, after_seq=0, limit=0, contact=""):
+        """
+            Select the messages of a user with seq > after_seq, at most limit of them (0 = all, otherwise
+            capped at MAX_PAGE_SIZE), optionally only those from contact. Returns (page, next_seq, has_more).
+        """
+        with self.user_lock(username):
+            page, has_more = self.users[username]["messages"].page(after_seq, min(limit, MAX_PAGE_SIZE), contact)
+        next_seq = page[-1]["seq"] if page else after_seq
+        return page, next_seq, has_more
     
+    def sync_since(self, username, since_seq=0, limit=0):
+        """
+            Select the changes to a user's mailbox with seq > since_seq, at most limit messages (0 = all,
+            otherwise capped at MAX_PAGE_SIZE). Each message is returned once, in its latest state.
+            Returns (changes, next_seq, has_more).
+        """
+        with self.user_lock(username):
+            return self.users[username]["messages"].changes(since_seq, min(limit, MAX_PAGE_SIZE))
+
     def register(self, username, password):
-        with self.lock:
-            # Initialize subscription flag to False
-            self.users[username] = {
-                "password": password,
-                "messages": [],
-                "subscribed": False
-            }
-            self.save()
+        with self.user_lock(username), self.lock:
+            self.commit({"op": "register", "username": username, "password": password})
+        self.save()
 
     def mark_read(self, username, contact, batch_num):
-        with self.lock:
-            users = self.users.get(username)
-            count = 0
-            for msg in users["messages"]:
-                if msg["from"] == contact and msg["status"] == "unread" and (batch_num == 0 or count < batch_num):
-                    msg["status"] = "read"
-                    count += 1
-                    if batch_num != 0 and count == batch_num:
-                        break
-            self.save()
-            return count
+        with self.user_lock(username):
+            if username not in self.users:
+                return 0
+            count = self.commit({"op": "mark_read", "username": username, "contact": contact, "batch_num": batch_num})
+        self.save()
+        return count
         
     def delete_message(self, sender, recipient, message_id):
-        print('filename', self.filename)
-        with self.lock:
-            recipient_info = self.users.get(recipient)
-            print('RECIPIENT INFO', recipient_info)
-            for msg in recipient_info["messages"]:
-                if msg["id"] == message_id and msg["from"] == sender and msg["status"] == "unread":
-                    msg["status"] = "deleted"
-            self.save()
+        """
+            Delete an unread message. Returns True if it was found, from sender, and still unread.
+        """
+        with self.user_lock(recipient):
+            if recipient not in self.users:
+                return False
+            if not self.commit({"op": "delete_message", "sender": sender, "recipient": recipient, "message_id": message_id}):
+                return False
+        self.save()
+        return True
+
+    def delete_account(self, username):
+        """
+            Mark an account as deleted. Returns False if there is no such account or it already was.
+        """
+        with self.user_lock(username), self.lock:
+            user = self.users.get(username)
+            if not user or user.get("deleted", False):
+                return False
+            self.commit({"op": "delete_account", "username": username})
+        self.save()
+        return True
         
     def set_subscription(self, username, subscribed):
-        with self.lock:
-            if username in self.users:
-                self.users[username]["subscribed"] = subscribed
-                if subscribed:
-                    # Create an entry for subscriber info (with an empty queue) if it does not exist.
-                    if username not in self.subscribers_set:
-                        self.subscribers_set[username] = {"queue": []}
-                else:
-                    if username in self.subscribers_set:
-                        del self.subscribers_set[username]
-                self.save()
+        with self.user_lock(username), self.lock:
+            if username not in self.users:
+                return
+            self.commit({"op": "set_subscription", "username": username, "subscribed": subscribed})
+        self.save()
 
     def append_subscriber_message(self, username, msg):
         with self.lock:
-            if username in self.subscribers_set:
-                self.subscribers_set[username]["queue"].append(msg)
-                self.save()
+            if username not in self.subscribers_set:
+                return
+            self.commit({"op": "push_subscriber_message", "username": username, "msg": dict(msg)})
+        self.save()
             
     def pop_subscriber_message(self, username):
         with self.lock:
-            if username in self.subscribers_set:
-                self.subscribers_set[username]["queue"].pop(0)
-                self.save()
+            if username not in self.subscribers_set:
+                return
+            self.commit({"op": "pop_subscriber_message", "username": username})
+        self.save()
 
     def add_active_user(self, username):
         with self.lock:
-            self.active_users_set.add(username)
-            self.save()
+            self.commit({"op": "active_user", "username": username, "active": True})
+        self.save()
 
     def remove_active_user(self, username):
         with self.lock:
-            self.active_users_set.discard(username)
-            self.save()
+            self.commit({"op": "active_user", "username": username, "active": False})
+        self.save()
 
     def get_active_users(self):
         with self.lock:
@@ -118,101 +811,775 @@ class PersistentStore:
         with self.lock:
             return self.subscribers_set.copy()
     
-    def save(self):
+    def append_log(self, entry):
+        """
+            Add an applied replication entry to the log. An entry without an index (on the leader) is
+            given the next one. Returns the entry's index.
+        """
+        with self.lock:
+            if not entry.index:
+                entry.index = self.log_index + 1
+            self.commit({"op": "log_index", "index": entry.index})
+            self.log.append(entry)
+            self.applied.notify_all()
+            return entry.index
+
+    def wait_for_index(self, index, timeout):
+        """
+            Wait until every log entry up to index has been applied. Returns False on timeout.
+        """
+        with self.lock:
+            return self.applied.wait_for(lambda: self.log_index >= index, timeout)
+
+    def staleness(self):
+        """
+            Seconds since this follower last had everything the leader had sent it, or None if it is
+            behind the leader's latest batch or never heard from a leader.
+        """
+        with self.lock:
+            if self.leader_contact is None or self.log_index < self.leader_index:
+                return None
+            return time.monotonic() - self.leader_contact
+
+    def log_since(self, index, until=None):
+        """
+            Logged entries with index > index and < until (default: all of them), or None if some of
+            those are no longer kept.
+        """
         with self.lock:
-            data = {
-                "users": self.users,
-                "subscribers": self.subscribers_set,
-                "active_users": list(self.active_users_set)
+            until = self.log_index + 1 if until is None else min(until, self.log_index + 1)
+            if index + 1 >= until:
+                return []
+            if not self.log or self.log[0].index > index + 1:
+                return None
+            start = index + 1 - self.log[0].index
+            return list(itertools.islice(self.log, start, until - self.log[0].index))
+
+    def snapshot(self, compact=False):
+        """
+            Returns (log index, JSON of the store). The log index and the mailboxes are copied together
+            under every lock of the store; since a mailbox mutation and its log entry are made under
+            the mailbox's lock, the snapshot holds exactly the entries up to the index, and replaying
+            the later ones on top of it (which mark_read is not safe against) applies each once.
+            Only the mailboxes' columns are copied under the locks (Mailbox.frozen); the message dicts
+            and the JSON are built outside them.
+            With compact, the snapshot is to replace the journal: it records the number of the latest
+            journal record, whose mutations it holds like all before it, and the unwritten ones are dropped.
+        """
+        with self.exclusive():
+            log_index = self.log_index
+            state = {
+                "subscribers": json.loads(json.dumps(self.subscribers_set)),
+                "active_users": list(self.active_users_set),
+                "log_index": log_index,
+                "members": dict(self.members),
+                "joint_members": dict(self.joint_members) if self.joint_members else None
             }
-            with open(self.filename, 'w') as f:
-                json.dump(data, f, indent=2)
+            if compact:
+                with self.journal_lock:
+                    state["journal_seq"] = self.journal_seq
+                    self.pending = []
+            users = {username: dict(user, messages=user["messages"].frozen()) for username, user in self.users.items()}
+        for user in users.values():
+            user["seq"] = user["messages"].seq
+            user["messages"] = user["messages"].to_dicts()
+        return log_index, json.dumps({"users": users, **state}, indent=2)
+
+    def install_snapshot(self, index, data):
+        """
+            Replace the whole state with a leader's snapshot taken at log index index.
+        """
+        with self.exclusive():
+            self.load(json.loads(data))
+            self.log_index = index
+            self.log.clear()
+            self.applied.notify_all()
+            self.compact_due = True
+        if self.on_membership_change:
+            self.on_membership_change()
+        self.save()
+
+    def set_membership(self, members, joint=None):
+        """
+            Install a cluster configuration.
+
+            Params:
+                members: {server id: "host:port"} of the current configuration
+                joint: {server id: "host:port"} of the configuration being moved to, or None
+        """
+        with self.lock:
+            self.commit({"op": "membership", "members": dict(members), "joint": dict(joint) if joint else None})
+        if self.on_membership_change:
+            self.on_membership_change()
+        self.save()
+
+    def configurations(self):
+        """
+            Member dicts a write must reach a majority of: the current one, plus the new one during a
+            change. Empty if no membership was ever installed.
+        """
+        with self.lock:
+            if not self.members:
+                return []
+            return [dict(self.members)] + ([dict(self.joint_members)] if self.joint_members else [])
+
+    def save(self):
+        """
+            Wait until the current in-memory state is durable. Must not be called while holding a lock of the store,
+            since a compaction needs those locks to copy the state.
+        """
+        if getattr(self.local, "deferred", False):
+            return # made durable when the enclosing batch() ends
+        self.writer.commit()
+
+    @contextmanager
+    def batch(self):
+        """
+            Make the mutations this thread applies inside the block durable with one wait at its end
+            instead of one per mutation.
+        """
+        self.local.deferred = True
+        try:
+            yield
+        finally:
+            self.local.deferred = False
+        self.save()
+
+    def write(self):
+        """
+            Durably append the records journaled since the last flush, taking no lock but journal_lock.
+            Compacts the journal first once it holds compact_every records, or after a snapshot was installed.
+        """
+        if self.compact_due or self.journal_records >= self.compact_every:
+            self.compact()
+        with self.journal_lock:
+            records, self.pending = self.pending, []
+        if records:
+            self.append_journal(records)
+
+    def append_journal(self, records):
+        """
+            Durably append records to the journal, one JSON line each
+        """
+        self.journal.write("".join(json.dumps(record) + "\n" for record in records))
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.journal_records += len(records)
+
+    def compact(self):
+        """
+            Fold the journal into a new snapshot: write the snapshot, then empty the journal. Replay skips
+            the records a snapshot holds, so a crash between the two loses and repeats nothing.
+        """
+        self.compact_due = False
+        _, data = PersistentStore.snapshot(self, compact=True) # as stored (SegmentStore keeps body offsets)
+        self.write_file(data)
+        self.journal.truncate(0)
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.journal_records = 0
+
+    def write_file(self, data):
+        """
+            Durably replace the store's file with data
+        """
+        tmp = self.filename + ".tmp"
+        with open(tmp, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
     
     # def get_all_messages(self):
     #     with self.lock:
     #         return self.users
 
+# -------------------------
+# SQLiteStore: the same store in an SQLite database (WAL mode) unique per server.
+# -------------------------
+class SQLiteStore(PersistentStore):
+    """
+        PersistentStore keeping accounts and mailboxes in an SQLite database instead of memory.
+
+        Nothing is loaded at startup but the metadata (subscribers, active users, log index and
+        membership), and mailboxes are never held in memory, so they may be larger than RAM. Unread
+        counts, pages, syncs and deletes are answered from indexes on (recipient, sender, status),
+        (recipient, changed) and the message ID. Mutations run on one connection inside an open
+        transaction that the group commit writer commits, so a batch of writes still costs one fsync.
+        Snapshots for followers use the JSON format of PersistentStore.
+    """
+    extension = ".db"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            subscribed INTEGER NOT NULL DEFAULT 0,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            seq INTEGER NOT NULL DEFAULT 0 -- sequence number of the latest change to the mailbox
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            recipient TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            id TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            message TEXT NOT NULL,
+            status TEXT NOT NULL,
+            changed INTEGER NOT NULL, -- sequence number of the latest change: seq, or when it was read or deleted
+            PRIMARY KEY (recipient, seq)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS messages_unread ON messages (recipient, sender, status);
+        CREATE INDEX IF NOT EXISTS messages_id ON messages (id);
+        CREATE INDEX IF NOT EXISTS messages_changed ON messages (recipient, changed);
+        CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+    """
+    METADATA = ["subscribers", "active_users", "log_index", "members", "joint_members"]
+
+    def open(self):
+        """
+            Open (or create) the database and load the metadata
+        """
+        # One connection shared by every thread. db_lock serializes its use and is taken after any other
+        # lock of the store; a mutation holds it throughout, so a commit never contains half of one.
+        self.db_lock = threading.RLock()
+        self.db = sqlite3.connect(self.filename, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL") # a commit returns only once it is on disk
+        self.db.executescript(self.SCHEMA)
+        self.load_metadata({row["key"]: json.loads(row["value"]) for row in self.db.execute("SELECT * FROM metadata")})
+
+    def load(self, data):
+        """
+            Replace the whole database with data, in the JSON format snapshot() produces
+        """
+        with self.db_lock:
+            self.db.execute("DELETE FROM messages")
+            self.db.execute("DELETE FROM users")
+            for username, user in data.get("users", {}).items():
+                messages = user.get("messages", [])
+                seqs = [msg.get("seq") or i + 1 for i, msg in enumerate(messages)]
+                self.db.execute("INSERT INTO users (username, password, subscribed, deleted, seq) VALUES (?, ?, ?, ?, ?)",
+                                (username, user["password"], user.get("subscribed", False), user.get("deleted", False),
+                                 max([user.get("seq", 0)] + [msg.get("updated", 0) for msg in messages] + seqs)))
+                self.db.executemany("INSERT INTO messages (recipient, seq, id, sender, message, status, changed) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    [(username, seq, msg["id"], msg["from"], msg["message"], msg["status"], msg.get("updated", seq))
+                                     for seq, msg in zip(seqs, messages)])
+        self.load_metadata(data)
+
+    @staticmethod
+    def message_from_row(row):
+        """
+            Message dict, as PersistentStore keeps it, of a row of the messages table
+        """
+        msg = {"id": row["id"], "from": row["sender"], "message": row["message"], "status": row["status"], "seq": row["seq"]}
+        if row["changed"] != row["seq"]:
+            msg["updated"] = row["changed"]
+        return msg
+
+    def next_seq(self, username):
+        """
+            Take the next sequence number of a user's mailbox. Caller must hold db_lock.
+        """
+        self.db.execute("UPDATE users SET seq = seq + 1 WHERE username = ?", (username,))
+        return self.db.execute("SELECT seq FROM users WHERE username = ?", (username,)).fetchone()["seq"]
+
+    def get_user(self, username):
+        with self.db_lock:
+            row = self.db.execute("SELECT password, subscribed, deleted FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None
+        return {"password": row["password"], "subscribed": bool(row["subscribed"]), "deleted": bool(row["deleted"])}
+
+    def usernames(self):
+        with self.db_lock:
+            rows = self.db.execute("SELECT username FROM users WHERE deleted = 0 ORDER BY rowid").fetchall()
+        return [row["username"] for row in rows]
+
+    def unread_count(self, username):
+        with self.db_lock:
+            return self.db.execute("SELECT COUNT(*) FROM messages WHERE recipient = ? AND status = 'unread'",
+                                   (username,)).fetchone()[0]
+
+    def unread_by_contact(self, username):
+        with self.db_lock:
+            rows = self.db.execute("SELECT sender, COUNT(*) AS unread FROM messages WHERE recipient = ? AND status = 'unread' "
+                                   "GROUP BY sender", (username,)).fetchall()
+        return {row["sender"]: row["unread"] for row in rows}
+
+    def add_message(self, recipient, msg):
+        with self.db_lock:
+            user = self.db.execute("SELECT seq FROM users WHERE username = ?", (recipient,)).fetchone()
+            if user is None:
+                return False
+            if self.db.execute("SELECT 1 FROM messages WHERE id = ? AND recipient = ?", (msg["id"], recipient)).fetchone():
+                return True # replayed after a snapshot that already had it
+            if not msg.get("seq"):
+                msg["seq"] = user["seq"] + 1
+            self.db.execute("UPDATE users SET seq = max(seq, ?) WHERE username = ?", (msg["seq"], recipient))
+            self.db.execute("INSERT INTO messages (recipient, seq, id, sender, message, status, changed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (recipient, msg["seq"], msg["id"], msg["from"], msg["message"], msg["status"], msg["seq"]))
+        self.save()
+        return True
+
+    def has_message(self, recipient, message_id):
+        with self.db_lock:
+            return self.db.execute("SELECT 1 FROM messages WHERE id = ? AND recipient = ?",
+                                   (message_id, recipient)).fetchone() is not None
+
+    def page_messages(self, username, after_seq=0, limit=0, contact=""):
+        query, params = "SELECT * FROM messages WHERE recipient = ? AND seq > ?", [username, after_seq]
+        if contact:
+            query, params = query + " AND sender = ?", params + [contact]
+        query += " ORDER BY seq"
+        if limit:
+            query, params = query + " LIMIT ?", params + [min(limit, MAX_PAGE_SIZE) + 1]
+        with self.db_lock:
+            rows = self.db.execute(query, params).fetchall()
+        has_more = bool(limit) and len(rows) > min(limit, MAX_PAGE_SIZE)
+        page = [self.message_from_row(row) for row in (rows[:-1] if has_more else rows)]
+        return page, page[-1]["seq"] if page else after_seq, has_more
+
+    def sync_since(self, username, since_seq=0, limit=0):
+        query, params = "SELECT * FROM messages WHERE recipient = ? AND changed > ? ORDER BY changed", [username, since_seq]
+        if limit:
+            query, params = query + " LIMIT ?", params + [min(limit, MAX_PAGE_SIZE) + 1]
+        with self.db_lock:
+            rows = self.db.execute(query, params).fetchall()
+        has_more = bool(limit) and len(rows) > min(limit, MAX_PAGE_SIZE)
+        delta = [dict(self.message_from_row(row), updated=row["changed"]) for row in (rows[:-1] if has_more else rows)]
+        return delta, delta[-1]["updated"] if delta else since_seq, has_more
+
+    def register(self, username, password):
+        with self.db_lock:
+            self.db.execute("DELETE FROM messages WHERE recipient = ?", (username,))
+            self.db.execute("INSERT OR REPLACE INTO users (username, password) VALUES (?, ?)", (username, password))
+        self.save()
+
+    def mark_read(self, username, contact, batch_num):
+        with self.db_lock:
+            query, params = "SELECT seq FROM messages WHERE recipient = ? AND sender = ? AND status = 'unread' ORDER BY seq", [username, contact]
+            if batch_num:
+                query, params = query + " LIMIT ?", params + [batch_num]
+            rows = self.db.execute(query, params).fetchall()
+            for row in rows:
+                self.db.execute("UPDATE messages SET status = 'read', changed = ? WHERE recipient = ? AND seq = ?",
+                                (self.next_seq(username), username, row["seq"]))
+        self.save()
+        return len(rows)
+
+    def delete_message(self, sender, recipient, message_id):
+        with self.db_lock:
+            row = self.db.execute("SELECT seq FROM messages WHERE id = ? AND recipient = ? AND sender = ? AND status = 'unread'",
+                                  (message_id, recipient, sender)).fetchone()
+            if row is None:
+                return False
+            self.db.execute("UPDATE messages SET status = 'deleted', changed = ? WHERE recipient = ? AND seq = ?",
+                            (self.next_seq(recipient), recipient, row["seq"]))
+        self.save()
+        return True
+
+    def delete_account(self, username):
+        with self.db_lock:
+            deleted = self.db.execute("UPDATE users SET deleted = 1 WHERE username = ? AND deleted = 0", (username,)).rowcount > 0
+        if deleted:
+            self.save()
+        return deleted
+
+    def set_subscription(self, username, subscribed):
+        with self.lock:
+            with self.db_lock:
+                if self.db.execute("UPDATE users SET subscribed = ? WHERE username = ?", (subscribed, username)).rowcount == 0:
+                    return
+            if subscribed:
+                self.subscribers_set.setdefault(username, {"queue": []})
+            else:
+                self.subscribers_set.pop(username, None)
+        self.save()
+
+    def metadata(self):
+        """
+            Everything but the users and their mailboxes, as snapshot() writes it. Caller must hold self.lock.
+        """
+        return {
+            "subscribers": json.loads(json.dumps(self.subscribers_set)),
+            "active_users": list(self.active_users_set),
+            "log_index": self.log_index,
+            "members": dict(self.members),
+            "joint_members": dict(self.joint_members) if self.joint_members else None
+        }
+
+    def snapshot(self):
+        """
+            Returns (log index, JSON of the store), read from one point of the database, with the log
+            index, under every lock of the store (see PersistentStore.snapshot)
+        """
+        users = {}
+        with self.exclusive(), self.db_lock:
+            state = self.metadata()
+            for row in self.db.execute("SELECT * FROM users ORDER BY rowid"):
+                users[row["username"]] = {"password": row["password"], "messages": [], "subscribed": bool(row["subscribed"]),
+                                          "seq": row["seq"]}
+                if row["deleted"]:
+                    users[row["username"]]["deleted"] = True
+            for row in self.db.execute("SELECT * FROM messages ORDER BY recipient, seq"):
+                users[row["recipient"]]["messages"].append(self.message_from_row(row))
+        return state["log_index"], json.dumps({"users": users, **state}, indent=2)
+
+    def write(self):
+        """
+            Durably commit the open transaction, together with the metadata it goes with. Both are
+            taken under every lock of the store, so the committed log index matches the committed rows.
+        """
+        with self.exclusive(), self.db_lock:
+            state = self.metadata()
+            self.db.executemany("INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+                                [(key, json.dumps(state[key])) for key in self.METADATA])
+            self.db.commit()
+
+    def queue_record(self, record):
+        """
+            Nothing to journal: the database's own log holds the mutations, and write() the metadata
+        """
+
+# -------------------------
+# SegmentStore: the JSON store with message bodies in memory-mapped segment files.
+# -------------------------
+class SegmentStore(PersistentStore):
+    """
+        PersistentStore keeping message bodies out of memory, in an append-only SegmentLog
+        (<filename>.segments). Each stored message holds the offset of its body ("body") instead of
+        the text, so the snapshot, the journal and the memory of the process no longer grow with the
+        length of the messages, and history nobody reads stays on disk. A flush syncs the segments
+        before writing the journal records or snapshot that refer to them. Pages, syncs and snapshots
+        for followers read the bodies back, so callers and followers see the usual message dicts.
+    """
+    extension = ".index.json"
+    mailbox_class = OffsetMailbox
+
+    def __init__(self, filename, segment_size=SEGMENT_SIZE, **kwargs):
+        self.segment_size = segment_size
+        super().__init__(filename, **kwargs)
+
+    def open(self):
+        self.segments = SegmentLog(self.filename + ".segments", self.segment_size)
+        super().open()
+
+    def load(self, data):
+        """
+            Replace the state with data. Messages carrying their text (a leader's snapshot, or a file
+            written by PersistentStore) have it moved to the segments.
+        """
+        for user in data.get("users", {}).values():
+            for msg in user["messages"]:
+                if "message" in msg:
+                    msg["body"] = self.segments.append(msg.pop("message").encode())
+        super().load(data)
+
+    def with_body(self, msg):
+        """
+            msg, a copy of a stored message, with its "body" offset replaced by the text
+        """
+        msg["message"] = self.segments.read(msg.pop("body")).decode()
+        return msg
+
+    def stored(self, msg):
+        """
+            Copy of msg with its text appended to the segments and replaced by the offset ("body")
+        """
+        record = {key: value for key, value in msg.items() if key != "message"}
+        record["body"] = self.segments.append(msg["message"].encode())
+        return record
+
+    def page_messages(self, username, after_seq=0, limit=0, contact=""):
+        page, next_seq, has_more = super().page_messages(username, after_seq, limit, contact)
+        return [self.with_body(msg) for msg in page], next_seq, has_more
+
+    def sync_since(self, username, since_seq=0, limit=0):
+        changes, next_seq, has_more = super().sync_since(username, since_seq, limit)
+        return [self.with_body(msg) for msg in changes], next_seq, has_more
+
+    def snapshot(self):
+        """
+            Returns (log index, JSON of the store) with every body read back, in PersistentStore's format
+        """
+        index, data = super().snapshot()
+        state = json.loads(data)
+        for user in state["users"].values():
+            user["messages"] = [self.with_body(msg) for msg in user["messages"]]
+        return index, json.dumps(state, indent=2)
+
+    def append_journal(self, records):
+        """
+            Durably append records, syncing the segments first. The records were taken before the sync,
+            so every body they refer to is on disk before they are.
+        """
+        self.segments.sync()
+        super().append_journal(records)
+
+    def write_file(self, data):
+        """
+            Durably write a snapshot taken before this call, syncing the segments first
+        """
+        self.segments.sync()
+        super().write_file(data)
+
+# Storage backends selectable with --storage
+STORAGE_BACKENDS = {"json": PersistentStore, "sqlite": SQLiteStore, "segments": SegmentStore}
+
 # -------------------------
 # Health Service: for simple pinging.
 # -------------------------
 class HealthService(chat_pb2_grpc.HealthServicer):
+    def __init__(self, store=None, election=None):
+        self.store = store
+        self.election = election
+
     def Ping(self, request, context):
-        return chat_pb2.PingResponse(alive=True)
+        return chat_pb2.PingResponse(alive=True, log_index=self.store.log_index if self.store else 0,
+                                     leader_id=(self.election.leader_id or 0) if self.election else 0)
 
 # -------------------------
-# LeaderElection: fixed ordering by server_id.
+# LeaderElection: failure detector; a live leader is kept, a successor is the lowest server_id among the
+# most up-to-date servers.
 # -------------------------
 class LeaderElection:
-    def __init__(self, server_id, peers):
+    """
+        Tracks which peers are up with a phi accrual failure detector, and keeps the resulting leader
+        cached so that reading it costs nothing.
+
+        One thread per peer pings it every heartbeat_interval seconds. The gaps between successful
+        pings give the peer's usual heartbeat rate; phi grows with the silence since the last one
+        relative to that rate, and the peer is declared down once phi exceeds phi_threshold (after
+        about 2.3 * phi_threshold heartbeat intervals for a steady peer). The leader is rechecked
+        after every heartbeat, so a failure is reflected at once. Log indexes only matter once the
+        leader is down: followers apply entries while the leader's cached index lags behind, so
+        comparing them while it is up could make a follower promote itself next to the leader.
+    """
+    def __init__(self, server_id, peers, connections=None, store=None, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 phi_threshold=PHI_THRESHOLD, address=None):
         self.server_id = server_id  # e.g., 1,2,3
         self.peers = peers          # List of (peer_id, address)
+        self.address = address      # this server's own host:port
+        self.connections = connections or PeerConnections()
+        self.store = store          # source of this server's own log index
+        self.heartbeat_interval = heartbeat_interval
+        self.phi_threshold = phi_threshold
         self.state = "backup"
         self.leader_id = None
+        self.leader_address = None  # host:port of leader_id, as returned by GetLeaderInfo
         self.lock = threading.Lock()
+        self.leader_changed = threading.Condition(self.lock)
         # Initially, we assume peers are not up.
         self.peer_status = {pid: False for pid, _ in peers}
-        # Track if a peer has ever been seen alive.
-        self.peer_ever_alive = {pid: False for pid, _ in peers}
+        self.peer_log_index = {}  # {address: log index reported by its last ping}
+        self.peer_leader = {}     # {address: leader id reported by its last ping}
+        self.last_heartbeat = {}  # {peer_id: time of its last successful ping}
+        self.heartbeat_gaps = {pid: deque(maxlen=LATENCY_WINDOW) for pid, _ in peers}
+        self.detection_times = deque(maxlen=LATENCY_WINDOW)  # seconds of silence before each peer was declared down
+        self.on_peer_up = None    # called with the id of a peer seen alive again after being down
+        self.running = True
+        self.started = False
+
+    def address_of(self, pid):
+        """
+            host:port of server pid
+        """
+        if pid == self.server_id and self.address:
+            return self.address
+        addresses = dict(self.peers)
+        if self.store:
+            addresses = {**(self.store.joint_members or {}), **self.store.members, **addresses}
+        return addresses[pid] if pid in addresses else all_host_port_pairs[pid - 1]
+
     def ping_peer(self, address):
+        start = time.monotonic()
         try:
-            channel = grpc.insecure_channel(address)
-            stub = chat_pb2_grpc.HealthStub(channel)
-            resp = stub.Ping(chat_pb2.PingRequest(), timeout=1)
+            resp = self.connections.health_stub(address).Ping(chat_pb2.PingRequest(), timeout=1)
+            self.connections.record(address, time.monotonic() - start)
+            self.peer_log_index[address] = resp.log_index
+            self.peer_leader[address] = resp.leader_id
             return resp.alive
         except Exception:
+            self.connections.record(address, 0, ok=False)
             return False
 
-    def elect(self):
-        with self.lock:
-            for pid, addr in self.peers:
-                is_alive = self.ping_peer(addr)
-                # If never seen alive, update status based on ping.
-                if not self.peer_ever_alive[pid]:
-                    if is_alive:
-                        self.peer_status[pid] = True
-                        self.peer_ever_alive[pid] = True
-                    else:
-                        self.peer_status[pid] = False
-                else:
-                    # If seen before, once it fails, mark as permanently dead.
-                    if not is_alive:
-                        if self.peer_status[pid] is True:
-                            print(f"Server {pid} has died and cannot come back.")
-                        self.peer_status[pid] = False
+    def phi(self, pid, now):
+        """
+            Suspicion that a peer is down: -log10 of the probability that a peer with its heartbeat rate
+            stays silent this long, with exponentially distributed gaps. Caller must hold self.lock.
+        """
+        if pid not in self.last_heartbeat:
+            return float("inf")
+        gaps = self.heartbeat_gaps[pid]
+        mean = max(sum(gaps) / len(gaps) if gaps else 0, self.heartbeat_interval)
+        return (now - self.last_heartbeat[pid]) / mean * math.log10(math.e)
 
-            print(self.peer_status)
+    def heartbeat(self, pid, address, authoritative=False):
+        """
+            Ping a peer once and judge whether it is up. A failed ping only brings a live peer down once
+            phi exceeds the threshold, unless authoritative is set.
 
-            # Derive lower_alive from peer_status
-            lower_alive = any(self.peer_status[pid] for pid in self.peer_status if pid < self.server_id)
+            Returns:
+                True if the peer is considered up
+        """
+        ok = self.ping_peer(address)
+        now = time.monotonic()
+        with self.lock:
+            if ok:
+                if pid in self.last_heartbeat and pid in self.heartbeat_gaps:
+                    self.heartbeat_gaps[pid].append(now - self.last_heartbeat[pid])
+                self.last_heartbeat[pid] = now
+                return True
+            was_alive = self.peer_status.get(pid, False)
+            if was_alive and (authoritative or self.phi(pid, now) > self.phi_threshold):
+                silence = now - self.last_heartbeat.get(pid, now)
+                self.detection_times.append(silence)
+                print(f"Server {pid} is down: no heartbeat for {silence:.2f} s.")
+                return False
+            return was_alive
 
-            # lower_alive = any(self.ping_peer(addr) for pid, addr in self.peers if pid < self.server_id)
-            if not lower_alive:
-                self.state = "leader"
-                self.leader_id = self.server_id
+    def update(self, statuses):
+        """
+            Apply new peer statuses and pick the leader. The current leader is kept while it is up.
+            Otherwise the leader that the live peers agree on is followed, so a server that comes back
+            joins the running leader instead of taking over. Failing both, the successor is the lowest
+            server_id among the live servers whose log index is the highest, so no committed entry is
+            lost. A server removed from the cluster never leads. Returns the leader's host:port.
+        """
+        revived = []
+        members = set()
+        for config in (self.store.configurations() if self.store else []):
+            members.update(config)
+        with self.lock:
+            for pid, alive in statuses.items():
+                if pid not in self.peer_status:
+                    continue # removed from the cluster meanwhile
+                if alive and not self.peer_status[pid]:
+                    print(f"Server {pid} is back up.")
+                    revived.append(pid)
+                self.peer_status[pid] = alive
+            log_indexes = {pid: self.peer_log_index.get(addr, 0) for pid, addr in self.peers if self.peer_status[pid]}
+            if not members or self.server_id in members or not log_indexes:
+                log_indexes[self.server_id] = self.store.log_index if self.store else 0
+            followed = {self.peer_leader.get(addr) for pid, addr in self.peers if self.peer_status[pid]} & log_indexes.keys()
+            if self.leader_id in log_indexes:
+                leader_id = self.leader_id
+            elif len(followed) == 1:
+                leader_id = followed.pop()
             else:
-                self.state = "backup"
-                candidate = self.server_id
-                for pid, addr in self.peers:
-                    if self.peer_status.get(pid, False):    
-                        candidate = min(candidate, pid)
-                self.leader_id = candidate
-            print(f"Server {self.server_id}: state={self.state}, leader={self.leader_id}")
-            return all_host_port_pairs[self.leader_id - 1] # return host:port of leader
+                latest = max(log_indexes.values())
+                leader_id = min(pid for pid, index in log_indexes.items() if index == latest)
+            changed = leader_id != self.leader_id
+            if changed:
+                print(f"Server {self.server_id}: state={'leader' if leader_id == self.server_id else 'backup'}, "
+                      f"leader={leader_id}, peers up={self.peer_status}")
+            self.leader_id = leader_id
+            self.state = "leader" if leader_id == self.server_id else "backup"
+            self.leader_address = leader = self.address_of(leader_id) # host:port of leader
+            if changed:
+                self.leader_changed.notify_all()
+        if self.on_peer_up is not None:
+            for pid in revived:
+                self.on_peer_up(pid)
+        return leader
+
+    def elect(self):
+        """
+            Ping every peer now, taking a failed ping as the peer being down, and pick the leader.
+            The heartbeat threads keep the result current afterwards.
+        """
+        return self.update({pid: self.heartbeat(pid, addr, authoritative=True) for pid, addr in self.peers})
+
+    def leader_info(self):
+        """
+            host:port of the current leader, without contacting any peer.
+        """
+        return self.leader_address or self.update({})
+
+    def wait_for_leader_change(self, known, timeout):
+        """
+            Wait until the leader's host:port differs from known, or timeout seconds. Returns the current one.
+        """
+        if self.leader_address is None:
+            self.update({})
+        with self.lock:
+            self.leader_changed.wait_for(lambda: self.leader_address != known, timeout)
+            return self.leader_address
+
+    def refresh_log_indexes(self):
+        """
+            Ping every other live peer for its log index, so that the leader's successor is picked on
+            current indexes rather than ones cached up to a heartbeat ago.
+        """
+        for pid, addr in self.peers:
+            if pid != self.leader_id and self.peer_status.get(pid):
+                self.ping_peer(addr)
+
+    def watch(self, pid, address):
+        while self.running and pid in self.peer_status:
+            start = time.monotonic()
+            alive = self.heartbeat(pid, address)
+            if not alive and pid == self.leader_id:
+                self.refresh_log_indexes()
+            self.update({pid: alive})
+            time.sleep(max(0, self.heartbeat_interval - (time.monotonic() - start)))
 
     def start(self):
-        while True:
-            self.elect()
-            time.sleep(HEARTBEAT_INTERVAL)
+        self.elect()
+        self.started = True
+        for pid, addr in self.peers:
+            threading.Thread(target=self.watch, args=(pid, addr), daemon=True).start()
+
+    def set_peers(self, peers):
+        """
+            Follow a membership change: stop watching removed peers, and ping new ones right away so
+            they count as up before their heartbeat thread's first round.
+
+            Params:
+                peers: List of (peer_id, address)
+        """
+        with self.lock:
+            added = [(pid, addr) for pid, addr in peers if pid not in self.peer_status]
+            ids = {pid for pid, _ in peers}
+            for pid in [pid for pid in self.peer_status if pid not in ids]:
+                del self.peer_status[pid]  # its watch thread exits
+                self.last_heartbeat.pop(pid, None)
+                self.heartbeat_gaps.pop(pid, None)
+            for pid, _ in added:
+                self.peer_status[pid] = False
+                self.heartbeat_gaps[pid] = deque(maxlen=LATENCY_WINDOW)
+            self.peers = list(peers)
+        self.update({pid: self.heartbeat(pid, addr, authoritative=True) for pid, addr in added})
+        if self.started:
+            for pid, addr in added:
+                threading.Thread(target=self.watch, args=(pid, addr), daemon=True).start()
+
+    def stop(self):
+        self.running = False
 
 # -------------------------
 # ChatService: Only leader handles SendMessage. If not leader, returns error.
 # -------------------------
 class ChatService(chat_pb2_grpc.ChatServiceServicer):
-    def __init__(self, store, election, peers):
+    def __init__(self, store, election, peers, replication_batch=64, connections=None, shard=None, id_format="bytes"):
         self.store = store
+        self.raw_ids = id_format == "bytes"  # UUID message IDs sent as 16 bytes; "text" for older clients
+        self.shard = shard  # (index, number of shards) of this replica group, or None if not sharded
         self.election = election
         self.peers = peers  # List of (peer_id, address)
-        # Track peer health: once marked down, remains down forever.
+        # Replication: one stream per follower, entries numbered by the store's replication log
+        self.ack_cond = threading.Condition()
+        self.connections = connections or election.connections
+        self.replication_batch = replication_batch
+        self.replicators = {pid: PeerReplicator(addr, store, replication_batch, self.ack_cond, self.connections)
+                            for pid, addr in peers}
+        self.replication_lock = threading.Lock()
+        self.membership_lock = threading.Lock()  # one membership change at a time
+        election.on_peer_up = self.peer_up
+        store.on_membership_change = self.membership_changed
+        if store.members:
+            self.membership_changed() # the replicated membership overrides the configured peers
         self.active_users_lock = threading.Lock()
         self.active_users = set()
         # In-memory subscribers for active gRPC streams.
@@ -230,31 +1597,244 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
         
         Returns:
             int: Number of successful acknowledgments from peers.
+
+        The request is appended to the leader's log and queued as one entry on every live follower's
+        replication stream at once, and the call returns as soon as a quorum (leader included) has it,
+        or after REPLICATION_TIMEOUT. Slower followers keep receiving the entry on their own streams
+        after the call returned; followers marked down get it from the log when they come back.
         """
-        ack_count = 1  # Leader's own write counts.
-        for pid, addr in self.peers:
-            if not self.election.peer_status.get(pid, True):
-                print(f"[REPL] Skipping peer {pid} at {addr} (marked down).")
-                continue
-            try:
-                print(f"[REPL] Attempting replication to peer {pid} at {addr} using method {method}.")
-                channel = grpc.insecure_channel(addr)
-                stub = chat_pb2_grpc.ReplicationServiceStub(channel)
-                response = getattr(stub, method)(rep_req, timeout=2)
-                if response.success:
-                    print(f"[REPL] Peer {pid} at {addr} acknowledged replication.")
-                    ack_count += 1
-                else:
-                    print(f"[REPL] Peer {pid} at {addr} did NOT acknowledge replication.")
-            except Exception as e:
-                print(f"[REPL] Replication error to peer {pid} at {addr}: {e}")
-        return ack_count
+        return len(self.replicate(method, rep_req))
+
+    def replicate(self, method, rep_req):
+        """
+            Append rep_req to the log, queue it on the live followers' streams and wait for a quorum.
+            Returns the ids of the servers that acknowledged it, the leader's own included.
+        """
+        pending = self.log_entry(method, rep_req)
+        self.store.save() # persist the new log index while the followers apply the entry
+        return self.wait_for_quorum(*pending)
+
+    @contextmanager
+    def ordered(self, username):
+        """
+            Hold username's mailbox lock while a mutation is applied and its entry logged (log_entry),
+            so the entries of a mailbox are logged in the order their mutations were applied, and neither a
+            snapshot nor the journal ever holds a mutation without its entry. The store is saved once the
+            lock is released.
+        """
+        with self.store.batch():
+            with self.store.user_lock(username), self.store.atomically():
+                yield
+
+    def log_entry(self, method, rep_req):
+        """
+            Append rep_req to the log and queue it on the live followers' streams, without waiting.
+            Returns (targets, index, method), the arguments of wait_for_quorum.
+        """
+        entry = chat_pb2.ReplicationEntry(**{REPLICATION_OPS[method]: rep_req})
+        targets = []
+        with self.replication_lock:
+            # Numbered and queued under one lock so every follower receives entries in index order
+            self.store.append_log(entry)
+            for pid, addr in self.peers:
+                if not self.election.peer_status.get(pid, True):
+                    print(f"[REPL] Skipping peer {pid} at {addr} (marked down).")
+                    self.replicators[pid].drop()
+                    continue
+                self.replicators[pid].enqueue(entry)
+                targets.append((pid, self.replicators[pid]))
+        return targets, entry.index, method
+
+    def configurations(self):
+        """
+            Server ids of each configuration a write needs a majority of: the replicated membership,
+            or this server and its configured peers if none was installed.
+        """
+        configs = [set(config) for config in self.store.configurations()]
+        return configs or [{self.election.server_id} | {pid for pid, _ in self.peers}]
+
+    @property
+    def quorum(self):
+        """
+            Acknowledgments (leader included) that make a majority of the newest configuration
+        """
+        return majority(self.configurations()[-1])
+
+    def membership_changed(self):
+        """
+            Follow a membership change: replicate to and monitor the servers of every current configuration.
+        """
+        members = {}
+        for config in self.store.configurations():
+            members.update(config)
+        peers = sorted((pid, addr) for pid, addr in members.items() if pid != self.election.server_id)
+        with self.replication_lock:
+            for pid, addr in peers:
+                if pid not in self.replicators:
+                    self.replicators[pid] = PeerReplicator(addr, self.store, self.replication_batch, self.ack_cond,
+                                                           self.connections)
+            self.peers = peers
+        self.election.set_peers(peers)
+
+    def commit_index(self):
+        """
+            Highest log index that a majority of every configuration (leader included) has applied.
+        """
+        acked = {pid: r.acked_index for pid, r in self.replicators.items()}
+        acked[self.election.server_id] = self.store.log_index
+        return min(sorted((acked.get(pid, 0) for pid in config), reverse=True)[majority(config) - 1]
+                   for config in self.configurations())
+
+    def ReadIndex(self, request, context):
+        """
+            Commit index a follower must reach before serving a READ_INDEX read
+        """
+        if self.election.state != "leader":
+            return chat_pb2.ReadIndexResponse(status="error: Not leader")
+        return chat_pb2.ReadIndexResponse(status="success", index=self.commit_index())
+
+    def read_error(self, read):
+        """
+            Check whether this server may serve a read with the given ReadOptions.
+
+            Params:
+                read: ReadOptions of the request
+
+            Returns:
+                None if it may, otherwise the error status to answer with
+        """
+        if read.consistency == chat_pb2.READ_LOCAL or self.election.state == "leader":
+            return None
+        if read.consistency == chat_pb2.READ_BOUNDED:
+            staleness = self.store.staleness()
+            if staleness is None or staleness * 1000 > read.max_staleness_ms:
+                return "error: Replica too stale"
+            return None
+        leader = dict(self.peers).get(self.election.leader_id)
+        if leader is None:
+            return "error: Leader unknown"
+        try:
+            response = self.connections.chat_stub(leader).ReadIndex(chat_pb2.ReadIndexRequest(), timeout=REPLICATION_TIMEOUT)
+        except grpc.RpcError as e:
+            print(f"[READ] Cannot get the read index from leader {self.election.leader_id}: {e}")
+            return "error: Leader unreachable"
+        if response.status != "success":
+            return response.status
+        if not self.store.wait_for_index(response.index, REPLICATION_TIMEOUT):
+            return "error: Replica behind"
+        return None
+
+    def peer_up(self, pid):
+        """
+            Called by the election when a follower is reachable again: stream it what it missed.
+        """
+        if self.election.state == "leader" and pid in self.replicators:
+            print(f"[REPL] Peer {pid} is back; catching it up.")
+            self.replicators[pid].resync()
+
+    def wait_for_quorum(self, targets, index, method):
+        """
+            Wait until enough of targets acknowledged index to form a majority of every configuration
+            with the leader, or until all of them did, or until REPLICATION_TIMEOUT. Returns the ids of
+            the servers that acknowledged it, the leader's own included.
+        """
+        deadline = time.monotonic() + REPLICATION_TIMEOUT
+        configs = self.configurations()
+        with self.ack_cond:
+            while True:
+                acked = {self.election.server_id} | {pid for pid, replicator in targets if replicator.acked_index >= index}
+                if has_quorum(acked, configs) or len(acked) == 1 + len(targets):
+                    return acked
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"[REPL] Entry {index} ({method}) acknowledged by {len(acked)} of {self.quorum} needed.")
+                    return acked
+                self.ack_cond.wait(remaining)
     
+    def ChangeMembership(self, request, context):
+        """
+            Add and/or remove a server with joint consensus, without restarting the others.
+
+            A new server first catches up as a learner, which receives the log but does not vote.
+            The leader then replicates the joint configuration, in which every write needs a majority
+            of both the old and the new members, and finally the new configuration on its own. Either
+            majority alone can never decide differently from the other during the change.
+        """
+        leader = self.redirect()
+        if leader:
+            return chat_pb2.ChangeMembershipResponse(status=NOT_LEADER, leader=leader)
+        with self.membership_lock:
+            old = self.store.configurations()[:1]
+            old = old[0] if old else {pid: self.election.address_of(pid) for pid in self.configurations()[0]}
+            new = dict(old)
+            if request.remove_id:
+                new.pop(request.remove_id, None)
+            if request.HasField("add"):
+                new[request.add.id] = request.add.address
+            if new == old or not new:
+                return chat_pb2.ChangeMembershipResponse(status="error: Nothing to change", members=member_list(old))
+
+            # Learners: stream the log (or a snapshot) to new servers before they count towards a quorum
+            for pid, address in new.items():
+                if pid in old or pid == self.election.server_id:
+                    continue
+                with self.replication_lock:
+                    if pid not in self.replicators:
+                        self.replicators[pid] = PeerReplicator(address, self.store, self.replication_batch,
+                                                               self.ack_cond, self.connections)
+                    learner = self.replicators[pid]
+                learner.resync()
+                if not learner.wait_for(self.store.log_index, LEARNER_TIMEOUT):
+                    return chat_pb2.ChangeMembershipResponse(status=f"error: Server {pid} did not catch up",
+                                                             members=member_list(old))
+
+            self.store.set_membership(old, new)
+            acked = self.replicate("ReplicateMembership", chat_pb2.ReplicateMembershipRequest(
+                members=member_list(old), joint=member_list(new)))
+            if not has_quorum(acked, [old, new]):
+                self.store.set_membership(old)
+                self.replicate("ReplicateMembership", chat_pb2.ReplicateMembershipRequest(members=member_list(old)))
+                return chat_pb2.ChangeMembershipResponse(status="error: No majority of both configurations",
+                                                         members=member_list(old))
+
+            # Sent to the joint members before applying it here, so that removed servers learn of it too
+            acked = self.replicate("ReplicateMembership", chat_pb2.ReplicateMembershipRequest(members=member_list(new)))
+            self.store.set_membership(new)
+            print(f"[MEMBERSHIP] Members are now {sorted(new)} (acknowledged by {sorted(acked)}).")
+            return chat_pb2.ChangeMembershipResponse(status="success", members=member_list(new))
+
     def GetLeaderInfo(self, request, context):
         """
             Allows client to access the host and port information of the leader
         """
-        return chat_pb2.GetLeaderInfoResponse(info=self.election.elect())
+        return chat_pb2.GetLeaderInfoResponse(info=self.election.leader_info())
+
+    def WatchLeadership(self, request, context):
+        """
+            Stream the leader's host and port now and whenever the leader changes, so clients fail over
+            as soon as this server notices, until the client cancels
+        """
+        known = None
+        while context.is_active():
+            leader = self.election.wait_for_leader_change(known, HEARTBEAT_INTERVAL)
+            if leader != known:
+                known = leader
+                yield chat_pb2.LeaderInfo(leader=leader, leader_id=self.election.leader_id)
+
+    def wrong_shard(self, username):
+        """
+            True if username belongs to another replica group than this one
+        """
+        return self.shard is not None and shard_for(username, self.shard[1]) != self.shard[0]
+
+    def redirect(self):
+        """
+            host:port of the leader if this server is not the leader, else None. Writes sent to a follower
+            are answered with NOT_LEADER and this address instead of being applied.
+        """
+        if self.election.state == "leader":
+            return None
+        return self.election.leader_info()
     
     def LoadActiveUsersAndSubscribersFromPersistent(self, request, context):
         """
@@ -277,19 +1857,25 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
         return chat_pb2.VersionResponse(success=True, message="success: Version matched")
     
     def Register(self, request, context):
+        leader = self.redirect()
+        if leader:
+            return chat_pb2.RegisterResponse(message=NOT_LEADER, leader=leader)
         username, password = request.username, request.password
+        if self.wrong_shard(username):
+            return chat_pb2.RegisterResponse(message=WRONG_SHARD)
         print(f"[REGISTER] Attempting to register user: {username}")
-        if username in self.store.users:
-            print(f"[REGISTER] Username {username} already exists.")
-            return chat_pb2.RegisterResponse(message="error: This username is unavailable")
-        
-        self.store.register(username, password)
-        print(f"[REGISTER] User {username} registered in local store.")
+        with self.ordered(username):
+            if self.store.get_user(username) is not None:
+                print(f"[REGISTER] Username {username} already exists.")
+                return chat_pb2.RegisterResponse(message="error: This username is unavailable")
 
-        rep_req = chat_pb2.ReplicateRegisterRequest(username=username, password=password)
-        ack_count = self.replicate_to_peers("ReplicateRegister", rep_req)
+            self.store.register(username, password)
+            print(f"[REGISTER] User {username} registered in local store.")
+            rep_req = chat_pb2.ReplicateRegisterRequest(username=username, password=password)
+            pending = self.log_entry("ReplicateRegister", rep_req)
+        ack_count = len(self.wait_for_quorum(*pending))
         
-        if ack_count >= 2:
+        if ack_count >= self.quorum:
             print(f"[REGISTER] Registration successful for {username}.")
         else:
             print(f"[REGISTER] Registration replication failed for {username}.")
@@ -301,8 +1887,11 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
         """
             Handle login request
         """
+        leader = self.redirect()
+        if leader:
+            return chat_pb2.LoginResponse(message=NOT_LEADER, leader=leader)
         username, password = request.username, request.password
-        user = self.store.users.get(username)
+        user = self.store.get_user(username)
         if user and user["password"] == password and not user.get("deleted", False):
             with self.active_users_lock:
                 if username in self.active_users:
@@ -313,43 +1902,65 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
             self.store.add_active_user(username)
             rep_req = chat_pb2.ReplicateActiveUserRequest(username=username)
             ack_count = self.replicate_to_peers("ReplicateActiveUserLogin", rep_req)
-            if ack_count >= 2:
+            if ack_count >= self.quorum:
                 print(f"[LOGIN] Login successful for {username}.")
             else:
                 print(f"[LOGIN] Login replication failed for {username}.")
 
-            unread = sum(1 for m in user["messages"] if m["status"] == "unread")
-            return chat_pb2.LoginResponse(message=f"success: Logged in. Unread messages: {unread}", unread_messages=unread)
+            unread = self.store.unread_count(username)
+            return chat_pb2.LoginResponse(message=f"success: Logged in. Unread messages: {unread}", unread_messages=unread,
+                                          unread_by_contact=self.store.unread_by_contact(username))
         return chat_pb2.LoginResponse(message="error: Invalid username or password", unread_messages=0)
 
     def ListUsers(self, request, context):
         """
             Returns a list of active users
         """
-        users = self.store.users
-        user_list = [u for u, data in users.items() if not data.get("deleted", False)]
-        return chat_pb2.ListUsersResponse(users=user_list)
+        error = self.read_error(request.read)
+        if error:
+            return chat_pb2.ListUsersResponse(status=error)
+        return chat_pb2.ListUsersResponse(users=self.store.usernames(), status="success")
     
     def SendMessage(self, request, context):
         # If not leader, cannot send
-        if self.election.state != "leader":
-            print("[SEND] Not leader, cannot send message.")
-            return chat_pb2.SendMessageResponse(status="error: Not leader", message_id="")
+        leader = self.redirect()
+        if leader:
+            print(f"[SEND] Not leader, redirecting to {leader}.")
+            return chat_pb2.SendMessageResponse(status=NOT_LEADER, message_id="", leader=leader)
         
         sender, recipient, message_text = request.sender, request.recipient, request.message
-        recipient_info = self.store.users.get(recipient)
+        if self.wrong_shard(recipient):
+            return chat_pb2.SendMessageResponse(status=WRONG_SHARD, message_id="")
+        recipient_info = self.store.get_user(recipient)
         if not recipient_info or recipient_info.get("deleted", False):
             return chat_pb2.SendMessageResponse(status="error: Recipient not found or deleted", message_id="")
+        message_id = message_id_from(request.message_id, request.bytes_message_id)
+        if message_id and self.store.has_message(recipient, message_id):
+            print(f"[SEND] Message {message_id} already delivered.")
+            return chat_pb2.SendMessageResponse(status="success", **id_fields(message_id, raw=self.raw_ids))
 
-        # Create message with a unique ID.
+        # Create message with a unique ID, or the one the client chose.
         msg = {
-            "id": str(uuid.uuid4()),
+            "id": message_id or str(uuid.uuid4()),
             "from": sender,
             "message": message_text,
             "status": "unread"
         }
 
-        sent_message = self.store.add_message(recipient, msg)
+        with self.ordered(recipient):
+            sent_message = self.store.add_message(recipient, msg)
+            if sent_message and "seq" not in msg: # a concurrent attempt of the same send stored it first
+                return chat_pb2.SendMessageResponse(status="success", **id_fields(msg["id"], raw=self.raw_ids))
+            if sent_message:
+                rep_req = chat_pb2.ReplicateMessageRequest(
+                    message_id=msg["id"],
+                    sender=sender,
+                    recipient=recipient,
+                    message=message_text,
+                    status="unread",
+                    seq=msg["seq"]
+                )
+                pending = self.log_entry("ReplicateMessage", rep_req)
         with self.subscribers_lock:
             if recipient in self.subscribers:
                 sub = self.subscribers[recipient]
@@ -359,22 +1970,15 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
                 # self.store.append_subscriber_message(recipient, msg) # For debugging
 
         if sent_message:
-            rep_req = chat_pb2.ReplicateMessageRequest(
-                message_id=msg["id"],
-                sender=sender,
-                recipient=recipient,
-                message=message_text,
-                status="unread"
-            )
-            ack_count = self.replicate_to_peers("ReplicateMessage", rep_req)
+            ack_count = len(self.wait_for_quorum(*pending))
 
             # With 3 servers, a majority is 2 (leader + one backup).
-            if ack_count >= 2:
+            if ack_count >= self.quorum:
                 print(f"[SEND] Message replication successful, ack count: {ack_count}")
             else:
                 print(f"[SEND] Message replication failed, ack count: {ack_count}")
             
-            return chat_pb2.SendMessageResponse(status="success", message_id=msg["id"])
+            return chat_pb2.SendMessageResponse(status="success", **id_fields(msg["id"], raw=self.raw_ids))
         
         print(f"[SEND] Failed to add message to recipient {recipient}'s store.")
         return chat_pb2.SendMessageResponse(status="error: Failed to store message", message_id="")
@@ -384,7 +1988,7 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
             Handles subscription request
         """
         username = request.username
-        if not self.store.users.get(username):
+        if not self.store.get_user(username):
             context.set_details("User not found")
             context.set_code(grpc.StatusCode.NOT_FOUND)
             return
@@ -394,7 +1998,7 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
         ack_count = self.replicate_to_peers("ReplicateSubscribe", req_rep)
 
         # With 3 servers, a majority is 2 (leader + one backup).
-        if ack_count >= 2:
+        if ack_count >= self.quorum:
             print(f"Subscribers replication successful, ack count: {ack_count}")
         else:
             print(f"Subscribers replication failed, ack count: {ack_count}")
@@ -411,32 +2015,37 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
                 msg = sub["queue"].pop(0)
                 # self.store.pop_subscriber_message(username) # For debugging
             yield chat_pb2.Message(
-                id=msg["id"],
+                **id_fields(msg["id"], "id", self.raw_ids),
                 sender=msg["from"],
                 message=msg["message"],
-                status=msg["status"]
+                status=msg["status"],
+                seq=msg.get("seq", 0)
             )
 
     def MarkRead(self, request, context):
         """
             Handle a mark read request
         """
+        leader = self.redirect()
+        if leader:
+            return chat_pb2.MarkReadResponse(message=NOT_LEADER, leader=leader)
         username, contact, batch_num = request.username, request.contact, request.batch_num
-        users = self.store.users.get(username)
+        users = self.store.get_user(username)
         if not users:
             context.set_details("User not found")
             context.set_code(grpc.StatusCode.NOT_FOUND)
             return chat_pb2.MarkReadResponse(message="")
-        count = self.store.mark_read(username, contact, batch_num)
-
-        rep_req = chat_pb2.ReplicateMarkReadRequest(
-            username=username,
-            contact=contact,
-            batch_num=batch_num
-        )
-        ack_count = self.replicate_to_peers("ReplicateMarkRead", rep_req)
+        with self.ordered(username):
+            count = self.store.mark_read(username, contact, batch_num)
+            rep_req = chat_pb2.ReplicateMarkReadRequest(
+                username=username,
+                contact=contact,
+                batch_num=batch_num
+            )
+            pending = self.log_entry("ReplicateMarkRead", rep_req)
+        ack_count = len(self.wait_for_quorum(*pending))
 
-        if ack_count >= 2:
+        if ack_count >= self.quorum:
             print("[MARKREAD] replication successful")
         else:
             print("[MAKRREAD] replication failed")
@@ -446,36 +2055,38 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
         """
             Handle delete unread message request
         """
-        sender, recipient, message_id = request.sender, request.recipient, request.message_id
-        recipient_info = self.store.users.get(recipient)
+        leader = self.redirect()
+        if leader:
+            return chat_pb2.DeleteUnreadMessageResponse(status="error", message="Not leader", leader=leader)
+        sender, recipient = request.sender, request.recipient
+        message_id = message_id_from(request.message_id, request.bytes_message_id)
+        recipient_info = self.store.get_user(recipient)
         if not recipient_info:
             return chat_pb2.DeleteUnreadMessageResponse(status="error", message="Recipient not found")
-        found = False
-        for msg in recipient_info["messages"]:
-            if msg["id"] == message_id and msg["from"] == sender and msg["status"] == "unread":
-                msg["status"] = "deleted"
-                found = True
-                with self.subscribers_lock:
-                    if recipient in self.subscribers:
-                        sub = self.subscribers[recipient]
-                        with sub["cond"]:
-                            deletion_msg = {
-                                "id": msg["id"],
-                                "from": msg["from"],
-                                "message": "",
-                                "status": "deleted"
-                            }
-                            sub["queue"].append(deletion_msg)
-                            sub["cond"].notify()
-                        # self.store.append_subscriber_message(recipient, deletion_msg) # For debugging
-                break
-        self.store.save()
+        with self.ordered(recipient):
+            found = self.store.delete_message(sender, recipient, message_id)
+            if found:
+                rep_req = chat_pb2.ReplicateDeleteMessageRequest(sender=sender, recipient=recipient, message_id=message_id)
+                pending = self.log_entry("ReplicateDeleteMessage", rep_req)
+        if found:
+            with self.subscribers_lock:
+                if recipient in self.subscribers:
+                    sub = self.subscribers[recipient]
+                    with sub["cond"]:
+                        deletion_msg = {
+                            "id": message_id,
+                            "from": sender,
+                            "message": "",
+                            "status": "deleted"
+                        }
+                        sub["queue"].append(deletion_msg)
+                        sub["cond"].notify()
+                    # self.store.append_subscriber_message(recipient, deletion_msg) # For debugging
         if not found:
             return chat_pb2.DeleteUnreadMessageResponse(status="error", message="Message not found or already read")
         
-        rep_req = chat_pb2.ReplicateDeleteMessageRequest(sender=sender, recipient=recipient, message_id=message_id)
-        ack_count = self.replicate_to_peers("ReplicateDeleteMessage", rep_req)
-        if ack_count >= 2:
+        ack_count = len(self.wait_for_quorum(*pending))
+        if ack_count >= self.quorum:
             print("[DELETEUNREADMESSAGE] replication successful")
         else:
             print("[DELETEUNREADMESSAGE] replication failed")
@@ -483,37 +2094,68 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
     
     def ReceiveMessages(self, request, context): # NO REPLICATION BECAUSE NO EDIT TO PERSISTENT
         """
-            Handle receive message request
+            Handle receive message request: messages after the after_seq cursor, at most limit of them
+            (0 = all), optionally only from contact
         """
+        error = self.read_error(request.read)
+        if error:
+            return chat_pb2.ReceiveMessagesResponse(status=error)
         username = request.username
-        users = self.store.users.get(username)
+        users = self.store.get_user(username)
         if not users:
             return chat_pb2.ReceiveMessagesResponse(status="error: User not found", messages=[])
+        page, next_seq, has_more = self.store.page_messages(username, request.after_seq, request.limit, request.contact)
         msgs = []
-        for m in users["messages"]:
+        for m in page:
             msgs.append(chat_pb2.Message(
-                id=m["id"],
+                **id_fields(m["id"], "id", self.raw_ids),
                 sender=m["from"],
                 message=m["message"],
-                status=m["status"]
+                status=m["status"],
+                seq=m["seq"]
             ))
-        return chat_pb2.ReceiveMessagesResponse(status="success", messages=msgs)
+        return chat_pb2.ReceiveMessagesResponse(status="success", messages=msgs, next_seq=next_seq, has_more=has_more)
+
+    def SyncSince(self, request, context): # NO REPLICATION BECAUSE NO EDIT TO PERSISTENT
+        """
+            Handle sync request: new messages and status changes after the since_seq cursor
+        """
+        error = self.read_error(request.read)
+        if error:
+            return chat_pb2.SyncResponse(status=error)
+        username = request.username
+        if self.store.get_user(username) is None:
+            return chat_pb2.SyncResponse(status="error: User not found", changes=[])
+        changes, next_seq, has_more = self.store.sync_since(username, request.since_seq, request.limit)
+        msgs = [chat_pb2.Message(
+            **id_fields(m["id"], "id", self.raw_ids),
+            sender=m["from"],
+            message=m["message"],
+            status=m["status"],
+            seq=m.get("seq", 0),
+            updated=m["updated"]
+        ) for m in changes]
+        return chat_pb2.SyncResponse(status="success", changes=msgs, next_seq=next_seq, has_more=has_more)
 
     def DeleteAccount(self, request, context):
         """
             Handle delete account request
         """
+        leader = self.redirect()
+        if leader:
+            return chat_pb2.DeleteAccountResponse(message=NOT_LEADER, leader=leader)
         username = request.username
-        users = self.store.users.get(username)
-        if users and not users.get("deleted", False):
-            users["deleted"] = True
+        with self.ordered(username):
+            deleted = self.store.delete_account(username)
+            if deleted:
+                pending = self.log_entry("ReplicateDeleteAccount", chat_pb2.ReplicateDeleteAccountRequest(username=username))
+        if deleted:
             with self.subscribers_lock:
                 if username in self.subscribers:
                     del self.subscribers[username]
-            rep_req = chat_pb2.ReplicateDeleteAccountRequest(username=username)
-            ack_count = self.replicate_to_peers("ReplicateDeleteAccount", rep_req)
+            ack_count = len(self.wait_for_quorum(*pending))
 
-            if ack_count >= 2:
+            if ack_count >= self.quorum:
                 print("[DELETEACCOUNT] replication successful")
             else:
                 print("[DELETEACCOUNT] replication failed")
@@ -521,6 +2163,9 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
         return chat_pb2.DeleteAccountResponse(message="error: User not found or already deleted")
     
     def Logout(self, request, context): # STILL NEED TO REPLICATE BACAUSE ACTIVE_USERS
+        leader = self.redirect()
+        if leader:
+            return chat_pb2.LogoutResponse(message=NOT_LEADER, leader=leader)
         username = request.username
         with self.active_users_lock:
             if username in self.active_users:
@@ -530,7 +2175,7 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
                 rep_req = chat_pb2.ReplicateActiveUserRequest(username=username)
                 ack_count = self.replicate_to_peers("ReplicateActiveUserLogout", rep_req)
 
-                if ack_count >= 2:
+                if ack_count >= self.quorum:
                     print("[LOGOUT] replication successful")
                 else:
                     print("[LOGOUT] replication failed")
@@ -542,10 +2187,89 @@ class ChatService(chat_pb2_grpc.ChatServiceServicer):
 class ReplicationService(chat_pb2_grpc.ReplicationServiceServicer):
     def __init__(self, store):
         self.store = store
+        self.lock = threading.Lock()
+        self.snapshot_file = store.filename + ".snapshot"  # chunks of the snapshot being received
+        self.snapshot_progress = None  # {"id": snapshot id, "received": bytes written to snapshot_file}
+
+    def Replicate(self, request_iterator, context):
+        """
+            Apply the batches streamed by the leader, in order, appending each entry to the local log,
+            and answer each batch with the last log index applied. A batch is persisted with one write
+            before it is acknowledged. Entries resent after a reconnect are skipped; an entry past the
+            next index stops the batch, and the leader then resends what is missing.
+        """
+        methods = {field: method for method, field in REPLICATION_OPS.items()}
+        for batch in request_iterator:
+            with self.lock:
+                with self.store.batch():
+                    for entry in batch.entries:
+                        if entry.index <= self.store.log_index:
+                            continue
+                        if entry.index != self.store.log_index + 1:
+                            break
+                        op = entry.WhichOneof("op")
+                        request = getattr(entry, op)
+                        # Applied and logged under the mailbox's lock, as on the leader, so neither a
+                        # snapshot nor the journal holds the one without the other
+                        with self.store.user_lock(getattr(request, "recipient", "") or getattr(request, "username", "")), \
+                                self.store.atomically():
+                            getattr(self, methods[op])(request, context)
+                            self.store.append_log(entry)
+                with self.store.lock:
+                    self.store.leader_index = batch.leader_index
+                    self.store.leader_contact = time.monotonic()
+                applied = self.store.log_index
+            yield chat_pb2.ReplicationAck(index=applied)
+
+    def GetLogIndex(self, request, context):
+        progress = self.snapshot_progress or {"id": "", "received": 0}
+        return chat_pb2.LogIndexResponse(index=self.store.log_index, snapshot_id=progress["id"],
+                                         snapshot_offset=progress["received"])
+
+    def InstallSnapshot(self, request_iterator, context):
+        """
+            Receive the leader's snapshot in chunks, when this follower is too far behind for the log,
+            and replace the store's state with it once the last chunk arrived and the whole snapshot
+            matches its digest. Chunks are appended to a file, so a transfer that breaks off can be
+            resumed from the offset GetLogIndex reports.
+        """
+        for chunk in request_iterator:
+            if zlib.crc32(chunk.data) != chunk.crc32:
+                context.abort(grpc.StatusCode.DATA_LOSS, f"chunk at offset {chunk.offset} is corrupt")
+            progress = self.snapshot_progress
+            if chunk.offset == 0:
+                progress = self.snapshot_progress = {"id": chunk.snapshot_id, "received": 0}
+                open(self.snapshot_file, 'wb').close()
+            elif progress is None or progress["id"] != chunk.snapshot_id or progress["received"] != chunk.offset:
+                context.abort(grpc.StatusCode.FAILED_PRECONDITION, f"expected snapshot {progress} to continue, got "
+                              f"{chunk.snapshot_id} at offset {chunk.offset}")
+            with open(self.snapshot_file, 'ab') as f:
+                f.write(chunk.data)
+                f.flush()
+                os.fsync(f.fileno())
+            progress["received"] += len(chunk.data)
+            if chunk.done:
+                self.snapshot_progress = None
+                with open(self.snapshot_file, 'rb') as f:
+                    data = f.read()
+                os.remove(self.snapshot_file)
+                if hashlib.sha256(data).hexdigest() != chunk.sha256:
+                    context.abort(grpc.StatusCode.DATA_LOSS, f"snapshot {chunk.snapshot_id} does not match its digest")
+                with self.lock:
+                    print(f"[REPL] Installing snapshot {chunk.snapshot_id} at log index {chunk.index}.")
+                    self.store.install_snapshot(chunk.index, data.decode())
+        return chat_pb2.InstallSnapshotResponse(index=self.store.log_index)
+
+    def ReplicateMembership(self, request, context):
+        joint = {m.id: m.address for m in request.joint}
+        print(f"[REPL_MEMBERSHIP] Members {[m.id for m in request.members]}" + (f", joining {sorted(joint)}" if joint else ""))
+        self.store.set_membership({m.id: m.address for m in request.members}, joint or None)
+        return chat_pb2.ReplicateMembershipResponse(success=True)
 
     def ReplicateRegister(self, request, context):
         print(f"[REPL_REGISTER] Replicating registration for user: {request.username}")
-        self.store.register(request.username, request.password)
+        if self.store.get_user(request.username) is None: # replayed after a snapshot that already had it
+            self.store.register(request.username, request.password)
         print(f"[REPL_REGISTER] Registration replicated for user: {request.username}")
         return chat_pb2.ReplicateRegisterResponse(success=True)
 
@@ -554,11 +2278,9 @@ class ReplicationService(chat_pb2_grpc.ReplicationServiceServicer):
             "id": request.message_id,
             "from": request.sender,
             "message": request.message,
-            "status": request.status
+            "status": request.status,
+            "seq": request.seq
         }
-        # Create recipient entry if needed.
-        # if request.recipient not in self.store.users:
-        #     self.store.users[request.recipient] = {}
         self.store.add_message(request.recipient, msg)
         return chat_pb2.ReplicateMessageResponse(success=True)
     
@@ -571,17 +2293,13 @@ class ReplicationService(chat_pb2_grpc.ReplicationServiceServicer):
         return chat_pb2.ReplicateDeleteMessageResponse(success=True)
 
     def ReplicateDeleteAccount(self, request, context):
-        username = request.username
-        user = self.store.users.get(username)
-        if user and not user.get("deleted", False):
-            user["deleted"] = True
-            self.store.save()
+        if self.store.delete_account(request.username):
             return chat_pb2.ReplicateDeleteAccountResponse(success=True)
         return chat_pb2.ReplicateDeleteAccountResponse(success=False)
 
     def ReplicateSubscribe(self, request, context):
         # Set the subscription flag per persistent store
-        if request.username in self.store.users:
+        if self.store.get_user(request.username) is not None:
             self.store.set_subscription(request.username, request.subscribed)
             return chat_pb2.ReplicateSubscribeResponse(success=True)
         return chat_pb2.ReplicateSubscribeResponse(success=False)
@@ -600,22 +2318,31 @@ class ReplicationService(chat_pb2_grpc.ReplicationServiceServicer):
 
 def clear(ports):
     for server_id in ports.keys():
-        filename = f"users_{server_id}.json"
-        if os.path.exists(filename):
-            os.remove(filename)
-            print(f"Cleared {filename}")
+        for filename in (f"users_{server_id}.json", f"users_{server_id}.json.journal"):
+            if os.path.exists(filename):
+                os.remove(filename)
+                print(f"Cleared {filename}")
 # -------------------------
 # Main server function. Automatically spawn each server with its own JSON file.
 # -------------------------
-def serve(server_id, host, port, peers):
-    store = PersistentStore(f"users_{server_id}.json")
-    election = LeaderElection(server_id, peers)
+def serve(server_id, host, port, peers, commit_latency=0.005, commit_batch=64, replication_batch=64,
+          heartbeat_interval=HEARTBEAT_INTERVAL, phi_threshold=PHI_THRESHOLD, members=None, shard=None, storage="json",
+          id_format="bytes"):
+    store_class = STORAGE_BACKENDS[storage]
+    filename = (f"users_{server_id}" if shard is None else f"users_shard{shard[0]}_{server_id}") + store_class.extension
+    store = store_class(filename, commit_latency=commit_latency, commit_batch=commit_batch)
+    if members and not store.members:
+        store.set_membership(members) # first start; afterwards membership changes come through the log
+    connections = PeerConnections()
+    election = LeaderElection(server_id, peers, connections, store, heartbeat_interval, phi_threshold,
+                              address=f"{host}:{port}")
+    chat = ChatService(store, election, peers, replication_batch, connections, shard, id_format)
     threading.Thread(target=election.start, daemon=True).start()
 
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    chat_pb2_grpc.add_ChatServiceServicer_to_server(ChatService(store, election, peers), server)
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), options=SERVER_OPTIONS)
+    chat_pb2_grpc.add_ChatServiceServicer_to_server(chat, server)
     chat_pb2_grpc.add_ReplicationServiceServicer_to_server(ReplicationService(store), server)
-    chat_pb2_grpc.add_HealthServicer_to_server(HealthService(), server)
+    chat_pb2_grpc.add_HealthServicer_to_server(HealthService(store, election), server)
     # Bind on all interfaces so that external peers can connect:
     server.add_insecure_port(f"0.0.0.0:{port}")
     server.start()
@@ -645,9 +2372,31 @@ def launch_servers():
 # run each server separately
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Start a specific server instance.")
-    parser.add_argument("--id", type=int, required=True, help="Server ID (1, 2, or 3)")
-    parser.add_argument("--all_ips", type=str, required=True,
-                        help="Comma-separated list of external IP addresses for all servers (order: server1,server2,server3)")
+    parser.add_argument("--id", type=int, required=True, help="Server ID (1, 2, 3, ...)")
+    cluster = parser.add_mutually_exclusive_group(required=True)
+    cluster.add_argument("--all_ips", type=str,
+                         help="Comma-separated list of external IP addresses for all servers (order: server1,server2,...); "
+                              "server i listens on port 8000 + i")
+    cluster.add_argument("--config", type=str,
+                         help='JSON cluster config: {"servers": {"1": "host:port", ...}}')
+    cluster.add_argument("--shards", type=str,
+                         help='JSON shard map, one cluster per replica group: {"shards": [{"1": "host:port", ...}, ...]}')
+    parser.add_argument("--shard", type=int, default=0, help="Replica group of this server, with --shards")
+    parser.add_argument("--commit_latency_ms", type=float, default=5,
+                        help="Longest time a write waits to be batched with others before it is flushed to disk")
+    parser.add_argument("--commit_batch", type=int, default=64,
+                        help="Number of pending writes that triggers an immediate flush")
+    parser.add_argument("--replication_batch", type=int, default=64,
+                        help="Most replication entries sent to a follower in one batch")
+    parser.add_argument("--heartbeat_ms", type=float, default=HEARTBEAT_INTERVAL * 1000,
+                        help="Interval between heartbeat pings to each peer")
+    parser.add_argument("--phi_threshold", type=float, default=PHI_THRESHOLD,
+                        help="Failure detector suspicion level at which a silent peer is declared down")
+    parser.add_argument("--storage", choices=sorted(STORAGE_BACKENDS), default="json",
+                        help="json: in-memory store written to users_<id>.json; sqlite: SQLite database users_<id>.db; "
+                             "segments: users_<id>.index.json with message bodies in users_<id>.index.json.segments/")
+    parser.add_argument("--id_format", choices=["bytes", "text"], default="bytes",
+                        help="bytes: UUID message IDs sent to clients as 16 raw bytes; text: as strings, for older clients")
     
     args = parser.parse_args()
 
@@ -667,20 +2416,27 @@ if __name__ == "__main__":
     #         os.remove(lock_file)
     # atexit.register(cleanup)
 
-    # Parse the IPs:
-    all_ips = args.all_ips.split(",")
-    host = all_ips[args.id - 1]  # External IP of this server
+    # Cluster members {server id: "host:port"}: this server's replica group in the shard map, the config file,
+    # or server i at all_ips[i - 1]:server_port(i)
+    shard = None
+    if args.shards:
+        shards = load_shards(args.shards)
+        members, shard = shards[args.shard], (args.shard, len(shards))
+    elif args.config:
+        members = load_config(args.config)
+    else:
+        all_ips = args.all_ips.split(",")
+        members = {i + 1: f"{all_ips[i]}:{server_port(i + 1)}" for i in range(len(all_ips))}
     # Build peers list and for all servers: each peer is a tuple (peer_id, "peer_ip:peer_port")
-    peers = []
-    for i in range(len(all_ips)):
-        if (i+1) != args.id:
-            peers.append((i+1, f"{all_ips[i]}:{ports[i+1]}"))
-        all_host_port_pairs.append(f"{all_ips[i]}:{ports[i+1]}")
+    peers = [(pid, address) for pid, address in sorted(members.items()) if pid != args.id]
+    all_host_port_pairs.extend(address for _, address in sorted(members.items()))
     
-    if args.id not in ports:
-        print(f"Invalid server ID {args.id}. Choose from {list(ports.keys())}.")
+    if args.id not in members:
+        print(f"Invalid server ID {args.id}. Choose from {sorted(members)}.")
     else:
         server_id = args.id
-        port = ports[server_id]
-        serve(server_id, host, port, peers)
-
+        host, port = members[server_id].rsplit(":", 1)  # External IP of this server
+        serve(server_id, host, int(port), peers, commit_latency=args.commit_latency_ms / 1000, commit_batch=args.commit_batch,
+              replication_batch=args.replication_batch, heartbeat_interval=args.heartbeat_ms / 1000,
+              phi_threshold=args.phi_threshold, members=members, shard=shard, storage=args.storage,
+              id_format=args.id_format)
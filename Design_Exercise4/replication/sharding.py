@@ -0,0 +1,123 @@
+import grpc
+import chat_pb2
+import chat_pb2_grpc
+import threading, time, uuid, json, zlib
+
+WRONG_SHARD = "error: Wrong shard"  # answer to a request for a user that another replica group holds
+ROUTE_RETRIES = 3  # attempts of a routed call before giving up
+ROUTE_RETRY_DELAY = 0.5  # seconds between attempts, while a replica group elects a new leader
+# ChatService method -> request field naming the user whose mailbox it changes (default: "username")
+ROUTING_FIELDS = {
+    "SendMessage": "recipient",
+    "DeleteUnreadMessage": "recipient",
+}
+
+def shard_for(username, num_shards):
+    """
+        Shard (replica group index) holding a user's account and mailbox: CRC32 of the UTF-8 username
+        modulo the number of shards, so every client and server computes the same one.
+    """
+    return zlib.crc32(username.encode()) % num_shards
+
+def load_shards(filename):
+    """
+        Read a shard map: {"shards": [{"1": "host:port", ...}, ...]}, one cluster config per replica group.
+
+        Returns:
+            list: {server id: "host:port"} per shard
+    """
+    with open(filename, 'r') as f:
+        config = json.load(f)
+    return [{int(pid): address for pid, address in shard.items()} for shard in config["shards"]]
+
+def routing_key(method, request):
+    """
+        Username whose shard must serve request
+    """
+    return getattr(request, ROUTING_FIELDS.get(method, "username"))
+
+class ShardRouter:
+    """
+        Sends each call to the leader of the replica group that holds the user it concerns.
+
+        Each shard is an independent cluster with its own leader and log, so writes for users on
+        different shards are ordered, replicated and persisted in parallel. The router keeps one stub
+        per shard leader, follows NOT_LEADER redirects, and looks the leader up again when its server
+        is unreachable. A message is stored only on the recipient's shard; its id is chosen here, once,
+        so a send repeated after a failure is recognised by that shard and delivered exactly once.
+    """
+    def __init__(self, shards):
+        self.shards = [[address for _, address in sorted(shard.items())] for shard in shards]
+        self.leaders = {}  # {shard: (host:port, stub)}
+        self.lock = threading.Lock()
+
+    def shard_of(self, username):
+        return shard_for(username, len(self.shards))
+
+    def servers_for(self, username):
+        """
+            host:port of every server in the replica group holding username
+        """
+        return self.shards[self.shard_of(username)]
+
+    def leader_stub(self, shard):
+        """
+            Stub of the shard's leader, asking its servers in turn if it is not known yet
+        """
+        with self.lock:
+            if shard in self.leaders:
+                return self.leaders[shard][1]
+        for server in self.shards[shard]:
+            try:
+                stub = chat_pb2_grpc.ChatServiceStub(grpc.insecure_channel(server))
+                return self.set_leader(shard, stub.GetLeaderInfo(chat_pb2.GetLeaderInfoRequest(), timeout=1).info)
+            except grpc.RpcError:
+                continue
+        raise ConnectionError(f"No leader found for shard {shard}")
+
+    def set_leader(self, shard, leader):
+        with self.lock:
+            if shard not in self.leaders or self.leaders[shard][0] != leader:
+                self.leaders[shard] = (leader, chat_pb2_grpc.ChatServiceStub(grpc.insecure_channel(leader)))
+            return self.leaders[shard][1]
+
+    def call(self, method, request):
+        """
+            Make a ChatService call on the leader of the shard holding the user it concerns, repeating
+            it if the leader moved or could not be reached.
+
+            Params:
+                method: name of the ChatService method, e.g. "SendMessage"
+                request: request message for it
+
+            Returns:
+                the response
+        """
+        if method == "SendMessage" and not request.message_id and not request.bytes_message_id:
+            request.bytes_message_id = uuid.uuid4().bytes # kept across attempts, so the send is applied once
+        shard = self.shard_of(routing_key(method, request))
+        for attempt in range(ROUTE_RETRIES):
+            try:
+                response = getattr(self.leader_stub(shard), method)(request)
+            except (grpc.RpcError, ConnectionError) as e:
+                print(f"{method} on shard {shard} failed: {e}")
+                with self.lock:
+                    self.leaders.pop(shard, None)
+                if attempt == ROUTE_RETRIES - 1:
+                    raise
+                time.sleep(ROUTE_RETRY_DELAY)
+                continue
+            leader = getattr(response, "leader", "")
+            if not (isinstance(leader, str) and leader):
+                return response
+            self.set_leader(shard, leader)
+        return response
+
+    def list_users(self):
+        """
+            Usernames of every shard, merged
+        """
+        users = []
+        for shard in range(len(self.shards)):
+            users.extend(self.leader_stub(shard).ListUsers(chat_pb2.ListUsersRequest()).users)
+        return sorted(users)
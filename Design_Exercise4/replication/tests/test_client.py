@@ -106,10 +106,13 @@ class TestClient(unittest.TestCase):
         fake_response = MagicMock()
         fake_response.status = "success"
         fake_response.messages = [fake_msg1, fake_msg2]
+        fake_response.next_seq = 2
+        fake_response.has_more = False
         mock_stub.ReceiveMessages.return_value = fake_response
 
         client.current_user = "test_user"
         client.conversations = {}
+        client.received_seq = 0
         client.load_conversations()
 
         # Check that messages are added to conversations for both senders
@@ -117,7 +120,67 @@ class TestClient(unittest.TestCase):
         self.assertIn("user2", client.conversations)
         self.assertEqual(client.conversations["user1"][0]["message"], "Hello")
         self.assertEqual(client.conversations["user2"][0]["message"], "Hi")
-        mock_stub.ReceiveMessages.assert_called_once_with(chat_pb2.ReceiveMessagesRequest(username="test_user"))
+        mock_stub.ReceiveMessages.assert_called_once_with(
+            chat_pb2.ReceiveMessagesRequest(username="test_user", after_seq=0, limit=client.RECEIVE_PAGE_SIZE))
+
+    @patch('client.stub')
+    def test_read_call_replica_then_leader(self, mock_stub):
+        """
+        Test that with read_from_replicas a read goes to a replica with bounded staleness, and is
+        repeated on the leader when the replica is too far behind.
+        """
+        replica = MagicMock()
+        replica.ListUsers.return_value = MagicMock(status="success", users=["bob"])
+        request = chat_pb2.ListUsersRequest()
+        with patch('client.read_stubs', [replica]):
+            self.assertEqual(client.read_call("ListUsers", request).users, ["bob"])
+            sent = replica.ListUsers.call_args[0][0]
+            self.assertEqual((sent.read.consistency, sent.read.max_staleness_ms), (chat_pb2.READ_BOUNDED, client.READ_STALENESS_MS))
+            mock_stub.ListUsers.assert_not_called()
+
+            replica.ListUsers.return_value = MagicMock(status="error: Replica too stale")
+            mock_stub.ListUsers.return_value = MagicMock(status="success", users=["bob", "carol"])
+            self.assertEqual(client.read_call("ListUsers", request).users, ["bob", "carol"])
+            mock_stub.ListUsers.assert_called_once_with(request)
+
+    @patch('client.switch_leader')
+    @patch('client.stub')
+    def test_write_call_follows_redirect(self, mock_stub, mock_switch_leader):
+        """
+        Test that a write answered by a follower with the leader's address is repeated on that leader.
+        """
+        leader_stub = MagicMock()
+        leader_stub.SendMessage.return_value = chat_pb2.SendMessageResponse(status="success: Message sent", message_id="m")
+        mock_stub.SendMessage.return_value = chat_pb2.SendMessageResponse(status="error: Not leader", leader="10.0.0.2:8002")
+        mock_switch_leader.side_effect = lambda leader: setattr(client, "stub", leader_stub)
+        request = chat_pb2.SendMessageRequest(sender="a", recipient="b", message="hi")
+
+        response = client.write_call("SendMessage", request)
+
+        mock_switch_leader.assert_called_once_with("10.0.0.2:8002")
+        leader_stub.SendMessage.assert_called_once_with(request)
+        self.assertEqual(response.message_id, "m")
+
+    @patch('client.connect_to_leader')
+    @patch('client.stub')
+    def test_writes_routed_by_shard(self, mock_stub, mock_connect):
+        """
+        Test that with a shard map, writes go through the router and the client follows the leader of the
+        logged-in user's replica group.
+        """
+        router = MagicMock()
+        router.call.return_value = chat_pb2.SendMessageResponse(status="success", message_id="m")
+        router.servers_for.return_value = ["10.0.0.4:8001", "10.0.0.5:8002"]
+        router.list_users.return_value = ["a", "b"]
+        request = chat_pb2.SendMessageRequest(sender="a", recipient="b", message="hi")
+        with patch('client.router', router), patch('client.all_host_port_pairs', ["10.0.0.1:8001"]):
+            self.assertEqual(client.write_call("SendMessage", request).message_id, "m")
+            self.assertEqual(client.list_users(), ["a", "b"])
+            client.use_home_shard("a")
+            self.assertEqual(client.all_host_port_pairs, ["10.0.0.4:8001", "10.0.0.5:8002"])
+        router.call.assert_called_once_with("SendMessage", request)
+        mock_stub.SendMessage.assert_not_called()
+        mock_connect.assert_called_once()
 
     @patch('client.stub')
     @patch('client.messagebox.showerror')
@@ -133,9 +196,11 @@ class TestClient(unittest.TestCase):
 
         client.current_user = "test_user"
         client.conversations = {}
+        client.received_seq = 0
         client.load_conversations()
 
-        mock_stub.ReceiveMessages.assert_called_once_with(chat_pb2.ReceiveMessagesRequest(username="test_user"))
+        mock_stub.ReceiveMessages.assert_called_once_with(
+            chat_pb2.ReceiveMessagesRequest(username="test_user", after_seq=0, limit=client.RECEIVE_PAGE_SIZE))
         mock_showerror.assert_called_once()
 
     @patch('client.conversation_list')
@@ -228,16 +293,45 @@ class TestClient(unittest.TestCase):
         client.update_chat_window("test_user")
         mock_stub.MarkRead.assert_not_called()
 
+    @patch('client.stub')
+    @patch('client.update_conversation_list')
+    def test_sync_conversations(self, mock_update_conversation_list, mock_stub):
+        """
+        Test sync_conversations applies new messages and status changes in place
+        and advances the cursor.
+        """
+        fake_response = MagicMock()
+        fake_response.status = "success"
+        fake_response.changes = [
+            chat_pb2.Message(id="a", sender="user1", message="Hello", status="read", seq=1, updated=8),
+            chat_pb2.Message(id="b", sender="user2", message="Hi", status="unread", seq=9, updated=9),
+        ]
+        fake_response.next_seq = 9
+        fake_response.has_more = False
+        mock_stub.SyncSince.return_value = fake_response
+
+        client.current_user = "test_user"
+        client.conversations = {"user1": [{"id": "a", "from": "user1", "message": "Hello", "status": "unread", "seq": 1}]}
+        client.received_seq = 7
+        client.sync_conversations()
+
+        mock_stub.SyncSince.assert_called_once_with(
+            chat_pb2.SyncRequest(username="test_user", since_seq=7, limit=client.RECEIVE_PAGE_SIZE))
+        self.assertEqual([m["status"] for m in client.conversations["user1"]], ["read"])
+        self.assertEqual(client.conversations["user2"][0]["message"], "Hi")
+        self.assertEqual(client.received_seq, 9)
+        mock_update_conversation_list.assert_called_once()
+
     @patch('client.root.after')
-    @patch('client.load_conversations')
-    def test_check_new_messages(self, mock_load_conversations, mock_after):
+    @patch('client.sync_conversations')
+    def test_check_new_messages(self, mock_sync_conversations, mock_after):
         """
-        Test check_new_messages to verify that it calls load_conversations
+        Test check_new_messages to verify that it calls sync_conversations
         and then schedules itself to run again after 5000ms.
         """
         client.current_user = "test_user"
         client.check_new_messages()
-        mock_load_conversations.assert_called_once()
+        mock_sync_conversations.assert_called_once()
         mock_after.assert_called_once_with(5000, client.check_new_messages)
 
     @patch('client.stub')
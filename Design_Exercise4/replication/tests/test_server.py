@@ -11,10 +11,16 @@ import threading
 import time
 import grpc
 import subprocess
+import json
+import tempfile
 
 import chat_pb2
 import chat_pb2_grpc
 import server
+import sharding
+import segments
+import mailboxes
+import uuid
 
 """
 Amended tests to accommodate the revised server code which uses PersistentStore and
@@ -104,6 +110,40 @@ class TestChatService(unittest.TestCase):
         self.assertIn("success: Logged in", response.message)
         self.assertGreaterEqual(response.unread_messages, 0)
 
+    def test_handle_login_unread_by_contact(self):
+        uname = "login_breakdown_user"
+        self.stub.Register(chat_pb2.RegisterRequest(username=uname, password="p"))
+        for sender in ["breakdown_a", "breakdown_a", "breakdown_b"]:
+            self.stub.SendMessage(chat_pb2.SendMessageRequest(sender=sender, recipient=uname, message="hi"))
+        self.stub.MarkRead(chat_pb2.MarkReadRequest(username=uname, contact="breakdown_b", batch_num=0))
+        response = self.stub.Login(chat_pb2.LoginRequest(username=uname, password="p"))
+        self.assertEqual(response.unread_messages, 2)
+        self.assertEqual(dict(response.unread_by_contact), {"breakdown_a": 2})
+
+    def test_handle_receive_messages_paged(self):
+        uname = "paged_receive_user"
+        self.stub.Register(chat_pb2.RegisterRequest(username=uname, password="p"))
+        for i in range(3):
+            self.stub.SendMessage(chat_pb2.SendMessageRequest(sender="paged_sender", recipient=uname, message=f"m{i}"))
+        first = self.stub.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username=uname, limit=2))
+        self.assertEqual([m.message for m in first.messages], ["m0", "m1"])
+        self.assertTrue(first.has_more)
+        rest = self.stub.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username=uname, after_seq=first.next_seq, limit=2))
+        self.assertEqual([m.message for m in rest.messages], ["m2"])
+        self.assertEqual((rest.next_seq, rest.has_more), (3, False))
+
+    def test_sync_since(self):
+        uname = "sync_user"
+        self.stub.Register(chat_pb2.RegisterRequest(username=uname, password="p"))
+        for i in range(2):
+            self.stub.SendMessage(chat_pb2.SendMessageRequest(sender="sync_sender", recipient=uname, message=f"m{i}"))
+        self.stub.MarkRead(chat_pb2.MarkReadRequest(username=uname, contact="sync_sender", batch_num=1))
+        delta = self.stub.SyncSince(chat_pb2.SyncRequest(username=uname, since_seq=2))
+        self.assertEqual([(m.message, m.status, m.seq, m.updated) for m in delta.changes], [("m0", "read", 1, 3)])
+        self.assertEqual((delta.next_seq, delta.has_more), (3, False))
+        full = self.stub.SyncSince(chat_pb2.SyncRequest(username=uname))
+        self.assertEqual([m.message for m in full.changes], ["m1", "m0"])
+
     def test_handle_login_already_logged_in(self):
         uname = "already_logged_in_user"
         pwd = "pass123"
@@ -150,7 +190,7 @@ class TestChatService(unittest.TestCase):
             sender=sender, recipient=recipient, message="Hello!"
         ))
         self.assertEqual(send_resp.status, "success")
-        self.assertNotEqual(send_resp.message_id, "")
+        self.assertEqual(len(send_resp.bytes_message_id), 16)
 
         # Check in recipient's messages:
         rcv_resp = self.stub.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username=recipient))
@@ -254,10 +294,10 @@ class TestChatService(unittest.TestCase):
         send_resp = self.stub.SendMessage(chat_pb2.SendMessageRequest(
             sender=sender, recipient=recipient, message="Hello"
         ))
-        msg_id = send_resp.message_id
+        msg_id = send_resp.bytes_message_id
 
         del_resp = self.stub.DeleteUnreadMessage(chat_pb2.DeleteUnreadMessageRequest(
-            sender=sender, recipient=recipient, message_id=msg_id
+            sender=sender, recipient=recipient, bytes_message_id=msg_id
         ))
         self.assertEqual(del_resp.status, "success")
         self.assertIn("deleted", del_resp.message.lower())
@@ -265,9 +305,20 @@ class TestChatService(unittest.TestCase):
         # Check the message status
         rcv_resp = self.stub.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username=recipient))
         for m in rcv_resp.messages:
-            if m.id == msg_id:
+            if m.bytes_id == msg_id:
                 self.assertEqual(m.status, "deleted")
 
+    def test_message_id_wire_formats(self):
+        message_id = str(uuid.uuid4())
+        fields = server.id_fields(message_id)
+        self.assertEqual(list(fields), ["bytes_message_id"])
+        self.assertEqual(server.message_id_from("", fields["bytes_message_id"]), message_id)
+        self.assertEqual(server.id_fields(message_id, raw=False), {"message_id": message_id})
+        self.assertEqual(server.id_fields("m1", "id"), {"id": "m1"})
+        raw = chat_pb2.Message(sender="alice", message="hi", status="unread", seq=1, **server.id_fields(message_id, "id"))
+        text = chat_pb2.Message(id=message_id, sender="alice", message="hi", status="unread", seq=1)
+        self.assertEqual(text.ByteSize() - raw.ByteSize(), 20)
+
     def test_handle_delete_unread_message_not_found(self):
         sender = "del_nf_sender"
         recipient = "del_nf_recipient"
@@ -503,21 +554,26 @@ class TestFaultToleranceCLI(unittest.TestCase):
                 leader_proc.terminate()
                 leader_proc.wait(timeout=3)
 
-            # Wait a bit for new leader to appear
+            if all(p.poll() is not None for p in self.procs):
+                return None
+            # Wait for a surviving server to name the new leader, and follow it: followers redirect writes
             time.sleep(2)
-            new_leader_stub = None
-            for s in [self.stub1, self.stub2, self.stub3]:
-                # skip the old leader if it's the same stub
-                if s == old_leader_stub:
-                    continue
-                try:
-                    resp = s.GetLeaderInfo(chat_pb2.GetLeaderInfoRequest(), timeout=1)
-                    if resp.info:
-                        new_leader_stub = s
-                        break
-                except:
-                    pass
-            return new_leader_stub
+            stubs = {"localhost:8001": self.stub1, "localhost:8002": self.stub2, "localhost:8003": self.stub3}
+            deadline = time.time() + 10
+            while time.time() < deadline:
+                for s in [self.stub1, self.stub2, self.stub3]:
+                    # skip the old leader if it's the same stub
+                    if s == old_leader_stub:
+                        continue
+                    try:
+                        resp = s.GetLeaderInfo(chat_pb2.GetLeaderInfoRequest(), timeout=1)
+                    except:
+                        continue
+                    new_leader_stub = stubs.get(resp.info)
+                    if new_leader_stub is not None and new_leader_stub != old_leader_stub:
+                        return new_leader_stub
+                time.sleep(0.2)
+            return None
 
         # ---------------------------
         # Check our old user is visible on the new leader
@@ -564,5 +620,939 @@ class TestFaultToleranceCLI(unittest.TestCase):
             idx = find_leader_index()  # expecting None
             self.assertIsNotNone(idx, "Somehow found a leader even though all servers should be dead!")
 
+###############################################################################
+# PersistentStore group commit
+###############################################################################
+
+class TestPersistentStoreGroupCommit(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, "users_test.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_file(self):
+        """State a store reopened from the files on disk has, in the snapshot format"""
+        return json.loads(server.PersistentStore(self.filename).snapshot()[1])
+
+    def test_mutation_durable_before_return(self):
+        store = server.PersistentStore(self.filename, commit_latency=0.05)
+        store.register("bob", "pw")
+        store.add_message("bob", {"id": "1", "from": "alice", "message": "Hi", "status": "unread"})
+        # No explicit flush: the call itself only returns once its batch is on disk
+        self.assertEqual(self.read_file()["users"]["bob"]["messages"][0]["id"], "1")
+
+    def test_concurrent_writers_share_flushes(self):
+        store = server.PersistentStore(self.filename, commit_latency=0.05, commit_batch=1000)
+        store.register("bob", "pw")
+        flushes_before = store.writer.flush_count
+        threads = [threading.Thread(target=store.add_message,
+                                    args=("bob", {"id": str(i), "from": "alice", "message": "x", "status": "unread"}))
+                   for i in range(50)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.read_file()["users"]["bob"]["messages"]), 50)
+        self.assertLess(store.writer.flush_count - flushes_before, 50)
+
+    def test_full_batch_flushes_before_latency(self):
+        store = server.PersistentStore(self.filename, commit_latency=30, commit_batch=4)
+        start = time.time()
+        threads = [threading.Thread(target=store.add_active_user, args=(f"user{i}",)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=10)
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(len(self.read_file()["active_users"]), 4)
+
+    def test_reload_from_file(self):
+        store = server.PersistentStore(self.filename, commit_latency=0)
+        store.register("bob", "pw")
+        store.set_subscription("bob", True)
+        reloaded = server.PersistentStore(self.filename)
+        self.assertTrue(reloaded.users["bob"]["subscribed"])
+        self.assertIn("bob", reloaded.subscribers_set)
+
+    def test_mailboxes_locked_separately(self):
+        store = server.PersistentStore(self.filename, commit_latency=0)
+        names = [f"user{i}" for i in range(10)]
+        alice = names[0]
+        bob = next(name for name in names if store.user_lock(name) is not store.user_lock(alice))
+        for name in [alice, bob]:
+            store.register(name, "pw")
+        with store.user_lock(alice):
+            # Another user's mailbox is changed, read and made durable while alice's lock is held:
+            # the flush appends to the journal without taking any mailbox lock
+            t = threading.Thread(target=store.add_message, args=(bob, {"id": "1", "from": alice, "message": "x", "status": "unread"}))
+            t.start()
+            t.join(timeout=10)
+            self.assertFalse(t.is_alive())
+            self.assertEqual(store.page_messages(bob)[0][0]["id"], "1")
+            self.assertEqual(store.unread_count(bob), 1)
+            self.assertEqual(self.read_file()["users"][bob]["messages"][0]["id"], "1")
+
+    def fill(self, store):
+        store.register("bob", "pw")
+        for i in range(4):
+            store.add_message("bob", {"id": str(i), "from": "alice", "message": "x", "status": "unread"})
+        store.mark_read("bob", "alice", 2)
+        store.delete_message("alice", "bob", "3")
+        store.set_membership({1: "localhost:1", 2: "localhost:2"})
+        store.append_log(chat_pb2.ReplicationEntry())
+        store.save() # made durable by the caller, as for a replicated entry
+
+    def test_flush_appends_to_journal(self):
+        store = server.PersistentStore(self.filename, commit_latency=0)
+        self.fill(store)
+        # Nothing was snapshotted: each flush appended the records of its mutations
+        self.assertFalse(os.path.exists(self.filename))
+        with open(self.filename + ".journal") as f:
+            self.assertEqual([json.loads(line)["op"] for line in f],
+                             ["register"] + ["add_message"] * 4 + ["mark_read", "delete_message", "membership", "log_index"])
+        reloaded = server.PersistentStore(self.filename)
+        self.assertEqual(reloaded.snapshot(), store.snapshot())
+        self.assertEqual(reloaded.members, {1: "localhost:1", 2: "localhost:2"})
+
+    def test_journal_compacted_into_snapshot(self):
+        store = server.PersistentStore(self.filename, commit_latency=0, compact_every=5)
+        self.fill(store)
+        store.add_active_user("bob")
+        self.assertEqual(self.read_file()["users"], json.loads(store.snapshot()[1])["users"])
+        self.assertLess(store.journal_records, 5)
+        with open(self.filename + ".journal") as f:
+            self.assertEqual(len(f.readlines()), store.journal_records)
+        self.assertEqual(server.PersistentStore(self.filename).snapshot(), store.snapshot())
+
+    def test_replay_skips_records_in_snapshot(self):
+        store = server.PersistentStore(self.filename, commit_latency=0)
+        self.fill(store)
+        with open(self.filename + ".journal") as f:
+            journal = f.read()
+        store.compact()
+        # A crash between writing the snapshot and emptying the journal: the mark-read in it is not applied twice
+        with open(self.filename + ".journal", "w") as f:
+            f.write(journal)
+        reloaded = server.PersistentStore(self.filename)
+        self.assertEqual(reloaded.unread_count("bob"), 1)
+        self.assertEqual(reloaded.snapshot(), store.snapshot())
+
+    def test_torn_journal_record_dropped(self):
+        store = server.PersistentStore(self.filename, commit_latency=0)
+        store.register("bob", "pw")
+        with open(self.filename + ".journal", "a") as f:
+            f.write('{"op": "register", "username": "ca')
+        reloaded = server.PersistentStore(self.filename, commit_latency=0)
+        self.assertEqual(reloaded.usernames(), ["bob"])
+        # Records appended after the torn one are replayed on the next start
+        reloaded.register("carol", "pw")
+        self.assertEqual(server.PersistentStore(self.filename).usernames(), ["bob", "carol"])
+
+    def test_installed_snapshot_replaces_journal(self):
+        store = server.PersistentStore(self.filename, commit_latency=0)
+        self.fill(store)
+        source = server.PersistentStore(os.path.join(self.tmpdir.name, "source.json"), commit_latency=0)
+        source.register("dave", "pw")
+        store.install_snapshot(9, source.snapshot()[1])
+        reloaded = server.PersistentStore(self.filename)
+        self.assertEqual((reloaded.usernames(), reloaded.log_index), (["dave"], 9))
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+class TestPersistentStoreIndex(unittest.TestCase):
+    store_class = server.PersistentStore
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = self.store_class(os.path.join(self.tmpdir.name, "users_test" + self.store_class.extension), commit_latency=0)
+        self.store.register("bob", "pw")
+        for i in range(5):
+            sender = "alice" if i % 2 == 0 else "carol"
+            self.store.add_message("bob", {"id": str(i), "from": sender, "message": "x", "status": "unread"})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def statuses(self):
+        return [m["status"] for m in self.store.page_messages("bob")[0]]
+
+    def test_unread_count(self):
+        self.assertEqual(self.store.unread_count("bob"), 5)
+        self.store.mark_read("bob", "carol", 0)
+        self.assertEqual(self.store.unread_count("bob"), 3)
+
+    def test_delete_then_mark_read(self):
+        self.assertTrue(self.store.delete_message("alice", "bob", "0"))
+        self.assertFalse(self.store.delete_message("alice", "bob", "0"))
+        self.assertFalse(self.store.delete_message("carol", "bob", "2"))
+        self.assertEqual(self.store.mark_read("bob", "alice", 1), 1)
+        self.assertEqual(self.statuses(), ["deleted", "unread", "read", "unread", "unread"])
+        self.assertEqual(self.store.unread_count("bob"), 3)
+
+    def test_unread_by_contact(self):
+        self.assertEqual(self.store.unread_by_contact("bob"), {"alice": 3, "carol": 2})
+        self.store.delete_message("carol", "bob", "1")
+        self.store.mark_read("bob", "alice", 2)
+        self.assertEqual(self.store.unread_by_contact("bob"), {"alice": 1, "carol": 1})
+        self.store.mark_read("bob", "carol", 0)
+        self.assertEqual(self.store.unread_by_contact("bob"), {"alice": 1})
+
+    def test_page_messages(self):
+        page, next_seq, has_more = self.store.page_messages("bob", 0, 2)
+        self.assertEqual([m["id"] for m in page], ["0", "1"])
+        self.assertEqual((next_seq, has_more), (2, True))
+        page, next_seq, has_more = self.store.page_messages("bob", 1, 0, "alice")
+        self.assertEqual([m["id"] for m in page], ["2", "4"])
+        self.assertEqual((next_seq, has_more), (5, False))
+
+    def test_replicated_message_keeps_seq(self):
+        self.store.add_message("bob", {"id": "r", "from": "alice", "message": "x", "status": "unread", "seq": 9})
+        self.store.add_message("bob", {"id": "n", "from": "alice", "message": "x", "status": "unread"})
+        self.assertEqual([m["seq"] for m in self.store.page_messages("bob")[0][-2:]], [9, 10])
+
+    def test_index_rebuilt_after_reload(self):
+        self.store.mark_read("bob", "alice", 1)
+        reloaded = self.store_class(self.store.filename)
+        self.assertEqual(reloaded.unread_count("bob"), 4)
+        self.assertTrue(reloaded.delete_message("alice", "bob", "4"))
+
+    def test_sync_since(self):
+        self.store.mark_read("bob", "alice", 1)
+        self.store.delete_message("carol", "bob", "3")
+        changes, next_seq, has_more = self.store.sync_since("bob", 5)
+        self.assertEqual([(m["id"], m["status"], m["updated"]) for m in changes], [("0", "read", 6), ("3", "deleted", 7)])
+        self.assertEqual((next_seq, has_more), (7, False))
+        # The next message continues the sequence; each message appears once, at its latest change
+        self.store.add_message("bob", {"id": "5", "from": "alice", "message": "x", "status": "unread"})
+        changes, next_seq, has_more = self.store.sync_since("bob", 0, 4)
+        self.assertEqual([m["id"] for m in changes], ["1", "2", "4", "0"])
+        self.assertTrue(has_more)
+        reloaded = self.store_class(self.store.filename)
+        self.assertEqual(reloaded.sync_since("bob", 0), self.store.sync_since("bob", 0))
+
+    def test_snapshot_matches_its_log_index(self):
+        entry = chat_pb2.ReplicationEntry(mark_read=chat_pb2.ReplicateMarkReadRequest(username="bob", contact="alice", batch_num=1))
+        snapshots = []
+        taker = threading.Thread(target=lambda: snapshots.append(self.store.snapshot()))
+        with self.store.batch(), self.store.user_lock("bob"):
+            self.store.mark_read("bob", "alice", 1)
+            taker.start()
+            taker.join(0.2)
+            # The snapshot waits for the entry of the mutation in progress instead of holding one without the other
+            self.assertTrue(taker.is_alive())
+            self.store.append_log(entry)
+        taker.join()
+        index, data = snapshots[0]
+        self.assertEqual(index, 1)
+        replica = self.store_class(os.path.join(self.tmpdir.name, "replica" + self.store_class.extension), commit_latency=0)
+        replica.install_snapshot(index, data)
+        self.assertEqual(replica.unread_by_contact("bob"), {"alice": 2, "carol": 2})
+
+class TestSQLiteStoreIndex(TestPersistentStoreIndex):
+    """The same queries, answered by the SQLite backend"""
+    store_class = server.SQLiteStore
+
+class TestMailbox(unittest.TestCase):
+
+    def test_uuid_ids_stored_as_bytes(self):
+        mailbox = server.Mailbox()
+        ids = [str(uuid.uuid4()) for _ in range(100)]
+        for message_id in ids + ["not-a-uuid"]:
+            mailbox.append({"id": message_id, "from": "alice", "message": "x", "status": "unread"})
+        self.assertEqual(len(mailbox.ids), 16 * 101)
+        self.assertEqual(mailbox.text_ids, {100: "not-a-uuid"})
+        self.assertEqual([mailbox.find(message_id) for message_id in ids[::25] + ["not-a-uuid"]], [0, 25, 50, 75, 100])
+        self.assertIsNone(mailbox.find(str(uuid.uuid4())))
+        self.assertEqual((mailbox[0]["id"], mailbox[-1]["id"]), (ids[0], "not-a-uuid"))
+        self.assertIsNone(mailbox.append({"id": ids[3], "from": "alice", "message": "again", "status": "unread"}))
+
+    def test_dicts_round_trip(self):
+        messages = [{"id": "1", "from": "alice", "message": "a", "status": "read", "seq": 1, "updated": 3},
+                    {"id": "2", "from": "carol", "message": "b", "status": "deleted", "seq": 2, "updated": 4},
+                    {"id": "3", "from": "alice", "message": "c", "status": "unread", "seq": 5}]
+        mailbox = server.Mailbox.from_dicts(messages)
+        self.assertEqual(mailbox.to_dicts(), messages)
+        self.assertEqual((mailbox.seq, mailbox.unread_by_contact()), (5, {"alice": 1}))
+        self.assertEqual(bytes(mailbox.statuses), bytes([mailboxes.READ, mailboxes.DELETED, mailboxes.UNREAD]))
+        frozen = mailbox.frozen()
+        mailbox.mark_read("alice", 0)
+        mailbox.append({"id": str(uuid.uuid4()), "from": "dave", "message": "d", "status": "unread"})
+        self.assertEqual(frozen.to_dicts(), messages)
+        self.assertEqual(frozen.seq, 5)
+
+    def test_page_with_messages_out_of_seq_order(self):
+        mailbox = server.Mailbox()
+        for seq in [1, 2, 5, 3, 4]:
+            mailbox.append({"id": str(seq), "from": "alice" if seq % 2 else "carol", "message": "x", "status": "unread", "seq": seq})
+        self.assertFalse(mailbox.in_order)
+        page, has_more = mailbox.page(2, 2)
+        self.assertEqual(([m["seq"] for m in page], has_more), ([3, 4], True))
+        self.assertEqual([m["seq"] for m in mailbox.page(4, 0)[0]], [5])
+        self.assertEqual([m["seq"] for m in mailbox.page(1, 0, "alice")[0]], [3, 5])
+
+class TestSegmentStoreIndex(TestPersistentStoreIndex):
+    """The same queries, with the bodies in segment files"""
+    store_class = server.SegmentStore
+
+class TestSegmentLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmpdir.name, "segments")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_records_span_segments(self):
+        log = segments.SegmentLog(self.directory, segment_size=64)
+        offsets = [log.append(f"record {i}".encode()) for i in range(10)]
+        self.assertEqual([log.read(offset) for offset in offsets], [f"record {i}".encode() for i in range(10)])
+        self.assertGreater(len(os.listdir(self.directory)), 1)
+        with self.assertRaises(ValueError):
+            log.append(b"x" * 64)
+
+    def test_reopen_appends_after_last_record(self):
+        log = segments.SegmentLog(self.directory, segment_size=4096)
+        first = log.append(b"first")
+        log.sync()
+        reopened = segments.SegmentLog(self.directory, segment_size=4096)
+        second = reopened.append(b"second")
+        self.assertGreater(second, first)
+        self.assertEqual((reopened.read(first), reopened.read(second)), (b"first", b"second"))
+
+    def test_torn_record_overwritten(self):
+        log = segments.SegmentLog(self.directory, segment_size=4096)
+        log.append(b"kept")
+        torn = log.append(b"torn")
+        log.maps[0][torn + segments.RECORD_HEADER.size] ^= 0xff  # as if the crash hit mid-record
+        log.sync()
+        with self.assertRaises(IOError):
+            log.read(torn)
+        reopened = segments.SegmentLog(self.directory, segment_size=4096)
+        self.assertEqual(reopened.append(b"next"), torn)
+
+class TestSegmentStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, "users_test.index.json")
+        self.store = server.SegmentStore(self.filename, commit_latency=0)
+        self.store.register("bob", "pw")
+        self.store.add_message("bob", {"id": "1", "from": "alice", "message": "a rather long body", "status": "unread"})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_bodies_only_in_segments(self):
+        with open(self.filename + ".journal") as f:
+            records = [json.loads(line) for line in f]
+        self.assertNotIn("a rather long body", json.dumps(records))
+        self.assertNotIn("message", records[-1]["msg"])
+        self.store.compact()
+        with open(self.filename) as f:
+            data = f.read()
+        self.assertNotIn("a rather long body", data)
+        self.assertNotIn("message", json.loads(data)["users"]["bob"]["messages"][0])
+        reloaded = server.SegmentStore(self.filename)
+        self.assertEqual(reloaded.page_messages("bob")[0][0]["message"], "a rather long body")
+
+    def test_snapshot_carries_bodies(self):
+        json_store = server.PersistentStore(os.path.join(self.tmpdir.name, "users_test.json"), commit_latency=0)
+        json_store.install_snapshot(3, self.store.snapshot()[1])
+        self.assertEqual(json_store.page_messages("bob")[0][0]["message"], "a rather long body")
+        # A snapshot with inline bodies is moved into the segments
+        json_store.add_message("bob", {"id": "2", "from": "alice", "message": "second", "status": "unread"})
+        self.store.install_snapshot(4, json_store.snapshot()[1])
+        self.assertEqual([m["message"] for m in self.store.sync_since("bob")[0]], ["a rather long body", "second"])
+        self.assertNotIn("message", self.store.users["bob"]["messages"][1])
+
+    def test_duplicate_not_appended_to_segments(self):
+        position = self.store.segments.position
+        replayed = {"id": "1", "from": "alice", "message": "a rather long body", "status": "unread", "seq": 1}
+        self.assertTrue(self.store.add_message("bob", replayed))
+        self.assertEqual(self.store.segments.position, position)
+        self.assertEqual(len(self.store.users["bob"]["messages"]), 1)
+
+class TestSQLiteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, "users_test.db")
+        self.store = server.SQLiteStore(self.filename, commit_latency=0)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_wal_mode(self):
+        self.assertEqual(self.store.db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+    def test_accounts_and_metadata_survive_restart(self):
+        self.store.register("alice", "pw")
+        self.store.register("bob", "pw")
+        self.store.set_subscription("bob", True)
+        self.assertTrue(self.store.delete_account("alice"))
+        self.assertFalse(self.store.delete_account("alice"))
+        self.store.set_membership({1: "localhost:8001", 2: "localhost:8002"})
+        self.store.append_log(chat_pb2.ReplicationEntry(register=chat_pb2.ReplicateRegisterRequest(username="bob")))
+        self.store.save()
+        reloaded = server.SQLiteStore(self.filename)
+        self.assertEqual(reloaded.usernames(), ["bob"])
+        self.assertEqual(reloaded.get_user("alice"), {"password": "pw", "subscribed": False, "deleted": True})
+        self.assertTrue(reloaded.get_user("bob")["subscribed"])
+        self.assertIn("bob", reloaded.get_subscribers())
+        self.assertEqual((reloaded.log_index, reloaded.members), (1, {1: "localhost:8001", 2: "localhost:8002"}))
+
+    def test_writes_group_committed(self):
+        store = server.SQLiteStore(os.path.join(self.tmpdir.name, "batched.db"), commit_latency=30, commit_batch=4)
+        start = time.time()
+        threads = [threading.Thread(target=store.register, args=(f"user{i}", "pw")) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=10)
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(store.writer.flush_count, 1)
+        self.assertEqual(len(server.SQLiteStore(store.filename).usernames()), 4)
+
+    def test_snapshot_matches_json_store(self):
+        json_store = server.PersistentStore(os.path.join(self.tmpdir.name, "users_test.json"), commit_latency=0)
+        for store in [self.store, json_store]:
+            store.register("bob", "pw")
+            for i in range(4):
+                store.add_message("bob", {"id": str(i), "from": "alice", "message": "x", "status": "unread"})
+            store.mark_read("bob", "alice", 1)
+            store.delete_message("alice", "bob", "3")
+        self.assertEqual(json.loads(self.store.snapshot()[1])["users"], json.loads(json_store.snapshot()[1])["users"])
+        # A follower on either backend installs the other's snapshot
+        json_store.install_snapshot(7, self.store.snapshot()[1])
+        self.store.install_snapshot(7, json_store.snapshot()[1])
+        self.assertEqual(self.store.sync_since("bob", 0), json_store.sync_since("bob", 0))
+        self.store.add_message("bob", {"id": "4", "from": "alice", "message": "x", "status": "unread"})
+        self.assertEqual(self.store.page_messages("bob", 4)[0][0]["seq"], 7)
+        self.assertEqual(server.SQLiteStore(self.filename).log_index, 7)
+
+    def test_queries_use_indexes(self):
+        def plan(query, *params):
+            return " ".join(row[-1] for row in self.store.db.execute("EXPLAIN QUERY PLAN " + query, params))
+        self.assertIn("messages_unread", plan("SELECT sender, COUNT(*) FROM messages WHERE recipient = ? AND status = 'unread' "
+                                              "GROUP BY sender", "bob"))
+        self.assertIn("messages_id", plan("SELECT 1 FROM messages WHERE id = ? AND recipient = ?", "1", "bob"))
+        self.assertIn("messages_changed", plan("SELECT * FROM messages WHERE recipient = ? AND changed > ? ORDER BY changed", "bob", 0))
+
+###############################################################################
+# Streaming replication
+###############################################################################
+
+class TestReplicationStream(unittest.TestCase):
+
+    def setUp(self):
+        """Run a follower (ReplicationService only) in-process on a spare port."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.follower_store = server.PersistentStore(os.path.join(self.tmpdir.name, "follower.json"), commit_latency=0.01)
+        self.follower = grpc.server(server.futures.ThreadPoolExecutor(max_workers=4))
+        chat_pb2_grpc.add_ReplicationServiceServicer_to_server(server.ReplicationService(self.follower_store), self.follower)
+        chat_pb2_grpc.add_HealthServicer_to_server(server.HealthService(self.follower_store), self.follower)
+        port = self.follower.add_insecure_port("localhost:0")
+        self.address = f"localhost:{port}"
+        self.follower.start()
+
+    def tearDown(self):
+        self.follower.stop(None)
+        self.tmpdir.cleanup()
+
+    def test_entries_batched_and_acknowledged(self):
+        leader_store = server.PersistentStore(os.path.join(self.tmpdir.name, "leader.json"), commit_latency=0)
+        replicator = server.PeerReplicator(self.address, leader_store, batch_size=16)
+        entries = [chat_pb2.ReplicationEntry(index=1, register=chat_pb2.ReplicateRegisterRequest(username="bob", password="pw"))]
+        for i in range(2, 101):
+            entries.append(chat_pb2.ReplicationEntry(index=i, message=chat_pb2.ReplicateMessageRequest(
+                message_id=str(i), sender="alice", recipient="bob", message="x", status="unread", seq=i - 1)))
+        for entry in entries:
+            replicator.enqueue(entry)
+        self.assertTrue(replicator.wait_for(100, 10))
+        self.assertEqual(len(self.follower_store.users["bob"]["messages"]), 99)
+        # Entries queued together travel together
+        self.assertLess(replicator.batch_count, 100)
+
+    def test_resent_entries_skipped(self):
+        service = server.ReplicationService(self.follower_store)
+        register = chat_pb2.ReplicationEntry(index=1, register=chat_pb2.ReplicateRegisterRequest(username="bob", password="pw"))
+        send = chat_pb2.ReplicationEntry(index=2, message=chat_pb2.ReplicateMessageRequest(
+            message_id="m", sender="alice", recipient="bob", message="x", status="unread", seq=1))
+        batches = [chat_pb2.ReplicationBatch(entries=[register, send]),
+                   chat_pb2.ReplicationBatch(entries=[send])]
+        acks = [ack.index for ack in service.Replicate(iter(batches), None)]
+        self.assertEqual(acks, [2, 2])
+        self.assertEqual(len(self.follower_store.users["bob"]["messages"]), 1)
+        self.assertEqual([entry.index for entry in self.follower_store.log], [1, 2])
+        # An entry past the next index is not applied; the leader has to send what is missing first
+        gap = chat_pb2.ReplicationEntry(index=4, register=chat_pb2.ReplicateRegisterRequest(username="eve", password="pw"))
+        acks = [ack.index for ack in service.Replicate(iter([chat_pb2.ReplicationBatch(entries=[gap])]), None)]
+        self.assertEqual(acks, [2])
+        self.assertNotIn("eve", self.follower_store.users)
+
+    def test_replicator_survives_unexpected_error(self):
+        leader_store = server.PersistentStore(os.path.join(self.tmpdir.name, "leader.json"), commit_latency=0)
+        log_since = leader_store.log_since
+        failures = [KeyError("bad entry")]
+        def failing_log_since(*args):
+            if failures:
+                raise failures.pop()
+            return log_since(*args)
+        leader_store.log_since = failing_log_since
+        replicator = server.PeerReplicator(self.address, leader_store)
+        entry = chat_pb2.ReplicationEntry(index=1, register=chat_pb2.ReplicateRegisterRequest(username="bob", password="pw"))
+        leader_store.append_log(entry)
+        replicator.enqueue(entry)
+        # The first attempt fails in catch_up; the thread backs off and the next attempt delivers the entry
+        self.assertTrue(replicator.wait_for(1, 10))
+        self.assertEqual(failures, [])
+        self.assertIn("bob", self.follower_store.users)
+
+    def test_replicate_to_peers(self):
+        election = server.LeaderElection(1, [(2, self.address)])
+        election.peer_status[2] = True
+        leader_store = server.PersistentStore(os.path.join(self.tmpdir.name, "leader.json"), commit_latency=0)
+        service = server.ChatService(leader_store, election, [(2, self.address)])
+        ack = service.replicate_to_peers("ReplicateRegister", chat_pb2.ReplicateRegisterRequest(username="carol", password="pw"))
+        self.assertEqual(ack, 2)
+        self.assertIn("carol", self.follower_store.users)
+        # A follower marked down is skipped
+        election.peer_status[2] = False
+        ack = service.replicate_to_peers("ReplicateRegister", chat_pb2.ReplicateRegisterRequest(username="dave", password="pw"))
+        self.assertEqual(ack, 1)
+
+    def test_peer_connections_shared_with_stats(self):
+        connections = server.PeerConnections()
+        self.assertIs(connections.channel(self.address), connections.channel(self.address))
+        election = server.LeaderElection(1, [(2, self.address)], connections)
+        leader_store = server.PersistentStore(os.path.join(self.tmpdir.name, "leader.json"), commit_latency=0)
+        service = server.ChatService(leader_store, election, [(2, self.address)])
+        self.assertIs(service.connections, connections)
+        election.peer_status[2] = True
+        service.replicate_to_peers("ReplicateRegister", chat_pb2.ReplicateRegisterRequest(username="frank", password="pw"))
+        self.assertFalse(election.ping_peer("localhost:1"))
+        stats = connections.latency_stats()
+        self.assertEqual(stats[self.address]["calls"], 1)
+        self.assertGreater(stats[self.address]["avg_ms"], 0)
+        self.assertEqual(stats["localhost:1"]["failures"], 1)
+        self.assertEqual(len(connections.channels), 2)
+        connections.close()
+
+    def test_quorum_returns_without_straggler(self):
+        # Peer 3 is considered alive but never answers; the live follower alone completes the quorum
+        peers = [(2, self.address), (3, "localhost:1")]
+        election = server.LeaderElection(1, peers)
+        election.peer_status.update({2: True, 3: True})
+        leader_store = server.PersistentStore(os.path.join(self.tmpdir.name, "leader.json"), commit_latency=0)
+        service = server.ChatService(leader_store, election, peers)
+        start = time.time()
+        ack = service.replicate_to_peers("ReplicateRegister", chat_pb2.ReplicateRegisterRequest(username="erin", password="pw"))
+        self.assertEqual(ack, 2)
+        self.assertLess(time.time() - start, server.REPLICATION_TIMEOUT)
+        self.assertIn("erin", self.follower_store.users)
+        self.assertEqual(service.commit_index(), 1)
+
+    def leader(self, **kwargs):
+        election = server.LeaderElection(1, [(2, self.address)])
+        election.peer_status[2] = False
+        leader_store = server.PersistentStore(os.path.join(self.tmpdir.name, "leader.json"), commit_latency=0, **kwargs)
+        return server.ChatService(leader_store, election, [(2, self.address)])
+
+    def wait_until(self, condition, timeout=10):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.05)
+        return condition()
+
+    def test_rejoining_follower_gets_missed_suffix(self):
+        service = self.leader()
+        for name in ["amy", "ben", "cal"]:
+            service.replicate_to_peers("ReplicateRegister", chat_pb2.ReplicateRegisterRequest(username=name, password="pw"))
+        self.assertEqual(self.follower_store.log_index, 0)
+        # Back up: the next write first brings the follower the three entries it missed
+        service.election.peer_status[2] = True
+        ack = service.replicate_to_peers("ReplicateRegister", chat_pb2.ReplicateRegisterRequest(username="dan", password="pw"))
+        self.assertEqual(ack, 2)
+        self.assertEqual(sorted(self.follower_store.users), ["amy", "ben", "cal", "dan"])
+        self.assertEqual(self.follower_store.log_index, 4)
+        self.assertEqual(service.replicators[2].snapshot_count, 0)
+
+    def test_follower_behind_log_gets_snapshot(self):
+        service = self.leader(log_retention=2)
+        for name in ["amy", "ben", "cal"]:
+            service.store.register(name, "pw")
+            service.replicate_to_peers("ReplicateRegister", chat_pb2.ReplicateRegisterRequest(username=name, password="pw"))
+        service.store.add_message("amy", {"id": "m", "from": "ben", "message": "x", "status": "unread"})
+        service.replicate_to_peers("ReplicateMessage", chat_pb2.ReplicateMessageRequest(
+            message_id="m", sender="ben", recipient="amy", message="x", status="unread", seq=1))
+        # The election reports the follower back up; it is caught up without waiting for a write
+        service.replicators[2].snapshot_chunk_size = 64 # several chunks
+        service.election.peer_status[2] = True
+        service.election.state = "leader"
+        service.peer_up(2)
+        self.assertTrue(self.wait_until(lambda: self.follower_store.log_index == 4))
+        # Counted once the follower's InstallSnapshot call has returned, after it saved the snapshot
+        self.assertTrue(self.wait_until(lambda: service.replicators[2].snapshot_count == 1))
+        self.assertEqual(sorted(self.follower_store.users), ["amy", "ben", "cal"])
+        self.assertEqual(self.follower_store.unread_count("amy"), 1)
+        reloaded = server.PersistentStore(self.follower_store.filename)
+        self.assertEqual(reloaded.log_index, 4)
+
+    def test_snapshot_transfer_resumes(self):
+        source = server.PersistentStore(os.path.join(self.tmpdir.name, "leader.json"), commit_latency=0)
+        for i in range(20):
+            source.register(f"user{i}", "pw")
+        source.log_index = 20
+        index, data = source.snapshot()
+        chunks = list(server.snapshot_chunks("snap", index, data.encode(), chunk_size=100))
+        stub = chat_pb2_grpc.ReplicationServiceStub(grpc.insecure_channel(self.address))
+        # The transfer breaks off after two chunks; the follower reports how far it got
+        self.assertEqual(stub.InstallSnapshot(iter(chunks[:2])).index, 0)
+        reply = stub.GetLogIndex(chat_pb2.LogIndexRequest())
+        self.assertEqual((reply.snapshot_id, reply.snapshot_offset), ("snap", 200))
+        # A corrupt chunk is rejected without losing the progress
+        corrupt = chat_pb2.SnapshotChunk()
+        corrupt.CopyFrom(chunks[2])
+        corrupt.crc32 += 1
+        with self.assertRaises(grpc.RpcError) as cm:
+            stub.InstallSnapshot(iter([corrupt]))
+        self.assertEqual(cm.exception.code(), grpc.StatusCode.DATA_LOSS)
+        self.assertEqual(stub.GetLogIndex(chat_pb2.LogIndexRequest()).snapshot_offset, 200)
+        # Resuming from the reported offset completes the install
+        self.assertEqual(stub.InstallSnapshot(server.snapshot_chunks("snap", index, data.encode(), 200, 100)).index, 20)
+        self.assertEqual(len(self.follower_store.users), 20)
+        self.assertEqual(stub.GetLogIndex(chat_pb2.LogIndexRequest()).snapshot_id, "")
+
+    def follower_service(self, leader_address="localhost:1"):
+        election = server.LeaderElection(2, [(1, leader_address)])
+        election.leader_id = 1
+        return server.ChatService(self.follower_store, election, [(1, leader_address)])
+
+    def test_bounded_staleness_read_on_follower(self):
+        service = self.leader()
+        service.election.peer_status[2] = True
+        service.store.register("bob", "pw")
+        service.replicate_to_peers("ReplicateRegister", chat_pb2.ReplicateRegisterRequest(username="bob", password="pw"))
+        follower = self.follower_service()
+        bounded = chat_pb2.ReadOptions(consistency=chat_pb2.READ_BOUNDED, max_staleness_ms=5000)
+        response = follower.ListUsers(chat_pb2.ListUsersRequest(read=bounded), None)
+        self.assertEqual((response.status, list(response.users)), ("success", ["bob"]))
+        time.sleep(0.01)
+        response = follower.ListUsers(chat_pb2.ListUsersRequest(read=chat_pb2.ReadOptions(
+            consistency=chat_pb2.READ_BOUNDED, max_staleness_ms=0)), None)
+        self.assertEqual(response.status, "error: Replica too stale")
+        # Behind the leader's latest batch: only local reads are served
+        self.follower_store.leader_index = 100
+        response = follower.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username="bob", read=bounded), None)
+        self.assertEqual(response.status, "error: Replica too stale")
+        response = follower.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username="bob"), None)
+        self.assertEqual(response.status, "success")
+
+    def test_read_index_read_on_follower(self):
+        service = self.leader()
+        service.election.peer_status[2] = True
+        service.election.state = "leader"
+        leader_server = grpc.server(server.futures.ThreadPoolExecutor(max_workers=4))
+        chat_pb2_grpc.add_ChatServiceServicer_to_server(service, leader_server)
+        leader_address = f"localhost:{leader_server.add_insecure_port('localhost:0')}"
+        leader_server.start()
+        self.addCleanup(leader_server.stop, None)
+        service.store.register("bob", "pw")
+        service.replicate_to_peers("ReplicateRegister", chat_pb2.ReplicateRegisterRequest(username="bob", password="pw"))
+        self.assertEqual(service.commit_index(), 1)
+        follower = self.follower_service(leader_address)
+        read_index = chat_pb2.ReadOptions(consistency=chat_pb2.READ_INDEX)
+        response = follower.SyncSince(chat_pb2.SyncRequest(username="bob", read=read_index), None)
+        self.assertEqual(response.status, "success")
+        # A server that is no longer leader cannot vouch for the commit index
+        service.election.state = "backup"
+        response = follower.SyncSince(chat_pb2.SyncRequest(username="bob", read=read_index), None)
+        self.assertEqual(response.status, "error: Not leader")
+
+    def test_failure_detector_marks_silent_peer_down(self):
+        self.addCleanup(setattr, server, "all_host_port_pairs", server.all_host_port_pairs)
+        server.all_host_port_pairs = ["localhost:1", self.address]
+        election = server.LeaderElection(1, [(2, self.address)], heartbeat_interval=0.05, phi_threshold=3)
+        self.addCleanup(election.stop)
+        election.start()
+        self.assertTrue(self.wait_until(lambda: len(election.heartbeat_gaps[2]) >= 5))
+        self.assertTrue(election.peer_status[2])
+        self.follower.stop(None)
+        self.assertTrue(self.wait_until(lambda: not election.peer_status[2], timeout=5))
+        # Declared down after roughly 2.3 * phi_threshold intervals of silence, not on the first failed ping
+        self.assertEqual(len(election.detection_times), 1)
+        self.assertGreater(election.detection_times[0], 0.2)
+        self.assertLess(election.detection_times[0], 2)
+
+    def test_get_leader_info_cached(self):
+        self.addCleanup(setattr, server, "all_host_port_pairs", server.all_host_port_pairs)
+        server.all_host_port_pairs = ["localhost:1", "localhost:2"]
+        # Peer 2 never answers; GetLeaderInfo must not wait on it
+        election = server.LeaderElection(1, [(2, "localhost:2")])
+        leader_store = server.PersistentStore(os.path.join(self.tmpdir.name, "leader.json"), commit_latency=0)
+        service = server.ChatService(leader_store, election, [(2, "localhost:2")])
+        start = time.perf_counter()
+        for _ in range(1000):
+            info = service.GetLeaderInfo(chat_pb2.GetLeaderInfoRequest(), None).info
+        self.assertEqual(info, "localhost:1")
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(election.connections.latency_stats(), {})
+
+    def test_follower_redirects_writes_and_pushes_leader_changes(self):
+        self.addCleanup(setattr, server, "all_host_port_pairs", server.all_host_port_pairs)
+        server.all_host_port_pairs = ["localhost:1", self.address]
+        follower = self.follower_service()
+        follower.election.update({1: True})
+        response = follower.Register(chat_pb2.RegisterRequest(username="zed", password="pw"), None)
+        self.assertEqual((response.message, response.leader), (server.NOT_LEADER, "localhost:1"))
+        self.assertNotIn("zed", self.follower_store.users)
+        response = follower.SendMessage(chat_pb2.SendMessageRequest(sender="a", recipient="b", message="x"), None)
+        self.assertEqual((response.status, response.leader), (server.NOT_LEADER, "localhost:1"))
+        # Watchers get the current leader, then the new one as soon as the follower notices the change
+        watch_server = grpc.server(server.futures.ThreadPoolExecutor(max_workers=2))
+        chat_pb2_grpc.add_ChatServiceServicer_to_server(follower, watch_server)
+        watch_address = f"localhost:{watch_server.add_insecure_port('localhost:0')}"
+        watch_server.start()
+        self.addCleanup(watch_server.stop, None)
+        stream = chat_pb2_grpc.ChatServiceStub(grpc.insecure_channel(watch_address)).WatchLeadership(
+            chat_pb2.WatchLeadershipRequest())
+        self.assertEqual(next(stream).leader, "localhost:1")
+        threading.Timer(0.2, follower.election.update, args=({1: False},)).start()
+        start = time.time()
+        info = next(stream)
+        self.assertEqual((info.leader, info.leader_id), (self.address, 2))
+        self.assertLess(time.time() - start, 1)
+        stream.cancel()
+
+    def test_election_prefers_up_to_date_server(self):
+        self.addCleanup(setattr, server, "all_host_port_pairs", server.all_host_port_pairs)
+        server.all_host_port_pairs = ["localhost:1", self.address]
+        self.follower_store.log_index = 5
+        leader_store = server.PersistentStore(os.path.join(self.tmpdir.name, "leader.json"), commit_latency=0)
+        election = server.LeaderElection(1, [(2, self.address)], store=leader_store)
+        revived = []
+        election.on_peer_up = revived.append
+        # Server 1 has the lower id but is behind, so server 2 leads
+        self.assertEqual(election.elect(), self.address)
+        self.assertEqual((election.state, revived), ("backup", [2]))
+        # and keeps leading while it is up, even once server 1 has caught up
+        leader_store.log_index = 5
+        self.assertEqual(election.elect(), self.address)
+        self.assertEqual(election.state, "backup")
+        # A server that went down is not written off for good
+        self.follower.stop(None)
+        self.assertEqual(election.elect(), "localhost:1")
+        self.assertEqual(election.state, "leader")
+        self.assertFalse(election.peer_status[2])
+        self.follower = grpc.server(server.futures.ThreadPoolExecutor(max_workers=4))
+        chat_pb2_grpc.add_HealthServicer_to_server(server.HealthService(self.follower_store), self.follower)
+        self.follower.add_insecure_port(self.address)
+        self.follower.start()
+        self.assertTrue(self.wait_until(lambda: election.elect() and election.peer_status[2]))
+        self.assertEqual(revived, [2, 2])
+
+    def test_follower_ahead_of_cached_leader_index_stays_backup(self):
+        store = server.PersistentStore(os.path.join(self.tmpdir.name, "follower2.json"), commit_latency=0)
+        election = server.LeaderElection(2, [(1, "localhost:1")], store=store, address="localhost:2")
+        election.update({1: True})
+        self.assertEqual(election.leader_id, 1)
+        # The follower applies entries past the leader's index cached from its last ping
+        election.peer_log_index["localhost:1"] = 100
+        store.log_index = 101
+        election.update({1: True})
+        self.assertEqual((election.leader_id, election.state), (1, "backup"))
+        # Only once the leader is down does the up-to-date follower take over
+        election.update({1: False})
+        self.assertEqual((election.leader_id, election.state), (2, "leader"))
+
+    def test_restarted_server_joins_running_leader(self):
+        self.addCleanup(setattr, server, "all_host_port_pairs", server.all_host_port_pairs)
+        server.all_host_port_pairs = ["localhost:1", self.address]
+        follower_election = server.LeaderElection(2, [(1, "localhost:1")], store=self.follower_store, address=self.address)
+        follower_election.update({1: False})
+        self.follower.stop(None)
+        self.follower = grpc.server(server.futures.ThreadPoolExecutor(max_workers=4))
+        chat_pb2_grpc.add_HealthServicer_to_server(server.HealthService(self.follower_store, follower_election), self.follower)
+        self.follower.add_insecure_port(self.address)
+        self.follower.start()
+        # Server 1 restarts as up to date as server 2 and has the lower id, but server 2 already leads
+        leader_store = server.PersistentStore(os.path.join(self.tmpdir.name, "leader.json"), commit_latency=0)
+        election = server.LeaderElection(1, [(2, self.address)], store=leader_store)
+        self.assertEqual(election.elect(), self.address)
+        self.assertEqual(election.state, "backup")
+
+    def single_node_leader(self):
+        leader_store = server.PersistentStore(os.path.join(self.tmpdir.name, "leader.json"), commit_latency=0)
+        leader_store.set_membership({1: "localhost:1"})
+        election = server.LeaderElection(1, [], store=leader_store, address="localhost:1")
+        service = server.ChatService(leader_store, election, [])
+        election.update({})
+        return service
+
+    def test_text_id_format(self):
+        service = self.single_node_leader()
+        service.raw_ids = False
+        service.store.register("amy", "pw")
+        response = service.SendMessage(chat_pb2.SendMessageRequest(sender="ben", recipient="amy", message="x"), None)
+        self.assertEqual((len(response.message_id), response.bytes_message_id), (36, b""))
+        page = service.ReceiveMessages(chat_pb2.ReceiveMessagesRequest(username="amy"), None)
+        self.assertEqual(page.messages[0].id, response.message_id)
+        deleted = service.DeleteUnreadMessage(chat_pb2.DeleteUnreadMessageRequest(
+            sender="ben", recipient="amy", message_id=response.message_id), None)
+        self.assertEqual(deleted.status, "success")
+
+    def test_mailbox_entries_logged_in_apply_order(self):
+        service = self.single_node_leader()
+        service.Register(chat_pb2.RegisterRequest(username="amy", password="pw"), None)
+        def client(i):
+            for j in range(20):
+                service.SendMessage(chat_pb2.SendMessageRequest(sender=f"s{i % 2}", recipient="amy", message=f"{i}-{j}"), None)
+                if j % 5 == 4:
+                    service.MarkRead(chat_pb2.MarkReadRequest(username="amy", contact=f"s{i % 2}", batch_num=3), None)
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        seqs = [entry.message.seq for entry in service.store.log if entry.WhichOneof("op") == "message"]
+        self.assertEqual(seqs, sorted(seqs))
+        # A follower replaying the log ends up with the leader's mailbox
+        follower = server.ReplicationService(self.follower_store)
+        list(follower.Replicate(iter([chat_pb2.ReplicationBatch(entries=list(service.store.log))]), None))
+        self.assertEqual(self.follower_store.unread_by_contact("amy"), service.store.unread_by_contact("amy"))
+        self.assertEqual(self.follower_store.sync_since("amy"), service.store.sync_since("amy"))
+
+    def test_joint_quorum_needs_both_majorities(self):
+        old, new = {1, 2, 3}, {1, 2, 3, 4, 5}
+        self.assertTrue(server.has_quorum({1, 2}, [old]))
+        self.assertFalse(server.has_quorum({1, 2}, [old, new]))
+        self.assertTrue(server.has_quorum({1, 4, 5}, [new]))
+        self.assertFalse(server.has_quorum({1, 4, 5}, [old, new]))
+        self.assertTrue(server.has_quorum({1, 2, 4}, [old, new]))
+        self.assertEqual([server.majority(range(n)) for n in [1, 2, 3, 4, 5]], [1, 2, 2, 3, 3])
+
+    def test_membership_survives_restart(self):
+        filename = os.path.join(self.tmpdir.name, "members.json")
+        store = server.PersistentStore(filename, commit_latency=0)
+        store.set_membership({1: "a:8001", 2: "b:8002"}, {1: "a:8001", 2: "b:8002", 3: "c:8003"})
+        store = server.PersistentStore(filename, commit_latency=0)
+        self.assertEqual(store.configurations(), [{1: "a:8001", 2: "b:8002"}, {1: "a:8001", 2: "b:8002", 3: "c:8003"}])
+        # The persisted membership wins over the peers a server was started with
+        service = server.ChatService(store, server.LeaderElection(1, [(5, "localhost:1")], store=store), [(5, "localhost:1")])
+        self.assertEqual([pid for pid, _ in service.peers], [2, 3])
+        self.assertEqual(sorted(service.election.peer_status), [2, 3])
+
+    def test_add_and_remove_node(self):
+        service = self.single_node_leader()
+        service.store.register("amy", "pw")
+        self.assertEqual(service.replicate_to_peers("ReplicateRegister", chat_pb2.ReplicateRegisterRequest(
+            username="amy", password="pw")), 1)
+        # The new server catches up before it votes, then the cluster moves through the joint configuration
+        response = service.ChangeMembership(chat_pb2.ChangeMembershipRequest(
+            add=chat_pb2.Member(id=2, address=self.address)), None)
+        self.assertEqual(response.status, "success")
+        self.assertEqual([m.id for m in response.members], [1, 2])
+        self.assertIn("amy", self.follower_store.users)
+        self.assertEqual(self.follower_store.configurations(), [{1: "localhost:1", 2: self.address}])
+        self.assertEqual((service.quorum, service.peers), (2, [(2, self.address)]))
+        self.assertEqual(service.replicate_to_peers("ReplicateRegister", chat_pb2.ReplicateRegisterRequest(
+            username="ben", password="pw")), 2)
+        self.assertEqual(service.commit_index(), service.store.log_index)
+        # The removed server still learns the final configuration, then is no longer watched
+        response = service.ChangeMembership(chat_pb2.ChangeMembershipRequest(remove_id=2), None)
+        self.assertEqual(response.status, "success")
+        self.assertEqual(self.follower_store.configurations(), [{1: "localhost:1"}])
+        self.assertEqual((service.quorum, service.peers, service.election.peer_status), (1, [], {}))
+        response = service.ChangeMembership(chat_pb2.ChangeMembershipRequest(remove_id=2), None)
+        self.assertEqual(response.status, "error: Nothing to change")
+
+    def test_unreachable_node_not_added(self):
+        self.addCleanup(setattr, server, "LEARNER_TIMEOUT", server.LEARNER_TIMEOUT)
+        server.LEARNER_TIMEOUT = 0.5
+        service = self.single_node_leader()
+        add = chat_pb2.ChangeMembershipRequest(add=chat_pb2.Member(id=2, address="localhost:1"))
+        # Nothing to catch up on, but the joint configuration cannot get a majority of {1, 2}: rolled back
+        response = service.ChangeMembership(add, None)
+        self.assertEqual(response.status, "error: No majority of both configurations")
+        self.assertEqual(service.store.configurations(), [{1: "localhost:1"}])
+        self.assertEqual(service.peers, [])
+        response = service.ChangeMembership(add, None)
+        self.assertEqual(response.status, "error: Server 2 did not catch up")
+        self.assertEqual(service.store.configurations(), [{1: "localhost:1"}])
+        # Only the leader changes membership
+        follower = self.follower_service()
+        follower.election.leader_address = "localhost:1"
+        response = follower.ChangeMembership(chat_pb2.ChangeMembershipRequest(remove_id=1), None)
+        self.assertEqual((response.status, response.leader), (server.NOT_LEADER, "localhost:1"))
+
+class TestSharding(unittest.TestCase):
+
+    def setUp(self):
+        """Run two single-server replica groups in-process and a router over them."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.servers, self.services, shards = [], [], []
+        for index in range(2):
+            rpc_server = grpc.server(server.futures.ThreadPoolExecutor(max_workers=4))
+            address = f"localhost:{rpc_server.add_insecure_port('localhost:0')}"
+            store = server.PersistentStore(os.path.join(self.tmpdir.name, f"shard{index}.json"), commit_latency=0)
+            election = server.LeaderElection(1, [], store=store, address=address)
+            service = server.ChatService(store, election, [], shard=(index, 2))
+            election.update({})
+            chat_pb2_grpc.add_ChatServiceServicer_to_server(service, rpc_server)
+            rpc_server.start()
+            self.servers.append(rpc_server)
+            self.services.append(service)
+            shards.append({1: address})
+        self.router = sharding.ShardRouter(shards)
+        # One user on each shard
+        names = [f"user{i}" for i in range(20)]
+        self.alice = next(name for name in names if sharding.shard_for(name, 2) == 0)
+        self.bob = next(name for name in names if sharding.shard_for(name, 2) == 1)
+
+    def tearDown(self):
+        for rpc_server in self.servers:
+            rpc_server.stop(None)
+        self.tmpdir.cleanup()
+
+    def test_usernames_spread_over_shards(self):
+        counts = [0] * 4
+        for i in range(4000):
+            counts[sharding.shard_for(f"user{i}", 4)] += 1
+        self.assertTrue(all(800 < count < 1200 for count in counts), counts)
+        self.assertEqual(sharding.shard_for("alice", 4), sharding.shard_for("alice", 4))
+
+    def test_cross_shard_send_delivered_once(self):
+        for name in [self.alice, self.bob]:
+            response = self.router.call("Register", chat_pb2.RegisterRequest(username=name, password="pw"))
+            self.assertTrue(response.message.startswith("success"))
+        self.assertIn(self.alice, self.services[0].store.users)
+        self.assertIn(self.bob, self.services[1].store.users)
+        self.assertEqual(self.router.list_users(), sorted([self.alice, self.bob]))
+        # alice's send is stored on bob's shard; repeating it (as after a lost reply) does not duplicate it
+        request = chat_pb2.SendMessageRequest(sender=self.alice, recipient=self.bob, message="hi")
+        first = self.router.call("SendMessage", request)
+        again = self.router.call("SendMessage", request)
+        self.assertEqual((first.status, again.status), ("success", "success"))
+        self.assertEqual(len(first.bytes_message_id), 16)
+        self.assertEqual(first.bytes_message_id, again.bytes_message_id)
+        self.assertEqual(len(self.services[1].store.users[self.bob]["messages"]), 1)
+        self.assertEqual(self.services[1].store.log_index, 2)  # the registration and one send
+
+    def test_wrong_shard_rejected(self):
+        response = self.services[1].Register(chat_pb2.RegisterRequest(username=self.alice, password="pw"), None)
+        self.assertEqual(response.message, sharding.WRONG_SHARD)
+        response = self.services[1].SendMessage(chat_pb2.SendMessageRequest(sender=self.bob, recipient=self.alice,
+                                                                            message="hi"), None)
+        self.assertEqual(response.status, sharding.WRONG_SHARD)
+        self.assertNotIn(self.alice, self.services[1].store.users)
+
 if __name__ == "__main__":
     unittest.main()